@@ -1,14 +1,28 @@
 ##############################################################################
 
-## Description :  This codes is for test two USB2CAN module commuincation
-##                on one Raspberry Pi.        
-##                CAN0 send "0x55, 0xaa, 0x5a,0xa5" to CAN1
-##                After that, CAN1 will "0x55, 0xaa, 0x5a,0xa5" to CAN0
-##                Finally, Print the test result
-
-## Author      :  
-              
-                
+## Description :  Link tester for two CAN channels on one host, like
+##                canfdtest from can-utils.
+##                Channel A sends sequenced frames at a given rate and size.
+##                In echo mode (default) channel B sends every frame back
+##                with ID + 1 and channel A checks the echo and measures the
+##                round-trip time; in stream mode channel B checks the
+##                frames and measures the one-way latency.
+##                Every frame is checked for loss, reordering, duplicates
+##                and corrupted payload. At the end the script prints the
+##                throughput and a latency histogram, and exits with status
+##                1 if any frame was lost or wrong.
+##
+##                Two USB2CAN modules on can0 and can1 (wired together):
+##                    python3 test.py --setup --count 10000 --rate 2000
+##                A virtual CAN interface (both sides on the same vcan):
+##                    sudo ip link add dev vcan0 type vcan && sudo ip link set vcan0 up
+##                    python3 test.py --channel-a vcan0 --channel-b vcan0
+##                Without any hardware, e.g. in CI:
+##                    python3 test.py --interface virtual --channel-a test --channel-b test
+
+## Author      :
+
+
 ## Date        :  2019.11.30
 
 ## Environment :  Hardware            ----------------------  Raspberry Pi 4
@@ -19,57 +33,308 @@
 
 
 ###############################################################################
+import argparse
 import os
+import struct
+import threading
+import time
 import can
 
-#Set CAN0 speed to 1M bps
-os.system('sudo ip link set can0 type can bitrate 1000000')
-os.system('sudo ifconfig can0 up')
-
-#Set CAN1 speed to 1M bps
-os.system('sudo ip link set can1 type can bitrate 1000000')
-os.system('sudo ifconfig can1 up')
-
-can0 = can.interface.Bus(channel = 'can0', bustype = 'socketcan_ctypes')
-can1 = can.interface.Bus(channel = 'can1', bustype = 'socketcan_ctypes')
-
-def rs485_enable():
-##  CAN0 SEND AND CAN1 RECEIVE    
-    msg = can.Message(arbitration_id=0x123, data=[0x55,0xaa,0x5a,0xa5],
-                      extended_id=False)
-
-    can0.send(msg)
-
-    msg = can1.recv(10.0)
-
-    if((msg.data[0]==0x55)and(msg.data[1]==0xaa)and
-       (msg.data[2]==0x5a)and(msg.data[3]==0xa5)):
-    ##  CAN1 SEND AND CAN0 RECEIVE     
-        msg = can.Message(arbitration_id=0x123, data=[0x55,0xaa,0x5a,0xa5],
-                          extended_id=False)
-
-        print(msg)
-        can1.send(msg)
-        msg = can0.recv(30.0)
-        if((msg.data[0]==0x55)and(msg.data[1]==0xaa)and(msg.data[2]==0x5a)and(msg.data[3]==0xa5)):
-            print(msg)
-            print('Both USB2CAN module communication test successful')
-        elif msg is None:    ## No data
-            print('Timeout USB2CAN module test failure.\r\n'*3)
-        else :
-            print('Data validation errors\r\n'*3)
-            print(msg)                       ##print the err data
-        
-    elif msg is None: ## No data
-        print('Timeout USB2CAN module test failure.\r\n'*3)
-    else :     ##print the err data
-        print('Data validation errors\r\n'*3)
-        print(msg)      
-    
-if __name__ == '__main__':
-    rs485_enable()
+TEST_ID = 0x123
+SEQUENCE_BYTES = 4  # the first bytes of each frame carry its sequence number
+FD_LENGTHS = (0, 1, 2, 3, 4, 5, 6, 7, 8, 12, 16, 20, 24, 32, 48, 64)
+SEND_RETRY_DELAY = 0.0005  # wait when the transmit queue of the interface is full
+HISTOGRAM_EDGES_US = [2 ** i for i in range(4, 21)]  # 16 us .. 1 s
+HISTOGRAM_WIDTH = 50
+
+
+def setup_link(channel, bitrate, data_bitrate=None):
+    """Bring a real SocketCAN channel up with the given bit rate(s)"""
+    os.system('sudo ifconfig %s down' % channel)
+    if data_bitrate:
+        os.system('sudo ip link set %s up type can bitrate %d dbitrate %d fd on' % (channel, bitrate, data_bitrate))
+    else:
+        os.system('sudo ip link set %s type can bitrate %d' % (channel, bitrate))
+    os.system('sudo ifconfig %s up' % channel)
+
+
+def payload(sequence, size):
+    """Frame data of a sequence number: the number, then a pattern derived from it"""
+    head = struct.pack('<I', sequence & 0xFFFFFFFF)[:min(size, SEQUENCE_BYTES)]
+    return head + bytes((sequence + i) & 0xFF for i in range(len(head), size))
+
+
+def sequence_of(data):
+    """Sequence number (modulo the bytes that carry it) of received frame data"""
+    head = bytes(data[:SEQUENCE_BYTES])
+    return int.from_bytes(head, 'little'), 1 << (8 * len(head))
+
+
+class Checker:
+    """Checks the order and contents of received test frames and collects latencies"""
+
+    def __init__(self, can_id, size, window):
+        self.can_id = can_id
+        self.size = size
+        self.window = window  # frames further than this behind the highest received one are lost
+        self.send_times = {}  # sequence (modulo) -> (sequence, time the frame was sent), in send order
+        self.lock = threading.Lock()
+        self.sent_count = 0
+        self.highest = -1  # highest sequence received
+        self.lost = 0
+        self.expected = 0
+        self.received = 0
+        self.reordered = 0
+        self.duplicates = 0
+        self.corrupted = 0
+        self.latencies = []
+        self.last_received = None
+
+    def sent(self, sequence, at):
+        with self.lock:
+            key = sequence % self.modulus()
+            # Never replace the send time of an earlier frame that is still in flight
+            if self.send_times.get(key, (sequence,))[0] == sequence:
+                self.send_times[key] = (sequence, at)
+            self.sent_count = max(self.sent_count, sequence + 1)
+
+    def ahead(self, sequence):
+        """How far `sequence` is ahead of the highest sequence received"""
+        return sequence - self.highest
+
+    def modulus(self):
+        return 1 << (8 * min(self.size, SEQUENCE_BYTES))
+
+    def check(self, msg, at):
+        self.received += 1
+        self.last_received = at
+        sequence, modulus = sequence_of(msg.data)
+        if msg.arbitration_id != self.can_id or len(msg.data) != self.size or modulus != self.modulus():
+            self.corrupted += 1
+            return
+        with self.lock:
+            sent = self.send_times.pop(sequence, None)
+            if sent is not None and sent[0] > self.highest:
+                self.highest = sent[0]
+                self.expire()
+        if sent is None:
+            self.duplicates += 1  # never sent, already received or given up as lost
+            return
+        self.latencies.append(at - sent[1])
+        if bytes(msg.data) != payload(sequence, self.size):
+            self.corrupted += 1
+        # Frames are numbered modulo 2^(8 * bytes), so compare the distance:
+        # a frame behind the expected one arrived after a later frame
+        if (sequence - self.expected) % modulus < modulus // 2:
+            self.expected = (sequence + 1) % modulus
+        else:
+            self.reordered += 1
+
+    def expire(self):
+        """Count the frames more than `window` behind the highest received one as lost"""
+        while self.send_times:
+            key, (oldest, _) = next(iter(self.send_times.items()))
+            if oldest >= self.highest - self.window:
+                break
+            del self.send_times[key]
+            self.lost += 1
+
+    def missing(self):
+        """Frames sent but not received: given up as lost, or still in flight"""
+        with self.lock:
+            return self.lost + len(self.send_times)
 
-    os.system('sudo ifconfig can1 down')
-    os.system('sudo ifconfig can0 down')
 
+def sender(bus, checker, count, rate, size, fd, brs, window, stop):
+    """Sends `count` sequenced frames, paced to `rate` frames/s (None: as fast as possible)"""
+    interval = 1.0 / rate if rate else 0.0
+    next_time = time.perf_counter()
+    for sequence in range(count):
+        if stop.is_set():
+            break
+        if interval:
+            next_time += interval
+            delay = next_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        # Frames are told apart by their sequence number modulo 2^(8 * bytes): stay within
+        # `window` of the highest one received; the checker gives up on frames further behind
+        while checker.ahead(sequence) > window and not stop.is_set():
+            time.sleep(SEND_RETRY_DELAY)
+        msg = can.Message(arbitration_id=TEST_ID, data=payload(sequence, size), is_extended_id=False,
+                          is_fd=fd, bitrate_switch=brs)
+        while not stop.is_set():
+            checker.sent(sequence, time.perf_counter())
+            try:
+                bus.send(msg)
+                break
+            except can.CanOperationError:
+                time.sleep(SEND_RETRY_DELAY)  # transmit queue full, e.g. ENOBUFS
 
+
+def echo(bus, stop):
+    """Sends every test frame back with ID + 1, like the device under test of canfdtest"""
+    while not stop.is_set():
+        msg = bus.recv(0.05)
+        if msg is None or msg.arbitration_id != TEST_ID:
+            continue
+        reply = can.Message(arbitration_id=TEST_ID + 1, data=msg.data, is_extended_id=False,
+                            is_fd=msg.is_fd, bitrate_switch=msg.bitrate_switch)
+        while not stop.is_set():
+            try:
+                bus.send(reply)
+                break
+            except can.CanOperationError:
+                time.sleep(SEND_RETRY_DELAY)
+
+
+def receive(bus, checker, count, stop, timeout):
+    """Checks frames until all were received or nothing arrived for `timeout` seconds"""
+    last = time.perf_counter()
+    while checker.received < count and not stop.is_set():
+        msg = bus.recv(0.05)
+        now = time.perf_counter()
+        if msg is None:
+            if now - last > timeout:
+                break
+            continue
+        last = now
+        if msg.arbitration_id == checker.can_id:
+            checker.check(msg, now)
+
+
+def percentile(values, share):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(share * len(values)), len(values) - 1)]
+
+
+def print_histogram(latencies, title):
+    print(title)
+    counts = [0] * (len(HISTOGRAM_EDGES_US) + 1)
+    for latency in latencies:
+        microseconds = latency * 1e6
+        bucket = 0
+        while bucket < len(HISTOGRAM_EDGES_US) and microseconds >= HISTOGRAM_EDGES_US[bucket]:
+            bucket += 1
+        counts[bucket] += 1
+    used = [i for i, n in enumerate(counts) if n]
+    if not used:
+        print('  no frames')
+        return
+    largest = max(counts)
+    for i in range(used[0], used[-1] + 1):
+        low = 0 if i == 0 else HISTOGRAM_EDGES_US[i - 1]
+        high = '%d us' % HISTOGRAM_EDGES_US[i] if i < len(HISTOGRAM_EDGES_US) else 'up'
+        bar = '#' * (counts[i] * HISTOGRAM_WIDTH // largest)
+        print('  %8d .. %-10s %8d %s' % (low, high, counts[i], bar))
+
+
+def run_test(args):
+    if args.size < 1:
+        raise SystemExit('Test frames need at least 1 byte for the sequence number')
+    if args.fd and args.size not in FD_LENGTHS:
+        raise SystemExit('CAN FD frames carry %s bytes' % ', '.join(map(str, FD_LENGTHS)))
+    if not args.fd and not 0 < args.size <= 8:
+        raise SystemExit('Classic CAN frames carry 1 to 8 bytes (use --fd for more)')
+
+    config = {'interface': args.interface}
+    if args.interface != 'virtual':
+        config.update(bitrate=args.bitrate, fd=args.fd)
+        if args.fd:
+            config['data_bitrate'] = args.data_bitrate
+    echoed = args.mode == 'echo'
+    # Each side only takes the frames meant for it from the driver
+    bus_a = can.Bus(channel=args.channel_a, receive_own_messages=False,
+                    can_filters=[{'can_id': TEST_ID + 1, 'can_mask': 0x7FF}], **config)
+    bus_b = can.Bus(channel=args.channel_b, receive_own_messages=False,
+                    can_filters=[{'can_id': TEST_ID, 'can_mask': 0x7FF}], **config)
+
+    # Frames up to `window` behind and ahead of the highest one received are told apart
+    modulus = 1 << (8 * min(args.size, SEQUENCE_BYTES))
+    window = (modulus - 1) // 2
+    if args.window and args.window < window:
+        window = args.window
+    elif args.window > window or not args.window and args.size < SEQUENCE_BYTES:
+        print('Window limited to %d frames: %d-byte frames carry sequence numbers modulo %d' % (
+            window, args.size, modulus))
+    checker = Checker(TEST_ID + 1 if echoed else TEST_ID, args.size, window)
+    stop = threading.Event()
+    threads = [threading.Thread(target=sender, args=(bus_a, checker, args.count, args.rate, args.size,
+                                                     args.fd, args.fd and args.brs, window, stop))]
+    if echoed:
+        threads.append(threading.Thread(target=echo, args=(bus_b, stop)))
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    try:
+        receive(bus_a if echoed else bus_b, checker, args.count, stop, args.timeout)
+    except KeyboardInterrupt:
+        print('Interrupted')
+    elapsed = (checker.last_received or time.perf_counter()) - start
+    stop.set()
+    for thread in threads:
+        thread.join()
+    bus_a.shutdown()
+    bus_b.shutdown()
+
+    lost = checker.missing()
+    unsent = args.count - checker.sent_count
+    kind = 'Round-trip time' if echoed else 'One-way latency'
+    print('%s test, %d frames of %d bytes, %s' % (
+        args.mode, args.count, args.size, '%g frames/s' % args.rate if args.rate else 'as fast as possible'))
+    print('  received    %d' % checker.received)
+    print('  lost        %d' % lost)
+    if unsent:
+        print('  not sent    %d' % unsent)
+    print('  reordered   %d' % checker.reordered)
+    print('  duplicates  %d' % checker.duplicates)
+    print('  corrupted   %d' % checker.corrupted)
+    if elapsed > 0 and checker.received:
+        frames_per_s = checker.received / elapsed
+        print('  throughput  %.0f frames/s, %.1f kbit/s payload' % (frames_per_s,
+                                                                  frames_per_s * args.size * 8 / 1000))
+    if checker.latencies:
+        print('  %s: min %.0f us, p50 %.0f us, p99 %.0f us, max %.0f us' % (
+            kind, min(checker.latencies) * 1e6, percentile(checker.latencies, 0.5) * 1e6,
+            percentile(checker.latencies, 0.99) * 1e6, max(checker.latencies) * 1e6))
+        print_histogram(checker.latencies, '%s histogram:' % kind)
+    ok = lost == 0 and unsent == 0 and checker.reordered == 0 and checker.duplicates == 0 and checker.corrupted == 0
+    print('Both USB2CAN module communication test successful' if ok else 'USB2CAN module test failure')
+    return 0 if ok else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description='CAN link tester for two channels (like canfdtest)')
+    parser.add_argument('--interface', default='socketcan', help='python-can interface (socketcan, virtual, ...)')
+    parser.add_argument('--channel-a', default='can0', help='sending channel')
+    parser.add_argument('--channel-b', default='can1', help='receiving / echoing channel')
+    parser.add_argument('--mode', choices=('echo', 'stream'), default='echo')
+    parser.add_argument('--count', type=int, default=1000, help='frames to send')
+    parser.add_argument('--rate', type=float, default=1000.0, help='frames/s, 0 = as fast as possible')
+    parser.add_argument('--size', type=int, default=8, help='payload bytes')
+    parser.add_argument('--window', type=int, default=64,
+                        help='most frames in flight before the sender waits, 0 = as many as the '
+                             'sequence numbers of --size bytes tell apart')
+    parser.add_argument('--timeout', type=float, default=2.0, help='seconds without frames before giving up')
+    parser.add_argument('--bitrate', type=int, default=1000000)
+    parser.add_argument('--fd', action='store_true', help='send CAN FD frames')
+    parser.add_argument('--data-bitrate', type=int, default=2000000)
+    parser.add_argument('--brs', action='store_true', help='switch to the data bit rate (CAN FD)')
+    parser.add_argument('--setup', action='store_true', help='bring can0/can1 up with ip link (needs sudo)')
+    args = parser.parse_args()
+
+    if args.setup:
+        for channel in sorted({args.channel_a, args.channel_b}):
+            setup_link(channel, args.bitrate, args.data_bitrate if args.fd else None)
+    try:
+        return run_test(args)
+    finally:
+        if args.setup:
+            for channel in sorted({args.channel_a, args.channel_b}):
+                os.system('sudo ifconfig %s down' % channel)
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
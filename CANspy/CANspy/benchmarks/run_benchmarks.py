@@ -0,0 +1,672 @@
+"""
+CANspy throughput benchmarks.
+
+Drives the headless capture paths and an offscreen ConfigWindow with
+synthetic, cangen-like traffic and compares the results with a stored
+baseline. Every case runs --repeats times, each run in a fresh Python
+process so that no case sees the heap, caches or threads another one left
+behind; the result of a case is the best throughput and CPU time and the
+median of every other metric over its runs. The script exits with status
+1 when a case regresses by more than the tolerance. The GUI cases share
+the event loop and the scheduler with the receive thread and vary much
+more from run to run, so they are compared with the wider GUI_TOLERANCE.
+
+    python benchmarks/run_benchmarks.py                  # compare with baseline.json
+    python benchmarks/run_benchmarks.py --update-baseline
+    python benchmarks/run_benchmarks.py --interface socketcan --channel vcan0
+    python benchmarks/run_benchmarks.py --cases e2e --repeats 5
+
+Metrics per case:
+    frames_per_s      sustained frames per second (higher is better)
+    cpu_us_per_frame  process CPU time per frame (lower is better)
+    memory_mb         growth of the resident set size of the run's process (lower is better)
+    latency_p50_ms    send-to-table latency of probe frames, GUI cases only
+    latency_p99_ms
+    disconnect_ms     time from stop_receiving() until the bus is shut down
+    scrub_ms          time to rebuild the overwrite state at a capture position
+"""
+
+import argparse
+import json
+import os
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import numpy as np
+from utils.traffic import generate_records, TrafficGenerator
+from capture.capture_file import CaptureWriter, MAX_DATA_LENGTH, FLAG_EXTENDED, record_to_message
+from capture.store import CaptureStore
+from capture.frames import CANMessage, FrameBatch
+from capture.importers import import_candump
+from capture.replay import ReplayEngine
+from capture.receiver import CANReceiver
+from capture.display_filter import DisplayFilter, FilterFeed
+from capture.bit_stats import BitStatistics
+from capture.correlation import search as correlation_search
+from capture.gateway import Gateway
+from capture.isotp import IsoTpDecoder
+from capture.j1939 import J1939Decoder
+from capture.canopen import CanOpenDecoder, Device, TPDO
+from capture.cycle_monitor import CycleMonitor
+from capture.e2e import E2EChecker, E2EProfile, P01, P05
+from capture.id_limit import MAX_IDS
+from capture.timeline import OverwriteTimeline
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+PROBE_ID = 0x7FF
+HIGHER_IS_BETTER = {"frames_per_s"}
+# Metrics that only get worse with noise take the best run, the others the median
+BEST_OF_RUNS = {"frames_per_s", "cpu_us_per_frame"}
+GUI_CASES = {"gui_overwrite", "gui_append"}
+GUI_TOLERANCE = {"frames_per_s": 0.5, "cpu_us_per_frame": 0.5, "latency_p50_ms": 1.0, "latency_p99_ms": 1.5}
+# Absolute slack so tiny values (e.g. 0.1 MB) do not fail on noise
+ABSOLUTE_SLACK = {"memory_mb": 8.0, "latency_p50_ms": 5.0, "latency_p99_ms": 20.0, "cpu_us_per_frame": 2.0,
+                  "disconnect_ms": 20.0, "disconnect_max_ms": 20.0, "scrub_ms": 5.0, "scrub_max_ms": 10.0}
+
+
+def rss_mb():
+    """Current resident set size, or the peak where /proc is not available"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        pass
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class Measurement:
+    """Wall time, CPU time and memory growth around a benchmark body"""
+
+    def __enter__(self):
+        self.rss = rss_mb()
+        self.cpu = time.process_time()
+        self.wall = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.wall = time.perf_counter() - self.wall
+        self.cpu = time.process_time() - self.cpu
+        self.rss = rss_mb() - self.rss
+
+    def result(self, frames, **extra):
+        result = {
+            "frames_per_s": frames / self.wall if self.wall else 0.0,
+            "cpu_us_per_frame": self.cpu * 1e6 / frames if frames else 0.0,
+            "memory_mb": self.rss,
+        }
+        result.update(extra)
+        return result
+
+
+# Headless cases
+
+def bench_store_append(frames):
+    messages = [record_to_message(r) for r in generate_records(frames, rng=np.random.default_rng(1))]
+    store = CaptureStore()
+    with Measurement() as m:
+        for msg in messages:
+            store.append_message(msg)
+    return m.result(frames)
+
+
+def bench_store_append_records(frames):
+    records = generate_records(frames, rng=np.random.default_rng(1))
+    store = CaptureStore()
+    with Measurement() as m:
+        for start in range(0, frames, 4096):
+            store.append_records(records[start:start + 4096])
+    return m.result(frames)
+
+
+def bench_store_periodic(frames, ids):
+    """Store vehicle-like traffic: `ids` periodic IDs whose payloads change only in a counter or rarely"""
+    records = generate_records(frames, id_mode='increment', id_range=(0x100, 0x100 + ids - 1), dlc_mode=8,
+                               rng=np.random.default_rng(1))
+    cycle = np.arange(frames) // ids
+    records['data'][:, :8] = (records['can_id'][:, None] * np.arange(1, 9)) & 0xFF
+    records['data'][:, 2] = cycle // 50  # a slowly changing signal
+    counted = records['can_id'] % 4 == 0  # every 4th ID has an alive counter
+    records['data'][counted, 1] = cycle[counted] % 16
+    store = CaptureStore()
+    with Measurement() as m:
+        for start in range(0, frames, 4096):
+            store.append_records(records[start:start + 4096])
+    if not (store.read(frames - 4096) == records[-4096:]).all():
+        raise RuntimeError("Stored frames differ")
+    return m.result(frames)
+
+
+def bench_frame_objects(frames):
+    """Convert can.Message to slotted CANMessage objects and keep them"""
+    messages = [record_to_message(r) for r in generate_records(frames, rng=np.random.default_rng(1))]
+    with Measurement() as m:
+        kept = [CANMessage.from_message(msg) for msg in messages]
+    result = m.result(len(kept))
+    del kept
+    return result
+
+
+def bench_frame_batch(frames):
+    """Collect can.Message frames in a FrameBatch and hand them over as records"""
+    messages = [record_to_message(r) for r in generate_records(frames, rng=np.random.default_rng(1))]
+    with Measurement() as m:
+        batch = FrameBatch()
+        for msg in messages:
+            batch.append_message(msg)
+        records = batch.to_records()
+    return m.result(len(records))
+
+
+def bench_capture_writer(frames):
+    messages = [record_to_message(r) for r in generate_records(frames, rng=np.random.default_rng(1))]
+    with tempfile.TemporaryDirectory() as tmp:
+        with Measurement() as m:
+            with CaptureWriter(os.path.join(tmp, "bench.canspy")) as writer:
+                for msg in messages:
+                    writer.write_message(msg)
+    return m.result(frames)
+
+
+def bench_import_candump(frames):
+    records = generate_records(frames, rate=10000.0, start_time=1.7e9, rng=np.random.default_rng(1))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.log")
+        with open(path, "w") as f:
+            for r in records:
+                data = r['data'][:r['dlc']].tobytes().hex().upper()
+                f.write(f"({r['timestamp']:.6f}) can0 {int(r['can_id']):03X}#{data}\n")
+        store = CaptureStore()
+        with Measurement() as m:
+            for chunk, _ in import_candump(path):
+                store.append_records(chunk)
+    return m.result(len(store))
+
+
+def bench_replay_asap(frames):
+    store = CaptureStore()
+    store.append_records(generate_records(frames, rng=np.random.default_rng(1)))
+    received = []
+    engine = ReplayEngine(store, on_frame=received.append, speed=None)
+    engine.running = True
+    with Measurement() as m:
+        engine.run()  # in this thread, without the start() thread hop
+    return m.result(len(received))
+
+
+def bench_display_filter(frames):
+    """Filter a capture store with a compiled display filter, in GUI-sized steps"""
+    store = CaptureStore()
+    store.append_records(generate_records(frames, rng=np.random.default_rng(1)))
+    feed = FilterFeed(store, DisplayFilter("id in 0x100..0x1FF and data[0] & 0x80 and cycle > 1ms"))
+    with Measurement() as m:
+        while not feed.update():
+            pass
+    return m.result(frames)
+
+
+def bench_bit_stats(frames, ids):
+    """Fold receive-sized batches into the per-ID bit statistics"""
+    records = generate_records(frames, rng=np.random.default_rng(1), id_range=(0x100, 0x100 + ids - 1))
+    stats = BitStatistics()
+    with Measurement() as m:
+        for start in range(0, frames, 4096):
+            stats.update(records[start:start + 4096])
+    return m.result(frames)
+
+
+def bench_isotp(frames):
+    """Reassemble ISO-TP transfers from receive-sized batches of mixed traffic"""
+    records = generate_records(frames, rng=np.random.default_rng(1))
+    # Every 16th frame is part of a 62-byte transfer on 0x7E8 (first frame + 8 consecutive frames)
+    diagnostic = records[::16]
+    diagnostic['can_id'] = 0x7E8
+    diagnostic['dlc'] = 8
+    sequence = np.arange(len(diagnostic)) % 9
+    diagnostic['data'][:, 0] = np.where(sequence == 0, 0x10, 0x20 | sequence)
+    diagnostic['data'][sequence == 0, 1] = 62
+    records[::16] = diagnostic
+    batches = [FrameBatch.from_records(records[start:start + 4096]) for start in range(0, frames, 4096)]
+    decoder = IsoTpDecoder()
+    with Measurement() as m:
+        for batch in batches:
+            decoder.update_batch(batch)
+    if decoder.summary()['pdus'] < len(diagnostic) // 9 - 1:
+        raise RuntimeError("ISO-TP transfers were not reassembled")
+    return m.result(frames)
+
+
+def bench_j1939(frames, sessions):
+    """Per-PGN statistics and transport reassembly with `sessions` interleaved transfers in flight"""
+    records = generate_records(frames, rng=np.random.default_rng(1))
+    records['flags'] |= 0x01  # extended
+    records['can_id'] = 0x18FE0000 | (records['can_id'] & 0xFFF)  # 4096 parameter groups
+    records['dlc'] = 8
+    # Every other frame belongs to a transport transfer of 32 packets: half of the sessions are
+    # broadcasts from SA 0..255, half connections from the same SAs to 0x10; all advance in turn
+    transport = records[::2]
+    packet = np.arange(len(transport))
+    session = packet % sessions
+    step = (packet // sessions) % 33  # 0: TP.CM, 1..32: TP.DT
+    source = session % 256
+    destination = np.where(session < 256, 0xFF, 0x10)
+    transport['can_id'] = np.where(step == 0, 0x1CEC0000, 0x1CEB0000) | (destination << 8) | source
+    transport['data'][:, 0] = np.where(step == 0, np.where(destination == 0xFF, 32, 16), step)
+    announce = transport['data'][step == 0]
+    announce[:, 1:8] = [224, 0, 32, 0xFF, 0xCA, 0xFE, 0]
+    transport['data'][step == 0] = announce
+    records[::2] = transport
+    batches = [FrameBatch.from_records(records[start:start + 4096]) for start in range(0, frames, 4096)]
+    decoder = J1939Decoder()
+    with Measurement() as m:
+        for batch in batches:
+            decoder.update_batch(batch)
+    summary = decoder.summary()
+    if summary['messages'] < len(transport) // 33 - sessions or summary['dropped']:
+        raise RuntimeError("J1939 transport messages were not reassembled")
+    return m.result(frames)
+
+
+def bench_canopen(frames, nodes):
+    """CANopen decoding of `nodes` nodes sending mapped TPDOs, with SYNC, heartbeats and SDO reads"""
+    records = generate_records(frames, rng=np.random.default_rng(1))
+    records['flags'] = 0
+    records['dlc'] = 8
+    index = np.arange(frames)
+    node = (index % nodes) + 1
+    # 4 TPDOs per node; every 100th frame a SYNC, every 200th a heartbeat, every 50th an SDO frame
+    records['can_id'] = 0x180 + 0x100 * ((index // nodes) % 4) + node
+    records['can_id'][::100] = 0x080
+    records['can_id'][7::200] = 0x700 + node[7::200]
+    records['data'][7::200, 0] = 5
+    sdo = np.arange(3, frames, 50)
+    step = np.arange(len(sdo)) % 2
+    records['can_id'][sdo] = np.where(step == 0, 0x600, 0x580) + node[sdo - step * 50]
+    records['data'][sdo, 0] = np.where(step == 0, 0x40, 0x43)
+    records['data'][sdo, 1:4] = [0x18, 0x10, 1]
+    decoder = CanOpenDecoder()
+    for node_id in range(1, nodes + 1):
+        device = Device(node_id, "bench")
+        for number in range(4):
+            device.pdos[0x180 + 0x100 * number + node_id] = (TPDO, number + 1, [("status", 0, 16, 6),
+                                                                                 ("position", 16, 32, 4),
+                                                                                 ("mode", 48, 8, 2)])
+        decoder.add_device(device)
+    batches = [FrameBatch.from_records(records[start:start + 4096]) for start in range(0, frames, 4096)]
+    with Measurement() as m:
+        for batch in batches:
+            decoder.update_batch(batch)
+    if decoder.summary()['events'] < len(sdo) // 2 - 1:
+        raise RuntimeError("SDO transfers were not decoded")
+    return m.result(frames)
+
+
+def bench_cycle_monitor(frames, ids):
+    """Late/missing/too-fast monitoring of `ids` periodic IDs, with every 16th ID going silent halfway"""
+    rng = np.random.default_rng(1)
+    periods = rng.choice([0.01, 0.02, 0.05, 0.1, 0.2], ids)
+    duration = frames / np.sum(1 / periods)
+    times = [np.arange(rng.uniform(0, period), duration / 2 if can_id % 16 == 0 else duration, period)
+             for can_id, period in enumerate(periods)]
+    can_ids = np.repeat(np.arange(ids), [len(t) for t in times])
+    times = np.concatenate(times) + 1.7e9
+    order = np.argsort(times, kind='stable')
+    records = np.zeros(len(times), dtype=generate_records(1).dtype)
+    records['timestamp'] = times[order] + rng.normal(0, 0.0005, len(times))  # jitter
+    records['timestamp'].sort()
+    records['can_id'] = can_ids[order] + 0x100
+    records['dlc'] = 8
+    batches = [FrameBatch.from_records(records[start:start + 4096]) for start in range(0, len(records), 4096)]
+    monitor = CycleMonitor()
+    with Measurement() as m:
+        for batch in batches:
+            monitor.update_batch(batch)
+    if monitor.summary()['missing'] < ids // 16 * 0.9:
+        raise RuntimeError("Silent IDs were not reported missing")
+    return m.result(len(records))
+
+
+def bench_id_flood(frames, ids):
+    """Receiver, store and overwrite view under `ids` periodic IDs mixed with 80 % random 29-bit IDs"""
+    from gui.capture_model import LatestTableModel
+
+    rng = np.random.default_rng(1)
+    records = generate_records(frames, id_mode='increment', id_range=(0x100, 0x100 + ids - 1), dlc_mode=8, rng=rng)
+    flood = rng.random(frames) < 0.8
+    records['can_id'][flood] = rng.integers(0, 1 << 29, int(flood.sum()))
+    records['flags'][flood] |= FLAG_EXTENDED
+    store = CaptureStore(MAX_IDS)
+    receiver = CANReceiver(store=store)
+    model = LatestTableModel(store)
+    with Measurement() as m:
+        for start in range(0, frames, 4096):
+            receiver.process_records(records[start:start + 4096])
+            model.refresh()
+    if max(len(receiver.id_state), len(store.id_positions), model.rowCount() - 1) > MAX_IDS:
+        raise RuntimeError("Per-ID state grew past the limit")
+    if not all(can_id in model.row_of_id for can_id in range(0x100, 0x100 + ids)):
+        raise RuntimeError("Periodic IDs were evicted")
+    return m.result(frames)
+
+
+def bench_timeline(frames, ids, positions):
+    """Keyframe a stored capture of `ids` IDs, then rebuild the overwrite state at random positions"""
+    rng = np.random.default_rng(1)
+    store = CaptureStore()
+    records = generate_records(frames, id_mode='random', id_range=(0x100, 0x100 + ids - 1), rng=rng)
+    for start in range(0, frames, 65536):
+        store.append_records(records[start:start + 65536])
+    timeline = OverwriteTimeline(store)
+    with Measurement() as m:
+        timeline.update()
+    times = []
+    for index in rng.integers(0, frames, positions).tolist():
+        started = time.perf_counter()
+        state = timeline.state_at(index)
+        times.append((time.perf_counter() - started) * 1000)
+    if state.counts.sum() != index:
+        raise RuntimeError("Rebuilt state does not count every frame")
+    return m.result(frames, scrub_ms=float(np.percentile(times, 50)), scrub_max_ms=max(times))
+
+
+def bench_e2e(frames, ids):
+    """E2E checks of half of `ids` IDs (P01 and P05), with every 1000th frame corrupted"""
+    records = generate_records(frames, id_range=(0x100, 0x100 + ids - 1), dlc_mode=8, rng=np.random.default_rng(1))
+    records['flags'] = 0
+    profiles = {}
+    for can_id in range(0x100, 0x100 + ids, 2):
+        profile = profiles[can_id] = E2EProfile(P01 if can_id % 4 else P05, can_id)
+        rows = np.flatnonzero(records['can_id'] == can_id)
+        counters = np.arange(len(rows)) % profile.modulus
+        data = records['data'][rows, :8]
+        if profile.name == P05:
+            data[:, 2] = counters
+            crc = profile.compute_crc(data, counters)
+            data[:, 0], data[:, 1] = crc & 0xFF, crc >> 8
+        else:
+            data[:, 1] = (data[:, 1] & 0xF0) | counters
+            data[:, 0] = profile.compute_crc(data, counters)
+        records['data'][rows, :8] = data
+    records['data'][::1000, 5] ^= 1
+    batches = [FrameBatch.from_records(records[start:start + 4096]) for start in range(0, frames, 4096)]
+    checker = E2EChecker(profiles)
+    with Measurement() as m:
+        for batch in batches:
+            checker.update_batch(batch)
+    crc_errors = sum(counts["CRC error"] for _, _, _, _, counts, _, _ in checker.id_rows())
+    if abs(crc_errors - frames // 2000) > frames // 10000:
+        raise RuntimeError(f"{crc_errors} CRC errors instead of about {frames // 2000}")
+    return m.result(frames)
+
+
+def bench_correlation(frames, ids):
+    """Search every candidate signal of a 10-minute capture for a reference series"""
+    store = CaptureStore()
+    store.append_records(generate_records(frames, rate=frames / 600.0, rng=np.random.default_rng(1),
+                                          id_range=(0x100, 0x100 + ids - 1)))
+    times = np.linspace(0, 600, 6001)
+    with Measurement() as m:
+        correlation_search(store, (times, np.sin(times / 30.0)), workers=1)
+    return m.result(frames)
+
+
+def bench_receiver(frames, interface, channel):
+    """Headless capture engine receiving synthetic traffic"""
+    import can
+    receiver = CANReceiver({'interface': interface, 'channel': channel}, store=CaptureStore())
+    receiver.start_receiving()
+    time.sleep(0.2)  # let the receive thread open the bus
+    bus = can.Bus(interface=interface, channel=channel)
+    generator = TrafficGenerator(bus, rate=None, count=frames, seed=1, id_range=(0x100, 0x17F))
+    with Measurement() as m:
+        generator.start()
+        deadline = time.perf_counter() + 60
+        while len(receiver.store) < frames and time.perf_counter() < deadline:
+            time.sleep(0.001)
+    generator.stop()
+    receiver.stop_receiving()
+    bus.shutdown()
+    return m.result(len(receiver.store))
+
+
+def bench_gateway(frames, channel):
+    """Forward synthetic traffic between two virtual buses through an ID-rewriting rule"""
+    import can
+    gateway = Gateway({'interface': 'virtual', 'channel': f"{channel}-a"},
+                      {'interface': 'virtual', 'channel': f"{channel}-b"},
+                      ["a>b 0x100/0x700 id^=0x400 data[0]|=0x80"])
+    gateway.start()
+    source = can.Bus(interface='virtual', channel=f"{channel}-a")
+    target = can.Bus(interface='virtual', channel=f"{channel}-b")
+    generator = TrafficGenerator(source, rate=None, count=frames, seed=1, id_range=(0x100, 0x17F))
+    received = 0
+    with Measurement() as m:
+        generator.start()
+        deadline = time.perf_counter() + 60
+        while received < frames and time.perf_counter() < deadline:
+            if target.recv(0.1) is not None:
+                received += 1
+    generator.stop()
+    gateway.stop()
+    source.shutdown()
+    target.shutdown()
+    stats = gateway.statistics()[0]
+    return m.result(received, latency_p50_ms=stats.get('p50_us', 0.0) / 1000,
+                    latency_p99_ms=stats.get('p99_us', 0.0) / 1000)
+
+
+def bench_disconnect(rounds, interface, channel):
+    """Stop an idle receiver and a busy one; the bus must be shut down when stop returns"""
+    import can
+    times = []
+    for i in range(rounds):
+        receiver = CANReceiver({'interface': interface, 'channel': channel})
+        receiver.start_receiving()
+        generator = None
+        if i % 2:
+            bus = can.Bus(interface=interface, channel=channel)
+            generator = TrafficGenerator(bus, rate=2000.0, seed=i)
+            generator.start()
+        time.sleep(0.05)
+        opened = receiver.bus
+        start = time.perf_counter()
+        receiver.stop_receiving()
+        times.append((time.perf_counter() - start) * 1000)
+        if receiver.thread.is_alive() or opened is None or not getattr(opened, "_is_shutdown", True):
+            raise RuntimeError("bus left open after stop_receiving()")
+        if generator is not None:
+            generator.stop()
+            bus.shutdown()
+    return {"disconnect_ms": float(np.percentile(times, 50)), "disconnect_max_ms": max(times)}
+
+
+# GUI cases
+
+def bench_gui(frames, overwrite, interface, channel):
+    import can
+    from PyQt5.QtWidgets import QApplication
+    from gui.config_window import ConfigWindow
+
+    app = QApplication.instance() or QApplication([])
+    window = ConfigWindow()
+    window.overwrite_checkbox.setChecked(overwrite)
+    window.configure_can({'interface': interface, 'channel': channel})
+
+    handled = [0]
+    latencies = []
+
+    def on_frames(batch):
+        now = time.perf_counter()
+        probes = np.flatnonzero(np.frombuffer(batch.can_ids, dtype=np.uint32) == PROBE_ID).tolist()
+        for i in probes:
+            sent = struct.unpack_from('<d', batch.data, i * MAX_DATA_LENGTH)[0]
+            latencies.append((now - sent) * 1000)
+        handled[0] += len(batch) - len(probes)
+
+    # Connected after handle_frames, so it runs once the table was updated
+    window.frames_received.connect(on_frames)
+    window.start_receiving()
+    time.sleep(0.2)  # let the receive thread open the bus
+
+    bus = can.Bus(interface=interface, channel=channel)
+    generator = TrafficGenerator(bus, rate=None, count=frames, seed=1, id_range=(0x100, 0x17F))
+    with Measurement() as m:
+        generator.start()
+        next_probe = 0.0
+        deadline = time.perf_counter() + 120
+        while handled[0] < generator.frames_sent or generator.is_alive():
+            app.processEvents()
+            now = time.perf_counter()
+            if now >= next_probe:
+                bus.send(can.Message(arbitration_id=PROBE_ID, is_extended_id=False, data=struct.pack('<d', now)))
+                next_probe = now + 0.01
+            if now > deadline:
+                break
+        # Drain the last probes
+        for _ in range(20):
+            app.processEvents()
+    generator.stop()
+    window.stop_receiving()
+    bus.shutdown()
+    window.deleteLater()
+    app.processEvents()
+
+    latencies = latencies or [0.0]
+    return m.result(handled[0],
+                    latency_p50_ms=float(np.percentile(latencies, 50)),
+                    latency_p99_ms=float(np.percentile(latencies, 99)))
+
+
+CASES = {
+    "store_append": lambda args: bench_store_append(200000),
+    "store_append_records": lambda args: bench_store_append_records(2000000),
+    "store_periodic": lambda args: bench_store_periodic(2000000, 100),
+    "frame_objects": lambda args: bench_frame_objects(200000),
+    "frame_batch": lambda args: bench_frame_batch(200000),
+    "capture_writer": lambda args: bench_capture_writer(200000),
+    "import_candump": lambda args: bench_import_candump(200000),
+    "replay_asap": lambda args: bench_replay_asap(100000),
+    "display_filter": lambda args: bench_display_filter(1000000),
+    "bit_stats": lambda args: bench_bit_stats(1000000, 2048),
+    "correlation": lambda args: bench_correlation(1200000, 100),
+    "isotp": lambda args: bench_isotp(1000000),
+    "j1939": lambda args: bench_j1939(1000000, 512),
+    "canopen": lambda args: bench_canopen(1000000, 64),
+    "cycle_monitor": lambda args: bench_cycle_monitor(1000000, 4096),
+    "e2e": lambda args: bench_e2e(1000000, 256),
+    "id_flood": lambda args: bench_id_flood(1000000, 100),
+    "timeline": lambda args: bench_timeline(2000000, 2000, 200),
+    "receiver": lambda args: bench_receiver(50000, args.interface, args.channel),
+    "disconnect": lambda args: bench_disconnect(20, args.interface, args.channel),
+    "gateway": lambda args: bench_gateway(50000, args.channel),
+    "gui_overwrite": lambda args: bench_gui(args.gui_frames, True, args.interface, args.channel),
+    "gui_append": lambda args: bench_gui(args.gui_frames, False, args.interface, args.channel),
+}
+
+
+def run_case(name, args):
+    """Result of one run of a case in a fresh interpreter"""
+    command = [sys.executable, os.path.abspath(__file__), "--run-case", name, "--gui-frames", str(args.gui_frames),
+               "--interface", args.interface, "--channel", args.channel]
+    process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    if process.returncode:
+        raise RuntimeError(f"Case {name} failed:\n{process.stderr}")
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def combine(runs):
+    """One result from several runs of a case"""
+    result = {}
+    for metric in runs[0]:
+        values = [run[metric] for run in runs]
+        if metric not in BEST_OF_RUNS:
+            result[metric] = float(np.median(values))
+        elif metric in HIGHER_IS_BETTER:
+            result[metric] = max(values)
+        else:
+            result[metric] = min(values)
+    return result
+
+
+def compare(name, result, baseline, tolerance):
+    """Return a list of regression messages for one case"""
+    failures = []
+    for metric, value in result.items():
+        if metric not in baseline:
+            continue
+        expected = baseline[metric]
+        allowed = max(tolerance, GUI_TOLERANCE.get(metric, 0.0)) if name in GUI_CASES else tolerance
+        if metric in HIGHER_IS_BETTER:
+            if value < expected * (1 - allowed):
+                failures.append(f"{name}.{metric}: {value:.1f} < {expected:.1f} - {allowed:.0%}")
+        else:
+            limit = expected * (1 + allowed) + ABSOLUTE_SLACK.get(metric, 0.0)
+            if value > limit:
+                failures.append(f"{name}.{metric}: {value:.2f} > {limit:.2f}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CANspy throughput benchmarks")
+    parser.add_argument("--cases", nargs="*", default=list(CASES), choices=list(CASES))
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="allowed relative regression (default 0.3)")
+    parser.add_argument("--gui-frames", type=int, default=1500)
+    parser.add_argument("--interface", default="virtual")
+    parser.add_argument("--channel", default="canspy-bench")
+    parser.add_argument("--repeats", type=int, default=3, help="runs per case (default 3)")
+    parser.add_argument("--run-case", choices=list(CASES), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        print(json.dumps(CASES[args.run_case](args)))
+        return 0
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results = {}
+    failures = []
+    for name in args.cases:
+        result = combine([run_case(name, args) for _ in range(max(args.repeats, 1))])
+        results[name] = result
+        metrics = "  ".join(f"{k}={v:.2f}" for k, v in result.items())
+        print(f"{name:<22} {metrics}")
+        if not args.update_baseline and name in baseline:
+            failures.extend(compare(name, result, baseline[name], args.tolerance))
+
+    if args.update_baseline:
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if failures:
+        print("\nRegressions:")
+        for failure in failures:
+            print(f"  {failure}")
+        return 1
+    print("\nNo regressions.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,197 @@
+"""
+Per-ID bit and byte statistics for reverse engineering.
+
+BitStatistics keeps, for every CAN ID, how often each of the 512 data bits
+toggled between consecutive frames of that ID, how often each byte changed
+or went up by one, and a value histogram of the first HISTOGRAM_BYTES
+bytes. A batch of frames is folded in with a few array operations: frames
+are grouped by ID, XOR-ed with their predecessor, unpacked to bits and
+summed per ID with np.add.reduceat, so the cost per frame does not depend
+on the number of IDs.
+
+From these counters classify() labels each byte:
+
+    CONSTANT   never changed
+    COUNTER    (almost) always one more than in the previous frame, as a
+               byte or in its low nibble (e.g. an alive counter)
+    CHECKSUM   changes (almost) every frame and each of its bits toggles
+               about every second frame, like a CRC or other hash
+"""
+
+import threading
+import numpy as np
+from capture.capture_file import MAX_DATA_LENGTH, FLAG_REMOTE, FLAG_ERROR, FLAG_GAP
+
+HISTOGRAM_BYTES = 8  # bytes with value histograms; 8 KiB per ID
+DATA_BITS = MAX_DATA_LENGTH * 8
+INITIAL_ROWS = 64
+
+# Byte classes returned by classify()
+SIGNAL = 0
+CONSTANT = 1
+COUNTER = 2
+CHECKSUM = 3
+CLASS_NAMES = {SIGNAL: "", CONSTANT: "constant", COUNTER: "counter", CHECKSUM: "checksum"}
+
+MIN_PAIRS = 16  # frame pairs of an ID needed before bytes are classified
+COUNTER_SHARE = 0.9  # share of pairs in which a counter increments
+CHECKSUM_SHARE = 0.9  # share of pairs in which a checksum byte changes
+CHECKSUM_TOGGLE = (0.3, 0.7)  # toggle rate of every bit of a checksum byte
+
+
+class BitStatistics:
+    """Incrementally updated toggle counters and byte histograms per CAN ID.
+
+    update() may run on the receive thread while the GUI reads snapshots;
+    both take a lock, and an update holds it only for one batch.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.row_of_id = {}
+            self.ids = []  # CAN ID of each row, in first-seen order
+            self.allocate(INITIAL_ROWS)
+
+    def allocate(self, rows):
+        """Grow the per-row arrays to `rows` rows, keeping their contents"""
+        old = getattr(self, 'frames', None)
+        kept = 0 if old is None else len(old)
+        arrays = {
+            'frames': np.zeros(rows, dtype=np.int64),
+            'pairs': np.zeros(rows, dtype=np.int64),  # consecutive frame pairs compared
+            'max_length': np.zeros(rows, dtype=np.int64),
+            'last_data': np.zeros((rows, MAX_DATA_LENGTH), dtype=np.uint8),
+            'toggles': np.zeros((rows, DATA_BITS), dtype=np.uint32),  # bit 0 is the MSB of byte 0
+            'changes': np.zeros((rows, MAX_DATA_LENGTH), dtype=np.uint32),
+            'increments': np.zeros((rows, MAX_DATA_LENGTH), dtype=np.uint32),
+            'nibble_increments': np.zeros((rows, MAX_DATA_LENGTH), dtype=np.uint32),
+            'histograms': np.zeros((rows, HISTOGRAM_BYTES, 256), dtype=np.uint32),
+        }
+        for name, array in arrays.items():
+            if kept:
+                array[:kept] = getattr(self, name)
+            setattr(self, name, array)
+
+    def rows_for(self, can_ids):
+        """Row of each CAN ID, adding rows for IDs seen for the first time"""
+        unique_ids, inverse = np.unique(can_ids, return_inverse=True)
+        rows = np.empty(len(unique_ids), dtype=np.int64)
+        for i, can_id in enumerate(unique_ids.tolist()):
+            row = self.row_of_id.get(can_id)
+            if row is None:
+                row = self.row_of_id[can_id] = len(self.ids)
+                self.ids.append(can_id)
+            rows[i] = row
+        if len(self.ids) > len(self.frames):
+            self.allocate(max(len(self.ids), 2 * len(self.frames)))
+        return rows[inverse]
+
+    def update_batch(self, batch):
+        """Fold in a FrameBatch (usable as a CANReceiver subscriber)"""
+        self.update(batch.to_records())
+
+    def update(self, records):
+        """Fold in an array of capture records"""
+        records = records[(records['flags'] & (FLAG_REMOTE | FLAG_ERROR | FLAG_GAP)) == 0]
+        if not len(records):
+            return
+        with self.lock:
+            rows = self.rows_for(records['can_id'])
+            # Group the frames by row, keeping their order within a row, and
+            # only look at the bytes some frame of the batch has
+            order = np.argsort(rows, kind='stable')
+            rows = rows[order]
+            lengths = records['dlc'][order].astype(np.int64)
+            width = max(int(lengths.max()), 1)
+            data = records['data'][order, :width]
+            starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+            group_rows = rows[starts]
+            counts = np.diff(np.r_[starts, len(rows)])
+
+            # Predecessor of every frame: the previous frame of its row, or the
+            # row's last frame from an earlier batch (none for a new ID)
+            previous = np.empty_like(data)
+            previous[1:] = data[:-1]
+            previous[starts] = self.last_data[group_rows, :width]
+            has_previous = np.ones(len(rows), dtype=bool)
+            has_previous[starts] = self.frames[group_rows] > 0
+            compared = has_previous[:, None]
+
+            difference = data - previous  # wraps around, so 0xFF -> 0x00 is +1
+            toggled = np.unpackbits((data ^ previous) * compared, axis=1)
+            self.toggles[group_rows, :width * 8] += np.add.reduceat(toggled, starts, axis=0, dtype=np.uint32)
+            self.changes[group_rows, :width] += np.add.reduceat(
+                (data != previous) & compared, starts, axis=0, dtype=np.uint32)
+            self.increments[group_rows, :width] += np.add.reduceat(
+                (difference == 1) & compared, starts, axis=0, dtype=np.uint32)
+            self.nibble_increments[group_rows, :width] += np.add.reduceat(
+                ((difference & 0x0F) == 1) & compared, starts, axis=0, dtype=np.uint32)
+            self.pairs[group_rows] += np.add.reduceat(has_previous, starts, dtype=np.int64)
+
+            # Value histograms of the first bytes
+            first = min(width, HISTOGRAM_BYTES)
+            cells = (rows[:, None] * HISTOGRAM_BYTES + np.arange(first)) * 256 + data[:, :first]
+            cells, cell_counts = np.unique(cells, return_counts=True)
+            self.histograms.reshape(-1)[cells] += cell_counts.astype(np.uint32)
+
+            self.frames[group_rows] += counts
+            self.max_length[group_rows] = np.maximum(self.max_length[group_rows],
+                                                     np.maximum.reduceat(lengths, starts))
+            # Bytes beyond the batch width are zero in the records, as in last_data
+            self.last_data[group_rows, :width] = data[starts + counts - 1]
+            self.last_data[group_rows, width:] = 0
+
+    def summary(self):
+        """(can_ids, frames, changing bits) of all IDs, in first-seen order"""
+        with self.lock:
+            used = len(self.ids)
+            return (np.array(self.ids, dtype=np.uint32), self.frames[:used].copy(),
+                    np.count_nonzero(self.toggles[:used], axis=1))
+
+    def snapshot(self, can_id):
+        """Counters of one ID as a dict of copies, or None if the ID was not seen"""
+        with self.lock:
+            row = self.row_of_id.get(can_id)
+            if row is None:
+                return None
+            return {
+                'frames': int(self.frames[row]),
+                'pairs': int(self.pairs[row]),
+                'length': int(self.max_length[row]),
+                'toggles': self.toggles[row].copy(),
+                'changes': self.changes[row].copy(),
+                'increments': self.increments[row].copy(),
+                'nibble_increments': self.nibble_increments[row].copy(),
+                'histograms': self.histograms[row].copy(),
+                'classes': classify(self.pairs[row:row + 1], self.toggles[row:row + 1],
+                                    self.changes[row:row + 1], self.increments[row:row + 1],
+                                    self.nibble_increments[row:row + 1])[0],
+            }
+
+    def classify_all(self):
+        """(can_ids, classes) with a byte class per ID and byte, for all IDs"""
+        with self.lock:
+            used = len(self.ids)
+            return np.array(self.ids, dtype=np.uint32), classify(
+                self.pairs[:used], self.toggles[:used], self.changes[:used], self.increments[:used],
+                self.nibble_increments[:used])
+
+
+def classify(pairs, toggles, changes, increments, nibble_increments):
+    """Byte classes (SIGNAL, CONSTANT, COUNTER, CHECKSUM) of shape (ids, MAX_DATA_LENGTH)"""
+    pairs = pairs.astype(np.float64)[:, None]
+    known = pairs >= MIN_PAIRS
+    share = np.divide(1.0, pairs, out=np.zeros_like(pairs), where=pairs > 0)
+    rates = toggles.reshape(len(toggles), MAX_DATA_LENGTH, 8) * share[:, :, None]
+    classes = np.full(changes.shape, SIGNAL, dtype=np.uint8)
+    checksum = ((changes * share >= CHECKSUM_SHARE)
+                & np.all((rates >= CHECKSUM_TOGGLE[0]) & (rates <= CHECKSUM_TOGGLE[1]), axis=2))
+    counter = (increments * share >= COUNTER_SHARE) | (nibble_increments * share >= COUNTER_SHARE)
+    classes[known & checksum] = CHECKSUM
+    classes[known & counter] = COUNTER
+    classes[known & (changes == 0)] = CONSTANT
+    return classes
@@ -0,0 +1,551 @@
+"""
+CANopen (CiA 301) decoding: NMT, SYNC, EMCY, PDO, SDO and heartbeat.
+
+CanOpenDecoder classifies frames through a dispatch table indexed by
+COB-ID: an array holding the kind of every 11-bit ID (NMT, SYNC, EMCY,
+TPDO, RPDO, SDO request/response, heartbeat), one holding its node ID and
+one its PDO number. The table starts out as the predefined connection
+set and is rebuilt when a device description moves a node's PDOs to
+other COB-IDs, so classifying a batch is a NumPy lookup.
+
+PDOs, the bulk of CANopen traffic, are reduced per batch to the latest
+frame of each COB-ID with NumPy, and only that frame is decoded, from
+the PDO mapping of a loaded EDS/DCF file (load_device()). NMT commands,
+EMCY, SDO and heartbeat frames are few and go through a handler per kind
+(the handlers list, indexed by kind), frame by frame, updating the Node
+state: NMT state from heartbeats and boot-ups, emergencies, and SDO
+transfers. Segmented SDO transfers are reassembled per node, checking
+the toggle bit, and reported like expedited ones; block transfers are
+reported as not decoded.
+"""
+
+import configparser
+import re
+import struct
+import threading
+from collections import deque
+import numpy as np
+from capture.capture_file import MAX_DATA_LENGTH, FLAG_EXTENDED, FLAG_REMOTE, FLAG_ERROR, FLAG_GAP
+
+# Kinds in the dispatch table
+NONE = 0
+NMT = 1
+SYNC = 2
+EMCY = 3
+TPDO = 4
+RPDO = 5
+SDO_RESPONSE = 6  # server to client, 0x580 + node
+SDO_REQUEST = 7  # client to server, 0x600 + node
+HEARTBEAT = 8
+KIND_NAMES = ["", "NMT", "SYNC", "EMCY", "TPDO", "RPDO", "SDO response", "SDO request", "Heartbeat"]
+
+NMT_STATES = {0: "boot-up", 4: "stopped", 5: "operational", 127: "pre-operational"}
+NMT_COMMANDS = {1: "start", 2: "stop", 0x80: "enter pre-operational", 0x81: "reset node",
+                0x82: "reset communication"}
+
+# Status of a reported event
+OK = "ok"
+ABORTED = "aborted"
+TIMEOUT = "timeout"
+TOGGLE_ERROR = "toggle error"
+INTERRUPTED = "interrupted"  # a new transfer started in the middle of one
+NOT_DECODED = "not decoded"  # SDO block transfer
+
+SDO_TIMEOUT = 1.0  # seconds between SDO frames before a transfer is abandoned
+HEARTBEAT_TIMEOUT = 3.0  # seconds without a heartbeat before a node is shown as silent
+MAX_SDO_LENGTH = 1 << 16
+MAX_EVENTS = 10000
+
+SDO_ABORT_CODES = {
+    0x05030000: "toggle bit not alternated", 0x05040000: "SDO protocol timed out",
+    0x05040001: "invalid command specifier", 0x06010000: "unsupported access",
+    0x06010001: "read of write-only object", 0x06010002: "write to read-only object",
+    0x06020000: "object does not exist", 0x06040041: "object cannot be mapped to PDO",
+    0x06060000: "hardware error", 0x06070010: "data type does not match",
+    0x06090011: "sub-index does not exist", 0x06090030: "value range exceeded",
+    0x08000000: "general error", 0x08000020: "data cannot be stored",
+    0x08000022: "data cannot be stored in the present device state",
+}
+
+EMCY_CLASSES = {
+    0x00: "error reset", 0x10: "generic", 0x20: "current", 0x21: "current, input side",
+    0x22: "current, inside", 0x23: "current, output side", 0x30: "voltage", 0x31: "mains voltage",
+    0x32: "voltage inside", 0x33: "output voltage", 0x40: "temperature", 0x41: "ambient temperature",
+    0x42: "device temperature", 0x50: "device hardware", 0x60: "device software", 0x61: "internal software",
+    0x62: "user software", 0x63: "data set", 0x70: "additional modules", 0x80: "monitoring",
+    0x81: "communication", 0x82: "protocol error", 0x90: "external error", 0xF0: "additional functions",
+    0xFF: "device specific",
+}
+
+# EDS data types: (signed, float) by DataType code; other codes are decoded unsigned
+SIGNED_TYPES = {0x02, 0x03, 0x04, 0x10, 0x12, 0x13, 0x14, 0x15}
+FLOAT_TYPES = {0x08: "<f", 0x11: "<d"}
+OBJECT_SECTION = re.compile(r"^([0-9A-F]{4})(?:SUB([0-9A-F]{1,2}))?$")  # [1A00], [1A00sub1] (upper-cased)
+
+
+def build_dispatch(pdo_ids=None):
+    """
+    Kind, node and PDO number of every 11-bit COB-ID.
+
+    :param pdo_ids: {COB-ID: (kind, node, PDO number)} of PDOs configured
+        away from the predefined connection set; their default COB-IDs are
+        released.
+    :return: (kinds, nodes, pdo numbers) uint8 arrays of 2048 entries.
+    """
+    kinds = np.zeros(2048, dtype=np.uint8)
+    nodes = np.zeros(2048, dtype=np.uint8)
+    numbers = np.zeros(2048, dtype=np.uint8)
+    node_ids = np.arange(1, 128)
+    kinds[0x000] = NMT
+    kinds[0x080] = SYNC
+    for base, kind, number in ((0x080, EMCY, 0), (0x580, SDO_RESPONSE, 0), (0x600, SDO_REQUEST, 0),
+                               (0x700, HEARTBEAT, 0), (0x180, TPDO, 1), (0x200, RPDO, 1), (0x280, TPDO, 2),
+                               (0x300, RPDO, 2), (0x380, TPDO, 3), (0x400, RPDO, 3), (0x480, TPDO, 4),
+                               (0x500, RPDO, 4)):
+        kinds[base + node_ids] = kind
+        nodes[base + node_ids] = node_ids
+        numbers[base + node_ids] = number
+    for cob_id, (kind, node, number) in (pdo_ids or {}).items():
+        if number <= 4:
+            default = (0x180 if kind == TPDO else 0x200) + 0x100 * (number - 1) + node
+            if kinds[default] == kind and nodes[default] == node:
+                kinds[default] = NONE
+        kinds[cob_id] = kind
+        nodes[cob_id] = node
+        numbers[cob_id] = min(number, 255)
+    return kinds, nodes, numbers
+
+
+def parse_value(text, node_id):
+    """Integer value of an EDS entry, with $NODEID substituted"""
+    text = text.strip().upper().replace("$NODEID", str(node_id or 0))
+    terms = [term.strip() for term in text.split("+") if term.strip()]
+    return sum(int(term, 16) if term.startswith("0X") else int(term, 10) for term in terms)
+
+
+def load_device(path, node_id=None):
+    """
+    Object names and PDO mappings of a node from an EDS or DCF file.
+
+    :param node_id: Node ID; defaults to the NodeID of a DCF's
+        [DeviceComissioning] section.
+    :return: Device
+    :raises ValueError: The file cannot be parsed or names no node ID.
+    """
+    parser = configparser.ConfigParser(interpolation=None, strict=False, inline_comment_prefixes=(";",))
+    try:
+        with open(path, encoding="latin-1") as f:
+            parser.read_file(f)
+    except configparser.Error as e:
+        raise ValueError(f"Cannot parse {path}: {e}") from None
+    sections = {name.upper(): parser[name] for name in parser.sections()}
+    if node_id is None:
+        commissioning = sections.get("DEVICECOMISSIONING") or sections.get("DEVICECOMMISSIONING")
+        if commissioning is None or "nodeid" not in commissioning:
+            raise ValueError(f"{path} does not name a node ID")
+        node_id = parse_value(commissioning["nodeid"], 0)
+    if not 1 <= node_id <= 127:
+        raise ValueError(f"Invalid node ID {node_id}")
+
+    def entry(index, sub=None):
+        return sections.get(f"{index:04X}" if sub is None else f"{index:04X}SUB{sub:X}")
+
+    def value(section):
+        text = section.get("parametervalue") or section.get("defaultvalue")
+        return parse_value(text, node_id) if text else None
+
+    device = Device(node_id, sections.get("DEVICEINFO", {}).get("productname", path))
+    for kind, communication, mapping in ((TPDO, 0x1800, 0x1A00), (RPDO, 0x1400, 0x1600)):
+        for number in range(1, 513):
+            cob_section = entry(communication + number - 1, 1)
+            count_section = entry(mapping + number - 1, 0)
+            if cob_section is None or count_section is None:
+                continue
+            cob_id = value(cob_section)
+            if cob_id is None or cob_id & 0xA0000000:
+                continue  # invalid or 29-bit PDO
+            cob_id &= 0x7FF
+            signals = []
+            offset = 0
+            for sub in range(1, (value(count_section) or 0) + 1):
+                mapped = entry(mapping + number - 1, sub)
+                mapped = value(mapped) if mapped is not None else None
+                if not mapped:
+                    continue
+                index, subindex, bits = mapped >> 16, (mapped >> 8) & 0xFF, mapped & 0xFF
+                target = entry(index, subindex) or entry(index)
+                data_type = parse_value(target["datatype"], 0) if target is not None and "datatype" in target else 7
+                if index >= 0x1000:  # indices below 0x1000 are dummy mappings
+                    signals.append((device.object_name(sections, index, subindex), offset, bits, data_type))
+                offset += bits
+            device.pdos[cob_id] = (kind, number, signals)
+    for key in sections:
+        match = OBJECT_SECTION.match(key)
+        if match:
+            index, subindex = int(match.group(1), 16), int(match.group(2) or "0", 16)
+            device.names[index, subindex] = device.object_name(sections, index, subindex)
+    return device
+
+
+class Device:
+    """Object names and PDO mappings of one node, from its EDS/DCF"""
+
+    def __init__(self, node_id, product):
+        self.node_id = node_id
+        self.product = product
+        self.pdos = {}  # COB-ID -> (TPDO/RPDO, PDO number, [(name, bit offset, bits, data type)])
+        self.names = {}  # (index, subindex) -> object name
+
+    @staticmethod
+    def object_name(sections, index, subindex):
+        main = sections.get(f"{index:04X}")
+        sub = sections.get(f"{index:04X}SUB{subindex:X}")
+        name = main.get("parametername", f"{index:04X}") if main is not None else f"{index:04X}"
+        if sub is not None and "parametername" in sub:
+            return f"{name}.{sub['parametername']}"
+        return name if subindex == 0 else f"{name}.{subindex}"
+
+    def decode(self, cob_id, data):
+        """[(name, value)] of the signals mapped into a PDO"""
+        mapping = self.pdos.get(cob_id)
+        if mapping is None:
+            return None
+        raw = int.from_bytes(data, "little")
+        values = []
+        for name, offset, bits, data_type in mapping[2]:
+            if offset + bits > len(data) * 8:
+                break  # PDO shorter than its mapping
+            value = (raw >> offset) & ((1 << bits) - 1)
+            if data_type in FLOAT_TYPES and bits in (32, 64):
+                value = struct.unpack(FLOAT_TYPES[data_type], value.to_bytes(bits // 8, "little"))[0]
+            elif data_type in SIGNED_TYPES and value >> (bits - 1):
+                value -= 1 << bits
+            values.append((name, value))
+        return values
+
+
+class Node:
+    """State of one CANopen node"""
+
+    __slots__ = ('node_id', 'state', 'last_heartbeat', 'heartbeats', 'boot_ups', 'emergencies', 'last_emergency',
+                 'pdo_frames', 'sdo_transfers', 'sdo_active', 'sdo_upload', 'sdo_index', 'sdo_subindex',
+                 'sdo_size', 'sdo_buffer', 'sdo_toggle', 'sdo_done', 'sdo_started', 'sdo_last', 'sdo_frames')
+
+    def __init__(self, node_id):
+        self.node_id = node_id
+        self.state = None  # NMT state from the last heartbeat
+        self.last_heartbeat = None
+        self.heartbeats = 0
+        self.boot_ups = 0
+        self.emergencies = 0
+        self.last_emergency = ""
+        self.pdo_frames = 0
+        self.sdo_transfers = 0
+        self.sdo_active = False
+        self.sdo_upload = False
+        self.sdo_index = 0
+        self.sdo_subindex = 0
+        self.sdo_size = None
+        self.sdo_buffer = bytearray()
+        self.sdo_toggle = 0
+        self.sdo_done = False  # the last segment (or expedited data) has been sent
+        self.sdo_started = 0.0
+        self.sdo_last = 0.0
+        self.sdo_frames = 0
+
+
+def describe_emergency(data):
+    """Text of an EMCY payload, e.g. "0x3210 voltage (register 0x04)" """
+    if len(data) < 3:
+        return "malformed"
+    code = data[0] | (data[1] << 8)
+    kind = EMCY_CLASSES.get(code >> 8) or EMCY_CLASSES.get((code >> 12) << 4, "")
+    return f"0x{code:04X} {kind} (register 0x{data[2]:02X})"
+
+
+class CanOpenDecoder:
+    """
+    Tracks CANopen nodes from received frames.
+
+    Usable as a CANReceiver subscriber through update_batch(); readers take
+    copies under the lock. Events (SDO transfers, emergencies, NMT
+    commands, boot-ups) are reported as (serial, start, end, node, kind,
+    object, size, payload, status) tuples.
+    """
+
+    def __init__(self, max_events=MAX_EVENTS, sdo_timeout=SDO_TIMEOUT):
+        self.lock = threading.Lock()
+        self.max_events = max_events
+        self.sdo_timeout = sdo_timeout
+        self.devices = {}  # node ID -> Device
+        # Handler of each kind in the dispatch table
+        self.handlers = [None, self.handle_nmt, None, self.handle_emergency, None, None,
+                         self.handle_sdo_response, self.handle_sdo_request, self.handle_heartbeat]
+        self.rebuild_dispatch()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.nodes = {}
+            self.pdos = {}  # COB-ID -> [frames, last time, last data, decoded values or None]
+            self.events = deque(maxlen=self.max_events)
+            self.event_count = 0
+            self.sync_count = 0
+            self.last_sync = None
+            self.frames = 0
+            self.last_time = 0.0
+
+    def rebuild_dispatch(self):
+        pdo_ids = {}
+        for device in self.devices.values():
+            for cob_id, (kind, number, signals) in device.pdos.items():
+                pdo_ids[cob_id] = (kind, device.node_id, number)
+        self.kinds, self.node_ids, self.pdo_numbers = build_dispatch(pdo_ids)
+
+    def add_device(self, device):
+        """Decode the PDOs of a node with the mapping of its device description"""
+        with self.lock:
+            self.devices[device.node_id] = device
+            self.rebuild_dispatch()
+            self.pdos = {}
+
+    def update_batch(self, batch):
+        """Fold in a FrameBatch (usable as a CANReceiver subscriber)"""
+        if not len(batch):
+            return
+        can_ids = np.frombuffer(batch.can_ids, dtype=np.uint32)
+        flags = np.frombuffer(batch.flags, dtype=np.uint8)
+        self.process(can_ids, flags, np.frombuffer(batch.timestamps, dtype=np.float64),
+                     np.frombuffer(batch.dlcs, dtype=np.uint8), batch.data)
+
+    def update(self, records):
+        """Fold in an array of capture records"""
+        if len(records):
+            self.process(records['can_id'], records['flags'], records['timestamp'], records['dlc'],
+                         records['data'].tobytes())
+
+    def process(self, can_ids, flags, timestamps, dlcs, data):
+        """Dispatch frames given as columns; `data` holds MAX_DATA_LENGTH bytes per frame"""
+        plain = (flags & (FLAG_EXTENDED | FLAG_REMOTE | FLAG_ERROR | FLAG_GAP)) == 0
+        kinds = np.where(plain, self.kinds[can_ids & 0x7FF], NONE)
+        pdo = np.flatnonzero((kinds == TPDO) | (kinds == RPDO))
+        syncs = np.flatnonzero(kinds == SYNC)
+        other = np.flatnonzero((kinds != NONE) & (kinds != TPDO) & (kinds != RPDO) & (kinds != SYNC))
+        with self.lock:
+            self.frames += len(can_ids)
+            self.last_time = float(timestamps[-1])
+            if len(syncs):
+                self.sync_count += len(syncs)
+                self.last_sync = float(timestamps[syncs[-1]])
+            if len(pdo):
+                self.fold_pdos(can_ids[pdo], timestamps, dlcs, data, pdo)
+            handlers = self.handlers
+            node_ids = self.node_ids
+            for index, can_id, kind in zip(other.tolist(), can_ids[other].tolist(), kinds[other].tolist()):
+                start = index * MAX_DATA_LENGTH
+                handlers[kind](int(node_ids[can_id]), float(timestamps[index]),
+                               bytes(data[start:start + int(dlcs[index])]))
+            self.expire(self.last_time)
+
+    def fold_pdos(self, cob_ids, timestamps, dlcs, data, positions):
+        """Count the PDO frames of a batch and decode the latest one of each COB-ID"""
+        unique_ids, reversed_index, counts = np.unique(cob_ids[::-1], return_index=True, return_counts=True)
+        last = positions[len(positions) - 1 - reversed_index]
+        for cob_id, index, count in zip(unique_ids.tolist(), last.tolist(), counts.tolist()):
+            start = index * MAX_DATA_LENGTH
+            payload = bytes(data[start:start + int(dlcs[index])])
+            node_id = int(self.node_ids[cob_id])
+            device = self.devices.get(node_id)
+            values = device.decode(cob_id, payload) if device is not None else None
+            pdo = self.pdos.get(cob_id)
+            if pdo is None:
+                self.pdos[cob_id] = [count, float(timestamps[index]), payload, values]
+            else:
+                pdo[0] += count
+                pdo[1] = float(timestamps[index])
+                pdo[2] = payload
+                pdo[3] = values
+            self.node(node_id).pdo_frames += count
+
+    def node(self, node_id):
+        node = self.nodes.get(node_id)
+        if node is None:
+            node = self.nodes[node_id] = Node(node_id)
+        return node
+
+    def report(self, start, end, node_id, kind, what, payload, status, size=None):
+        self.events.append((self.event_count, start, end, node_id, kind, what,
+                            len(payload) if size is None else size, payload, status))
+        self.event_count += 1
+
+    def object_text(self, node_id, index, subindex):
+        device = self.devices.get(node_id)
+        name = device.names.get((index, subindex)) if device is not None else None
+        text = f"{index:04X}sub{subindex:X}"
+        return f"{text} {name}" if name else text
+
+    def handle_nmt(self, node_id, timestamp, data):
+        if len(data) < 2:
+            return
+        command = NMT_COMMANDS.get(data[0], f"command 0x{data[0]:02X}")
+        self.report(timestamp, timestamp, data[1], "NMT", command + (" (all nodes)" if data[1] == 0 else ""),
+                    data, OK)
+
+    def handle_heartbeat(self, node_id, timestamp, data):
+        if not data:
+            return
+        node = self.node(node_id)
+        state = data[0] & 0x7F  # the toggle bit is set in node guarding responses
+        if state == 0:
+            node.boot_ups += 1
+            self.report(timestamp, timestamp, node_id, "Boot-up", "", data, OK)
+            state = 127  # a node enters pre-operational after booting
+        node.state = state
+        node.last_heartbeat = timestamp
+        node.heartbeats += 1
+
+    def handle_emergency(self, node_id, timestamp, data):
+        node = self.node(node_id)
+        node.emergencies += 1
+        node.last_emergency = describe_emergency(data)
+        self.report(timestamp, timestamp, node_id, "EMCY", node.last_emergency, data,
+                    OK if data[:2] == b"\x00\x00" else "error")
+
+    def start_sdo(self, node, timestamp, data, upload):
+        if node.sdo_active:
+            self.finish_sdo(node, INTERRUPTED, timestamp)
+        node.sdo_active = True
+        node.sdo_upload = upload
+        node.sdo_index = data[1] | (data[2] << 8)
+        node.sdo_subindex = data[3]
+        node.sdo_size = None
+        node.sdo_buffer.clear()
+        node.sdo_toggle = 0
+        node.sdo_done = False
+        node.sdo_started = timestamp
+        node.sdo_frames = 0
+
+    def expedited(self, node, data):
+        """Data of an expedited initiate frame, or None for a segmented transfer (size noted)"""
+        command = data[0]
+        if command & 0x02:
+            unused = (command >> 2) & 0x03 if command & 0x01 else 0
+            return data[4:8 - unused]
+        if command & 0x01:
+            node.sdo_size = int.from_bytes(data[4:8], "little")
+        return None
+
+    def segment(self, node, timestamp, data):
+        """Append a segment; False on a toggle error"""
+        command = data[0]
+        if (command >> 4) & 1 != node.sdo_toggle:
+            self.finish_sdo(node, TOGGLE_ERROR, timestamp)
+            return False
+        node.sdo_toggle ^= 1
+        unused = (command >> 1) & 0x07
+        if len(node.sdo_buffer) < MAX_SDO_LENGTH:
+            node.sdo_buffer += data[1:8 - unused]
+        node.sdo_done = bool(command & 0x01)
+        return True
+
+    def handle_sdo_request(self, node_id, timestamp, data):
+        if len(data) < 8:
+            return
+        node = self.node(node_id)
+        specifier = data[0] >> 5
+        if specifier == 1:  # initiate download (write)
+            self.start_sdo(node, timestamp, data, upload=False)
+            payload = self.expedited(node, data)
+            if payload is not None:
+                node.sdo_buffer += payload
+                node.sdo_done = True
+        elif specifier == 2:  # initiate upload (read)
+            self.start_sdo(node, timestamp, data, upload=True)
+        elif specifier == 0 and node.sdo_active and not node.sdo_upload:  # download segment
+            if not self.segment(node, timestamp, data):
+                return
+        elif specifier == 4:
+            self.abort_sdo(node, timestamp, data)
+            return
+        elif specifier in (5, 6):  # block upload/download
+            self.start_sdo(node, timestamp, data, upload=specifier == 5)
+            self.finish_sdo(node, NOT_DECODED, timestamp)
+            return
+        if node.sdo_active:
+            node.sdo_last = timestamp
+            node.sdo_frames += 1
+
+    def handle_sdo_response(self, node_id, timestamp, data):
+        if len(data) < 8:
+            return
+        node = self.node(node_id)
+        if not node.sdo_active:
+            return
+        node.sdo_last = timestamp
+        node.sdo_frames += 1
+        specifier = data[0] >> 5
+        if specifier == 4:
+            self.abort_sdo(node, timestamp, data)
+        elif node.sdo_upload:
+            if specifier == 2:  # initiate upload response
+                payload = self.expedited(node, data)
+                if payload is not None:
+                    node.sdo_buffer += payload
+                    self.finish_sdo(node, OK, timestamp)
+            elif specifier == 0 and self.segment(node, timestamp, data) and node.sdo_done:
+                self.finish_sdo(node, OK, timestamp)
+        elif specifier in (1, 3) and node.sdo_done:  # the server confirmed the last data
+            self.finish_sdo(node, OK, timestamp)
+
+    def abort_sdo(self, node, timestamp, data):
+        if not node.sdo_active:
+            return
+        code = int.from_bytes(data[4:8], "little")
+        node.sdo_buffer[:] = data[4:8]
+        self.finish_sdo(node, f"{ABORTED}: {SDO_ABORT_CODES.get(code, f'0x{code:08X}')}", timestamp)
+
+    def finish_sdo(self, node, status, timestamp):
+        node.sdo_active = False
+        node.sdo_transfers += 1
+        kind = "SDO read" if node.sdo_upload else "SDO write"
+        payload = bytes(node.sdo_buffer)
+        if status == OK and node.sdo_size is not None and node.sdo_size != len(payload):
+            status = f"size {len(payload)}, announced {node.sdo_size}"
+        self.report(node.sdo_started, timestamp, node.node_id, kind,
+                    self.object_text(node.node_id, node.sdo_index, node.sdo_subindex), payload, status)
+
+    def expire(self, now):
+        """Abandon SDO transfers whose next frame is overdue"""
+        for node in self.nodes.values():
+            if node.sdo_active and now - node.sdo_last > self.sdo_timeout:
+                self.finish_sdo(node, TIMEOUT, node.sdo_last)
+
+    def node_rows(self):
+        """(node ID, state text, last heartbeat, heartbeats, boot-ups, emergencies, last emergency,
+        PDO frames, SDO transfers, silent) of every node, by node ID"""
+        with self.lock:
+            rows = []
+            for node_id in sorted(self.nodes):
+                node = self.nodes[node_id]
+                silent = node.last_heartbeat is not None and self.last_time - node.last_heartbeat > HEARTBEAT_TIMEOUT
+                state = NMT_STATES.get(node.state, "" if node.state is None else f"state {node.state}")
+                rows.append((node_id, state, node.last_heartbeat, node.heartbeats, node.boot_ups, node.emergencies,
+                             node.last_emergency, node.pdo_frames, node.sdo_transfers, silent))
+            return rows
+
+    def pdo_rows(self):
+        """(COB-ID, node, kind, PDO number, frames, last time, data, values) of every PDO seen"""
+        with self.lock:
+            return [(cob_id, int(self.node_ids[cob_id]), KIND_NAMES[self.kinds[cob_id]],
+                     int(self.pdo_numbers[cob_id])) + tuple(pdo) for cob_id, pdo in sorted(self.pdos.items())]
+
+    def events_since(self, serial):
+        """Events with a serial number >= `serial`"""
+        with self.lock:
+            skip = max(serial - (self.event_count - len(self.events)), 0)
+            return [self.events[i] for i in range(skip, len(self.events))]
+
+    def summary(self):
+        with self.lock:
+            return {'frames': self.frames, 'nodes': len(self.nodes), 'pdos': len(self.pdos),
+                    'syncs': self.sync_count, 'events': self.event_count}
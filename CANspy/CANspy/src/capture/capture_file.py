@@ -0,0 +1,371 @@
+"""
+Native CANspy capture file format.
+
+A capture file is a fixed-size header followed by an array of fixed-size
+frame records and, once the capture is closed, an index trailer:
+
+    header   HEADER_SIZE bytes (see HEADER_DTYPE)
+    records  record_count * RECORD_DTYPE
+    trailer  TRAILER_DTYPE, then the ID table, the per-ID record positions
+             and a sparse time index (every TIME_INDEX_STEP-th timestamp)
+
+Because every record has the same size, a file is opened with np.memmap
+and individual frames are read on demand, so even multi-gigabyte captures
+open instantly. A file whose writer never closed (crash, power loss) has
+no trailer; the reader then derives the record count from the file size.
+
+A record's dlc is the length of its data. A remote frame has no data but
+requests a length: its record keeps that as dlc, with zeroed data bytes.
+"""
+
+import os
+from array import array
+import numpy as np
+
+CAPTURE_EXTENSION = ".canspy"
+CAPTURE_MAGIC = b"CANSPYCP"
+TRAILER_MAGIC = b"CSPYIDX1"
+CAPTURE_VERSION = 1
+HEADER_SIZE = 64
+MAX_DATA_LENGTH = 64
+TIME_INDEX_STEP = 1024
+
+# Record flags
+FLAG_EXTENDED = 0x01
+FLAG_FD = 0x02
+FLAG_REMOTE = 0x04
+FLAG_ERROR = 0x08
+FLAG_BRS = 0x10
+FLAG_ESI = 0x20
+FLAG_GAP = 0x40  # marker, not a frame: reception was interrupted (see gap_record)
+
+# CAN ID of gap markers; above any 29-bit ID, so markers never mix with frames
+GAP_ID = 0xFFFFFFFF
+
+RECORD_DTYPE = np.dtype([
+    ('timestamp', '<f8'),
+    ('can_id', '<u4'),
+    ('flags', 'u1'),
+    ('dlc', 'u1'),
+    ('channel', 'u1'),
+    ('reserved', 'u1'),
+    ('data', 'u1', (MAX_DATA_LENGTH,)),
+])
+
+HEADER_DTYPE = np.dtype([
+    ('magic', 'S8'),
+    ('version', '<u2'),
+    ('header_size', '<u2'),
+    ('record_size', '<u2'),
+    ('reserved', '<u2'),
+    ('record_count', '<u8'),
+    ('trailer_offset', '<u8'),
+    ('start_time', '<f8'),
+    ('padding', 'u1', (HEADER_SIZE - 40,)),
+])
+
+TRAILER_DTYPE = np.dtype([
+    ('magic', 'S8'),
+    ('id_count', '<u8'),
+    ('time_step', '<u8'),
+    ('time_count', '<u8'),
+])
+
+# One entry per distinct CAN ID, sorted by ID; 'offset' points into the
+# positions array where the record indices of this ID start.
+ID_INDEX_DTYPE = np.dtype([
+    ('can_id', '<u4'),
+    ('reserved', '<u4'),
+    ('count', '<u8'),
+    ('offset', '<u8'),
+])
+
+
+def message_flags(msg):
+    """Pack the boolean attributes of a can.Message into record flags"""
+    flags = 0
+    if msg.is_extended_id:
+        flags |= FLAG_EXTENDED
+    if getattr(msg, "is_fd", False):
+        flags |= FLAG_FD
+    if msg.is_remote_frame:
+        flags |= FLAG_REMOTE
+    if msg.is_error_frame:
+        flags |= FLAG_ERROR
+    if getattr(msg, "bitrate_switch", False):
+        flags |= FLAG_BRS
+    if getattr(msg, "error_state_indicator", False):
+        flags |= FLAG_ESI
+    return flags
+
+
+def message_data(msg):
+    """Record data of a can.Message; a remote frame gets zero bytes up to its DLC"""
+    return bytes(msg.dlc) if msg.is_remote_frame else msg.data
+
+
+def record_to_message(record):
+    """Build a can.Message from a capture record"""
+    import can
+    flags = int(record['flags'])
+    length = int(record['dlc'])
+    data = b'' if flags & FLAG_REMOTE else record['data'][:length].tobytes()
+    return can.Message(
+        timestamp=float(record['timestamp']),
+        arbitration_id=int(record['can_id']),
+        is_extended_id=bool(flags & FLAG_EXTENDED),
+        is_remote_frame=bool(flags & FLAG_REMOTE),
+        is_error_frame=bool(flags & FLAG_ERROR),
+        is_fd=bool(flags & FLAG_FD),
+        bitrate_switch=bool(flags & FLAG_BRS),
+        error_state_indicator=bool(flags & FLAG_ESI),
+        dlc=length,
+        data=data,
+        channel=int(record['channel']),
+    )
+
+
+class CaptureWriter:
+    """Stream frames into a capture file, writing the index on close"""
+
+    def __init__(self, path, buffer_size=4096):
+        self.path = path
+        self.file = open(path, "wb")
+        self.buffer = np.zeros(buffer_size, dtype=RECORD_DTYPE)
+        self.buffered = 0
+        self.record_count = 0
+        self.start_time = 0.0
+        # Kept in memory to build the trailer without re-reading the file
+        self.can_ids = array('I')
+        self.time_index = array('d')
+        self._write_header(0, 0)
+
+    def _write_header(self, record_count, trailer_offset):
+        header = np.zeros(1, dtype=HEADER_DTYPE)
+        header['magic'] = CAPTURE_MAGIC
+        header['version'] = CAPTURE_VERSION
+        header['header_size'] = HEADER_SIZE
+        header['record_size'] = RECORD_DTYPE.itemsize
+        header['record_count'] = record_count
+        header['trailer_offset'] = trailer_offset
+        header['start_time'] = self.start_time
+        self.file.seek(0)
+        self.file.write(header.tobytes())
+
+    def write(self, timestamp, can_id, flags, data, channel=0):
+        """Append one frame"""
+        if self.record_count == 0:
+            self.start_time = timestamp
+        if self.record_count % TIME_INDEX_STEP == 0:
+            self.time_index.append(timestamp)
+        record = self.buffer[self.buffered]
+        length = len(data)
+        record['timestamp'] = timestamp
+        record['can_id'] = can_id
+        record['flags'] = flags
+        record['dlc'] = length
+        record['channel'] = channel
+        record['data'][:length] = np.frombuffer(bytes(data), dtype=np.uint8)
+        record['data'][length:] = 0
+        self.can_ids.append(can_id)
+        self.record_count += 1
+        self.buffered += 1
+        if self.buffered == len(self.buffer):
+            self.flush()
+
+    def write_message(self, msg, channel=0):
+        """Append a can.Message"""
+        self.write(float(msg.timestamp), msg.arbitration_id, message_flags(msg), message_data(msg), channel)
+
+    def write_records(self, records):
+        """Append an array of RECORD_DTYPE records in one go"""
+        if len(records) == 0:
+            return
+        self.flush()
+        timestamps = records['timestamp']
+        if self.record_count == 0:
+            self.start_time = float(timestamps[0])
+        # Timestamps of records whose global index is a multiple of the step
+        first = (-self.record_count) % TIME_INDEX_STEP
+        self.time_index.extend(timestamps[first::TIME_INDEX_STEP].tolist())
+        self.can_ids.frombytes(records['can_id'].astype('<u4').tobytes())
+        self.file.write(np.ascontiguousarray(records, dtype=RECORD_DTYPE).tobytes())
+        self.record_count += len(records)
+
+    def flush(self):
+        if self.buffered:
+            self.file.write(self.buffer[:self.buffered].tobytes())
+            self.buffered = 0
+        self.file.flush()
+
+    def close(self):
+        """Write the index trailer and finalize the header"""
+        if self.file is None:
+            return
+        self.flush()
+        trailer_offset = HEADER_SIZE + self.record_count * RECORD_DTYPE.itemsize
+        can_ids = np.frombuffer(self.can_ids, dtype=np.uint32)
+        positions = np.argsort(can_ids, kind='stable').astype('<u8')
+        unique_ids, offsets, counts = np.unique(can_ids[positions], return_index=True, return_counts=True)
+        id_index = np.zeros(len(unique_ids), dtype=ID_INDEX_DTYPE)
+        id_index['can_id'] = unique_ids
+        id_index['count'] = counts
+        id_index['offset'] = offsets
+        time_index = np.frombuffer(self.time_index, dtype=np.float64)
+
+        trailer = np.zeros(1, dtype=TRAILER_DTYPE)
+        trailer['magic'] = TRAILER_MAGIC
+        trailer['id_count'] = len(id_index)
+        trailer['time_step'] = TIME_INDEX_STEP
+        trailer['time_count'] = len(time_index)
+
+        self.file.seek(trailer_offset)
+        self.file.write(trailer.tobytes())
+        self.file.write(id_index.tobytes())
+        self.file.write(positions.tobytes())
+        self.file.write(time_index.astype('<f8').tobytes())
+        self.file.truncate()
+        self._write_header(self.record_count, trailer_offset)
+        self.file.close()
+        self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class CaptureReader:
+    """Random access to a capture file through a memory map"""
+
+    def __init__(self, path):
+        self.path = path
+        file_size = os.path.getsize(path)
+        if file_size < HEADER_SIZE:
+            raise ValueError(f"{path} is not a CANspy capture file")
+        header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)[0]
+        if header['magic'] != CAPTURE_MAGIC:
+            raise ValueError(f"{path} is not a CANspy capture file")
+        if header['record_size'] != RECORD_DTYPE.itemsize:
+            raise ValueError(f"Unsupported record size {header['record_size']} in {path}")
+        self.start_time = float(header['start_time'])
+
+        trailer_offset = int(header['trailer_offset'])
+        if trailer_offset:
+            count = int(header['record_count'])
+        else:
+            # Unfinished capture: trust the file size, ignore a partial record
+            count = (file_size - HEADER_SIZE) // RECORD_DTYPE.itemsize
+        self.records = self._map(RECORD_DTYPE, HEADER_SIZE, count)
+
+        self.id_index = None
+        self.positions = None
+        self.time_index = None
+        self.time_step = TIME_INDEX_STEP
+        if trailer_offset:
+            self._load_trailer(trailer_offset, count)
+
+    def _map(self, dtype, offset, count):
+        if count == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(self.path, dtype=dtype, mode='r', offset=offset, shape=(count,))
+
+    def _load_trailer(self, offset, record_count):
+        trailer = np.fromfile(self.path, dtype=TRAILER_DTYPE, count=1, offset=offset)
+        if len(trailer) == 0 or trailer[0]['magic'] != TRAILER_MAGIC:
+            return
+        trailer = trailer[0]
+        offset += TRAILER_DTYPE.itemsize
+        id_count = int(trailer['id_count'])
+        self.id_index = np.array(self._map(ID_INDEX_DTYPE, offset, id_count))
+        offset += id_count * ID_INDEX_DTYPE.itemsize
+        self.positions = self._map(np.dtype('<u8'), offset, record_count)
+        offset += record_count * 8
+        self.time_step = int(trailer['time_step'])
+        self.time_index = np.array(self._map(np.dtype('<f8'), offset, int(trailer['time_count'])))
+
+    def _build_index(self):
+        """Build the indexes of an unfinished capture (reads the whole file once)"""
+        can_ids = np.asarray(self.records['can_id'])
+        positions = np.argsort(can_ids, kind='stable').astype('<u8')
+        unique_ids, offsets, counts = np.unique(can_ids[positions], return_index=True, return_counts=True)
+        id_index = np.zeros(len(unique_ids), dtype=ID_INDEX_DTYPE)
+        id_index['can_id'] = unique_ids
+        id_index['count'] = counts
+        id_index['offset'] = offsets
+        self.id_index = id_index
+        self.positions = positions
+        self.time_index = np.ascontiguousarray(self.records['timestamp'][::self.time_step])
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, index):
+        return self.records[index]
+
+    def read(self, start=0, stop=None):
+        """Copy of the records in [start, stop)"""
+        return np.array(self.records[start:stop])
+
+    def ids(self):
+        """Sorted array of the distinct CAN IDs in the capture"""
+        if self.id_index is None:
+            self._build_index()
+        return self.id_index['can_id']
+
+    def indices_for_id(self, can_id):
+        """Record indices of all frames with the given CAN ID, in capture order"""
+        if self.id_index is None:
+            self._build_index()
+        i = np.searchsorted(self.id_index['can_id'], can_id)
+        if i == len(self.id_index) or self.id_index['can_id'][i] != can_id:
+            return np.zeros(0, dtype='<u8')
+        entry = self.id_index[i]
+        start = int(entry['offset'])
+        return self.positions[start:start + int(entry['count'])]
+
+    def id_summary(self, stop=None):
+        """Return (can_ids, first, last, counts) of the frames before `stop`, in first-seen order"""
+        if self.id_index is None:
+            self._build_index()
+        offsets = self.id_index['offset'].astype(np.int64)
+        counts = self.id_index['count'].astype(np.int64)
+        first = np.asarray(self.positions[offsets]).astype(np.int64) if len(offsets) else offsets
+        last = np.asarray(self.positions[offsets + counts - 1]).astype(np.int64) if len(offsets) else offsets
+        can_ids = self.id_index['can_id']
+        if stop is not None and stop < len(self.records):
+            # Only needed for partial views; the file itself never grows
+            keep = first < stop
+            can_ids, first, offsets, counts = can_ids[keep], first[keep], offsets[keep], counts[keep]
+            counts = np.array([int(np.searchsorted(self.positions[o:o + c], stop))
+                               for o, c in zip(offsets.tolist(), counts.tolist())], dtype=np.int64)
+            last = np.array([int(self.positions[o + c - 1]) for o, c in zip(offsets.tolist(), counts.tolist())],
+                            dtype=np.int64)
+        order = np.argsort(first, kind='stable')
+        return can_ids[order], first[order], last[order], counts[order]
+
+    def previous_of_id(self, index):
+        """Return (position of the record within its ID, index of the previous frame of that ID or -1)"""
+        positions = self.indices_for_id(int(self.records[index]['can_id']))
+        rank = int(np.searchsorted(positions, index))
+        previous = int(positions[rank - 1]) if rank > 0 else -1
+        return rank, previous
+
+    def index_at_time(self, timestamp):
+        """Index of the first record with a timestamp >= the given one"""
+        if self.time_index is None:
+            self._build_index()
+        block = int(np.searchsorted(self.time_index, timestamp, side='left'))
+        # The answer lies in the block preceding the first larger index entry
+        start = max(block - 1, 0) * self.time_step
+        stop = min(block * self.time_step, len(self.records))
+        if stop <= start:
+            return min(start, len(self.records))
+        window = np.asarray(self.records['timestamp'][start:stop])
+        return start + int(np.searchsorted(window, timestamp, side='left'))
+
+    def close(self):
+        self.records = None
+        self.positions = None
+
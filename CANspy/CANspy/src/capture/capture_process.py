@@ -0,0 +1,276 @@
+"""
+Capture in a separate process.
+
+With a ProcessReceiver the bus is read by a capture process with its own
+interpreter (and GIL), so heavy repaints in the GUI cannot delay reception.
+The capture process runs an ordinary CANReceiver and writes every batch
+into a SharedRing: a ring buffer of capture records in
+multiprocessing.shared_memory. The GUI process maps the same memory and
+copies new records straight out of it, without pickling.
+
+Recording also happens in the capture process, so if the GUI crashes the
+capture process notices, closes the capture file with its index and exits.
+
+Ring layout: RING_HEADER_DTYPE, then `capacity` RECORD_DTYPE slots. Like
+a seqlock, the writer first advances `write_end` to the end of the frames
+it is about to write, then fills the slots, then advances `write_count`
+to publish them. A reader copies the frames up to `write_count` and then
+checks `write_end`: frames more than `capacity` behind it may have been
+overwritten, even half-way, during the copy. The reader drops them and
+counts them as lost, as it does for the frames it fell behind on.
+"""
+
+import multiprocessing
+import queue
+import threading
+import time
+import numpy as np
+from multiprocessing import shared_memory
+from capture.capture_file import RECORD_DTYPE
+from capture.receiver import CANReceiver
+
+RING_FRAMES = 1 << 18  # 20 MiB of records
+POLL_INTERVAL = 0.005  # seconds between reads of an empty ring
+COMMAND_TIMEOUT = 0.2
+CONNECT_TIMEOUT = 10.0  # longest wait of the capture process for the bus to open
+
+RING_HEADER_DTYPE = np.dtype([
+    ('write_count', '<u8'),  # frames written completely
+    ('capacity', '<u8'),
+    ('write_end', '<u8'),  # frames written or being written
+    ('padding', 'u1', (40,)),
+])
+
+
+class SharedRing:
+    """Single-writer ring buffer of capture records in shared memory.
+
+    :param name: Name of an existing ring to attach to, or None to create one.
+    """
+
+    def __init__(self, name=None, capacity=RING_FRAMES):
+        if name is None:
+            size = RING_HEADER_DTYPE.itemsize + capacity * RECORD_DTYPE.itemsize
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self.header = np.ndarray((), dtype=RING_HEADER_DTYPE, buffer=self.shm.buf)
+        if self.owner:
+            self.header['write_count'] = 0
+            self.header['write_end'] = 0
+            self.header['capacity'] = capacity
+        self.capacity = int(self.header['capacity'])
+        self.records = np.ndarray((self.capacity,), dtype=RECORD_DTYPE, buffer=self.shm.buf,
+                                  offset=RING_HEADER_DTYPE.itemsize)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def write_count(self):
+        return int(self.header['write_count'])
+
+    def write(self, records):
+        """Append records, overwriting the oldest ones once the ring is full"""
+        count = len(records)
+        if count > self.capacity:
+            records = records[-self.capacity:]
+        written = self.write_count
+        # Claim the slots before touching them, so readers can tell a torn copy
+        self.header['write_end'] = written + count
+        # Records dropped from the front of an oversized write still take their places in the count
+        start = (written + count - len(records)) % self.capacity
+        first = min(len(records), self.capacity - start)
+        self.records[start:start + first] = records[:first]
+        self.records[:len(records) - first] = records[first:]
+        # Publish only after the slots are filled
+        self.header['write_count'] = written + count
+
+    def read(self, position):
+        """Records written since `position`: (records, new position, lost frames)"""
+        written = self.write_count
+        lost = max(0, written - position - self.capacity)
+        position += lost
+        if position >= written:
+            return self.records[:0].copy(), position, lost
+        start = position % self.capacity
+        stop = start + (written - position)
+        if stop <= self.capacity:
+            records = self.records[start:stop].copy()
+        else:
+            records = np.concatenate((self.records[start:], self.records[:stop - self.capacity]))
+        # Frames the writer overwrote, or started to, while they were being copied are dropped
+        overrun = min(max(0, int(self.header['write_end']) - position - self.capacity), len(records))
+        if overrun:
+            records = records[overrun:]
+            lost += overrun
+        return records, written, lost
+
+    def close(self):
+        # The arrays must go before the mapping can be closed
+        del self.header, self.records
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def capture_main(ring_name, commands, events):
+    """Entry point of the capture process"""
+    ring = SharedRing(ring_name)
+    receiver = CANReceiver()
+    receiver.subscribe(lambda batch: ring.write(batch.to_records()))
+    receiver.on_error = lambda error: events.put(('error', str(error)))
+    receiver.on_status = lambda text: events.put(('status', text))
+    parent = multiprocessing.parent_process()
+    try:
+        while parent is None or parent.is_alive():
+            try:
+                command, argument = commands.get(timeout=COMMAND_TIMEOUT)
+            except queue.Empty:
+                continue
+            if command == 'connect':
+                receiver.config = argument['config']
+                receiver.auto_reconnect = argument['auto_reconnect']
+                receiver.can_filters = argument['can_filters']
+                receiver.start_receiving()
+                if receiver.wait_connected(argument['timeout']):
+                    events.put(('connected', None))
+            elif command == 'disconnect':
+                receiver.stop_receiving()
+                events.put(('disconnected', receiver.frames_received))
+            elif command == 'filters':
+                receiver.set_filters(argument)
+            elif command == 'record':
+                receiver.start_recording(argument)
+            elif command == 'stop_recording':
+                receiver.stop_recording()
+            elif command == 'exit':
+                break
+    finally:
+        receiver.close()
+        ring.close()
+
+
+class ProcessReceiver(CANReceiver):
+    """CANReceiver whose bus is read by a separate capture process.
+
+    The capture process is started on first use and lives until close(),
+    so a recording continues across disconnects like with CANReceiver.
+    Frames fed through process_message() (e.g. a replay into the table)
+    are handled locally. Reconnecting is done by the capture process, whose
+    status texts are passed on to on_status. Its events are only taken by
+    the receive thread (check_process()); stop_receiving() waits on
+    `disconnected`.
+    """
+
+    def __init__(self, config=None, store=None, batch_interval=POLL_INTERVAL, capacity=RING_FRAMES,
+                 auto_reconnect=False):
+        super().__init__(config, store, batch_interval, auto_reconnect)
+        self.capacity = capacity
+        self.process = None
+        self.ring = None
+        self.commands = None
+        self.events = None
+        self.disconnected = threading.Event()  # set when the capture process has published its last frames
+        self.position = 0
+        self.frames_lost = 0
+
+    def ensure_process(self):
+        if self.process is not None and self.process.is_alive():
+            return
+        self.shutdown_process()
+        context = multiprocessing.get_context('spawn')
+        self.ring = SharedRing(capacity=self.capacity)
+        self.position = 0
+        self.commands = context.Queue()
+        self.events = context.Queue()
+        self.process = context.Process(target=capture_main, args=(self.ring.name, self.commands, self.events),
+                                       name="CANspy capture", daemon=True)
+        self.process.start()
+
+    def shutdown_process(self):
+        process = self.process
+        if process is None:
+            return
+        self.process = None
+        if process.is_alive():
+            self.commands.put(('exit', None))
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self.ring.close()
+        self.ring = None
+
+    def start_receiving(self):
+        if self.is_receiving:
+            return False
+        self.ensure_process()
+        self.disconnected.clear()
+        self.commands.put(('connect', {'config': self.config, 'auto_reconnect': self.auto_reconnect,
+                                       'can_filters': self.can_filters, 'timeout': CONNECT_TIMEOUT}))
+        return super().start_receiving()
+
+    def stop_receiving(self, timeout=2):
+        if self.process is not None and self.is_receiving:
+            self.commands.put(('disconnect', None))
+            # Wait until the capture process has published its last frames, unless the receive thread ended
+            deadline = time.monotonic() + timeout
+            while not self.disconnected.wait(self.batch_interval):
+                if time.monotonic() >= deadline or not (self.thread and self.thread.is_alive()):
+                    break
+        super().stop_receiving(timeout)
+
+    def set_filters(self, can_filters):
+        self.can_filters = can_filters
+        if self.process is not None:
+            self.commands.put(('filters', can_filters))
+
+    def start_recording(self, path):
+        self.ensure_process()
+        self.commands.put(('record', path))
+
+    def stop_recording(self):
+        if self.process is not None:
+            self.commands.put(('stop_recording', None))
+
+    def close(self):
+        self.stop_receiving()
+        self.shutdown_process()
+
+    def receive(self, bus=None):
+        ring = self.ring
+        while True:
+            records, self.position, lost = ring.read(self.position)
+            self.frames_lost += lost
+            if len(records):
+                self.process_records(records)
+            elif not self.is_receiving:
+                break  # stopped, and the ring is drained
+            else:
+                self.check_process()
+                time.sleep(self.batch_interval)
+
+    def reconnect(self, error):
+        raise error  # the capture process reconnects by itself
+
+    def check_process(self):
+        """Handle the events of the capture process; only called by the receive thread"""
+        while True:
+            try:
+                event, argument = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if event == 'error':
+                raise RuntimeError(argument)
+            if event == 'status':
+                self.notify(argument)
+            elif event == 'connected':
+                self.connected = True
+                self.connect_event.set()
+            elif event == 'disconnected':
+                self.disconnected.set()
+        if not self.process.is_alive():
+            raise RuntimeError("Capture process exited")
@@ -0,0 +1,333 @@
+"""
+Search a capture for signals that track a reference series.
+
+Every candidate signal of every CAN ID, that is every start bit, length,
+byte order (Intel/little endian or Motorola/big endian) and signedness, is
+decoded from the first 8 data bytes and compared with a reference by the
+Pearson correlation coefficient. The reference is either a series of
+(time, value) samples, e.g. a logged vehicle speed, or another candidate
+given in DBC notation (see parse_signal). It is linearly interpolated to
+the timestamps of each ID's frames.
+
+The candidates are not decoded one by one. A candidate's raw value is a
+weighted sum of data bits (weights 2^k, the sign bit negative if signed),
+so its covariance with the reference and its variance follow from the
+products of the bits with the reference and the 64 x 64 covariance matrix
+of the bits. Those are accumulated once per ID with two matrix products
+over the unpacked bits; all candidates are then scored at once from a
+weight matrix, at a cost that no longer depends on the number of frames.
+IDs are searched in parallel by a pool of processes.
+"""
+
+import functools
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from capture.capture_file import FLAG_REMOTE, FLAG_ERROR, FLAG_GAP
+
+SIGNAL_BYTES = 8  # candidates are decoded from the first 8 data bytes
+SIGNAL_BITS = SIGNAL_BYTES * 8
+DEFAULT_LENGTHS = tuple(range(1, 17))
+MIN_SAMPLES = 8  # IDs with fewer frames in the reference's time span are skipped
+STATS_CHUNK = 1 << 16  # frames unpacked to bits at a time
+READ_BLOCK = 1 << 20
+POOL_MIN_FRAMES = 1 << 21  # smaller searches are quicker than starting the worker processes
+
+RESULT_DTYPE = np.dtype([
+    ('can_id', '<u4'),
+    ('start_bit', 'u1'),  # DBC start bit: LSB for Intel, MSB for Motorola
+    ('length', 'u1'),
+    ('big_endian', '?'),
+    ('signed', '?'),
+    ('correlation', '<f8'),
+    ('frames', '<i8'),
+])
+
+# DBC signal notation, e.g. "0x3E8:16|12@1-": ID, start bit, length, 1 = Intel / 0 = Motorola, +/- sign
+SIGNAL_PATTERN = re.compile(r"^\s*(0[xX][0-9a-fA-F]+|\d+)\s*:\s*(\d+)\s*\|\s*(\d+)\s*@\s*([01])\s*([+-])\s*$")
+
+
+def parse_signal(text):
+    """
+    Parses a signal in DBC notation.
+
+    :param text: "ID:start|length@order sign", e.g. "0x3E8:16|12@1-" for a
+        signed 12-bit Intel signal starting at bit 16 of ID 0x3E8.
+    :return: (can_id, start_bit, length, big_endian, signed)
+    """
+    match = SIGNAL_PATTERN.match(text)
+    if match is None:
+        raise ValueError(f"Invalid signal {text!r}, expected e.g. 0x3E8:16|12@1-")
+    can_id = int(match.group(1), 0)
+    start_bit, length = int(match.group(2)), int(match.group(3))
+    big_endian = match.group(4) == "0"
+    signed = match.group(5) == "-"
+    position = motorola_position(start_bit) if big_endian else start_bit
+    if length < 1 or start_bit >= SIGNAL_BITS or position + length > SIGNAL_BITS:
+        raise ValueError(f"Signal {text!r} does not fit into {SIGNAL_BYTES} bytes")
+    return can_id, start_bit, length, big_endian, signed
+
+
+def format_signal(can_id, start_bit, length, big_endian, signed):
+    return f"0x{int(can_id):X}:{int(start_bit)}|{int(length)}@{0 if big_endian else 1}{'-' if signed else '+'}"
+
+
+def motorola_position(start_bit):
+    """Position counted from the MSB of byte 0 of a DBC Motorola start bit,
+    and back: the mapping is its own inverse"""
+    return (start_bit // 8) * 8 + 7 - start_bit % 8
+
+
+def signal_weights(start_bit, length, big_endian, signed):
+    """Weight of each data bit (bit i = bit i % 8 of byte i // 8) in the signal's raw value"""
+    start_bit, length = int(start_bit), int(length)
+    weights = np.zeros(SIGNAL_BITS, dtype=np.float64)
+    if big_endian:
+        # Motorola bits run from the MSB at the start bit towards later bytes
+        first = motorola_position(start_bit)
+        bits = [motorola_position(position) for position in range(first + length - 1, first - 1, -1)]
+    else:
+        bits = list(range(start_bit, start_bit + length))
+    weights[bits] = 2.0 ** np.arange(length)
+    if signed:
+        weights[bits[-1]] = -weights[bits[-1]]
+    return weights
+
+
+@functools.lru_cache(maxsize=8)
+def candidates(lengths):
+    """
+    All candidate signals of the given lengths.
+
+    :return: (RESULT_DTYPE array with the signal fields set, weight matrix
+        of shape (candidates, SIGNAL_BITS))
+    """
+    signals = []
+    for length in lengths:
+        for position in range(SIGNAL_BITS - length + 1):
+            orders = [False]
+            # Motorola signals within one byte are the same as the Intel ones
+            if position // 8 != (position + length - 1) // 8:
+                orders.append(True)
+            for big_endian in orders:
+                start_bit = motorola_position(position) if big_endian else position
+                for signed in ((False, True) if length > 1 else (False,)):
+                    signals.append((start_bit, length, big_endian, signed))
+    table = np.zeros(len(signals), dtype=RESULT_DTYPE)
+    for i, name in enumerate(('start_bit', 'length', 'big_endian', 'signed')):
+        table[name] = [signal[i] for signal in signals]
+    weights = np.array([signal_weights(*signal) for signal in signals])
+    return table, weights
+
+
+def unpack_bits(data):
+    """(frames, SIGNAL_BITS) 0/1 array of (frames, >= 8) data bytes"""
+    return np.unpackbits(np.ascontiguousarray(data[:, :SIGNAL_BYTES]), axis=1, bitorder='little')
+
+
+def decode(data, signal):
+    """Raw values of a signal in the data bytes of frames of its ID, as float64"""
+    return unpack_bits(data) @ signal_weights(*signal[1:])
+
+
+def search_id(task):
+    """
+    Correlates all candidate signals of one ID with the reference.
+
+    :param task: (can_id, times, data, reference_times, reference_values,
+        lengths, limit, exclude), where exclude is None or a boolean array of
+        data bits whose candidates are skipped, e.g. the bits of the
+        reference signal itself.
+    :return: RESULT_DTYPE array of the `limit` best candidates
+    """
+    can_id, times, data, reference_times, reference_values, lengths, limit, exclude = task
+    inside = (times >= reference_times[0]) & (times <= reference_times[-1])
+    times, data = times[inside], data[inside]
+    frames = len(times)
+    if frames < MIN_SAMPLES:
+        return np.zeros(0, dtype=RESULT_DTYPE)
+    reference = np.interp(times, reference_times, reference_values)
+    reference -= reference.mean()
+    reference_norm = float(np.sqrt(reference @ reference))
+    if reference_norm == 0:
+        return np.zeros(0, dtype=RESULT_DTYPE)
+
+    # Bit statistics: co-occurrence counts (exact integers), bit counts and
+    # the products of each bit with the centered reference
+    gram = np.zeros((SIGNAL_BITS, SIGNAL_BITS), dtype=np.int64)
+    counts = np.zeros(SIGNAL_BITS, dtype=np.int64)
+    cross = np.zeros(SIGNAL_BITS, dtype=np.float64)
+    for start in range(0, frames, STATS_CHUNK):
+        bits = unpack_bits(data[start:start + STATS_CHUNK]).astype(np.float64)
+        gram += np.rint(bits.T @ bits).astype(np.int64)
+        counts += np.rint(bits.sum(axis=0)).astype(np.int64)
+        cross += bits.T @ reference[start:start + STATS_CHUNK]
+    covariance = (frames * gram - np.outer(counts, counts)) / float(frames)
+
+    table, weights = candidates(lengths)
+    if exclude is not None:
+        keep = ~(weights[:, exclude] != 0).any(axis=1)
+        table, weights = table[keep], weights[keep]
+    variances = np.einsum('kj,kj->k', weights @ covariance, weights)
+    norms = np.sqrt(np.maximum(variances, 0.0)) * reference_norm
+    results = table.copy()
+    results['can_id'] = can_id
+    results['frames'] = frames
+    results['correlation'] = np.divide(weights @ cross, norms, out=np.zeros(len(table)), where=norms > 0)
+    return best(results, limit)
+
+
+def best(results, limit):
+    """The `limit` results with the largest absolute correlation, best first"""
+    strength = np.abs(results['correlation'])
+    if len(results) > limit:
+        top = np.argpartition(-strength, limit - 1)[:limit]
+        results, strength = results[top], strength[top]
+    return results[np.argsort(-strength, kind='stable')]
+
+
+def frames_by_id(source, ids=None):
+    """
+    Timestamps and first data bytes of the frames of each ID.
+
+    :param source: CaptureStore or CaptureReader.
+    :param ids: Only these CAN IDs (default: all).
+    :return: {can_id: (times, data)} with data of shape (frames, 8)
+    """
+    times, can_ids, data = [], [], []
+    for start in range(0, len(source), READ_BLOCK):
+        records = source.read(start, start + READ_BLOCK)
+        records = records[(records['flags'] & (FLAG_REMOTE | FLAG_ERROR | FLAG_GAP)) == 0]
+        if ids is not None:
+            records = records[np.isin(records['can_id'], np.asarray(list(ids), dtype=np.uint32))]
+        times.append(records['timestamp'])
+        can_ids.append(records['can_id'])
+        data.append(records['data'][:, :SIGNAL_BYTES])
+    if not times:
+        return {}
+    times, can_ids, data = np.concatenate(times), np.concatenate(can_ids), np.concatenate(data)
+    order = np.argsort(can_ids, kind='stable')
+    times, can_ids, data = times[order], can_ids[order], data[order]
+    starts = np.flatnonzero(np.r_[True, can_ids[1:] != can_ids[:-1]]) if len(can_ids) else []
+    stops = list(starts[1:]) + [len(can_ids)]
+    return {int(can_ids[a]): (times[a:b], data[a:b]) for a, b in zip(starts, stops)}
+
+
+def search(source, reference, lengths=DEFAULT_LENGTHS, ids=None, limit=50, workers=None):
+    """
+    Finds the candidate signals that correlate best with a reference.
+
+    :param source: CaptureStore or CaptureReader to search.
+    :param reference: (times, values) arrays in the capture's time base, or a
+        signal (can_id, start_bit, length, big_endian, signed) of the capture;
+        candidates sharing bits with that signal are not reported.
+    :param lengths: Signal lengths in bits to try.
+    :param ids: Only search these CAN IDs (default: all).
+    :param limit: Number of results.
+    :param workers: Processes to search in; None for one per CPU on large
+        captures, 1 to search in this process.
+    :return: RESULT_DTYPE array, strongest correlation (positive or negative) first
+    """
+    signal = reference if len(reference) == 5 else None
+    if ids is not None and signal is not None:
+        ids = set(ids) | {signal[0]}
+    frames = frames_by_id(source, ids)
+    exclude_id, exclude = None, None
+    if signal is not None:
+        can_id = signal[0]
+        if can_id not in frames:
+            raise ValueError(f"CAN ID 0x{can_id:X} is not in the capture")
+        reference_times, data = frames[can_id]
+        reference_values = decode(data, signal)
+        exclude_id, exclude = can_id, signal_weights(*signal[1:]) != 0
+    else:
+        reference_times, reference_values = (np.asarray(a, dtype=np.float64) for a in reference)
+        order = np.argsort(reference_times, kind='stable')
+        reference_times, reference_values = reference_times[order], reference_values[order]
+    if len(reference_times) < 2:
+        raise ValueError("The reference needs at least two samples")
+
+    lengths = tuple(sorted({int(length) for length in lengths}))
+    if not all(1 <= length <= SIGNAL_BITS for length in lengths):
+        raise ValueError(f"Signal lengths must be 1 to {SIGNAL_BITS} bits")
+    tasks = [(can_id, times, data, reference_times, reference_values, lengths, limit,
+              exclude if can_id == exclude_id else None)
+             for can_id, (times, data) in frames.items()]
+    if workers is None:
+        total = sum(len(times) for times, _ in frames.values())
+        workers = (os.cpu_count() or 1) if total >= POOL_MIN_FRAMES else 1
+    if workers == 1 or len(tasks) < 2:
+        parts = [search_id(task) for task in tasks]
+    else:
+        # Spawned, not forked: the GUI process runs threads that a fork would copy mid-operation
+        with ProcessPoolExecutor(min(workers, len(tasks)),
+                                 mp_context=multiprocessing.get_context('spawn')) as pool:
+            parts = list(pool.map(search_id, tasks))
+    if not parts:
+        return np.zeros(0, dtype=RESULT_DTYPE)
+    return best(np.concatenate(parts), limit)
+
+
+def load_reference(path):
+    """(times, values) from a CSV file with time and value columns; a header line is skipped"""
+    table = np.genfromtxt(path, delimiter=",", usecols=(0, 1), comments="#", invalid_raise=False)
+    table = np.atleast_2d(table)
+    table = table[~np.isnan(table).any(axis=1)]
+    return table[:, 0], table[:, 1]
+
+
+def open_source(path):
+    """CaptureReader for a .canspy file, or a CaptureStore with an imported log"""
+    from capture.capture_file import CaptureReader, CAPTURE_EXTENSION
+    from capture.store import CaptureStore
+    from capture.importers import importer_for
+    if path.lower().endswith(CAPTURE_EXTENSION):
+        return CaptureReader(path)
+    importer = importer_for(path)
+    if importer is None:
+        raise ValueError(f"Unsupported log format: {path}")
+    store = CaptureStore()
+    for records, _ in importer(path):
+        store.append_records(records)
+    return store
+
+
+def main():
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Find signals in a capture that correlate with a reference")
+    parser.add_argument("capture", help=".canspy capture or candump/ASC/TRC/BLF log")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--reference", help="CSV file with time and value columns, in the capture's time base")
+    group.add_argument("--signal", help="a signal of the capture in DBC notation, e.g. 0x3E8:16|12@1-")
+    parser.add_argument("--lengths", default=f"{DEFAULT_LENGTHS[0]}-{DEFAULT_LENGTHS[-1]}",
+                        help="signal lengths in bits, e.g. 8-16 or 8,12,16")
+    parser.add_argument("--ids", help="only search these CAN IDs, e.g. 0x100,0x3E8")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--workers", type=int, help="processes (default: one per CPU)")
+    args = parser.parse_args()
+
+    lengths = []
+    for part in args.lengths.split(","):
+        low, _, high = part.partition("-")
+        lengths.extend(range(int(low), int(high or low) + 1))
+    ids = None if not args.ids else {int(part, 0) for part in args.ids.split(",")}
+    reference = parse_signal(args.signal) if args.signal else load_reference(args.reference)
+
+    start = time.perf_counter()
+    source = open_source(args.capture)
+    results = search(source, reference, lengths=lengths, ids=ids, limit=args.limit, workers=args.workers)
+    print(f"{len(source)} frames searched in {time.perf_counter() - start:.2f} s")
+    for result in results:
+        signal = format_signal(result['can_id'], result['start_bit'], result['length'],
+                               result['big_endian'], result['signed'])
+        print(f"{signal:<22} r={result['correlation']:+.4f}  ({result['frames']} frames)")
+    source.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,413 @@
+"""
+Cycle time monitor: alarms for periodic messages that are late, missing
+or too fast.
+
+Every monitored ID has an expected period, given by the user or learned:
+from the first LEARN_INTERVALS intervals of the ID as it is received, or
+from the frames already in a capture store (the data behind the table's
+Cycle Time column, see learn_from()). IDs whose intervals vary too much
+to have a period are marked aperiodic and not monitored.
+
+Received batches are checked with NumPy: the frames are sorted by ID,
+every interval is compared with the period of its ID, and only the
+per-ID results are folded in with Python, so a frame costs O(1) however
+many IDs are monitored. A frame is too fast when its interval is below
+(1 - tolerance) periods and late when it is above (1 + tolerance)
+periods.
+
+A missing message is detected without visiting every ID on every tick:
+each ID has one deadline, `missing_factor` periods after its last frame,
+in a hierarchical TimerWheel. Frames do not touch the wheel; they only
+move the ID's last time. When a deadline fires, the deadline is taken
+again from the ID's last frame: if that is still ahead the ID is
+re-armed, otherwise it is reported missing at that deadline. The wheel
+advances with the frame timestamps, and with poll() while the bus is
+silent.
+
+Alarms are logged when an ID changes status (ok, late, too fast,
+missing), not for every frame; the per-ID counters count every frame.
+"""
+
+import threading
+import time
+from collections import deque
+import numpy as np
+from capture.capture_file import FLAG_REMOTE, FLAG_ERROR, FLAG_GAP
+
+OK = "ok"
+LATE = "late"
+MISSING = "missing"
+TOO_FAST = "too fast"
+LEARNING = "learning"
+APERIODIC = "aperiodic"
+STATUSES = [OK, LATE, MISSING, TOO_FAST, LEARNING, APERIODIC]  # codes of the status array
+
+TICK = 0.001  # seconds per timer wheel tick
+WHEEL_BITS = 8  # 256 slots per level
+WHEEL_LEVELS = 4  # 2^32 ticks: about 50 days at 1 ms
+LEARN_INTERVALS = 8  # intervals observed before a period is learned
+MAX_SPREAD = 0.5  # intervals learned from must lie within +-50 % of their median
+TOLERANCE = 0.5  # frames more than 50 % early or late are flagged
+MISSING_FACTOR = 3.0  # periods without a frame before an ID is missing
+MAX_ALARMS = 10000
+
+
+class TimerWheel:
+    """
+    Hierarchical timer wheel of integer ticks.
+
+    Level n has 2^WHEEL_BITS slots of 2^(n * WHEEL_BITS) ticks each; a
+    timer goes into the lowest level whose span covers its distance from
+    the current tick, and moves down a level each time the level below
+    wraps. Scheduling is O(1); advancing costs one step per tick, skipping
+    runs of ticks in which no timer can fire.
+    """
+
+    def __init__(self, start=0):
+        self.size = 1 << WHEEL_BITS
+        self.mask = self.size - 1
+        self.slots = [[[] for _ in range(self.size)] for _ in range(WHEEL_LEVELS)]
+        self.counts = [0] * WHEEL_LEVELS
+        self.current = start
+
+    def __len__(self):
+        return sum(self.counts)
+
+    def schedule(self, key, tick):
+        """Fire `key` once the wheel reaches `tick` (on the next advance if that has passed)"""
+        self.insert(key, max(tick, self.current + 1))
+
+    def insert(self, key, tick):
+        delta = tick - self.current
+        level = 0
+        while level < WHEEL_LEVELS - 1 and delta >= 1 << (WHEEL_BITS * (level + 1)):
+            level += 1
+        if level == WHEEL_LEVELS - 1:
+            tick = min(tick, self.current + (1 << (WHEEL_BITS * WHEEL_LEVELS)) - 1)
+        self.slots[level][(tick >> (WHEEL_BITS * level)) & self.mask].append((tick, key))
+        self.counts[level] += 1
+
+    def advance(self, tick):
+        """Move to `tick`; return the (tick, key) timers that fired, in order"""
+        fired = []
+        while self.current < tick:
+            if self.counts[0] == 0:
+                # Nothing fires before the lowest busy level cascades, at a multiple of its slot span
+                level = 1
+                while level < WHEEL_LEVELS and self.counts[level] == 0:
+                    level += 1
+                if level == WHEEL_LEVELS:
+                    self.current = tick
+                    break
+                shift = WHEEL_BITS * level
+                boundary = ((self.current >> shift) + 1) << shift
+                if boundary > tick:
+                    self.current = tick
+                    break
+                self.current = boundary - 1
+            self.current += 1
+            if self.current & self.mask == 0:
+                self.cascade(1)
+            index = self.current & self.mask
+            slot = self.slots[0][index]
+            if slot:
+                self.slots[0][index] = []
+                self.counts[0] -= len(slot)
+                slot.sort()
+                fired.extend(slot)
+        return fired
+
+    def cascade(self, level):
+        """Move the timers of the slot of `level` that is now due into the levels below"""
+        if level >= WHEEL_LEVELS:
+            return
+        index = (self.current >> (WHEEL_BITS * level)) & self.mask
+        if index == 0:
+            self.cascade(level + 1)
+        slot = self.slots[level][index]
+        if slot:
+            self.slots[level][index] = []
+            self.counts[level] -= len(slot)
+            for tick, key in slot:
+                self.insert(key, tick)  # may be due right now, in the level 0 slot about to fire
+
+
+def learn_period(intervals):
+    """Period of a series of intervals, or None when they are too irregular"""
+    intervals = np.asarray(intervals, dtype=np.float64)
+    if not len(intervals):
+        return None
+    period = float(np.median(intervals))
+    if period <= 0 or np.any(np.abs(intervals - period) > period * MAX_SPREAD):
+        return None
+    return period
+
+
+class CycleMonitor:
+    """
+    Late/missing/too-fast detection for periodic IDs.
+
+    Usable as a CANReceiver subscriber through update_batch(); readers take
+    copies under the lock. The state of each ID is kept in NumPy arrays,
+    indexed by a slot per ID, so a batch is folded in with array
+    operations; Python only handles IDs that are learning, change status
+    or need a deadline. Alarms are (serial, time, CAN ID, status, interval,
+    period) tuples.
+
+    :param periods: {CAN ID: expected period in seconds}; other IDs have
+        their period learned unless `learn` is False.
+    """
+
+    def __init__(self, periods=None, learn=True, tolerance=TOLERANCE, missing_factor=MISSING_FACTOR,
+                 max_alarms=MAX_ALARMS):
+        self.lock = threading.Lock()
+        self.periods = dict(periods or {})
+        self.learn = learn
+        self.tolerance = tolerance
+        self.missing_factor = missing_factor
+        self.max_alarms = max_alarms
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.slot_of = {}  # CAN ID -> slot in the state arrays
+            self.count = 0
+            self.allocate(256)
+            self.learning = {}  # slot -> intervals observed so far
+            self.wheel = None  # started at the first frame's time
+            self.alarms = deque(maxlen=self.max_alarms)
+            self.alarm_count = 0
+            self.frames = 0
+            self.now = None  # time of the latest frame
+            self.clock_offset = 0.0  # frame time - monotonic time at the latest batch
+            for can_id, period in self.periods.items():
+                slot = self.add(can_id)
+                self.configured[slot] = True
+                self.set_period(slot, period)
+            self.index_ids()
+
+    def allocate(self, capacity):
+        """Grow the state arrays to `capacity` slots"""
+        used = self.count
+
+        def grow(name, fill, dtype):
+            array = np.full(capacity, fill, dtype=dtype)
+            if used:
+                array[:used] = getattr(self, name)[:used]
+            setattr(self, name, array)
+
+        grow('ids', 0, np.uint32)
+        grow('last', np.nan, np.float64)  # time of the latest frame
+        grow('period', np.nan, np.float64)  # NaN: not monitored (yet)
+        grow('interval', np.nan, np.float64)  # latest interval
+        grow('status', STATUSES.index(LEARNING), np.int8)
+        grow('configured', False, bool)
+        grow('armed', False, bool)  # has a deadline in the wheel
+        for name in ('frame_count', 'late_count', 'missing_count', 'too_fast_count'):
+            grow(name, 0, np.int64)
+
+    def add(self, can_id):
+        if self.count == len(self.ids):
+            self.allocate(len(self.ids) * 2)
+        slot = self.slot_of[can_id] = self.count
+        self.ids[slot] = can_id
+        self.count += 1
+        self.learning[slot] = []
+        return slot
+
+    def index_ids(self):
+        """Sorted IDs and their slots, for looking up the slots of a batch"""
+        order = np.argsort(self.ids[:self.count], kind='stable')
+        self.sorted_ids = self.ids[:self.count][order]
+        self.sorted_slots = order
+
+    def slots_for(self, unique_ids):
+        """Slots of sorted distinct IDs, adding the IDs seen for the first time"""
+        position = np.searchsorted(self.sorted_ids, unique_ids)
+        found = position < len(self.sorted_ids)
+        found[found] = self.sorted_ids[position[found]] == unique_ids[found]
+        if not found.all():
+            for can_id in unique_ids[~found].tolist():
+                self.add(can_id)
+            self.index_ids()
+            position = np.searchsorted(self.sorted_ids, unique_ids)
+        return self.sorted_slots[position]
+
+    def learn_from(self, source):
+        """Learn the periods of the IDs in a capture store from their latest frames"""
+        periods = {}
+        for can_id in source.ids().tolist():
+            positions = source.indices_for_id(can_id)[-LEARN_INTERVALS - 1:]
+            if len(positions) > LEARN_INTERVALS // 2:
+                timestamps = np.array([float(source[int(index)]['timestamp']) for index in positions])
+                periods[can_id] = learn_period(np.diff(timestamps))
+        with self.lock:
+            for can_id, period in periods.items():
+                slot = self.slot_of.get(can_id)
+                if slot is None:
+                    slot = self.add(can_id)
+                if not self.configured[slot]:
+                    self.set_period(slot, period)
+            self.index_ids()
+
+    def set_period(self, slot, period):
+        self.learning.pop(slot, None)
+        self.period[slot] = np.nan if period is None else period
+        self.status[slot] = STATUSES.index(APERIODIC if period is None else OK)
+
+    def update_batch(self, batch):
+        """Fold in a FrameBatch (usable as a CANReceiver subscriber)"""
+        if len(batch):
+            self.process(np.frombuffer(batch.can_ids, dtype=np.uint32), np.frombuffer(batch.flags, dtype=np.uint8),
+                         np.frombuffer(batch.timestamps, dtype=np.float64))
+
+    def update(self, records):
+        """Fold in an array of capture records"""
+        if len(records):
+            self.process(records['can_id'], records['flags'], records['timestamp'])
+
+    def process(self, can_ids, flags, timestamps):
+        frames = (flags & (FLAG_REMOTE | FLAG_ERROR | FLAG_GAP)) == 0
+        can_ids = can_ids[frames]
+        timestamps = timestamps[frames]
+        if not len(can_ids):
+            return
+        order = np.argsort(can_ids, kind='stable')
+        sorted_ids = can_ids[order]
+        sorted_times = timestamps[order]
+        unique_ids, first, counts = np.unique(sorted_ids, return_index=True, return_counts=True)
+        last = first + counts - 1
+        intervals = np.empty(len(sorted_times))
+        intervals[1:] = np.diff(sorted_times)
+        with self.lock:
+            self.frames += len(can_ids)
+            if self.wheel is None:
+                self.wheel = TimerWheel(int(float(timestamps[0]) / TICK))
+            slots = self.slots_for(unique_ids)
+            # The first frame of each ID is measured from the ID's previous batch (NaN for a new ID)
+            intervals[first] = sorted_times[first] - self.last[slots]
+            self.last[slots] = sorted_times[last]
+            self.interval[slots] = intervals[last]
+            self.frame_count[slots] += counts
+            if self.learning and self.learn:
+                for i in np.flatnonzero(np.isin(slots, list(self.learning))).tolist():
+                    self.learn_intervals(int(slots[i]), intervals[first[i]:last[i] + 1])
+            periods = self.period[slots]
+            frame_periods = np.repeat(periods, counts)
+            with np.errstate(invalid='ignore'):
+                fast = intervals < frame_periods * (1 - self.tolerance)
+                late = intervals > frame_periods * (1 + self.tolerance)
+            fast_counts = np.add.reduceat(fast, first)
+            late_counts = np.add.reduceat(late, first)
+            monitored = ~np.isnan(periods)
+            self.too_fast_count[slots] += fast_counts
+            self.late_count[slots] += late_counts
+            status = np.where(fast_counts > 0, STATUSES.index(TOO_FAST),
+                              np.where(late_counts > 0, STATUSES.index(LATE), STATUSES.index(OK)))
+            changed = np.flatnonzero(monitored & (status != self.status[slots]))
+            if len(changed):
+                # Logged with the interval that caused the change
+                shortest = np.fmin.reduceat(intervals, first)
+                longest = np.fmax.reduceat(intervals, first)
+                for i in changed.tolist():
+                    interval = shortest[i] if fast_counts[i] else longest[i] if late_counts[i] else intervals[last[i]]
+                    self.set_status(int(slots[i]), STATUSES[status[i]], float(sorted_times[last[i]]), interval)
+            for slot in slots[monitored & ~self.armed[slots]].tolist():
+                self.arm(slot)
+            self.now = float(timestamps[-1]) if self.now is None else max(self.now, float(timestamps[-1]))
+            self.clock_offset = self.now - time.monotonic()
+            self.expire(self.now)
+
+    def learn_intervals(self, slot, intervals):
+        observed = self.learning[slot]
+        observed.extend(intervals[~np.isnan(intervals)][:LEARN_INTERVALS].tolist())
+        if len(observed) >= LEARN_INTERVALS:
+            self.set_period(slot, learn_period(observed[:LEARN_INTERVALS]))
+
+    def arm(self, slot):
+        self.armed[slot] = True
+        self.wheel.schedule(slot, int((self.last[slot] + self.period[slot] * self.missing_factor) / TICK) + 1)
+
+    def set_status(self, slot, status, when, interval):
+        """Log a change of status, with the interval that caused it"""
+        self.status[slot] = STATUSES.index(status)
+        self.alarms.append((self.alarm_count, when, int(self.ids[slot]), status,
+                            None if np.isnan(interval) else float(interval), float(self.period[slot])))
+        self.alarm_count += 1
+
+    def expire(self, now):
+        """Advance the wheel to `now`: re-arm IDs whose deadline from their last frame is ahead, flag the others"""
+        if self.wheel is None:
+            return
+        for tick, slot in self.wheel.advance(int(now / TICK)):
+            self.armed[slot] = False
+            period = self.period[slot]
+            if np.isnan(period):
+                continue
+            # An ID seen since its deadline was set can still have missed the deadline of its last frame
+            deadline = float(self.last[slot] + period * self.missing_factor)
+            if deadline > now:
+                self.arm(slot)
+            else:
+                self.missing_count[slot] += 1
+                self.interval[slot] = np.nan
+                self.set_status(slot, MISSING, deadline, deadline - self.last[slot])
+
+    def poll(self):
+        """Advance the wheel to the current time while no frames arrive"""
+        with self.lock:
+            if self.now is not None:
+                self.expire(time.monotonic() + self.clock_offset)
+
+    def status_of(self, can_id):
+        slot = self.slot_of.get(can_id)
+        return None if slot is None else STATUSES[self.status[slot]]
+
+    def id_rows(self):
+        """(CAN ID, status, period, last interval, frames, late, missing, too fast) of every ID, by ID"""
+        with self.lock:
+            rows = []
+            for slot in self.sorted_slots.tolist():
+                period = float(self.period[slot])
+                interval = float(self.interval[slot])
+                rows.append((int(self.ids[slot]), STATUSES[self.status[slot]], None if np.isnan(period) else period,
+                             None if np.isnan(interval) else interval, int(self.frame_count[slot]),
+                             int(self.late_count[slot]), int(self.missing_count[slot]),
+                             int(self.too_fast_count[slot])))
+            return rows
+
+    def alarms_since(self, serial):
+        with self.lock:
+            skip = max(serial - (self.alarm_count - len(self.alarms)), 0)
+            return [self.alarms[i] for i in range(skip, len(self.alarms))]
+
+    def summary(self):
+        with self.lock:
+            statuses = np.bincount(self.status[:self.count], minlength=len(STATUSES))
+            return {'frames': self.frames, 'ids': self.count, 'alarms': self.alarm_count,
+                    'late': int(statuses[STATUSES.index(LATE)]), 'missing': int(statuses[STATUSES.index(MISSING)]),
+                    'too_fast': int(statuses[STATUSES.index(TOO_FAST)]),
+                    'monitored': int(np.count_nonzero(~np.isnan(self.period[:self.count])))}
+
+
+def parse_periods(text):
+    """{CAN ID: period in seconds} from "0x100=10ms, 0x200=0.1s, 7E8=100" (plain numbers are ms)"""
+    periods = {}
+    for item in text.replace(";", ",").split(","):
+        if not item.strip():
+            continue
+        try:
+            can_id, period = item.split("=")
+            period = period.strip().lower()
+            if period.endswith("ms"):
+                seconds = float(period[:-2]) / 1000
+            elif period.endswith("s"):
+                seconds = float(period[:-1])
+            else:
+                seconds = float(period) / 1000
+            periods[int(can_id.strip(), 16)] = seconds
+        except ValueError:
+            raise ValueError(f"Invalid period: {item.strip()}") from None
+        if seconds <= 0:
+            raise ValueError(f"Invalid period: {item.strip()}")
+    return periods
@@ -0,0 +1,619 @@
+"""
+Display filters.
+
+A display filter narrows the table to the frames matching an expression:
+
+    id in 0x100..0x1FF and data[0] & 0x80 and cycle > 50ms
+    ext and id in {0x18FEF100, 0x18FEF200..0x18FEF2FF}
+    not rtr and (len < 8 or data[7] == 0xFF)
+
+The expression is parsed once and compiled twice, into Python code objects:
+a closure taking one frame, used for small batches, and a NumPy version
+taking whole columns of capture records, used for everything else. Neither
+walks a syntax tree per frame.
+
+Fields:
+    id        CAN ID
+    len, dlc  data length in bytes
+    data[i]   byte i of the data (0 beyond the data length)
+    time      timestamp in seconds
+    cycle     seconds since the previous frame of the same ID (NaN for the
+              first one, so comparisons with it are false)
+    channel
+    ext, fd, brs, esi, rtr, error   frame flags (true/false)
+
+Operators, from lowest to highest precedence: `or`/`||`, `and`/`&&`,
+`not`/`!`, comparisons (== != < <= > >=, `in`, `not in`), | ^ & << >>
++ - *, unary - and ~. Numbers are decimal, hex (0x) or binary (0b);
+`s`, `ms` and `us` turn a number into seconds, e.g. `cycle > 50ms`.
+`in` takes a range `a..b` (inclusive) or a set `{a, b, c..d}`.
+
+A frame for which the expression cannot be evaluated, e.g. a shift by a
+count outside 0..63 in `1 << (data[0] - 5)`, does not match. The NumPy
+version evaluates such frames, and those whose left shifts lose bits out
+of 64, with the per-frame closure, so both versions match the same frames.
+
+ID constraints that hold for every matching frame (an `id` range, set or
+comparison that is and-ed with the rest) are also turned into python-can
+acceptance filters by can_filters(), so the bus can drop other IDs.
+"""
+
+import math
+import re
+import numpy as np
+from capture.capture_file import RECORD_DTYPE, FLAG_EXTENDED, FLAG_FD, FLAG_REMOTE, FLAG_ERROR, FLAG_BRS, FLAG_ESI
+from capture.store import CaptureStore
+from capture.id_limit import MAX_IDS, LFU, LRU, excess, select_victims
+
+MAX_CAN_ID = 0x1FFFFFFF
+MAX_ACCEPTANCE_FILTERS = 32  # ID ranges needing more mask filters are not pushed down
+SCALAR_FRAMES = 16  # up to this many frames, the per-frame closure beats the NumPy version
+FILTER_STEP = 1 << 16  # records filtered per FilterFeed.update() call, about 15 ms
+MAX_SHIFT = 63
+
+FLAG_FIELDS = {'ext': FLAG_EXTENDED, 'fd': FLAG_FD, 'brs': FLAG_BRS, 'esi': FLAG_ESI, 'rtr': FLAG_REMOTE,
+               'error': FLAG_ERROR}
+NUMBER_FIELDS = {'id': 'can_id', 'len': 'dlc', 'dlc': 'dlc', 'time': 'timestamp', 'cycle': 'cycle',
+                 'channel': 'channel'}
+FLOAT_FIELDS = ('time', 'cycle')
+INTEGER_OPERATORS = ('|', '^', '&', '<<', '>>', '~')
+UNITS = {'s': 1.0, 'ms': 1e-3, 'us': 1e-6}
+COMPARISONS = ('==', '!=', '<=', '>=', '<', '>')
+ID_FIELD = ('field', 'id')
+# Binary operators by precedence level, lowest first
+BINARY_LEVELS = (('|',), ('^',), ('&',), ('<<', '>>'), ('+', '-'), ('*',))
+
+TOKEN_PATTERN = re.compile(r"""
+    \s*(?:
+      (?P<number>0[xX][0-9a-fA-F]+|0[bB][01]+|\d+(?:\.\d+)?)(?P<unit>ms|us|s)?(?!\w)(?!\.\d)
+    | (?P<name>[A-Za-z_]\w*)
+    | (?P<op>\.\.|==|!=|<=|>=|<<|>>|&&|\|\||[<>&|^~+\-*!()\[\]{},])
+    )""", re.VERBOSE)
+
+
+class FilterError(ValueError):
+    """Syntax or type error in a display filter; `position` is the offset in the text"""
+
+    def __init__(self, message, position=None):
+        super().__init__(message if position is None else f"{message} (at {position + 1})")
+        self.position = position
+
+
+def tokenize(text):
+    """List of (kind, value, position) tokens, ending with ('end', None, len(text))"""
+    tokens = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = TOKEN_PATTERN.match(text, position)
+        if match is None or match.end() == position:
+            raise FilterError(f"Unexpected {text[position:].split()[0]!r}", position)
+        start = match.start(match.lastgroup)
+        if match.group('number') is not None:
+            literal = match.group('number').lower()
+            if literal[:2] in ('0x', '0b'):
+                value = int(literal[2:], 16 if literal[1] == 'x' else 2)
+            else:
+                value = int(literal) if literal.isdigit() else float(literal)
+            if match.group('unit'):
+                value = value * UNITS[match.group('unit')]
+            tokens.append(('number', value, start))
+        elif match.group('name') is not None:
+            name = match.group('name').lower()
+            tokens.append(('keyword' if name in ('and', 'or', 'not', 'in', 'true', 'false') else 'name',
+                           name, start))
+        else:
+            op = {'&&': 'and', '||': 'or', '!': 'not'}.get(match.group('op'), match.group('op'))
+            tokens.append(('keyword' if op in ('and', 'or', 'not') else 'op', op, start))
+        position = match.end()
+    tokens.append(('end', None, len(text)))
+    return tokens
+
+
+class Parser:
+    """Recursive descent parser producing a tuple syntax tree.
+
+    Nodes: ('number', value), ('field', name), ('flag', name), ('byte', index),
+    ('binary', op, left, right), ('unary', op, operand), ('compare', op, left, right),
+    ('in', operand, ranges), ('and', left, right), ('or', left, right), ('not', operand).
+    """
+
+    def __init__(self, text):
+        self.tokens = tokenize(text)
+        self.index = 0
+
+    def peek(self):
+        return self.tokens[self.index]
+
+    def next(self):
+        token = self.tokens[self.index]
+        self.index += 1
+        return token
+
+    def accept(self, value):
+        if self.peek()[1] == value and self.peek()[0] != 'number':
+            return self.next()
+        return None
+
+    def expect(self, value):
+        token = self.accept(value)
+        if token is None:
+            kind, found, position = self.peek()
+            raise FilterError(f"Expected {value!r}" + ("" if kind == 'end' else f", found {found!r}"), position)
+        return token
+
+    def parse(self):
+        if self.peek()[0] == 'end':
+            raise FilterError("Empty filter", 0)
+        node = self.parse_or()
+        kind, value, position = self.peek()
+        if kind != 'end':
+            raise FilterError(f"Unexpected {value!r}", position)
+        return node
+
+    def parse_or(self):
+        node = self.parse_and()
+        while self.accept('or'):
+            node = ('or', node, self.parse_and())
+        return node
+
+    def parse_and(self):
+        node = self.parse_not()
+        while self.accept('and'):
+            node = ('and', node, self.parse_not())
+        return node
+
+    def parse_not(self):
+        if self.accept('not'):
+            return ('not', self.parse_not())
+        return self.parse_comparison()
+
+    def parse_comparison(self):
+        node = self.parse_binary(0)
+        for op in COMPARISONS:
+            token = self.accept(op)
+            if token:
+                right = self.parse_binary(0)
+                if ID_FIELD in (node, right) and (is_float(node) or is_float(right)):
+                    raise FilterError("CAN IDs can only be compared with integers", token[2])
+                return ('compare', op, node, right)
+        if self.peek()[1] == 'not' and self.tokens[self.index + 1][1] == 'in':
+            self.next()
+            position = self.next()[2]
+            return ('not', self.parse_in(node, position))
+        token = self.accept('in')
+        if token:
+            return self.parse_in(node, token[2])
+        return node
+
+    def parse_in(self, node, position):
+        ranges = self.parse_set()
+        if node == ID_FIELD and any(isinstance(bound, float) for bounds in ranges for bound in bounds):
+            raise FilterError("CAN ID ranges must be integers", position)
+        return ('in', node, ranges)
+
+    def parse_set(self):
+        """A range `a..b` or a set `{a, b..c}`: list of (low, high)"""
+        if not self.accept('{'):
+            return [self.parse_range()]
+        ranges = [self.parse_range()]
+        while self.accept(','):
+            ranges.append(self.parse_range())
+        self.expect('}')
+        return ranges
+
+    def parse_range(self):
+        low = self.parse_constant()
+        high = self.parse_constant() if self.accept('..') else low
+        if high < low:
+            raise FilterError(f"Empty range {low}..{high}", self.peek()[2])
+        return low, high
+
+    def parse_constant(self):
+        kind, value, position = self.next()
+        if kind != 'number':
+            raise FilterError("Expected a number", position)
+        return value
+
+    def parse_binary(self, level):
+        if level == len(BINARY_LEVELS):
+            return self.parse_unary()
+        node = self.parse_binary(level + 1)
+        while True:
+            for op in BINARY_LEVELS[level]:
+                token = self.accept(op)
+                if token:
+                    node = ('binary', op, node, self.parse_binary(level + 1))
+                    check_integer(node, token[2])
+                    break
+            else:
+                return node
+
+    def parse_unary(self):
+        for op in ('-', '~'):
+            token = self.accept(op)
+            if token:
+                node = ('unary', op, self.parse_unary())
+                check_integer(node, token[2])
+                return node
+        return self.parse_primary()
+
+    def parse_primary(self):
+        kind, value, position = self.next()
+        if kind == 'number':
+            return ('number', value)
+        if value in ('true', 'false'):
+            return ('number', int(value == 'true'))
+        if value == '(':
+            node = self.parse_or()
+            self.expect(')')
+            return node
+        if kind == 'name':
+            if value == 'data':
+                self.expect('[')
+                index_position = self.peek()[2]
+                index = self.parse_constant()
+                if not isinstance(index, int) or index >= 64:
+                    raise FilterError("Data index must be an integer below 64", index_position)
+                self.expect(']')
+                return ('byte', index)
+            if value in FLAG_FIELDS:
+                return ('flag', value)
+            if value in NUMBER_FIELDS:
+                return ('field', value)
+            raise FilterError(f"Unknown field {value!r}", position)
+        raise FilterError("Expected a value" if kind == 'end' else f"Unexpected {value!r}", position)
+
+
+def is_float(node):
+    """Whether an expression can have a non-integer value (time, cycle, 1.5, 50ms)"""
+    kind = node[0]
+    if kind == 'number':
+        return isinstance(node[1], float)
+    if kind == 'field':
+        return node[1] in FLOAT_FIELDS
+    if kind == 'binary':
+        return is_float(node[2]) or is_float(node[3])
+    if kind == 'unary':
+        return is_float(node[2])
+    return False
+
+
+def check_integer(node, position):
+    """Raise FilterError for a bitwise operator with a non-integer operand"""
+    if node[1] in INTEGER_OPERATORS and is_float(node):
+        raise FilterError(f"{node[1]!r} needs integer operands", position)
+
+
+def is_boolean(node):
+    return node[0] in ('compare', 'in', 'and', 'or', 'not', 'flag')
+
+
+def fields_of(node):
+    """Names of the record columns an expression reads"""
+    kind = node[0]
+    if kind == 'field':
+        return {NUMBER_FIELDS[node[1]]}
+    if kind == 'flag':
+        return {'flags'}
+    if kind == 'byte':
+        return {'data', 'dlc'}
+    found = set()
+    for child in node[1:]:
+        if isinstance(child, tuple):
+            found |= fields_of(child)
+    return found
+
+
+class ScalarCompiler:
+    """Python source of an expression over one frame's fields"""
+
+    names = {'can_id': 'can_id', 'dlc': 'dlc', 'timestamp': 'timestamp', 'cycle': 'cycle', 'channel': 'channel'}
+
+    def boolean(self, node):
+        return self.emit(node) if is_boolean(node) else f"({self.emit(node)} != 0)"
+
+    def number(self, node):
+        return self.emit(node)
+
+    def emit(self, node):
+        kind = node[0]
+        if kind == 'number':
+            return repr(node[1])
+        if kind == 'field':
+            return self.names[NUMBER_FIELDS[node[1]]]
+        if kind == 'flag':
+            return f"((flags & {FLAG_FIELDS[node[1]]}) != 0)"
+        if kind == 'byte':
+            return self.byte(node[1])
+        if kind == 'binary':
+            if node[1] in ('<<', '>>'):
+                return self.shift(self.number(node[2]), self.number(node[3]), node[1] == '<<')
+            return f"({self.number(node[2])} {node[1]} {self.number(node[3])})"
+        if kind == 'unary':
+            return f"({node[1]}{self.number(node[2])})"
+        if kind == 'compare':
+            return f"({self.number(node[2])} {node[1]} {self.number(node[3])})"
+        if kind == 'in':
+            return self.contains(self.number(node[1]), node[2])
+        if kind in ('and', 'or'):
+            return f"({self.boolean(node[1])} {self.logic[kind]} {self.boolean(node[2])})"
+        if kind == 'not':
+            return self.negate(self.boolean(node[1]))
+        raise FilterError(f"Cannot compile {kind}")
+
+    logic = {'and': 'and', 'or': 'or'}
+
+    def byte(self, index):
+        return f"(data[{index}] if dlc > {index} else 0)"
+
+    def shift(self, value, count, left):
+        return f"shift({value}, {count}, {left})"
+
+    def contains(self, value, ranges):
+        if len(ranges) == 1:
+            low, high = ranges[0]
+            return f"({low!r} <= {value} <= {high!r})"
+        # Evaluate the operand once
+        terms = [f"{low!r} <= value <= {high!r}" for low, high in ranges]
+        return f"(lambda value: {' or '.join(terms)})({value})"
+
+    def negate(self, operand):
+        return f"(not {operand})"
+
+    def function(self, node):
+        return f"lambda can_id, flags, dlc, data, timestamp, cycle, channel: bool({self.boolean(node)})"
+
+
+class VectorCompiler(ScalarCompiler):
+    """NumPy source of an expression over columns of capture records"""
+
+    logic = {'and': '&', 'or': '|'}
+
+    def number(self, node):
+        # Booleans take part in arithmetic as 0/1
+        return f"np.asarray({self.emit(node)}, dtype=np.int64)" if is_boolean(node) else self.emit(node)
+
+    def byte(self, index):
+        return f"np.where(dlc > {index}, data[:, {index}], 0).astype(np.int64)"
+
+    def shift(self, value, count, left):
+        return f"shift({value}, {count}, {left}, inexact)"
+
+    def contains(self, value, ranges):
+        terms = [f"(({value} >= {low!r}) & ({value} <= {high!r}))" if low != high else f"({value} == {low!r})"
+                 for low, high in ranges]
+        return f"({' | '.join(terms)})"
+
+    def negate(self, operand):
+        return f"np.logical_not({operand})"
+
+    def function(self, node):
+        return f"lambda can_id, flags, dlc, data, timestamp, cycle, channel, inexact: {self.boolean(node)}"
+
+
+def scalar_shift(value, count, left):
+    """value << count or value >> count of one frame"""
+    if not 0 <= count <= MAX_SHIFT:
+        raise ArithmeticError(f"Shift count {count} out of range")
+    return value << count if left else value >> count
+
+
+def vector_shift(value, count, left, inexact):
+    """
+    value << count or value >> count over columns.
+
+    Rows where the result is not the one of Python integers (a count out
+    of range, bits shifted out of 64) are marked in `inexact`.
+    """
+    value, count = np.broadcast_arrays(np.asarray(value, dtype=np.int64), np.asarray(count, dtype=np.int64))
+    valid = (count >= 0) & (count <= MAX_SHIFT)
+    count = np.where(valid, count, 0)
+    if left:
+        result = np.left_shift(value, count)
+        valid &= np.right_shift(result, count) == value
+    else:
+        result = np.right_shift(value, count)
+    inexact |= ~valid
+    return result
+
+
+def id_ranges(node):
+    """Sorted, disjoint (low, high) ID ranges every match lies in, or None if unconstrained"""
+    kind = node[0]
+    if kind == 'in' and node[1] == ('field', 'id'):
+        return merge_ranges([(int(math.ceil(low)), int(math.floor(high))) for low, high in node[2]])
+    if kind == 'compare':
+        op, left, right = node[1:]
+        if right == ('field', 'id') and left[0] == 'number':
+            op, left, right = {'<': '>', '>': '<', '<=': '>=', '>=': '<='}.get(op, op), right, left
+        if left == ('field', 'id') and right[0] == 'number':
+            value = right[1]
+            bounds = {'==': (value, value), '<': (0, math.ceil(value) - 1), '<=': (0, math.floor(value)),
+                      '>': (math.floor(value) + 1, MAX_CAN_ID), '>=': (math.ceil(value), MAX_CAN_ID)}.get(op)
+            if bounds is not None:
+                return merge_ranges([(int(bounds[0]), int(bounds[1]))])
+        return None
+    if kind == 'and':
+        left, right = id_ranges(node[1]), id_ranges(node[2])
+        if left is None or right is None:
+            return left if right is None else right
+        return merge_ranges([(max(a, c), min(b, d)) for a, b in left for c, d in right])
+    if kind == 'or':
+        left, right = id_ranges(node[1]), id_ranges(node[2])
+        if left is None or right is None:
+            return None
+        return merge_ranges(left + right)
+    return None
+
+
+def merge_ranges(ranges):
+    merged = []
+    for low, high in sorted((max(low, 0), min(high, MAX_CAN_ID)) for low, high in ranges):
+        if low > high:
+            continue
+        if merged and low <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], high))
+        else:
+            merged.append((low, high))
+    return merged
+
+
+def range_masks(low, high):
+    """Aligned (can_id, can_mask) blocks that exactly cover low..high"""
+    blocks = []
+    while low <= high:
+        size = low & -low if low else 1 << 29
+        while size > high - low + 1:
+            size >>= 1
+        blocks.append((low, MAX_CAN_ID & ~(size - 1)))
+        low += size
+    return blocks
+
+
+class DisplayFilter:
+    """A compiled display filter.
+
+    :param text: Filter expression, see the module documentation.
+    :raises FilterError: if the expression is invalid.
+    """
+
+    def __init__(self, text):
+        self.text = text.strip()
+        tree = Parser(self.text).parse()
+        self.fields = fields_of(tree)
+        self.uses_cycle = 'cycle' in self.fields
+        self.ranges = id_ranges(tree)
+        self.scalar_source = ScalarCompiler().function(tree)
+        self.vector_source = VectorCompiler().function(tree)
+        self.match = eval(compile(self.scalar_source, "<display filter>", "eval"), {'shift': scalar_shift})
+        self.match_columns = eval(compile(self.vector_source, "<display filter>", "eval"),
+                                  {'np': np, 'shift': vector_shift})
+        # Both versions must run; a frame that cannot be evaluated only fails to match
+        probe = np.zeros(SCALAR_FRAMES + 1, dtype=RECORD_DTYPE)
+        try:
+            self.mask(probe)
+            self.mask(probe[:1])
+        except (NameError, TypeError) as e:
+            raise FilterError(f"Cannot evaluate the filter: {e}") from e
+
+    def __repr__(self):
+        return f"DisplayFilter({self.text!r})"
+
+    def can_filters(self):
+        """python-can acceptance filters for the IDs the filter can match, or None to receive all IDs"""
+        if self.ranges is None:
+            return None
+        filters = [{'can_id': can_id, 'can_mask': can_mask}
+                   for low, high in self.ranges for can_id, can_mask in range_masks(low, high)]
+        if len(filters) > MAX_ACCEPTANCE_FILTERS:
+            return None
+        # No frame can match: a filter no ID passes, instead of none (which passes all)
+        return filters or [{'can_id': MAX_CAN_ID, 'can_mask': MAX_CAN_ID, 'extended': False}]
+
+    def mask(self, records, cycles=None):
+        """Boolean array: which of the capture records match"""
+        count = len(records)
+        if count == 0:
+            return np.zeros(0, dtype=bool)
+        if cycles is None and self.uses_cycle:
+            cycles = np.full(count, np.nan)
+        if count <= SCALAR_FRAMES:
+            return self.mask_frames(records, cycles)
+        columns = {name: None for name in ('can_id', 'flags', 'dlc', 'data', 'timestamp', 'cycle', 'channel')}
+        columns['inexact'] = inexact = np.zeros(count, dtype=bool)
+        for name in self.fields:
+            if name == 'cycle':
+                columns[name] = cycles
+            elif name in ('timestamp', 'data', 'flags'):
+                columns[name] = records[name]
+            else:
+                # Signed, so that e.g. `id - 0x100` cannot wrap around
+                columns[name] = records[name].astype(np.int64)
+        result = np.asarray(self.match_columns(**columns), dtype=bool)
+        result = np.broadcast_to(result, (count,)).copy() if result.ndim == 0 else result
+        if inexact.any():
+            rows = np.flatnonzero(inexact)
+            result[rows] = self.mask_frames(records[rows], None if cycles is None else cycles[rows])
+        return result
+
+    def mask_frames(self, records, cycles):
+        """mask() with the per-frame closure"""
+        match = self.match
+        data = records['data']
+        if cycles is None:
+            cycles = [math.nan] * len(records)
+        else:
+            cycles = cycles.tolist()
+        return np.fromiter(
+            evaluate(match, ((can_id, flags, dlc, data[i].tobytes(), timestamp, cycles[i], channel)
+                             for i, (can_id, flags, dlc, timestamp, channel) in enumerate(zip(
+                                 records['can_id'].tolist(), records['flags'].tolist(), records['dlc'].tolist(),
+                                 records['timestamp'].tolist(), records['channel'].tolist())))),
+            dtype=bool, count=len(records))
+
+
+def evaluate(match, frames):
+    """match() of each frame's fields; False for a frame it cannot be evaluated for"""
+    for fields in frames:
+        try:
+            yield match(*fields)
+        except ArithmeticError:
+            yield False
+
+
+class FilterFeed:
+    """Apply a DisplayFilter to a growing source and collect the matches in a CaptureStore.
+
+    update() filters at most FILTER_STEP records per call, so a large
+    capture can be worked through in steps between GUI events. The IDs
+    indexed by the store and remembered for `cycle` are bounded by max_ids
+    (see capture.id_limit); an ID forgotten for `cycle` has no cycle time
+    at its next frame.
+    """
+
+    def __init__(self, source, display_filter, max_ids=MAX_IDS, id_policy=LFU):
+        self.source = source
+        self.filter = display_filter
+        self.store = CaptureStore(max_ids, id_policy)
+        self.scanned = 0
+        self.max_ids = max_ids
+        self.last_seen = {}  # can_id -> timestamp of its latest frame, for `cycle`
+
+    def update(self, count=None, limit=FILTER_STEP):
+        """Filter the source up to `count` records; True once all of them are done"""
+        count = len(self.source) if count is None else count
+        stop = min(count, self.scanned + limit)
+        if stop > self.scanned:
+            records = self.source.read(self.scanned, stop)
+            cycles = self.cycles(records) if self.filter.uses_cycle else None
+            self.store.append_records(records[self.filter.mask(records, cycles)])
+            self.scanned = stop
+        return self.scanned >= count
+
+    def cycles(self, records):
+        """Time since the previous frame of the same ID for each record"""
+        can_ids = records['can_id']
+        timestamps = records['timestamp']
+        order = np.argsort(can_ids, kind='stable')
+        sorted_ids = can_ids[order]
+        sorted_times = timestamps[order]
+        cycles = np.empty(len(records))
+        cycles[1:] = np.diff(sorted_times)
+        first = np.ones(len(records), dtype=bool)
+        first[1:] = sorted_ids[1:] != sorted_ids[:-1]
+        last_seen = self.last_seen
+        previous = np.array([last_seen.get(can_id, math.nan) for can_id in sorted_ids[first].tolist()])
+        cycles[first] = sorted_times[first] - previous
+        last = np.ones(len(records), dtype=bool)
+        last[:-1] = first[1:]
+        last_seen.update(zip(sorted_ids[last].tolist(), sorted_times[last].tolist()))
+        n = excess(len(last_seen), self.max_ids)
+        if n:
+            # Only the time of the latest frame is known: forget the least recent IDs
+            seen_ids = list(last_seen)
+            for victim in select_victims(None, list(last_seen.values()), n, LRU).tolist():
+                del last_seen[seen_ids[victim]]
+        result = np.empty(len(records))
+        result[order] = cycles
+        return result
@@ -0,0 +1,382 @@
+"""
+AUTOSAR E2E protection checks: CRC and alive counter of protected IDs.
+
+Each protected ID has an E2EProfile, given as text such as
+"0x100=P01:0x123, 0x200=P05:0x1234" (see parse_profiles()). The standard
+layouts of the profiles are supported:
+
+    P01  CRC8 SAE J1850 in byte 0, 4-bit counter (0-14) in the low nibble
+         of byte 1; the CRC covers the data ID (both bytes, or the low or
+         high byte alternating with the counter: "alt") and bytes 1..n-1.
+    P02  CRC8H2F in byte 0, 4-bit counter in the low nibble of byte 1;
+         the CRC covers bytes 1..n-1 and the data ID selected by the
+         counter from a list of 16.
+    P05  CRC16 CCITT in bytes 0-1 (little endian), 8-bit counter in
+         byte 2; the CRC covers bytes 2..n-1 and the data ID.
+
+CRCs are table driven, and computed for all frames of a profile and
+length at once: one table lookup per byte position over a column of the
+frames' data, so a batch costs a few NumPy operations whatever the
+number of frames and protected IDs. Frames of other IDs only cost the lookup
+that selects the protected ones. The same code checks live batches (the
+last counter of each ID is carried over to the next batch) and recorded
+captures (check_capture(), or python -m capture.e2e).
+
+A frame is checked like the receiver's E2E library would: frames that
+are too short or fail the CRC are counted and do not move the counter;
+the counter then advances by one (ok), repeats, jumps by up to
+`max_delta` (frames lost) or jumps further (wrong sequence).
+"""
+
+import threading
+from collections import deque
+import numpy as np
+from capture.capture_file import FLAG_REMOTE, FLAG_ERROR, FLAG_GAP, MAX_DATA_LENGTH
+
+P01 = "P01"
+P02 = "P02"
+P05 = "P05"
+PROFILES = {P01: (2, 15), P02: (2, 16), P05: (3, 256)}  # name -> (minimum length, counter modulus)
+NAMES = list(PROFILES)  # codes of the profile array
+P01_MODES = ("both", "alt", "low")  # data ID bytes in the P01 CRC
+
+OK = "ok"
+TOO_SHORT = "too short"
+CRC_ERROR = "CRC error"
+INVALID_COUNTER = "invalid counter"
+REPEATED = "repeated"
+LOST = "lost frames"
+WRONG_SEQUENCE = "wrong sequence"
+STATUSES = [OK, TOO_SHORT, CRC_ERROR, INVALID_COUNTER, REPEATED, LOST, WRONG_SEQUENCE]  # codes of a check
+
+MAX_DELTA_COUNTER = 2  # counter jumps up to this are frames lost, larger ones a wrong sequence
+MAX_ERRORS = 10000
+
+
+def crc_table(poly, width):
+    """Lookup table of a non-reflected CRC: the CRC of each byte value with a zero register"""
+    top = 1 << (width - 1)
+    mask = (1 << width) - 1
+    table = []
+    for byte in range(256):
+        crc = byte << (width - 8)
+        for _ in range(8):
+            crc = ((crc << 1) ^ poly) & mask if crc & top else (crc << 1) & mask
+        table.append(crc)
+    return np.array(table, dtype=np.uint8 if width == 8 else np.uint16)
+
+
+CRC8_TABLE = crc_table(0x1D, 8)  # SAE J1850
+CRC8H2F_TABLE = crc_table(0x2F, 8)
+CRC16_TABLE = crc_table(0x1021, 16)  # CCITT
+
+
+def crc8(columns, table, init):
+    """CRC8 of every row, given the rows' bytes as a sequence of columns"""
+    crc = None
+    for column in columns:
+        crc = table[(init if crc is None else crc) ^ column]
+    return crc
+
+
+def crc16(columns, init):
+    """CRC16 CCITT of every row, given the rows' bytes as a sequence of columns"""
+    crc = None
+    for column in columns:
+        crc = np.full(len(column), init, dtype=np.uint16) if crc is None else crc
+        crc = CRC16_TABLE[(crc >> 8) ^ column] ^ (crc << 8)
+    return crc
+
+
+def compute_crc(name, mode, data, counters, data_ids):
+    """
+    CRC of each row of a (frames, length) data matrix, all of one length.
+
+    :param data_ids: data ID of each row; for P02 the one selected by the row's counter
+    """
+    length = data.shape[1]
+    if name == P01:
+        if mode == "both":
+            prefix = [(data_ids & 0xFF).astype(np.uint8), (data_ids >> 8).astype(np.uint8)]
+        elif mode == "alt":
+            prefix = [np.where(counters % 2 == 0, data_ids & 0xFF, data_ids >> 8).astype(np.uint8)]
+        else:
+            prefix = [(data_ids & 0xFF).astype(np.uint8)]
+        columns = prefix + [data[:, i] for i in range(1, length)]
+        return crc8(columns, CRC8_TABLE, np.uint8(0)).astype(np.int64)
+    if name == P02:
+        columns = [data[:, i] for i in range(1, length)] + [data_ids.astype(np.uint8)]
+        return (crc8(columns, CRC8H2F_TABLE, np.uint8(0xFF)) ^ 0xFF).astype(np.int64)
+    columns = [data[:, i] for i in range(2, length)]
+    columns += [(data_ids & 0xFF).astype(np.uint8), (data_ids >> 8).astype(np.uint8)]
+    return crc16(columns, 0xFFFF).astype(np.int64)
+
+
+class E2EProfile:
+    """
+    E2E protection of one ID.
+
+    :param name: P01, P02 or P05
+    :param data_id: 16-bit data ID (P01, P05), or a list of 16 data IDs of one byte (P02)
+    :param mode: data ID bytes in the P01 CRC: "both", "alt" or "low"
+    """
+
+    def __init__(self, name, data_id=0, mode="both", max_delta=MAX_DELTA_COUNTER):
+        if name not in PROFILES:
+            raise ValueError(f"Unknown E2E profile: {name}")
+        if mode not in P01_MODES:
+            raise ValueError(f"Unknown data ID mode: {mode}")
+        self.name = name
+        self.min_length, self.modulus = PROFILES[name]
+        self.mode = mode
+        self.max_delta = max_delta
+        if name == P02:
+            data_ids = list(data_id) if isinstance(data_id, (list, tuple)) else [data_id] * 16
+            if len(data_ids) != 16:
+                raise ValueError("P02 needs 16 data IDs")
+            self.data_id = np.array(data_ids, dtype=np.uint8)
+        else:
+            self.data_id = int(data_id) & 0xFFFF
+
+    def __repr__(self):
+        data_id = self.data_id.tolist() if self.name == P02 else self.data_id
+        return f"E2EProfile({self.name!r}, {data_id!r}, {self.mode!r})"
+
+    def data_ids(self, counters):
+        """Data ID of each frame, given the frames' counters"""
+        if self.name == P02:
+            return self.data_id[counters]
+        return np.full(len(counters), self.data_id, dtype=np.int64)
+
+    def compute_crc(self, data, counters):
+        """CRC of each row of a (frames, length) data matrix, all of one length"""
+        return compute_crc(self.name, self.mode, data, counters, self.data_ids(counters))
+
+
+def parse_profiles(text):
+    """
+    {CAN ID: E2EProfile} from text like "0x100=P01:0x123, 0x101=P01:0x124:alt,
+    0x200=P02:1/2/.../16, 0x300=P05:0x1234"
+
+    :raise ValueError: on a malformed entry
+    """
+    profiles = {}
+    for part in text.replace(";", ",").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        can_id, separator, spec = part.partition("=")
+        fields = spec.strip().split(":")
+        try:
+            if not separator or len(fields) > 3:
+                raise ValueError
+            name = fields[0].strip().upper()
+            data_id = 0
+            if len(fields) > 1:
+                values = [int(value, 0) for value in fields[1].split("/")]
+                data_id = values if len(values) > 1 else values[0]
+            mode = fields[2].strip().lower() if len(fields) > 2 else "both"
+            profiles[int(can_id.strip(), 0)] = E2EProfile(name, data_id, mode)
+        except ValueError as e:
+            raise ValueError(f"Invalid E2E profile '{part}'" + (f": {e}" if str(e) else "")) from None
+    return profiles
+
+
+class E2EChecker:
+    """
+    CRC and counter checks of the protected IDs.
+
+    Usable as a CANReceiver subscriber through update_batch(); readers take
+    copies under the lock. The profile and state of each protected ID are
+    kept in NumPy arrays indexed by a slot per ID (the ID's position among
+    the sorted protected IDs), so a batch is checked with array operations
+    over all of its protected frames: grouped by profile and length for
+    the CRCs, and sorted by slot for the counters. Python only handles the
+    frames that fail. Errors are (serial, time, CAN ID, status, detail,
+    data) tuples, one per frame that is not ok.
+
+    :param profiles: {CAN ID: E2EProfile}
+    """
+
+    def __init__(self, profiles=None, max_errors=MAX_ERRORS):
+        self.lock = threading.Lock()
+        self.profiles = dict(profiles or {})
+        self.max_errors = max_errors
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.ids = np.array(sorted(self.profiles), dtype=np.uint32)
+            profiles = [self.profiles[can_id] for can_id in self.ids.tolist()]
+            count = len(profiles)
+            self.kinds = np.array([NAMES.index(profile.name) for profile in profiles], dtype=np.int64)
+            self.modes = np.array([P01_MODES.index(profile.mode) for profile in profiles], dtype=np.int64)
+            self.min_length = np.array([profile.min_length for profile in profiles], dtype=np.int64)
+            self.modulus = np.array([profile.modulus for profile in profiles], dtype=np.int64)
+            self.max_delta = np.array([profile.max_delta for profile in profiles], dtype=np.int64)
+            self.data_ids = np.array([0 if profile.name == P02 else profile.data_id for profile in profiles],
+                                     dtype=np.int64)
+            self.p02_ids = np.zeros((count, 16), dtype=np.int64)
+            for slot, profile in enumerate(profiles):
+                if profile.name == P02:
+                    self.p02_ids[slot] = profile.data_id
+            self.counter = np.full(count, -1, dtype=np.int64)  # last accepted counter, -1: none yet
+            self.status = np.full(count, -1, dtype=np.int8)  # check result of the latest frame
+            self.last_time = np.full(count, np.nan)
+            self.frame_count = np.zeros(count, dtype=np.int64)
+            self.counts = np.zeros((count, len(STATUSES)), dtype=np.int64)  # frames per check result
+            self.lost = np.zeros(count, dtype=np.int64)  # frames lost in tolerated counter jumps
+            self.errors = deque(maxlen=self.max_errors)
+            self.error_count = 0
+            self.frames = 0
+            self.checked = 0
+
+    def update_batch(self, batch):
+        """Fold in a FrameBatch (usable as a CANReceiver subscriber)"""
+        if len(batch):
+            self.process(np.frombuffer(batch.can_ids, dtype=np.uint32), np.frombuffer(batch.flags, dtype=np.uint8),
+                         np.frombuffer(batch.timestamps, dtype=np.float64), np.frombuffer(batch.dlcs, dtype=np.uint8),
+                         np.frombuffer(batch.data, dtype=np.uint8).reshape(-1, MAX_DATA_LENGTH))
+
+    def update(self, records):
+        """Fold in an array of capture records"""
+        if len(records):
+            self.process(records['can_id'], records['flags'], records['timestamp'], records['dlc'], records['data'])
+
+    def process(self, can_ids, flags, timestamps, dlcs, data):
+        with self.lock:
+            self.frames += len(can_ids)
+            if not len(self.ids):
+                return
+            selected = np.flatnonzero(np.isin(can_ids, self.ids)
+                                      & ((flags & (FLAG_REMOTE | FLAG_ERROR | FLAG_GAP)) == 0))
+            if not len(selected):
+                return
+            self.checked += len(selected)
+            slots = np.searchsorted(self.ids, can_ids[selected])
+            order = np.argsort(slots, kind='stable')
+            selected = selected[order]
+            self.check(slots[order], timestamps[selected], dlcs[selected].astype(np.int64), data[selected])
+
+    def check(self, slots, timestamps, lengths, data):
+        """Check frames sorted by slot, in time order within a slot"""
+        p05 = self.kinds[slots] == NAMES.index(P05)
+        received = np.where(p05, data[:, 0] | (data[:, 1].astype(np.int64) << 8), data[:, 0]).astype(np.int64)
+        counters = np.where(p05, data[:, 2], data[:, 1] & 0x0F).astype(np.int64)
+        codes = np.zeros(len(data), dtype=np.int8)
+        long_enough = lengths >= self.min_length[slots]
+        codes[~long_enough] = STATUSES.index(TOO_SHORT)
+
+        # One CRC computation per profile, data ID mode and length
+        computed = received.copy()
+        checked = np.flatnonzero(long_enough)
+        groups = (self.kinds[slots[checked]] * len(P01_MODES) + self.modes[slots[checked]]) * (MAX_DATA_LENGTH + 1) \
+            + lengths[checked]
+        for group in np.unique(groups).tolist():
+            rows = checked[groups == group]
+            kind_mode, length = divmod(group, MAX_DATA_LENGTH + 1)
+            kind, mode = divmod(kind_mode, len(P01_MODES))
+            name = NAMES[kind]
+            data_ids = self.p02_ids[slots[rows], counters[rows]] if name == P02 else self.data_ids[slots[rows]]
+            computed[rows] = compute_crc(name, P01_MODES[mode], data[rows, :length], counters[rows], data_ids)
+        codes[long_enough & (computed != received)] = STATUSES.index(CRC_ERROR)
+        codes[(codes == 0) & (counters >= self.modulus[slots])] = STATUSES.index(INVALID_COUNTER)
+
+        # Counter continuity over the frames that passed, the first of each ID from its previous batch
+        accepted = np.flatnonzero(codes == 0)
+        deltas = np.zeros(len(data), dtype=np.int64)
+        if len(accepted):
+            values = counters[accepted]
+            accepted_slots = slots[accepted]
+            first = np.ones(len(accepted), dtype=bool)
+            first[1:] = accepted_slots[1:] != accepted_slots[:-1]
+            previous = np.empty(len(accepted), dtype=np.int64)
+            previous[1:] = values[:-1]
+            last_counters = self.counter[accepted_slots[first]]
+            previous[first] = np.where(last_counters < 0, values[first] - 1, last_counters)
+            accepted_deltas = (values - previous) % self.modulus[accepted_slots]
+            deltas[accepted] = accepted_deltas
+            jumps = accepted_deltas > 1
+            tolerated = jumps & (accepted_deltas <= self.max_delta[accepted_slots])
+            codes[accepted[accepted_deltas == 0]] = STATUSES.index(REPEATED)
+            codes[accepted[tolerated]] = STATUSES.index(LOST)
+            codes[accepted[jumps & ~tolerated]] = STATUSES.index(WRONG_SEQUENCE)
+            last = np.ones(len(accepted), dtype=bool)
+            last[:-1] = first[1:]
+            self.counter[accepted_slots[last]] = values[last]
+            self.lost += np.bincount(accepted_slots[tolerated], weights=accepted_deltas[tolerated] - 1,
+                                     minlength=len(self.ids)).astype(np.int64)
+
+        count = len(self.ids)
+        self.frame_count += np.bincount(slots, minlength=count)
+        self.counts += np.bincount(slots * len(STATUSES) + codes, minlength=count * len(STATUSES)).reshape(count, -1)
+        latest = np.flatnonzero(np.append(slots[1:] != slots[:-1], True))
+        self.status[slots[latest]] = codes[latest]
+        self.last_time[slots[latest]] = timestamps[latest]
+        for i in np.flatnonzero(codes)[-self.max_errors:].tolist():
+            status = STATUSES[codes[i]]
+            if status == CRC_ERROR:
+                width = 4 if p05[i] else 2
+                detail = f"CRC 0x{received[i]:0{width}X}, expected 0x{computed[i]:0{width}X}"
+            elif status == TOO_SHORT:
+                detail = f"{lengths[i]} bytes"
+            else:
+                detail = f"counter {counters[i]}" + (f" (+{deltas[i]})" if deltas[i] else "")
+            self.errors.append((self.error_count, float(timestamps[i]), int(self.ids[slots[i]]), status, detail,
+                                data[i, :lengths[i]].tobytes()))
+            self.error_count += 1
+
+    def id_rows(self):
+        """(CAN ID, profile, status, frames, {status: frames}, lost, last counter) of every protected ID, by ID"""
+        with self.lock:
+            return [(can_id, NAMES[self.kinds[slot]], None if self.status[slot] < 0 else STATUSES[self.status[slot]],
+                     int(self.frame_count[slot]), dict(zip(STATUSES, self.counts[slot].tolist())),
+                     int(self.lost[slot]), None if self.counter[slot] < 0 else int(self.counter[slot]))
+                    for slot, can_id in enumerate(self.ids.tolist())]
+
+    def errors_since(self, serial):
+        with self.lock:
+            skip = max(serial - (self.error_count - len(self.errors)), 0)
+            return [self.errors[i] for i in range(skip, len(self.errors))]
+
+    def summary(self):
+        with self.lock:
+            failing = int(np.count_nonzero(self.status > 0))
+            return {'frames': self.frames, 'checked': self.checked, 'ids': len(self.ids), 'failing': failing,
+                    'errors': self.error_count}
+
+
+def check_capture(source, profiles, block=1 << 20):
+    """E2EChecker with every frame of a capture store or reader checked"""
+    checker = E2EChecker(profiles)
+    for start in range(0, len(source), block):
+        checker.update(source.read(start, start + block))
+    return checker
+
+
+def main():
+    import argparse
+    import time
+    from capture.correlation import open_source
+
+    parser = argparse.ArgumentParser(description="Check the AUTOSAR E2E CRCs and counters of a capture")
+    parser.add_argument("capture", help=".canspy capture or candump/ASC/TRC/BLF log")
+    parser.add_argument("profiles", help='protected IDs, e.g. "0x100=P01:0x123, 0x200=P05:0x1234"')
+    parser.add_argument("--errors", type=int, default=20, help="errors listed")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    source = open_source(args.capture)
+    checker = check_capture(source, parse_profiles(args.profiles))
+    summary = checker.summary()
+    print(f"{summary['checked']} of {summary['frames']} frames checked in {time.perf_counter() - start:.2f} s")
+    for can_id, name, status, frames, counts, lost, _ in checker.id_rows():
+        errors = ", ".join(f"{count} {what}" for what, count in counts.items() if count and what != OK)
+        print(f"0x{can_id:X} {name}: {frames} frames, {errors or 'no errors'}" + (f" ({lost} lost)" if lost else ""))
+    for _, when, can_id, status, detail, data in checker.errors_since(0)[:args.errors]:
+        print(f"{when:.6f} 0x{can_id:X} {status}: {detail}  {data.hex(' ').upper()}")
+    source.close()
+
+
+if __name__ == '__main__':
+    main()
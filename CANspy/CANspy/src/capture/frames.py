@@ -0,0 +1,179 @@
+"""
+Compact frame types for passing frames between pipeline stages.
+
+CANMessage is a slotted single frame with plain int/float/bytes fields,
+about a third of the size of a can.Message. FrameBatch holds many frames in
+contiguous arrays (one per field plus a fixed-stride data buffer), so
+thousands of frames can be handed from the receive thread to the store,
+the table or a writer without creating an object per frame. Both convert
+to and from can.Message and capture records (RECORD_DTYPE).
+"""
+
+from array import array
+import numpy as np
+from capture.capture_file import (RECORD_DTYPE, MAX_DATA_LENGTH, FLAG_EXTENDED, FLAG_FD, FLAG_REMOTE,
+                                  FLAG_ERROR, message_flags, message_data, record_to_message)
+
+PADDING = bytes(MAX_DATA_LENGTH)
+
+
+class CANMessage:
+    """One CAN frame. `flags` holds the capture FLAG_* bits."""
+
+    __slots__ = ('timestamp', 'identifier', 'flags', 'dlc', 'data', 'channel')
+
+    def __init__(self, identifier, data=b'', is_fd=False, timestamp=0.0, flags=0, dlc=None, channel=0):
+        self.timestamp = float(timestamp)
+        self.identifier = int(identifier)
+        self.data = bytes(data)
+        self.flags = int(flags) | (FLAG_FD if is_fd else 0)
+        self.dlc = len(self.data) if dlc is None else int(dlc)
+        self.channel = channel
+
+    @property
+    def is_fd(self):
+        return bool(self.flags & FLAG_FD)
+
+    @property
+    def is_extended_id(self):
+        return bool(self.flags & FLAG_EXTENDED)
+
+    @property
+    def is_remote_frame(self):
+        return bool(self.flags & FLAG_REMOTE)
+
+    @property
+    def is_error_frame(self):
+        return bool(self.flags & FLAG_ERROR)
+
+    @classmethod
+    def from_message(cls, msg, channel=0):
+        """Build from a can.Message"""
+        return cls(msg.arbitration_id, msg.data, timestamp=msg.timestamp, flags=message_flags(msg),
+                   dlc=msg.dlc, channel=channel)
+
+    @classmethod
+    def from_record(cls, record):
+        """Build from a capture record"""
+        length = int(record['dlc'])
+        flags = int(record['flags'])
+        data = b'' if flags & FLAG_REMOTE else record['data'][:length].tobytes()
+        return cls(int(record['can_id']), data, timestamp=float(record['timestamp']), flags=flags, dlc=length,
+                   channel=int(record['channel']))
+
+    def to_message(self):
+        """Convert to a can.Message"""
+        return record_to_message(self.to_record())
+
+    def to_record(self):
+        """Convert to a capture record; a remote frame keeps its DLC as dlc, like message_data()"""
+        record = np.zeros((), dtype=RECORD_DTYPE)
+        record['timestamp'] = self.timestamp
+        record['can_id'] = self.identifier
+        record['flags'] = self.flags
+        record['dlc'] = self.dlc if self.flags & FLAG_REMOTE else len(self.data)
+        record['channel'] = self.channel
+        record['data'][:len(self.data)] = np.frombuffer(self.data, dtype=np.uint8)
+        return record
+
+    def __eq__(self, other):
+        if not isinstance(other, CANMessage):
+            return NotImplemented
+        return (self.timestamp, self.identifier, self.flags, self.dlc, self.data, self.channel) == \
+            (other.timestamp, other.identifier, other.flags, other.dlc, other.data, other.channel)
+
+    def __repr__(self):
+        return f"CANMessage(identifier={self.identifier}, data={self.data}, is_fd={self.is_fd})"
+
+
+class FrameBatch:
+    """Frames stored column-wise in contiguous arrays.
+
+    Appending costs a few array appends and no per-frame object; the columns
+    are exposed as NumPy arrays and the whole batch converts to an array of
+    capture records in one vectorized step.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.timestamps = array('d')
+        self.can_ids = array('I')
+        self.flags = array('B')
+        self.dlcs = array('B')
+        self.channels = array('B')
+        self.data = bytearray()  # MAX_DATA_LENGTH bytes per frame
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def append(self, timestamp, can_id, flags, data, channel=0):
+        """Append one frame"""
+        length = len(data)
+        self.timestamps.append(timestamp)
+        self.can_ids.append(can_id)
+        self.flags.append(flags)
+        self.dlcs.append(length)
+        self.channels.append(channel)
+        self.data += data
+        self.data += PADDING[length:]
+
+    def append_message(self, msg, channel=0):
+        """Append a can.Message"""
+        self.append(float(msg.timestamp), msg.arbitration_id, message_flags(msg), message_data(msg), channel)
+
+    def extend(self, other):
+        """Append all frames of another batch"""
+        self.timestamps.extend(other.timestamps)
+        self.can_ids.extend(other.can_ids)
+        self.flags.extend(other.flags)
+        self.dlcs.extend(other.dlcs)
+        self.channels.extend(other.channels)
+        self.data += other.data
+
+    def __getitem__(self, index):
+        """Frame at an index as a CANMessage"""
+        index = range(len(self))[index]
+        start = index * MAX_DATA_LENGTH
+        flags = self.flags[index]
+        length = 0 if flags & FLAG_REMOTE else self.dlcs[index]
+        return CANMessage(self.can_ids[index], self.data[start:start + length], timestamp=self.timestamps[index],
+                          flags=flags, dlc=self.dlcs[index], channel=self.channels[index])
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def to_records(self):
+        """The batch as an array of RECORD_DTYPE records"""
+        records = np.zeros(len(self), dtype=RECORD_DTYPE)
+        records['timestamp'] = np.frombuffer(self.timestamps, dtype=np.float64)
+        records['can_id'] = np.frombuffer(self.can_ids, dtype=np.uint32)
+        records['flags'] = np.frombuffer(self.flags, dtype=np.uint8)
+        records['dlc'] = np.frombuffer(self.dlcs, dtype=np.uint8)
+        records['channel'] = np.frombuffer(self.channels, dtype=np.uint8)
+        records['data'] = np.frombuffer(self.data, dtype=np.uint8).reshape(-1, MAX_DATA_LENGTH)
+        return records
+
+    def to_messages(self):
+        """The batch as a list of can.Message"""
+        return [record_to_message(record) for record in self.to_records()]
+
+    @classmethod
+    def from_records(cls, records):
+        batch = cls()
+        batch.timestamps.frombytes(np.ascontiguousarray(records['timestamp'], dtype=np.float64).tobytes())
+        batch.can_ids.frombytes(np.ascontiguousarray(records['can_id'], dtype=np.uint32).tobytes())
+        batch.flags.frombytes(np.ascontiguousarray(records['flags'], dtype=np.uint8).tobytes())
+        batch.dlcs.frombytes(np.ascontiguousarray(records['dlc'], dtype=np.uint8).tobytes())
+        batch.channels.frombytes(np.ascontiguousarray(records['channel'], dtype=np.uint8).tobytes())
+        batch.data += np.ascontiguousarray(records['data'], dtype=np.uint8).tobytes()
+        return batch
+
+    @classmethod
+    def from_messages(cls, messages, channel=0):
+        batch = cls()
+        for msg in messages:
+            batch.append_message(msg, channel)
+        return batch
@@ -0,0 +1,344 @@
+"""
+Gateway between two buses, a cangw-like bridge that works on any interface.
+
+A Gateway opens bus A and bus B and runs one forwarding thread per
+direction. Each thread waits for a frame, then drains everything else the
+driver already holds (up to BATCH_FRAMES) and forwards the whole batch, so
+a burst costs one wake-up instead of one per frame. Every frame is checked
+against all rules of its direction; each matching rule sends its own,
+possibly modified, copy, as cangw does with several jobs.
+
+A rule is written as one line:
+
+    a>b 0x100/0x700 id=0x200 data[0]|=0x80 len=8 rate=100 burst=5 name=speed
+
+    a>b, b>a        direction
+    ID[/MASK]       match frames with can_id & MASK == ID & MASK; without a
+                    mask the ID must match exactly, "*" matches everything
+    ext, std        only extended or standard frames
+    id OP VALUE     rewrite the CAN ID, OP being =, &=, |= or ^=
+    data[i] OP V    modify payload byte i (bytes beyond the frame are left alone)
+    len=N           set the payload length (cut off or padded with zeros)
+    rate=R burst=B  forward at most R frames/s, with bursts of up to B frames
+    name=TEXT       name shown in the statistics
+
+Per rule the gateway counts matched, forwarded, rate-limited and failed
+frames and keeps the latest LATENCY_SAMPLES forwarding latencies (from
+recv() returning to send() returning) for percentiles.
+
+    python -m capture.gateway --a socketcan:can0 --b pcan:PCAN_USBBUS1 --rule "a>b *" --rule "b>a *"
+"""
+
+import re
+import threading
+import time
+import numpy as np
+from capture.receiver import WAKE_INTERVAL
+
+BATCH_FRAMES = 256
+LATENCY_SAMPLES = 1 << 16
+LATENCY_PERCENTILES = (50, 90, 99)
+
+DIRECTIONS = ("a>b", "b>a")
+OPERATIONS = {
+    "=": lambda old, value: value,
+    "&=": lambda old, value: old & value,
+    "|=": lambda old, value: old | value,
+    "^=": lambda old, value: old ^ value,
+}
+MODIFICATION_PATTERN = re.compile(r"^(id|data\[(\d+)\]|len)(=|&=|\|=|\^=)(0[xX][0-9a-fA-F]+|\d+)$")
+MATCH_PATTERN = re.compile(r"^(0[xX][0-9a-fA-F]+|\d+)(?:/(0[xX][0-9a-fA-F]+|\d+))?$")
+CAN_EFF_MASK = 0x1FFFFFFF
+
+
+class GatewayRule:
+    """One forwarding rule with its counters; see the module docstring for the syntax"""
+
+    def __init__(self, direction="a>b", can_id=0, mask=0, extended=None, modifications=(), rate=None,
+                 burst=1, name=None):
+        if direction not in DIRECTIONS:
+            raise ValueError(f"Direction must be one of {', '.join(DIRECTIONS)}")
+        self.direction = direction
+        self.can_id = can_id & mask
+        self.mask = mask
+        self.extended = extended
+        self.modifications = list(modifications)  # (field, byte index, operation, value)
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.name = name or f"{direction} 0x{can_id:X}/0x{mask:X}"
+        self.reset()
+
+    @classmethod
+    def parse(cls, text):
+        """Rule from its one-line form, e.g. "a>b 0x100/0x700 id^=0x400 rate=50" """
+        words = text.split()
+        if not words or words[0] not in DIRECTIONS:
+            raise ValueError(f"Rule {text!r} must start with a direction ({', '.join(DIRECTIONS)})")
+        options = {'direction': words[0], 'modifications': []}
+        for word in words[1:]:
+            match = MATCH_PATTERN.match(word)
+            if word == "*":
+                options['can_id'], options['mask'] = 0, 0
+            elif match:
+                options['can_id'] = int(match.group(1), 0)
+                options['mask'] = int(match.group(2), 0) if match.group(2) else CAN_EFF_MASK
+            elif word in ("ext", "std"):
+                options['extended'] = word == "ext"
+            elif word.startswith(("rate=", "burst=", "name=")):
+                key, _, value = word.partition("=")
+                options[key] = value if key == "name" else float(value)
+            else:
+                match = MODIFICATION_PATTERN.match(word)
+                if match is None:
+                    raise ValueError(f"Unknown rule element {word!r} in {text!r}")
+                field, index, operation, value = match.groups()
+                value = int(value, 0)
+                if field.startswith("data"):
+                    if value > 0xFF:
+                        raise ValueError(f"Byte value out of range in {word!r}")
+                    options['modifications'].append(("data", int(index), operation, value))
+                elif field == "len":
+                    if operation != "=" or value > 64:
+                        raise ValueError(f"Use len=N with N up to 64, not {word!r}")
+                    options['modifications'].append(("len", 0, operation, value))
+                else:
+                    options['modifications'].append(("id", 0, operation, value & CAN_EFF_MASK))
+        if 'can_id' not in options:
+            raise ValueError(f"Rule {text!r} needs an ID to match, or * for all frames")
+        return cls(**options)
+
+    def reset(self):
+        self.matched = 0
+        self.forwarded = 0
+        self.limited = 0
+        self.errors = 0
+        self.tokens = float(self.burst)
+        self.refilled = time.monotonic()
+        self.latencies = np.zeros(LATENCY_SAMPLES, dtype=np.float64)
+        self.latency_count = 0
+
+    def matches(self, msg):
+        if (msg.arbitration_id & self.mask) != self.can_id:
+            return False
+        return self.extended is None or msg.is_extended_id == self.extended
+
+    def take_token(self, now):
+        """True if the rate limit lets another frame through at `now`"""
+        if self.rate is None:
+            return True
+        self.tokens = min(self.burst, self.tokens + (now - self.refilled) * self.rate)
+        self.refilled = now
+        if self.tokens < 1.0:
+            return False
+        self.tokens -= 1.0
+        return True
+
+    def apply(self, msg):
+        """The frame to forward for `msg`, modified by the rule"""
+        import can
+        can_id = msg.arbitration_id
+        data = msg.data
+        if self.modifications:
+            data = bytearray(data)
+            for field, index, operation, value in self.modifications:
+                if field == "id":
+                    can_id = OPERATIONS[operation](can_id, value)
+                elif field == "data":
+                    if index < len(data):
+                        data[index] = OPERATIONS[operation](data[index], value)
+                elif value < len(data):
+                    del data[value:]
+                else:
+                    data.extend(bytes(value - len(data)))
+        return can.Message(arbitration_id=can_id, is_extended_id=msg.is_extended_id or can_id > 0x7FF,
+                           data=data, is_fd=msg.is_fd, bitrate_switch=msg.bitrate_switch,
+                           is_remote_frame=msg.is_remote_frame, dlc=len(data) if data else msg.dlc,
+                           check=False)
+
+    def add_latency(self, seconds):
+        self.latencies[self.latency_count % LATENCY_SAMPLES] = seconds
+        self.latency_count += 1
+
+    def statistics(self):
+        """Counters and latency percentiles (microseconds) of the rule"""
+        samples = self.latencies[:min(self.latency_count, LATENCY_SAMPLES)]
+        result = {'name': self.name, 'matched': self.matched, 'forwarded': self.forwarded,
+                  'limited': self.limited, 'errors': self.errors}
+        if len(samples):
+            values = np.percentile(samples, LATENCY_PERCENTILES) * 1e6
+            for percentile, value in zip(LATENCY_PERCENTILES, values):
+                result[f'p{percentile}_us'] = float(value)
+            result['max_us'] = float(samples.max() * 1e6)
+        return result
+
+
+class Gateway:
+    """
+    Forwards frames between two buses according to a list of GatewayRule.
+
+    :param config_a: python-can Bus arguments of bus A.
+    :param config_b: python-can Bus arguments of bus B.
+    :param rules: GatewayRule objects (or their one-line forms).
+    """
+
+    def __init__(self, config_a, config_b, rules):
+        self.configs = {'a': dict(config_a), 'b': dict(config_b)}
+        self.rules = [GatewayRule.parse(rule) if isinstance(rule, str) else rule for rule in rules]
+        self.buses = {}
+        self.threads = []
+        self.running = False
+        self.error = None
+        self.frames_received = {'a': 0, 'b': 0}
+
+    def start(self):
+        import can
+        if self.running:
+            return False
+        self.error = None
+        try:
+            for side, config in self.configs.items():
+                self.buses[side] = can.Bus(**config)
+        except Exception:
+            self.close_buses()
+            raise
+        self.running = True
+        self.threads = []
+        for direction in DIRECTIONS:
+            source, target = direction.split(">")
+            rules = [rule for rule in self.rules if rule.direction == direction]
+            if not rules:
+                continue
+            thread = threading.Thread(target=self.forward, args=(source, target, rules), daemon=True,
+                                      name=f"gateway {direction}")
+            self.threads.append(thread)
+            thread.start()
+        return True
+
+    def stop(self, timeout=2):
+        self.running = False
+        for thread in self.threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout=timeout)
+        self.close_buses()
+
+    def close_buses(self):
+        for bus in self.buses.values():
+            try:
+                bus.shutdown()
+            except Exception:
+                pass
+        self.buses = {}
+
+    def forward(self, source, target, rules):
+        """Forwarding loop of one direction (runs on its own thread)"""
+        bus_in, bus_out = self.buses[source], self.buses[target]
+        clock = time.perf_counter
+        batch = []
+        try:
+            while self.running:
+                msg = bus_in.recv(WAKE_INTERVAL)
+                if msg is None:
+                    continue
+                # Take everything the driver already holds before sending
+                batch.append((msg, clock()))
+                while len(batch) < BATCH_FRAMES:
+                    msg = bus_in.recv(0)
+                    if msg is None:
+                        break
+                    batch.append((msg, clock()))
+                self.frames_received[source] += len(batch)
+                now = time.monotonic()
+                for msg, received in batch:
+                    if msg.is_error_frame:
+                        continue
+                    for rule in rules:
+                        if not rule.matches(msg):
+                            continue
+                        rule.matched += 1
+                        if not rule.take_token(now):
+                            rule.limited += 1
+                            continue
+                        try:
+                            bus_out.send(rule.apply(msg))
+                        except Exception:
+                            rule.errors += 1
+                            continue
+                        rule.forwarded += 1
+                        rule.add_latency(clock() - received)
+                batch.clear()
+        except Exception as e:
+            self.error = e
+            self.running = False
+
+    def statistics(self):
+        return [rule.statistics() for rule in self.rules]
+
+    def reset_statistics(self):
+        for rule in self.rules:
+            rule.reset()
+
+
+def parse_bus(text, bitrate=None, fd=False):
+    """python-can Bus arguments from "interface:channel", e.g. "socketcan:can0" """
+    interface, _, channel = text.partition(":")
+    if not interface or not channel:
+        raise ValueError(f"Bus {text!r} must be given as interface:channel")
+    config = {'interface': interface, 'channel': channel}
+    if bitrate:
+        config['bitrate'] = bitrate
+    if fd:
+        config['fd'] = True
+    return config
+
+
+def format_statistics(stats):
+    text = (f"{stats['name']}: {stats['matched']} matched, {stats['forwarded']} forwarded, "
+            f"{stats['limited']} rate-limited, {stats['errors']} failed")
+    if 'max_us' in stats:
+        percentiles = ", ".join(f"p{p} {stats[f'p{p}_us']:.0f}" for p in LATENCY_PERCENTILES)
+        text += f"; latency {percentiles}, max {stats['max_us']:.0f} us"
+    return text
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Forward frames between two CAN buses")
+    parser.add_argument("--a", required=True, help="bus A as interface:channel, e.g. socketcan:can0")
+    parser.add_argument("--b", required=True, help="bus B as interface:channel, e.g. pcan:PCAN_USBBUS1")
+    parser.add_argument("--bitrate", type=int, help="bit rate of both buses")
+    parser.add_argument("--fd", action="store_true")
+    parser.add_argument("--rule", action="append", default=[], help='e.g. "a>b 0x100/0x700 id^=0x400 rate=50"')
+    parser.add_argument("--rules", help="file with one rule per line (# starts a comment)")
+    parser.add_argument("--duration", type=float, help="stop after this many seconds")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between statistics")
+    args = parser.parse_args()
+
+    rules = list(args.rule)
+    if args.rules:
+        with open(args.rules, "r", encoding="utf-8") as file:
+            rules += [line.split("#")[0].strip() for line in file if line.split("#")[0].strip()]
+    if not rules:
+        parser.error("no rules given (--rule or --rules)")
+    gateway = Gateway(parse_bus(args.a, args.bitrate, args.fd), parse_bus(args.b, args.bitrate, args.fd),
+                      [GatewayRule.parse(rule) for rule in rules])
+    gateway.start()
+    start = time.monotonic()
+    try:
+        while gateway.running:
+            time.sleep(args.interval)
+            for stats in gateway.statistics():
+                print(format_statistics(stats))
+            if args.duration and time.monotonic() - start >= args.duration:
+                break
+    except KeyboardInterrupt:
+        pass
+    gateway.stop()
+    if gateway.error:
+        print(f"Error: {gateway.error}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,51 @@
+"""
+Bounds for per-ID state.
+
+A fuzzing node or a misconfigured ECU sending random 29-bit IDs adds an
+entry to every per-ID table (receiver state, store index, overwrite view)
+for each frame, until memory runs out. A table bounded by max_ids holds at
+most that many IDs: when it grows past the limit, the IDs the eviction
+policy ranks lowest are removed in one vectorized step, down to
+max_ids - max_ids // EVICT_FRACTION, and folded into an "other IDs"
+aggregate. Evicting a batch at a time keeps the cost per frame constant
+however many distinct IDs arrive.
+
+LFU evicts the IDs with the fewest frames, the least recent first among
+equals, so periodic traffic survives a flood of one-off IDs. LRU evicts
+the IDs whose latest frame is the oldest. An ID that comes back after it
+was evicted is counted afresh.
+"""
+
+import numpy as np
+
+LFU = "least frequent"
+LRU = "least recent"
+POLICIES = [LFU, LRU]
+MAX_IDS = 16384  # default limit; far more than any real bus has
+EVICT_FRACTION = 4
+
+
+def excess(size, max_ids):
+    """Number of IDs to evict from a table of `size` IDs; max_ids None means unbounded"""
+    if max_ids is None or size <= max_ids:
+        return 0
+    return size - (max_ids - max_ids // EVICT_FRACTION)
+
+
+def select_victims(counts, latest, n, policy=LFU):
+    """
+    Positions of the n entries to evict.
+
+    :param counts: frames of each entry
+    :param latest: index or time of each entry's latest frame
+    """
+    latest = np.asarray(latest)
+    if n <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if n >= len(latest):
+        return np.arange(len(latest))
+    if policy == LRU:
+        return np.argpartition(latest, n - 1)[:n]
+    if policy != LFU:
+        raise ValueError(f"Unknown eviction policy: {policy}")
+    return np.lexsort((latest, np.asarray(counts)))[:n]
@@ -0,0 +1,402 @@
+"""
+Streaming importers for third-party CAN log formats.
+
+Every importer is a generator that reads the file in large blocks and
+yields (records, position) tuples, where records is an array of up to
+CHUNK_FRAMES RECORD_DTYPE frames and position is the number of bytes
+consumed so far. Lines are split with plain str methods and frames are
+gathered into flat lists that become one numpy array per chunk, which
+keeps the per-line overhead low.
+
+Supported formats:
+    candump -l log files (.log), as written by can-utils
+    Vector ASC (.asc)
+    PCAN-View TRC (.trc), file versions 1.0 to 2.1
+    Vector BLF (.blf), decoded through python-can's BLFReader
+"""
+
+import os
+import threading
+from datetime import datetime
+import numpy as np
+from capture.capture_file import (RECORD_DTYPE, MAX_DATA_LENGTH, FLAG_EXTENDED, FLAG_FD,
+                                  FLAG_REMOTE, FLAG_ERROR, FLAG_BRS, FLAG_ESI, message_flags,
+                                  message_data)
+
+CHUNK_FRAMES = 16384
+BLOCK_SIZE = 1 << 20
+
+CAN_EFF_FLAG = 0x80000000
+CAN_RTR_FLAG = 0x40000000
+CAN_ERR_FLAG = 0x20000000
+CAN_EFF_MASK = 0x1FFFFFFF
+
+# Days between the OLE automation epoch (1899-12-30) and the Unix epoch
+OLE_UNIX_EPOCH_DAYS = 25569
+
+DLC_TO_LENGTH = [0, 1, 2, 3, 4, 5, 6, 7, 8, 12, 16, 20, 24, 32, 48, 64]
+
+# Message flags of ASC CANFD lines
+ASC_FLAG_RTR = 0x0010
+ASC_FLAG_EDL = 0x1000  # extended data length: a CAN FD frame
+
+
+class RecordChunk:
+    """Collect parsed frames and turn them into one record array"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.timestamps = []
+        self.can_ids = []
+        self.flags = []
+        self.lengths = []
+        self.channels = []
+        self.payloads = []
+
+    def add(self, timestamp, can_id, flags, data, channel=0):
+        self.timestamps.append(timestamp)
+        self.can_ids.append(can_id)
+        self.flags.append(flags)
+        self.lengths.append(len(data))
+        self.channels.append(channel)
+        self.payloads.append(data.ljust(MAX_DATA_LENGTH, b'\0'))
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def take(self):
+        records = np.zeros(len(self.timestamps), dtype=RECORD_DTYPE)
+        records['timestamp'] = self.timestamps
+        records['can_id'] = self.can_ids
+        records['flags'] = self.flags
+        records['dlc'] = self.lengths
+        records['channel'] = self.channels
+        records['data'] = np.frombuffer(b''.join(self.payloads), dtype=np.uint8).reshape(-1, MAX_DATA_LENGTH)
+        self.reset()
+        return records
+
+
+def read_lines(path, block_size=BLOCK_SIZE):
+    """Yield (lines, position) for each block of complete lines in a text file"""
+    with open(path, "rb") as f:
+        tail = b''
+        position = 0
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            position += len(block)
+            block = tail + block
+            cut = block.rfind(b'\n') + 1
+            tail = block[cut:]
+            yield block[:cut].decode('latin-1').splitlines(), position - len(tail)
+        if tail:
+            yield tail.decode('latin-1').splitlines(), position
+
+
+def import_candump(path, chunk_frames=CHUNK_FRAMES):
+    """Import a `candump -l` log: "(1436509052.249713) can0 123#11223344" """
+    chunk = RecordChunk()
+    channels = {}
+    position = 0
+    for lines, position in read_lines(path):
+        for line in lines:
+            parts = line.split()
+            if len(parts) < 3 or line[0] != '(':
+                continue
+            try:
+                timestamp = float(parts[0][1:-1])
+                can_id_text, sep, payload = parts[2].partition('#')
+                if not sep:
+                    continue
+                can_id = int(can_id_text, 16)
+                flags = 0
+                if len(can_id_text) == 8:
+                    if can_id & CAN_ERR_FLAG:
+                        flags |= FLAG_ERROR
+                    else:
+                        flags |= FLAG_EXTENDED
+                    can_id &= CAN_EFF_MASK
+                if payload[:1] == '#':
+                    # CAN FD frame: '##' followed by one flags nibble
+                    fd_flags = int(payload[1], 16)
+                    flags |= FLAG_FD
+                    if fd_flags & 0x01:
+                        flags |= FLAG_BRS
+                    if fd_flags & 0x02:
+                        flags |= FLAG_ESI
+                    data = bytes.fromhex(payload[2:])
+                elif payload[:1] in ('R', 'r'):
+                    # Remote frame, optionally with its DLC: 'R' or 'R8'
+                    flags |= FLAG_REMOTE
+                    data = bytes(min(int(payload[1:2] or '0', 16), 8))
+                else:
+                    data = bytes.fromhex(payload)
+            except (ValueError, IndexError):
+                continue
+            channel = channels.setdefault(parts[1], len(channels))
+            chunk.add(timestamp, can_id, flags, data, channel)
+            if len(chunk) >= chunk_frames:
+                yield chunk.take(), position
+    if len(chunk):
+        yield chunk.take(), position
+
+
+def _asc_datetime(text):
+    """Parse the date of an ASC 'date' or 'Begin Triggerblock' line"""
+    months = {"Jan": 1, "Feb": 2, "Mar": 3, "Apr": 4, "May": 5, "Jun": 6, "Jul": 7,
+              "Aug": 8, "Sep": 9, "Oct": 10, "Nov": 11, "Dec": 12,
+              "Mär": 3, "Mai": 5, "Okt": 10, "Dez": 12}
+    parts = text.split()
+    # Drop the weekday name ("Mon Jan 13 10:02:03.123 am 2020")
+    if parts and parts[0][:3] not in months:
+        parts = parts[1:]
+    if parts and parts[0][:3] in months:
+        parts[0] = str(months[parts[0][:3]])
+    text = ' '.join(parts)
+    for fmt in ("%m %d %I:%M:%S.%f %p %Y", "%m %d %I:%M:%S %p %Y",
+                "%m %d %H:%M:%S.%f %Y", "%m %d %H:%M:%S %Y"):
+        try:
+            return datetime.strptime(text, fmt).timestamp()
+        except ValueError:
+            continue
+    return 0.0
+
+
+def import_asc(path, chunk_frames=CHUNK_FRAMES):
+    """Import a Vector ASC log (classic CAN and CANFD lines)"""
+    chunk = RecordChunk()
+    base = 16
+    relative = False
+    start_time = 0.0
+    previous = 0.0
+    position = 0
+    for lines, position in read_lines(path):
+        for line in lines:
+            parts = line.split()
+            if len(parts) < 3:
+                continue
+            first = parts[0]
+            if not first[:1].isdigit():
+                keyword = first.lower()
+                if keyword == 'date':
+                    start_time = _asc_datetime(' '.join(parts[1:]))
+                elif keyword == 'base':
+                    base = 10 if parts[1] == 'dec' else 16
+                    relative = len(parts) > 3 and parts[3] == 'relative'
+                elif keyword == 'begin' and len(parts) > 2 and parts[1].lower() == 'triggerblock':
+                    start_time = _asc_datetime(' '.join(parts[2:])) or start_time
+                continue
+            try:
+                offset = float(first)
+                if relative:
+                    previous += offset
+                    offset = previous
+                kind = parts[1]
+                if kind == 'CANFD':
+                    # CANFD <ch> <dir> <id> [name] <brs> <esi> <dlc> <len> <data...>
+                    #       [<duration> <bit count> <flags> ...]
+                    channel = int(parts[2]) - 1
+                    if parts[4].lower().startswith('errorframe'):
+                        continue
+                    can_id_text = parts[4]
+                    fields = parts[5:]
+                    if not fields[0].isdigit() or len(fields[0]) > 1:
+                        fields = fields[1:]  # symbolic frame name
+                    brs, esi, dlc, length = fields[0], fields[1], int(fields[2], 16), int(fields[3])
+                    data_fields = fields[4:4 + length]
+                    trailer = fields[4 + length:]
+                    if len(trailer) > 2:
+                        line_flags = int(trailer[2], 16)
+                        fd, remote = line_flags & ASC_FLAG_EDL, line_flags & ASC_FLAG_RTR
+                    else:
+                        # Only a classic remote frame has a DLC but no data
+                        remote = dlc > 0 and length == 0
+                        fd = not remote
+                    if remote and not fd:
+                        flags = FLAG_REMOTE
+                        data_fields = ['00'] * DLC_TO_LENGTH[min(dlc, 8)]
+                    else:
+                        flags = FLAG_FD if fd else 0
+                        if fd and brs == '1':
+                            flags |= FLAG_BRS
+                        if fd and esi == '1':
+                            flags |= FLAG_ESI
+                elif kind.isdigit():
+                    # <ch> <id> <dir> <d|r> <dlc> <data...>
+                    channel = int(kind) - 1
+                    if parts[2].lower().startswith('errorframe'):
+                        chunk.add(start_time + offset, 0, FLAG_ERROR, b'', channel)
+                        continue
+                    can_id_text = parts[2]
+                    flags = 0
+                    if parts[4].lower() == 'r':
+                        flags |= FLAG_REMOTE
+                        dlc = parts[5] if len(parts) > 5 else ''  # a remote frame's DLC, if logged
+                        data_fields = ['00'] * min(int(dlc), 8) if len(dlc) == 1 and dlc.isdigit() else []
+                    else:
+                        length = DLC_TO_LENGTH[min(int(parts[5], base), 8)]
+                        data_fields = parts[6:6 + length]
+                else:
+                    continue  # statistics, J1939TP and other events
+                if can_id_text[-1] in 'xX':
+                    flags |= FLAG_EXTENDED
+                    can_id_text = can_id_text[:-1]
+                can_id = int(can_id_text, base)
+                if base == 16:
+                    data = bytes.fromhex(''.join(data_fields))
+                else:
+                    data = bytes(int(b) for b in data_fields)
+            except (ValueError, IndexError):
+                continue
+            chunk.add(start_time + offset, can_id, flags, data, channel)
+            if len(chunk) >= chunk_frames:
+                yield chunk.take(), position
+    if len(chunk):
+        yield chunk.take(), position
+
+
+# Column layouts of the TRC versions without a $COLUMNS line
+TRC_COLUMNS = {
+    '1.0': 'NOIlD',
+    '1.1': 'NOdIlD',
+    '1.2': 'NOBdIlD',
+    '1.3': 'NOBdIRlD',
+    '2.0': 'NOTIdlD',
+}
+
+TRC_FD_TYPES = {'FD': 0, 'FB': FLAG_BRS, 'FE': FLAG_ESI, 'BI': FLAG_BRS | FLAG_ESI}
+
+
+def import_trc(path, chunk_frames=CHUNK_FRAMES):
+    """Import a PCAN-View TRC trace"""
+    chunk = RecordChunk()
+    version = '1.0'  # files without $FILEVERSION are version 1.0
+    columns = None
+    start_time = 0.0
+    position = 0
+    for lines, position in read_lines(path):
+        for line in lines:
+            if not line or line[0] == ';':
+                if line.startswith(';$FILEVERSION='):
+                    version = line.split('=', 1)[1].strip()
+                elif line.startswith(';$STARTTIME='):
+                    start_time = (float(line.split('=', 1)[1]) - OLE_UNIX_EPOCH_DAYS) * 86400
+                elif line.startswith(';$COLUMNS='):
+                    columns = line.split('=', 1)[1].strip().replace(',', '')
+                continue
+            if columns is None:
+                columns = TRC_COLUMNS.get(version, TRC_COLUMNS['1.0'])
+            parts = line.split()
+            if len(parts) < len(columns) - 1:
+                continue
+            try:
+                fields = dict(zip(columns[:-1], parts))
+                frame_type = fields.get('T', 'DT')
+                flags = 0
+                if frame_type in TRC_FD_TYPES:
+                    flags = FLAG_FD | TRC_FD_TYPES[frame_type]
+                elif frame_type == 'RR':
+                    flags = FLAG_REMOTE
+                elif frame_type != 'DT':
+                    continue  # status, error counter and event lines
+                can_id_text = fields['I']
+                if can_id_text == 'FFFFFFFF':
+                    continue  # v1.x error/status line
+                can_id = int(can_id_text, 16)
+                if len(can_id_text) > 4:
+                    flags |= FLAG_EXTENDED
+                # 'L' is the DLC, 'l' the data length in bytes
+                if 'L' in fields:
+                    length = DLC_TO_LENGTH[int(fields['L'])]
+                else:
+                    data_length = fields['l']
+                    length = 0 if data_length == 'RTR' else int(data_length)
+                    if parts[len(columns) - 1:len(columns)] == ['RTR']:
+                        flags |= FLAG_REMOTE
+                channel = int(fields['B']) - 1 if 'B' in fields else 0
+                offset = float(fields['O'].rstrip(')') if 'O' in fields else 0) / 1000
+                data_fields = parts[len(columns) - 1:]
+                if flags & FLAG_REMOTE:
+                    data = bytes(length)
+                else:
+                    data = bytes.fromhex(''.join(data_fields[:length]))
+            except (ValueError, IndexError, KeyError):
+                continue
+            chunk.add(start_time + offset, can_id, flags, data, channel)
+            if len(chunk) >= chunk_frames:
+                yield chunk.take(), position
+    if len(chunk):
+        yield chunk.take(), position
+
+
+def import_blf(path, chunk_frames=CHUNK_FRAMES):
+    """Import a Vector BLF log through python-can's BLF decoder"""
+    import can
+    chunk = RecordChunk()
+    position = 0
+    with open(path, "rb") as f:
+        reader = can.BLFReader(f)
+        for msg in reader:
+            chunk.add(msg.timestamp, msg.arbitration_id, message_flags(msg), bytes(message_data(msg)),
+                      msg.channel if isinstance(msg.channel, int) else 0)
+            if len(chunk) >= chunk_frames:
+                position = f.tell()
+                yield chunk.take(), position
+        position = os.path.getsize(path)
+    if len(chunk):
+        yield chunk.take(), position
+
+
+IMPORTERS = {
+    '.log': import_candump,
+    '.asc': import_asc,
+    '.trc': import_trc,
+    '.blf': import_blf,
+}
+
+
+def importer_for(path):
+    """Return the importer generator function for a log file, or None"""
+    return IMPORTERS.get(os.path.splitext(path)[1].lower())
+
+
+class ImportThread(threading.Thread):
+    """Import a log file into a CaptureStore in the background.
+
+    The store is filled chunk by chunk, so the first frames can be browsed
+    while the rest of the file is still being indexed. on_progress is called
+    from the import thread with (frames, percent) after each chunk.
+    """
+
+    def __init__(self, path, store, on_progress=None, on_finished=None):
+        super().__init__(daemon=True)
+        self.path = path
+        self.store = store
+        self.on_progress = on_progress
+        self.on_finished = on_finished
+        self.running = True
+        self.error = None
+
+    def run(self):
+        importer = importer_for(self.path)
+        try:
+            if importer is None:
+                raise ValueError(f"Unsupported log format: {self.path}")
+            total = max(os.path.getsize(self.path), 1)
+            for records, position in importer(self.path):
+                if not self.running:
+                    break
+                self.store.append_records(records)
+                if self.on_progress:
+                    self.on_progress(len(self.store), int(position * 100 / total))
+        except Exception as e:
+            self.error = e
+        finally:
+            if self.on_finished:
+                self.on_finished(self.error)
+
+    def stop(self):
+        self.running = False
@@ -0,0 +1,317 @@
+"""
+ISO-TP (ISO 15765-2) reassembly, in the spirit of isotpsniffer.
+
+IsoTpDecoder follows diagnostic traffic as it is received and turns the
+single, first and consecutive frames of each sender into complete PDUs. A
+flow is kept per CAN ID, with the ID of its partner: the data of a flow
+goes out on its own ID, and the flow control frames for it come back on
+the partner's ID. Flows are looked up in a dict by CAN ID, so each frame
+costs one lookup; a batch is first narrowed down to the diagnostic IDs
+with NumPy, so other traffic costs nothing per frame.
+
+Which IDs are diagnostic is configured as (tester ID, ECU ID) pairs. By
+default these are the OBD/UDS IDs 0x7E0-0x7E7 <-> 0x7E8-0x7EF and the
+functional request ID 0x7DF, plus 29-bit normal fixed addressing
+(0x18DA<target><source> and functional 0x18DB<target><source>), whose
+flows are created when first seen. Normal addressing is assumed (no
+address extension byte).
+
+Both classic and CAN FD ISO-TP are understood: single frames with the
+escape length byte, first frames with a 32-bit length and consecutive
+frames of up to 63 bytes. Reassembly buffers are allocated once per flow
+and bounded by max_length; a transfer is abandoned when the next
+consecutive frame does not arrive within `timeout` (N_Cr) or arrives out
+of sequence, and is then reported with that status.
+"""
+
+import threading
+from collections import deque
+import numpy as np
+from capture.capture_file import MAX_DATA_LENGTH, FLAG_EXTENDED, FLAG_REMOTE, FLAG_ERROR, FLAG_GAP
+
+# Protocol control information: high nibble of the first byte
+SINGLE_FRAME = 0
+FIRST_FRAME = 1
+CONSECUTIVE_FRAME = 2
+FLOW_CONTROL = 3
+
+# Flow status of a flow control frame
+FLOW_STATUS_NAMES = {0: "continue", 1: "wait", 2: "overflow"}
+
+# Status of a reported PDU
+OK = "ok"
+TIMEOUT = "timeout"
+SEQUENCE_ERROR = "sequence error"
+INTERRUPTED = "interrupted"  # a new single or first frame arrived in the middle of a transfer
+OVERFLOW = "overflow"  # longer than max_length, or the receiver answered overflow
+
+MAX_PDU_LENGTH = 1 << 16  # longest PDU reassembled; 4095 is the classic CAN limit
+N_CR_TIMEOUT = 1.0  # seconds between consecutive frames before a transfer is abandoned
+MAX_PDUS = 10000  # completed PDUs kept
+MAX_FLOWS = 1024  # flows created on the fly for fixed addressing
+
+DEFAULT_PAIRS = [(0x7E0 + i, 0x7E8 + i) for i in range(8)] + [(0x7DF, None)]
+FIXED_PHYSICAL = 0x18DA0000
+FIXED_FUNCTIONAL = 0x18DB0000
+FIXED_MASK = 0x1FFF0000
+
+# UDS (ISO 14229) services, by request SID
+UDS_SERVICES = {
+    0x10: "DiagnosticSessionControl", 0x11: "ECUReset", 0x14: "ClearDiagnosticInformation",
+    0x19: "ReadDTCInformation", 0x22: "ReadDataByIdentifier", 0x23: "ReadMemoryByAddress",
+    0x24: "ReadScalingDataByIdentifier", 0x27: "SecurityAccess", 0x28: "CommunicationControl",
+    0x29: "Authentication", 0x2A: "ReadDataByPeriodicIdentifier", 0x2C: "DynamicallyDefineDataIdentifier",
+    0x2E: "WriteDataByIdentifier", 0x2F: "InputOutputControlByIdentifier", 0x31: "RoutineControl",
+    0x34: "RequestDownload", 0x35: "RequestUpload", 0x36: "TransferData", 0x37: "RequestTransferExit",
+    0x38: "RequestFileTransfer", 0x3D: "WriteMemoryByAddress", 0x3E: "TesterPresent",
+    0x83: "AccessTimingParameter", 0x84: "SecuredDataTransmission", 0x85: "ControlDTCSetting",
+    0x86: "ResponseOnEvent", 0x87: "LinkControl",
+}
+UDS_NEGATIVE_RESPONSE = 0x7F
+UDS_RESPONSE_CODES = {
+    0x10: "generalReject", 0x11: "serviceNotSupported", 0x12: "subFunctionNotSupported",
+    0x13: "incorrectMessageLengthOrInvalidFormat", 0x14: "responseTooLong", 0x21: "busyRepeatRequest",
+    0x22: "conditionsNotCorrect", 0x24: "requestSequenceError", 0x31: "requestOutOfRange",
+    0x33: "securityAccessDenied", 0x35: "invalidKey", 0x36: "exceedNumberOfAttempts",
+    0x37: "requiredTimeDelayNotExpired", 0x70: "uploadDownloadNotAccepted", 0x71: "transferDataSuspended",
+    0x72: "generalProgrammingFailure", 0x73: "wrongBlockSequenceCounter",
+    0x78: "requestCorrectlyReceived-ResponsePending", 0x7E: "subFunctionNotSupportedInActiveSession",
+    0x7F: "serviceNotSupportedInActiveSession",
+}
+
+
+def describe_uds(payload):
+    """Short UDS description of a PDU, e.g. "ReadDataByIdentifier response" """
+    if not payload:
+        return ""
+    sid = payload[0]
+    if sid == UDS_NEGATIVE_RESPONSE and len(payload) >= 3:
+        service = UDS_SERVICES.get(payload[1], f"0x{payload[1]:02X}")
+        code = UDS_RESPONSE_CODES.get(payload[2], f"0x{payload[2]:02X}")
+        return f"{service} negative: {code}"
+    if sid in UDS_SERVICES:
+        return UDS_SERVICES[sid]
+    if sid - 0x40 in UDS_SERVICES:
+        return f"{UDS_SERVICES[sid - 0x40]} response"
+    return ""
+
+
+class Flow:
+    """Reassembly state of the data sent on one CAN ID"""
+
+    __slots__ = ('can_id', 'partner', 'receiving', 'buffer', 'length', 'received', 'sequence', 'started',
+                 'last', 'frames', 'block_size', 'separation_time', 'waits')
+
+    def __init__(self, can_id, partner):
+        self.can_id = can_id
+        self.partner = partner
+        self.buffer = bytearray()
+        self.receiving = False
+        self.length = 0
+        self.received = 0
+        self.sequence = 0
+        self.started = 0.0
+        self.last = 0.0
+        self.frames = 0
+        self.block_size = None  # from the partner's last flow control frame
+        self.separation_time = None
+        self.waits = 0
+
+
+class IsoTpDecoder:
+    """
+    Reassembles ISO-TP PDUs from received frames.
+
+    :param pairs: (tester ID, ECU ID) pairs; an ECU ID of None is a
+        functional request ID without responses. Defaults to DEFAULT_PAIRS.
+    :param fixed_addressing: Also follow 29-bit normal fixed addressing.
+    :param max_length: Longest PDU that is reassembled.
+    :param timeout: N_Cr in seconds.
+    """
+
+    def __init__(self, pairs=None, fixed_addressing=True, max_length=MAX_PDU_LENGTH, timeout=N_CR_TIMEOUT,
+                 max_pdus=MAX_PDUS):
+        self.lock = threading.Lock()
+        self.pairs = list(DEFAULT_PAIRS if pairs is None else pairs)
+        self.fixed_addressing = fixed_addressing
+        self.max_length = max_length
+        self.timeout = timeout
+        self.max_pdus = max_pdus
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.flows = {}
+            for tester, ecu in self.pairs:
+                self.flows[tester] = Flow(tester, ecu)
+                if ecu is not None:
+                    self.flows[ecu] = Flow(ecu, tester)
+            self.configured_ids = np.array(sorted(self.flows), dtype=np.uint32)
+            self.active = {}  # flows in the middle of a transfer
+            self.pdus = deque(maxlen=self.max_pdus)
+            self.pdu_count = 0  # PDUs reported so far, including those dropped from `pdus`
+            self.frames = 0
+            self.flow_control_frames = 0
+            self.stray_frames = 0  # consecutive frames without a transfer, malformed frames
+
+    def update_batch(self, batch):
+        """Fold in a FrameBatch (usable as a CANReceiver subscriber)"""
+        can_ids = np.frombuffer(batch.can_ids, dtype=np.uint32)
+        flags = np.frombuffer(batch.flags, dtype=np.uint8)
+        selected = self.select(can_ids, flags)
+        if not len(selected):
+            return
+        data = batch.data
+        with self.lock:
+            for index in selected.tolist():
+                start = index * MAX_DATA_LENGTH
+                self.handle(batch.can_ids[index], batch.timestamps[index],
+                            data[start:start + batch.dlcs[index]])
+            self.expire(batch.timestamps[-1])
+
+    def update(self, records):
+        """Fold in an array of capture records"""
+        selected = self.select(records['can_id'], records['flags'])
+        with self.lock:
+            for record in records[selected]:
+                self.handle(int(record['can_id']), float(record['timestamp']),
+                            record['data'][:record['dlc']].tobytes())
+            if len(records):
+                self.expire(float(records['timestamp'][-1]))
+
+    def select(self, can_ids, flags):
+        """Indices of the frames that belong to a diagnostic ID"""
+        wanted = np.isin(can_ids, self.configured_ids)
+        if self.fixed_addressing:
+            fixed = can_ids & FIXED_MASK
+            wanted |= ((fixed == FIXED_PHYSICAL) | (fixed == FIXED_FUNCTIONAL)) & ((flags & FLAG_EXTENDED) != 0)
+        wanted &= (flags & (FLAG_REMOTE | FLAG_ERROR | FLAG_GAP)) == 0
+        return np.flatnonzero(wanted)
+
+    def flow_for(self, can_id):
+        flow = self.flows.get(can_id)
+        if flow is None and len(self.flows) < MAX_FLOWS + len(self.configured_ids):
+            # 29-bit fixed addressing: the partner swaps target and source address
+            partner = None
+            if can_id & FIXED_MASK == FIXED_PHYSICAL:
+                partner = FIXED_PHYSICAL | ((can_id & 0xFF) << 8) | ((can_id >> 8) & 0xFF)
+            flow = self.flows[can_id] = Flow(can_id, partner)
+        return flow
+
+    def handle(self, can_id, timestamp, data):
+        """Process one frame of a diagnostic ID"""
+        flow = self.flow_for(can_id)
+        if flow is None or not data:
+            return
+        self.frames += 1
+        kind = data[0] >> 4
+        if kind == SINGLE_FRAME:
+            length, header = data[0] & 0x0F, 1
+            if length == 0 and len(data) > 8:  # CAN FD escape: length in the second byte
+                length, header = data[1], 2
+            if length == 0 or header + length > len(data):
+                self.stray_frames += 1
+                return
+            if flow.receiving:
+                self.finish(flow, INTERRUPTED, timestamp)
+            self.report(timestamp, timestamp, flow, bytes(data[header:header + length]), OK, 1)
+        elif kind == FIRST_FRAME:
+            if len(data) < 2:
+                self.stray_frames += 1
+                return
+            length, header = ((data[0] & 0x0F) << 8) | data[1], 2
+            if length == 0 and len(data) >= 6:  # more than 4095 bytes: 32-bit length
+                length, header = int.from_bytes(data[2:6], 'big'), 6
+            if flow.receiving:
+                self.finish(flow, INTERRUPTED, timestamp)
+            if length > self.max_length:
+                self.report(timestamp, timestamp, flow, bytes(data[header:]), OVERFLOW, 1, length)
+                return
+            if len(flow.buffer) < length:
+                flow.buffer.extend(bytes(length - len(flow.buffer)))
+            received = min(len(data) - header, length)
+            flow.buffer[:received] = data[header:header + received]
+            flow.receiving = True
+            flow.length = length
+            flow.received = received
+            flow.sequence = 1
+            flow.started = flow.last = timestamp
+            flow.frames = 1
+            flow.waits = 0
+            self.active[can_id] = flow
+        elif kind == CONSECUTIVE_FRAME:
+            if flow.receiving and timestamp - flow.last > self.timeout:
+                self.finish(flow, TIMEOUT, flow.last)
+            if not flow.receiving:
+                self.stray_frames += 1
+                return
+            if data[0] & 0x0F != flow.sequence:
+                self.finish(flow, SEQUENCE_ERROR, timestamp)
+                return
+            count = min(len(data) - 1, flow.length - flow.received)
+            flow.buffer[flow.received:flow.received + count] = data[1:1 + count]
+            flow.received += count
+            flow.sequence = (flow.sequence + 1) & 0x0F
+            flow.last = timestamp
+            flow.frames += 1
+            if flow.received >= flow.length:
+                self.finish(flow, OK, timestamp)
+        elif kind == FLOW_CONTROL:
+            # Flow control on this ID steers the transfer of the partner
+            self.flow_control_frames += 1
+            target = self.flows.get(flow.partner) if flow.partner is not None else None
+            if target is None or len(data) < 3:
+                return
+            status = data[0] & 0x0F
+            target.block_size = data[1]
+            target.separation_time = data[2]
+            if target.receiving:
+                target.last = timestamp
+                if status == 1:
+                    target.waits += 1
+                elif status == 2:
+                    self.finish(target, OVERFLOW, timestamp)
+        else:
+            self.stray_frames += 1
+
+    def finish(self, flow, status, timestamp):
+        """End the flow's transfer and report what was received"""
+        self.report(flow.started, timestamp, flow, bytes(flow.buffer[:flow.received]), status, flow.frames,
+                    flow.length)
+        flow.receiving = False
+        self.active.pop(flow.can_id, None)
+
+    def expire(self, now):
+        """Abandon transfers whose next consecutive frame is overdue"""
+        for flow in [flow for flow in self.active.values() if now - flow.last > self.timeout]:
+            self.finish(flow, TIMEOUT, flow.last)
+
+    def report(self, start, end, flow, payload, status, frames, length=None):
+        self.pdus.append((self.pdu_count, start, end, flow.can_id, flow.partner,
+                          len(payload) if length is None else length, payload, status, frames))
+        self.pdu_count += 1
+
+    def pdus_since(self, serial):
+        """PDUs with a serial number >= `serial`, as (serial, start, end, can_id, partner,
+        length, payload, status, frames) tuples; older ones may have been dropped"""
+        with self.lock:
+            skip = max(serial - (self.pdu_count - len(self.pdus)), 0)
+            return [self.pdus[i] for i in range(skip, len(self.pdus))]
+
+    def summary(self):
+        with self.lock:
+            return {'frames': self.frames, 'pdus': self.pdu_count, 'active': len(self.active),
+                    'flows': len(self.flows), 'flow_control': self.flow_control_frames,
+                    'stray': self.stray_frames}
+
+
+def parse_pairs(text):
+    """(tester, ECU) pairs from "7E0:7E8, 18DA10F1:18DAF110" (hex); a lone ID has no responses"""
+    pairs = []
+    for part in text.replace(";", ",").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        tester, _, ecu = part.partition(":")
+        pairs.append((int(tester, 16), int(ecu, 16) if ecu.strip() else None))
+    return pairs
@@ -0,0 +1,321 @@
+"""
+SAE J1939 decoding: ID fields, PGN grouping and transport protocol.
+
+A 29-bit J1939 ID holds the priority (3 bits), the parameter group number
+(PGN: data page bits and PDU format PF, plus PDU specific PS when PF >=
+240) and the source address (SA). For PF < 240 (PDU1) PS is the
+destination address instead. split_id() decodes an ID through an LRU
+cache, so decoding costs one dict lookup per distinct ID.
+
+group_keys() maps IDs to a key per (PGN, SA), dropping priority and
+destination, so the overwrite view and the statistics show one row per
+parameter group and sender instead of one per ID variant.
+
+TransportDecoder reassembles multi-packet messages of the transport
+protocol (TP.CM/TP.DT): broadcasts (BAM) and connection mode transfers
+(RTS/CTS). Sessions live in a fixed pool of MAX_SESSIONS slots with
+preallocated buffers, found by (source, destination) in a dict, so data
+packets of many concurrent sessions are copied into place without
+allocating session objects or buffers per frame.
+"""
+
+import functools
+import threading
+from collections import deque
+import numpy as np
+from capture.capture_file import MAX_DATA_LENGTH, FLAG_EXTENDED, FLAG_REMOTE, FLAG_ERROR, FLAG_GAP
+
+PGN_TP_CM = 0xEC00  # transport protocol connection management
+PGN_TP_DT = 0xEB00  # transport protocol data transfer
+PF_TP_CM = PGN_TP_CM >> 8
+PF_TP_DT = PGN_TP_DT >> 8
+GLOBAL_ADDRESS = 0xFF
+
+# TP.CM control bytes
+TP_RTS = 16
+TP_CTS = 17
+TP_END_OF_MESSAGE_ACK = 19
+TP_BAM = 32
+TP_ABORT = 255
+
+MAX_PACKETS = 255
+MAX_MESSAGE_LENGTH = MAX_PACKETS * 7  # 1785 bytes
+MAX_SESSIONS = 1024
+MAX_MESSAGES = 10000
+BAM_TIMEOUT = 0.75  # T1: longest wait for the next packet of a broadcast
+CMDT_TIMEOUT = 1.25  # T3: longest wait in a connection mode transfer
+
+# Status of a reported transport message
+OK = "ok"
+TIMEOUT = "timeout"
+ABORTED = "aborted"
+SEQUENCE_ERROR = "sequence error"
+INTERRUPTED = "interrupted"  # the sender started a new session
+
+STANDARD_KEY = 0x40000000  # group key bit of 11-bit frames, which are not J1939
+
+PGN_NAMES = {
+    0x00000: "TSC1", 0x0C000: "TC1", 0x0E800: "ACK", 0x0EA00: "Request", PGN_TP_DT: "TP.DT",
+    PGN_TP_CM: "TP.CM", 0x0EE00: "Address Claimed", 0x0FECA: "DM1", 0x0FECB: "DM2", 0x0FECC: "DM3",
+    0x0F003: "EEC2", 0x0F004: "EEC1", 0x0F005: "ETC2", 0x0F001: "EBC1", 0x0F002: "ETC1",
+    0x0FEF1: "CCVS1", 0x0FEEE: "ET1", 0x0FEEF: "EFL/P1", 0x0FEF2: "LFE1", 0x0FEF5: "AMB",
+    0x0FEF6: "IC1", 0x0FEF7: "VEP1", 0x0FEE5: "HOURS", 0x0FEE9: "LFC1", 0x0FEEC: "VI",
+    0x0FEDA: "SOFT", 0x0FEE0: "VD", 0x0FEFC: "DD1", 0x0FE6C: "TCO1", 0x0FDC4: "EEC15",
+}
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def split_id(can_id):
+    """(priority, PGN, source address, destination address) of a 29-bit ID;
+    the destination is GLOBAL_ADDRESS for PDU2 (broadcast) PGNs"""
+    priority = (can_id >> 26) & 0x7
+    pf = (can_id >> 16) & 0xFF
+    ps = (can_id >> 8) & 0xFF
+    pgn = (can_id >> 8) & 0x3FF00
+    if pf >= 240:
+        return priority, pgn | ps, can_id & 0xFF, GLOBAL_ADDRESS
+    return priority, pgn, can_id & 0xFF, ps
+
+
+def pgn_name(pgn):
+    return PGN_NAMES.get(pgn, f"PGN {pgn}")
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def id_text(can_id, extended=True):
+    """CAN ID column text in J1939 mode, e.g. "0x18FEF100 CCVS1 SA 00" """
+    if not extended:
+        return f"0x{can_id:X}"
+    priority, pgn, source, destination = split_id(can_id)
+    text = f"0x{can_id:X} {pgn_name(pgn)} SA {source:02X}"
+    if destination != GLOBAL_ADDRESS:
+        text += f" DA {destination:02X}"
+    return text
+
+
+def group_keys(can_ids, flags):
+    """
+    Key per (PGN, SA) of each frame, for grouping.
+
+    :return: uint32 array: the ID without priority (and without destination
+        for PDU1 PGNs); standard frames keep their ID with STANDARD_KEY set.
+    """
+    can_ids = np.asarray(can_ids, dtype=np.uint32)
+    keys = can_ids & np.uint32(0x03FFFFFF)
+    pdu1 = ((keys >> 16) & 0xFF) < 240
+    keys = np.where(pdu1, keys & np.uint32(0x03FF00FF), keys)
+    extended = (np.asarray(flags) & FLAG_EXTENDED) != 0
+    return np.where(extended, keys, can_ids | np.uint32(STANDARD_KEY)).astype(np.uint32)
+
+
+def key_text(key):
+    """Label of a group key, e.g. "CCVS1 (65265) SA 00" """
+    if key & STANDARD_KEY:
+        return f"0x{key & ~STANDARD_KEY:X}"
+    _, pgn, source, _ = split_id(int(key))
+    return f"{pgn_name(pgn)} ({pgn}) SA {source:02X}"
+
+
+class TransportDecoder:
+    """
+    Reassembles TP.CM/TP.DT transport messages.
+
+    Each session occupies one of MAX_SESSIONS slots: a MAX_MESSAGE_LENGTH
+    region of one shared buffer plus entries in per-slot state lists.
+    """
+
+    def __init__(self, max_sessions=MAX_SESSIONS, max_messages=MAX_MESSAGES):
+        self.max_sessions = max_sessions
+        self.max_messages = max_messages
+        self.buffer = bytearray(max_sessions * MAX_MESSAGE_LENGTH)
+        self.reset()
+
+    def reset(self):
+        slots = self.max_sessions
+        self.slot_of = {}  # (source << 8) | destination -> slot
+        self.free = list(range(slots - 1, -1, -1))
+        self.session_pgn = [0] * slots
+        self.session_size = [0] * slots
+        self.session_packets = [0] * slots
+        self.session_next = [0] * slots  # sequence number of the next data packet
+        self.session_broadcast = [False] * slots
+        self.session_started = [0.0] * slots
+        self.session_last = [0.0] * slots
+        self.messages = deque(maxlen=self.max_messages)
+        self.message_count = 0
+        self.dropped_sessions = 0  # no free slot
+        self.stray_packets = 0
+
+    def handle(self, can_id, timestamp, data):
+        """Process a TP.CM or TP.DT frame"""
+        pf = (can_id >> 16) & 0xFF
+        source = can_id & 0xFF
+        destination = (can_id >> 8) & 0xFF
+        if len(data) < 8:
+            self.stray_packets += 1
+            return
+        if pf == PF_TP_DT:
+            self.data_packet((source << 8) | destination, timestamp, data)
+            return
+        control = data[0]
+        if control in (TP_BAM, TP_RTS):
+            key = (source << 8) | (GLOBAL_ADDRESS if control == TP_BAM else destination)
+            slot = self.slot_of.get(key)
+            if slot is not None:
+                self.finish(key, INTERRUPTED, timestamp)
+            size = data[1] | (data[2] << 8)
+            packets = data[3]
+            if not self.free or size > MAX_MESSAGE_LENGTH or packets == 0:
+                self.dropped_sessions += 1
+                return
+            slot = self.free.pop()
+            self.slot_of[key] = slot
+            self.session_pgn[slot] = data[5] | (data[6] << 8) | (data[7] << 16)
+            self.session_size[slot] = size
+            self.session_packets[slot] = packets
+            self.session_next[slot] = 1
+            self.session_broadcast[slot] = control == TP_BAM
+            self.session_started[slot] = self.session_last[slot] = timestamp
+        elif control == TP_ABORT:
+            # Either side may abort a connection; the sender of the data is the other one
+            for key in ((destination << 8) | source, (source << 8) | destination):
+                if key in self.slot_of:
+                    self.finish(key, ABORTED, timestamp)
+        elif control in (TP_CTS, TP_END_OF_MESSAGE_ACK):
+            # Sent by the receiver: the session is keyed by the data sender
+            slot = self.slot_of.get((destination << 8) | source)
+            if slot is not None:
+                self.session_last[slot] = timestamp
+                # A CTS names the next packet to send, also when it asks for packets again
+                if control == TP_CTS and data[1] > 0 and 1 <= data[2] <= self.session_packets[slot]:
+                    self.session_next[slot] = data[2]
+
+    def data_packet(self, key, timestamp, data):
+        slot = self.slot_of.get(key)
+        if slot is None:
+            slot = self.slot_of.get((key & 0xFF00) | GLOBAL_ADDRESS)  # broadcasts go to the global address
+            key = (key & 0xFF00) | GLOBAL_ADDRESS
+        if slot is None:
+            self.stray_packets += 1
+            return
+        sequence = data[0]
+        if sequence != self.session_next[slot]:
+            self.finish(key, SEQUENCE_ERROR, timestamp)
+            return
+        offset = (sequence - 1) * 7
+        start = slot * MAX_MESSAGE_LENGTH
+        self.buffer[start + offset:start + offset + 7] = data[1:8]
+        self.session_next[slot] = sequence + 1
+        self.session_last[slot] = timestamp
+        if sequence >= self.session_packets[slot]:
+            self.finish(key, OK, timestamp)
+
+    def finish(self, key, status, timestamp):
+        """End a session and report it"""
+        slot = self.slot_of.pop(key)
+        size = self.session_size[slot]
+        received = min((self.session_next[slot] - 1) * 7, size)
+        start = slot * MAX_MESSAGE_LENGTH
+        payload = bytes(self.buffer[start:start + received])
+        self.messages.append((self.message_count, self.session_started[slot], timestamp,
+                              self.session_pgn[slot], key >> 8, key & 0xFF, size, payload, status,
+                              self.session_broadcast[slot]))
+        self.message_count += 1
+        self.free.append(slot)
+
+    def expire(self, now):
+        """End sessions whose next packet is overdue"""
+        overdue = []
+        for key, slot in self.slot_of.items():
+            timeout = BAM_TIMEOUT if self.session_broadcast[slot] else CMDT_TIMEOUT
+            if now - self.session_last[slot] > timeout:
+                overdue.append(key)
+        for key in overdue:
+            self.finish(key, TIMEOUT, self.session_last[self.slot_of[key]])
+
+    def messages_since(self, serial):
+        """Messages with a serial number >= `serial`, as (serial, start, end, pgn, source,
+        destination, size, payload, status, broadcast) tuples"""
+        skip = max(serial - (self.message_count - len(self.messages)), 0)
+        return [self.messages[i] for i in range(skip, len(self.messages))]
+
+
+class J1939Decoder:
+    """
+    Per (PGN, SA) statistics and transport reassembly, fed with received batches.
+
+    Usable as a CANReceiver subscriber through update_batch(); readers take
+    copies under the lock.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.transport = TransportDecoder()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.transport.reset()
+            self.groups = {}  # group key -> [count, first time, last time, last CAN ID, last data]
+            self.frames = 0
+
+    def update_batch(self, batch):
+        """Fold in a FrameBatch (usable as a CANReceiver subscriber)"""
+        if len(batch):
+            self.update(batch.to_records())
+
+    def update(self, records):
+        """Fold in an array of capture records"""
+        records = records[(records['flags'] & (FLAG_REMOTE | FLAG_ERROR | FLAG_GAP)) == 0]
+        if not len(records):
+            return
+        can_ids = records['can_id']
+        flags = records['flags']
+        keys = group_keys(can_ids, flags)
+        unique_keys, first, counts = np.unique(keys, return_index=True, return_counts=True)
+        last = len(keys) - 1 - np.unique(keys[::-1], return_index=True)[1]
+        extended = (flags & FLAG_EXTENDED) != 0
+        pf = (can_ids >> 16) & 0xFF
+        transport = np.flatnonzero(extended & ((pf == PF_TP_CM) | (pf == PF_TP_DT)))
+        timestamps = records['timestamp']
+        last_records = records[last]
+        last_data = memoryview(last_records['data'].tobytes())
+        with self.lock:
+            self.frames += len(records)
+            groups = self.groups
+            for i, (key, first_time, last_time, can_id, dlc, count) in enumerate(zip(
+                    unique_keys.tolist(), timestamps[first].tolist(), last_records['timestamp'].tolist(),
+                    last_records['can_id'].tolist(), last_records['dlc'].tolist(), counts.tolist())):
+                data = bytes(last_data[i * MAX_DATA_LENGTH:i * MAX_DATA_LENGTH + dlc])
+                group = groups.get(key)
+                if group is None:
+                    groups[key] = [count, first_time, last_time, can_id, data]
+                else:
+                    group[0] += count
+                    group[2] = last_time
+                    group[3] = can_id
+                    group[4] = data
+            if len(transport):
+                # One copy of the 8 data bytes of all transport frames, sliced per frame
+                data = memoryview(records['data'][transport, :8].tobytes())
+                handle = self.transport.handle
+                for offset, can_id, timestamp, dlc in zip(range(0, len(data), 8), can_ids[transport].tolist(),
+                                                          timestamps[transport].tolist(),
+                                                          records['dlc'][transport].tolist()):
+                    handle(can_id, timestamp, data[offset:offset + min(dlc, 8)])
+            self.transport.expire(float(timestamps[-1]))
+
+    def group_rows(self):
+        """(key, count, first time, last time, last CAN ID, last data) of every group"""
+        with self.lock:
+            return [(key,) + tuple(group) for key, group in self.groups.items()]
+
+    def messages_since(self, serial):
+        with self.lock:
+            return self.transport.messages_since(serial)
+
+    def summary(self):
+        with self.lock:
+            return {'frames': self.frames, 'groups': len(self.groups),
+                    'messages': self.transport.message_count, 'sessions': len(self.transport.slot_of),
+                    'dropped': self.transport.dropped_sessions}
@@ -0,0 +1,431 @@
+"""
+Capture engine.
+
+CANReceiver owns the bus and the receive thread. That thread is the only
+writer of the capture: it keeps per-ID state (bounded, see
+capture.id_limit), collects frames in a FrameBatch and, every
+`batch_interval` seconds (or BATCH_FRAMES frames), appends the batch to
+the CaptureStore in one step and hands it to all subscribers (and to the
+capture file, while recording). Subscribers run on the receive thread and
+must return quickly; the GUI forwards batches to the Qt thread with a
+queued signal. Nothing here touches Qt, so the engine runs headless and
+can be profiled and benchmarked without a display.
+
+The receive loop can be woken at any time: on buses with a file descriptor
+(SocketCAN) it waits in select() on the bus and a wake-up socket pair, on
+the others (PCAN, virtual) every recv() waits at most WAKE_INTERVAL. So a
+disconnect takes milliseconds and the bus is always shut down by the
+receive thread itself.
+
+With auto_reconnect, losing an open bus (e.g. a PCAN-USB adapter being
+unplugged) does not end the capture: the receiver re-probes the channel
+and reopens the bus with exponential backoff, then continues the same
+session. Store, per-ID state and recording are kept, and the outage is
+recorded as a gap marker (FLAG_GAP record, see gap_record).
+
+    python -m capture.receiver --interface virtual --channel vcan0 --record out.canspy
+"""
+
+import select
+import socket
+import struct
+import threading
+import time
+import numpy as np
+from capture.capture_file import CaptureWriter, FLAG_GAP, GAP_ID, message_flags, message_data
+from capture.frames import FrameBatch
+from capture.id_limit import MAX_IDS, LFU, excess, select_victims
+
+BATCH_INTERVAL = 0.02  # seconds
+BATCH_FRAMES = 4096
+WAKE_INTERVAL = 0.02  # longest recv() wait on buses that cannot be selected on
+RECONNECT_DELAY = 0.5  # first retry delay in seconds, doubled up to RECONNECT_MAX_DELAY
+RECONNECT_MAX_DELAY = 10.0
+DEFAULT_CONFIG = {'interface': 'pcan', 'channel': 'PCAN_USBBUS1', 'bitrate': 500000, 'fd': False}
+
+
+def bus_fileno(bus):
+    """File descriptor to select() on for the bus, or None"""
+    try:
+        fileno = bus.fileno()
+    except (NotImplementedError, AttributeError, OSError):
+        return None
+    return fileno if isinstance(fileno, int) and fileno >= 0 else None
+
+
+def gap_record(start, end):
+    """(timestamp, can_id, flags, data) of a marker for an outage from start to end"""
+    return end, GAP_ID, FLAG_GAP, struct.pack('<d', start)
+
+
+def gap_start(data):
+    """Start time of the outage stored in a gap marker's data"""
+    return struct.unpack_from('<d', bytes(data[:8]))[0]
+
+
+class IDState:
+    """Running state of one CAN ID"""
+
+    __slots__ = ('count', 'first_timestamp', 'last_timestamp', 'cycle')
+
+    def __init__(self, timestamp):
+        self.count = 1
+        self.first_timestamp = timestamp
+        self.last_timestamp = timestamp
+        self.cycle = 0.0  # last period in seconds
+
+    def update(self, timestamp):
+        self.count += 1
+        self.cycle = timestamp - self.last_timestamp
+        self.last_timestamp = timestamp
+
+    def absorb(self, other):
+        """Add the frames of another ID's state (e.g. an evicted one)"""
+        self.count += other.count
+        self.first_timestamp = min(self.first_timestamp, other.first_timestamp)
+        self.last_timestamp = max(self.last_timestamp, other.last_timestamp)
+
+
+class CANReceiver:
+    """Receive frames from a python-can bus into a store and fan them out.
+
+    :param config: Keyword arguments for can.Bus (interface, channel, ...).
+    :param store: CaptureStore to append to, or None to keep no frames
+        (e.g. when they are only recorded).
+    :param batch_interval: Longest time a frame waits before it is published.
+    :param auto_reconnect: Reopen the bus after it was lost instead of stopping.
+    :param max_ids: Most IDs to keep state for (see capture.id_limit), or None.
+    :param id_policy: Which IDs to evict beyond max_ids, LFU or LRU.
+    """
+
+    def __init__(self, config=None, store=None, batch_interval=BATCH_INTERVAL, auto_reconnect=False,
+                 max_ids=MAX_IDS, id_policy=LFU):
+        self.config = config
+        self.store = store
+        self.batch_interval = batch_interval
+        self.auto_reconnect = auto_reconnect
+        self.max_ids = max_ids
+        self.id_policy = id_policy
+        self.subscribers = []
+        self.on_error = None
+        self.on_status = None  # called with a text when the bus is lost or back
+        self.gaps = []  # (start, end) of every outage bridged by a reconnect
+        self.last_timestamp = None
+        self.id_state = {}
+        self.other_state = None  # IDState of the frames of all evicted IDs
+        self.evicted_ids = 0
+        self.batch = FrameBatch()
+        self.flush_at = 0.0
+        self.bus = None
+        self.thread = None
+        self.is_receiving = False
+        self.frames_received = 0
+        self.error = None
+        self.writer = None
+        self.writer_lock = threading.Lock()
+        self.wake_sockets = None
+        self.stop_event = threading.Event()
+        self.connected = False
+        self.connect_event = threading.Event()  # set once the bus is open or opening failed
+        self.can_filters = None  # python-can acceptance filters, None receives all IDs
+
+    def subscribe(self, callback):
+        """Call `callback(batch)` on the receive thread for every published FrameBatch"""
+        # Replaced, not mutated, so the receive thread can iterate without a lock
+        self.subscribers = self.subscribers + [callback]
+
+    def unsubscribe(self, callback):
+        self.subscribers = [s for s in self.subscribers if s != callback]
+
+    def open_bus(self):
+        import can
+        config = dict(self.config or DEFAULT_CONFIG)
+        if self.can_filters is not None:
+            config['can_filters'] = self.can_filters
+        return can.Bus(**config)
+
+    def set_filters(self, can_filters):
+        """Set the acceptance filters (python-can can_filters) of the bus, now and after reconnects"""
+        self.can_filters = can_filters
+        bus = self.bus
+        if bus is not None:
+            bus.set_filters(can_filters)
+
+    def start_receiving(self):
+        if self.is_receiving:
+            return False
+        self.error = None
+        self.connected = False
+        self.connect_event.clear()
+        self.stop_event.clear()
+        self.is_receiving = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return True
+
+    def stop_receiving(self, timeout=2):
+        self.is_receiving = False
+        self.stop_event.set()
+        self.wake()
+        if self.thread and self.thread.is_alive() and self.thread is not threading.current_thread():
+            self.thread.join(timeout=timeout)
+            bus = self.bus
+            if self.thread.is_alive() and bus is not None:
+                # The driver did not return in time; never leave the bus open
+                bus.shutdown()
+
+    def wait_connected(self, timeout=5.0):
+        """Wait until the bus is open; False if opening it failed or did not finish in time"""
+        self.connect_event.wait(timeout)
+        return self.connected and self.error is None
+
+    def wake(self):
+        """Make a receive loop blocked in select() check is_receiving"""
+        sockets = self.wake_sockets
+        if sockets is not None:
+            try:
+                sockets[1].send(b'\0')
+            except OSError:
+                pass
+
+    def close(self):
+        """Stop receiving and recording"""
+        self.stop_receiving()
+        self.stop_recording()
+
+    def start_recording(self, path):
+        """Write all published frames into a capture file"""
+        writer = CaptureWriter(path)
+        with self.writer_lock:
+            old_writer = self.writer
+            self.writer = writer
+        if old_writer is not None:
+            old_writer.close()
+
+    def stop_recording(self):
+        """Stop recording and write the capture index"""
+        with self.writer_lock:
+            writer = self.writer
+            self.writer = None
+        if writer is not None:
+            writer.close()
+
+    def notify(self, text):
+        if self.on_status:
+            self.on_status(text)
+
+    def run(self):
+        bus = None
+        try:
+            while True:
+                try:
+                    self.receive(bus)
+                    break
+                except Exception as e:
+                    # Only a bus that was open and then lost is reconnected
+                    if not (self.auto_reconnect and self.connected and self.is_receiving):
+                        raise
+                    bus = self.reconnect(e)
+                    if bus is None:
+                        break
+        except Exception as e:
+            self.error = e
+            if self.on_error:
+                self.on_error(e)
+        finally:
+            self.flush()
+            self.is_receiving = False
+            self.connect_event.set()
+
+    def reconnect(self, error):
+        """Reopen a lost bus with backoff; returns the bus, or None when stopped first"""
+        lost = time.monotonic()
+        self.flush()
+        # Gap times are in the bus time base, which need not be epoch time
+        lost_at = self.last_timestamp if self.last_timestamp is not None else time.time()
+        self.notify(f"Bus lost ({error}), reconnecting...")
+        delay = RECONNECT_DELAY
+        attempt = 0
+        while not self.stop_event.wait(delay):
+            attempt += 1
+            try:
+                self.probe_channel()
+                bus = self.open_bus()
+            except Exception as e:
+                self.notify(f"Reconnect attempt {attempt} failed: {e}")
+                delay = min(delay * 2, RECONNECT_MAX_DELAY)
+                continue
+            back_at = lost_at + (time.monotonic() - lost)
+            self.gaps.append((lost_at, back_at))
+            self.batch.append(*gap_record(lost_at, back_at))
+            self.flush()
+            self.notify(f"Reconnected after {back_at - lost_at:.1f} s")
+            return bus
+        return None
+
+    def probe_channel(self):
+        """Find the adapter again; it may come back on another PCAN channel"""
+        config = self.config or DEFAULT_CONFIG
+        if config.get('interface') != 'pcan':
+            return
+        from utils.usb2can import probe_pcan_channel, probe_pcan_channels
+        bitrate = config.get('bitrate', 500000)
+        if probe_pcan_channel(config['channel'], bitrate) is not None:
+            return
+        found = probe_pcan_channels(bitrate=bitrate)
+        if not found:
+            raise RuntimeError("No PCAN hardware detected")
+        self.config = dict(config, channel=found[0][0])
+
+    def receive(self, bus=None):
+        """The receive loop, run on the receive thread"""
+        bus = self.bus = bus if bus is not None else self.open_bus()
+        self.connected = True
+        self.connect_event.set()
+        fileno = bus_fileno(bus)
+        wake_reader = None
+        if fileno is not None:
+            self.wake_sockets = socket.socketpair()
+            wake_reader = self.wake_sockets[0]
+            wake_reader.setblocking(False)
+        try:
+            while self.is_receiving:
+                timeout = max(0.0, self.flush_at - time.perf_counter()) if len(self.batch) else 1.0
+                if fileno is None:
+                    msg = bus.recv(min(timeout, WAKE_INTERVAL))
+                else:
+                    msg = bus.recv(0)
+                    if msg is None:
+                        readable = select.select([fileno, wake_reader], [], [], timeout)[0]
+                        if wake_reader in readable:
+                            wake_reader.recv(64)
+                            continue
+                        if readable:
+                            msg = bus.recv(0)
+                if msg is not None:
+                    self.process_message(msg)
+                elif len(self.batch) and time.perf_counter() >= self.flush_at:
+                    self.flush()
+        finally:
+            sockets, self.wake_sockets = self.wake_sockets, None
+            if sockets is not None:
+                for sock in sockets:
+                    sock.close()
+            self.bus = None
+            try:
+                bus.shutdown()
+            except Exception:
+                pass  # a lost device may fail to shut down; the loop error is what counts
+
+    def update_state(self, can_id, timestamp):
+        state = self.id_state.get(can_id)
+        if state is None:
+            self.id_state[can_id] = IDState(timestamp)
+            if self.max_ids is not None and len(self.id_state) > self.max_ids:
+                self.evict_ids()
+        else:
+            state.update(timestamp)
+
+    def evict_ids(self):
+        """Fold the state of the IDs ranked lowest by id_policy into other_state"""
+        can_ids = list(self.id_state)
+        states = list(self.id_state.values())
+        counts = np.fromiter((state.count for state in states), dtype=np.int64, count=len(states))
+        latest = np.fromiter((state.last_timestamp for state in states), dtype=np.float64, count=len(states))
+        victims = select_victims(counts, latest, excess(len(states), self.max_ids), self.id_policy)
+        evicted = IDState(min(states[victim].first_timestamp for victim in victims.tolist()))
+        evicted.count = int(counts[victims].sum())
+        evicted.last_timestamp = float(latest[victims].max())
+        for victim in victims.tolist():
+            del self.id_state[can_ids[victim]]
+        if self.other_state is None:
+            self.other_state = evicted
+        else:
+            self.other_state.absorb(evicted)
+        self.evicted_ids += len(victims)
+
+    def process_message(self, msg):
+        """Take in one can.Message. Only one thread may feed a receiver at a time."""
+        timestamp = float(msg.timestamp)
+        can_id = msg.arbitration_id
+        self.update_state(can_id, timestamp)
+        batch = self.batch
+        if not len(batch):
+            self.flush_at = time.perf_counter() + self.batch_interval
+        batch.append(timestamp, can_id, message_flags(msg), message_data(msg))
+        self.frames_received += 1
+        if len(batch) >= BATCH_FRAMES or time.perf_counter() >= self.flush_at:
+            self.flush()
+
+    def process_records(self, records):
+        """Take in an array of capture records and publish them at once"""
+        update_state = self.update_state
+        for can_id, timestamp in zip(records['can_id'].tolist(), records['timestamp'].tolist()):
+            update_state(can_id, timestamp)
+        self.frames_received += len(records)
+        self.batch.extend(FrameBatch.from_records(records))
+        self.flush()
+
+    def flush(self):
+        """Publish the frames collected so far"""
+        batch = self.batch
+        if not len(batch):
+            return
+        self.batch = FrameBatch()
+        self.last_timestamp = batch.timestamps[-1]
+        records = batch.to_records()
+        store = self.store
+        if store is not None:
+            store.append_records(records)
+        if self.writer is not None:
+            with self.writer_lock:
+                if self.writer is not None:
+                    self.writer.write_records(records)
+        for callback in self.subscribers:
+            callback(batch)
+
+    def clear(self, store=None):
+        """Start over with another store and no per-ID state"""
+        self.store = store
+        self.id_state = {}
+        self.other_state = None
+        self.evicted_ids = 0
+        self.last_timestamp = None
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Headless CANspy capture")
+    parser.add_argument("--interface", default=DEFAULT_CONFIG['interface'])
+    parser.add_argument("--channel", default=DEFAULT_CONFIG['channel'])
+    parser.add_argument("--bitrate", type=int, default=DEFAULT_CONFIG['bitrate'])
+    parser.add_argument("--fd", action="store_true")
+    parser.add_argument("--record", help="write a .canspy capture file")
+    parser.add_argument("--duration", type=float, help="stop after this many seconds")
+    args = parser.parse_args()
+
+    config = {'interface': args.interface, 'channel': args.channel, 'bitrate': args.bitrate, 'fd': args.fd}
+    receiver = CANReceiver(config)
+    if args.record:
+        receiver.start_recording(args.record)
+    receiver.start_receiving()
+    start = time.monotonic()
+    try:
+        while receiver.is_receiving:
+            time.sleep(1.0)
+            other = f", {receiver.evicted_ids} evicted" if receiver.evicted_ids else ""
+            print(f"{receiver.frames_received} frames, {len(receiver.id_state)} IDs{other}")
+            if args.duration and time.monotonic() - start >= args.duration:
+                break
+    except KeyboardInterrupt:
+        pass
+    receiver.close()
+    if receiver.error:
+        print(f"Error: {receiver.error}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,196 @@
+"""
+Timed replay of captured frames, like can-utils' canplayer.
+
+A ReplayEngine walks a CaptureReader or CaptureStore in blocks and sends
+each frame to a python-can bus (a real channel, `virtual` or `vcan`) and/or
+hands it to a callback, at the original pace scaled by a speed factor or
+as fast as possible. Frames are scheduled against time.perf_counter() with
+a hybrid timer: sleep until shortly before the deadline, then spin, so the
+release error stays well below a millisecond even at high frame rates.
+"""
+
+import threading
+import time
+import numpy as np
+from capture.capture_file import FLAG_GAP, record_to_message
+
+MIN_SPEED = 0.1
+MAX_SPEED = 100.0
+SPIN_THRESHOLD = 0.002  # seconds before a deadline at which sleeping stops
+IDLE_WAIT = 0.05  # seconds of waiting for the next frame from which on_idle is called first
+BLOCK_FRAMES = 4096
+
+
+def wait_until(deadline, spin_threshold=SPIN_THRESHOLD):
+    """Sleep, then busy-wait until time.perf_counter() reaches the deadline"""
+    remaining = deadline - time.perf_counter()
+    if remaining > spin_threshold:
+        time.sleep(remaining - spin_threshold)
+    while time.perf_counter() < deadline:
+        pass
+
+
+def open_replay_bus(interface='virtual', channel='vcan0', **kwargs):
+    """Open the bus a replay is sent to"""
+    import can
+    return can.Bus(interface=interface, channel=channel, **kwargs)
+
+
+class ReplayEngine:
+    """Replay a capture onto a bus and/or into a callback.
+
+    :param source: CaptureReader or CaptureStore to replay.
+    :param bus: python-can bus to send frames on, or None.
+    :param on_frame: Callable receiving a can.Message per replayed frame, or None.
+    :param speed: Time scale (0.1 to 100), or None to send as fast as possible.
+    :param loop: Restart from the beginning when the end is reached.
+    :param id_filter: Iterable of CAN IDs to replay; None replays all IDs.
+    :param on_idle: Callable run on the replay thread before a pause or a
+        wait of IDLE_WAIT or more for the next frame (e.g. to publish the
+        frames handed to on_frame so far), or None.
+    """
+
+    def __init__(self, source, bus=None, on_frame=None, speed=1.0, loop=False, id_filter=None,
+                 on_finished=None, on_idle=None):
+        self.source = source
+        self.bus = bus
+        self.on_frame = on_frame
+        self.on_idle = on_idle
+        self.on_finished = on_finished
+        self.loop = loop
+        self.set_speed(speed)
+        self.id_filter = None
+        self.set_id_filter(id_filter)
+
+        self.position = 0  # index of the next frame to replay
+        self.seek_to = None
+        self.rebase = True
+        self.running = False
+        self.paused = threading.Event()
+        self.paused.set()  # set = not paused
+        self.thread = None
+
+        # Statistics
+        self.frames_sent = 0
+        self.loops = 0
+        self.max_late = 0.0
+        self.total_late = 0.0
+        self.error = None
+
+    def set_speed(self, speed):
+        """Change the replay speed; None replays as fast as possible"""
+        if speed is not None:
+            speed = min(max(float(speed), MIN_SPEED), MAX_SPEED)
+        self.speed = speed
+        self.rebase = True
+
+    def set_id_filter(self, id_filter):
+        self.id_filter = None if not id_filter else np.array(sorted(id_filter), dtype=np.uint32)
+
+    def seek(self, timestamp):
+        """Continue the replay from the first frame at or after the timestamp"""
+        self.seek_index(self.source.index_at_time(timestamp))
+
+    def seek_index(self, index):
+        self.seek_to = max(0, min(int(index), len(self.source)))
+        if not self.running:
+            self.position = self.seek_to
+            self.seek_to = None
+
+    def start(self):
+        if self.running:
+            return False
+        self.running = True
+        self.rebase = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return True
+
+    def stop(self):
+        self.running = False
+        self.paused.set()
+        if self.thread and self.thread.is_alive() and self.thread is not threading.current_thread():
+            self.thread.join(timeout=2)
+
+    def pause(self):
+        self.paused.clear()
+
+    def resume(self):
+        self.rebase = True
+        self.paused.set()
+
+    def is_paused(self):
+        return not self.paused.is_set()
+
+    def mean_late(self):
+        return self.total_late / self.frames_sent if self.frames_sent else 0.0
+
+    def run(self):
+        try:
+            self._replay()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.running = False
+            if self.on_finished:
+                self.on_finished(self.error)
+
+    def _replay(self):
+        wall_base = 0.0
+        time_base = 0.0
+        while self.running:
+            if self.seek_to is not None:
+                self.position, self.seek_to = self.seek_to, None
+                self.rebase = True
+            start = self.position
+            if start >= len(self.source):
+                if not self.loop or len(self.source) == 0:
+                    break
+                self.loops += 1
+                self.position = 0
+                self.rebase = True
+                continue
+
+            block = self.source.read(start, start + BLOCK_FRAMES)
+            end = start + len(block)
+            block = block[(block['flags'] & FLAG_GAP) == 0]  # gap markers are not frames
+            if self.id_filter is not None:
+                block = block[np.isin(block['can_id'], self.id_filter)]
+
+            for record in block:
+                if not self.paused.is_set():
+                    self.idle()
+                    self.paused.wait()
+                if not self.running or self.seek_to is not None:
+                    break
+                if self.rebase:
+                    # Anchor the schedule at this frame (start, seek, resume, speed change)
+                    wall_base = time.perf_counter()
+                    time_base = float(record['timestamp'])
+                    self.rebase = False
+                speed = self.speed
+                if speed is not None:
+                    deadline = wall_base + (float(record['timestamp']) - time_base) / speed
+                    if deadline - time.perf_counter() >= IDLE_WAIT:
+                        self.idle()
+                    wait_until(deadline)
+                    late = time.perf_counter() - deadline
+                    self.total_late += late
+                    if late > self.max_late:
+                        self.max_late = late
+                self._send(record)
+            else:
+                self.position = end
+
+    def idle(self):
+        if self.on_idle is not None:
+            self.on_idle()
+
+    def _send(self, record):
+        msg = record_to_message(record)
+        msg.timestamp = time.time()
+        if self.bus is not None:
+            self.bus.send(msg)
+        if self.on_frame is not None:
+            self.on_frame(msg)
+        self.frames_sent += 1
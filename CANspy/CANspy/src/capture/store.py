@@ -0,0 +1,381 @@
+"""
+In-memory capture store.
+
+Frames are kept as records in fixed-size chunks, so appending never moves
+frames that are already stored and a reader on another thread can keep
+reading while a single writer appends. The store offers the same
+random-access interface as CaptureReader, so the capture view works the
+same over a file on disk and over frames that are still arriving.
+
+Payloads are not stored in the records' 64-byte data field. A stored
+record (COMPACT_DTYPE) holds a reference into a payload heap of 8-byte
+words, where a new payload takes only its length rounded up to whole
+words. A frame whose payload equals that of the previous frame of its
+ID shares that frame's reference instead, so periodic frames that
+repeat their data cost no payload bytes at all. The comparison is
+vectorized: the frames of an appended block are sorted by ID (needed for
+the ID index anyway) and each is compared with its predecessor, a word
+at a time. Records are rebuilt as RECORD_DTYPE by __getitem__ and
+read(), with one gather per word of the longest payload for a block.
+
+The per-ID index can be bounded with max_ids (see capture.id_limit): the
+frames of evicted IDs stay in the store but are no longer indexed, so
+ids(), id_summary() and indices_for_id() cover the tracked IDs only and
+previous_of_id() does not know their rank. evicted_ids, evicted_frames
+and evicted_latest sum them up.
+"""
+
+import struct
+from array import array
+from bisect import bisect_left
+import numpy as np
+from capture.capture_file import RECORD_DTYPE, TIME_INDEX_STEP, MAX_DATA_LENGTH, message_flags, message_data
+from capture.id_limit import LFU, excess, select_victims
+
+CHUNK_SHIFT = 16
+CHUNK_SIZE = 1 << CHUNK_SHIFT
+CHUNK_MASK = CHUNK_SIZE - 1
+HEAP_SHIFT = 17
+HEAP_WORDS = 1 << HEAP_SHIFT  # 8-byte words per payload heap chunk (1 MiB); a payload never spans two
+HEAP_MASK = HEAP_WORDS - 1
+HEADER_SIZE = RECORD_DTYPE.fields['data'][1]  # bytes of a record before its data
+DLC_OFFSET = RECORD_DTYPE.fields['dlc'][1]
+# A stored record: the RECORD_DTYPE header, with the data replaced by a payload heap reference
+# (heap chunk << HEAP_SHIFT | word), enough for 32 GiB of distinct payloads
+COMPACT_DTYPE = np.dtype(RECORD_DTYPE.descr[:-1] + [('payload', '<u4')])
+# The header of either record as one field, copied with one memcpy per record
+RECORD_HEADER = np.dtype({'names': ['header'], 'formats': [f'V{HEADER_SIZE}'], 'itemsize': RECORD_DTYPE.itemsize})
+COMPACT_HEADER = np.dtype({'names': ['header', 'payload'], 'formats': [f'V{HEADER_SIZE}', '<u4'],
+                           'offsets': [0, HEADER_SIZE], 'itemsize': COMPACT_DTYPE.itemsize})
+
+
+class CaptureStore:
+    """Append-only frame store with per-ID and time indexes
+
+    :param max_ids: Most IDs to index, or None for all of them.
+    :param id_policy: Which IDs to evict from the index beyond max_ids, LFU or LRU.
+    """
+
+    def __init__(self, max_ids=None, id_policy=LFU):
+        self.max_ids = max_ids
+        self.id_policy = id_policy
+        self.clear()
+
+    def clear(self):
+        self.chunks = []
+        self.heap = []  # payloads, padded to whole 8-byte words
+        self.heap_used = HEAP_WORDS  # words used in the last heap chunk
+        self.count = 0
+        self.id_positions = {}  # can_id -> array of record indices
+        self.evicted_ids = 0
+        self.evicted_frames = 0  # frames of evicted IDs, as indexed when they were evicted
+        self.evicted_latest = -1  # index of the latest of those frames
+        self.time_index = array('d')
+        self.time_step = TIME_INDEX_STEP
+
+    def _ensure_capacity(self, total):
+        while len(self.chunks) * CHUNK_SIZE < total:
+            self.chunks.append(np.zeros(CHUNK_SIZE, dtype=COMPACT_DTYPE))
+
+    def _stored(self, index):
+        return self.chunks[index >> CHUNK_SHIFT][index & CHUNK_MASK]
+
+    def _stored_at(self, indices):
+        """Stored records at an array of indices"""
+        chunks = indices >> CHUNK_SHIFT
+        first, last = int(chunks.min()), int(chunks.max())
+        if first == last:
+            return self.chunks[first][indices & CHUNK_MASK]
+        stored = np.empty(len(indices), dtype=COMPACT_DTYPE)
+        for chunk in np.unique(chunks).tolist():
+            rows = np.flatnonzero(chunks == chunk)
+            stored[rows] = self.chunks[chunk][indices[rows] & CHUNK_MASK]
+        return stored
+
+    def _add_payloads(self, packed, words):
+        """
+        Copy payloads into the heap; returns the reference of each.
+
+        :param packed: the payloads' 8-byte words, concatenated
+        :param words: number of words of each payload
+        """
+        ends = np.cumsum(words)
+        references = np.empty(len(words), dtype=np.uint32)
+        done = 0
+        while done < len(words):
+            base = int(ends[done - 1]) if done else 0
+            # Whole payloads that fit in the rest of the current heap chunk
+            stop = int(np.searchsorted(ends, base + HEAP_WORDS - self.heap_used, side='right'))
+            if stop == done:
+                self.heap.append(np.zeros(HEAP_WORDS, dtype='<u8'))
+                self.heap_used = 0
+                continue
+            size = int(ends[stop - 1]) - base
+            offset = ((len(self.heap) - 1) << HEAP_SHIFT) + self.heap_used
+            references[done:stop] = offset + (ends[done:stop] - words[done:stop] - base)
+            self.heap[-1][self.heap_used:self.heap_used + size] = packed[base:base + size]
+            self.heap_used += size
+            done = stop
+        return references
+
+    def _payloads(self, references, lengths, data=None):
+        """
+        Data of stored payload references.
+
+        :param data: zeroed (frames, MAX_DATA_LENGTH) array to fill, or None for a new one
+        """
+        if data is None:
+            data = np.zeros((len(references), MAX_DATA_LENGTH), dtype=np.uint8)
+        words = (int(lengths.max()) + 7) // 8 if len(lengths) else 0
+        data_words = data.view('<u8')
+        heap_chunks = references >> HEAP_SHIFT
+        offsets = (references & HEAP_MASK).astype(np.int64)
+        first, last = (int(heap_chunks.min()), int(heap_chunks.max())) if words else (0, -1)
+        for word in range(words):
+            # Only the words a payload has: the word after it belongs to the next one
+            needed = lengths > word * 8
+            every = needed.all()
+            for chunk in range(first, last + 1):
+                if first == last:
+                    rows = slice(None) if every else np.flatnonzero(needed)
+                else:
+                    rows = np.flatnonzero(needed & (heap_chunks == chunk))
+                data_words[rows, word] = self.heap[chunk][offsets[rows] + word]
+        return data
+
+    def append(self, timestamp, can_id, flags, data, channel=0):
+        """Append one frame"""
+        index = self.count
+        self._ensure_capacity(index + 1)
+        data = bytes(data)
+        length = len(data)
+        positions = self.id_positions.get(can_id)
+        reference = 0 if not length else None  # empty payloads take no words
+        if positions and length:
+            previous = self._stored(positions[-1])
+            if previous['dlc'] == length and self._bytes(int(previous['payload']), length) == data:
+                reference = previous['payload']
+        if reference is None:
+            words = (length + 7) // 8
+            if self.heap_used + words > HEAP_WORDS:
+                self.heap.append(np.zeros(HEAP_WORDS, dtype='<u8'))
+                self.heap_used = 0
+            reference = ((len(self.heap) - 1) << HEAP_SHIFT) + self.heap_used
+            self.heap[-1][self.heap_used:self.heap_used + words] = np.frombuffer(data.ljust(words * 8, b'\0'),
+                                                                                dtype='<u8')
+            self.heap_used += words
+        self.chunks[index >> CHUNK_SHIFT][index & CHUNK_MASK] = (timestamp, can_id, flags, length, channel, 0,
+                                                                 reference)
+        if positions is None:
+            positions = self.id_positions[can_id] = array('Q')
+        positions.append(index)
+        if index % self.time_step == 0:
+            self.time_index.append(timestamp)
+        if self.max_ids is not None and len(self.id_positions) > self.max_ids:
+            self._evict_ids()
+        # Publish the frame only once it is complete
+        self.count = index + 1
+
+    def _bytes(self, reference, length):
+        if not length:
+            return b''
+        offset = reference & HEAP_MASK
+        return self.heap[reference >> HEAP_SHIFT][offset:offset + (length + 7) // 8].tobytes()[:length]
+
+    def append_message(self, msg, channel=0):
+        """Append a can.Message"""
+        self.append(float(msg.timestamp), msg.arbitration_id, message_flags(msg), message_data(msg), channel)
+
+    def append_batch(self, batch):
+        """Append a FrameBatch"""
+        self.append_records(batch.to_records())
+
+    def append_records(self, records):
+        """Append an array of RECORD_DTYPE records"""
+        total = len(records)
+        if total == 0:
+            return
+        start = self.count
+        self._ensure_capacity(start + total)
+
+        # Group the new record indices by ID in one pass
+        can_ids = records['can_id']
+        order = np.argsort(can_ids, kind='stable')
+        unique_ids, firsts = np.unique(can_ids[order], return_index=True)
+        bounds = (firsts * 8).tolist() + [total * 8]
+        absolute = memoryview((order + start).astype(np.uint64).tobytes())
+        id_positions = self.id_positions
+        last_stored = [-1] * len(unique_ids)  # previous frame of each ID, if stored
+        for i, can_id in enumerate(unique_ids.tolist()):
+            positions = id_positions.get(can_id)
+            if positions is None:
+                positions = id_positions[can_id] = array('Q')
+            elif positions:
+                last_stored[i] = positions[-1]
+            positions.frombytes(absolute[bounds[i]:bounds[i + 1]])
+        last_stored = np.array(last_stored, dtype=np.int64)
+
+        # Compare each payload with the previous frame of its ID: within the block in ID order,
+        # or the ID's last stored frame for the first frame of each ID
+        # Payloads are compared 8 bytes at a time (bytes beyond the DLC are zero)
+        lengths = records['dlc'][order].astype(np.int64)
+        words = (int(lengths.max()) + 7) // 8
+        data = records['data'].view('<u8')[order, :words]
+        same = np.zeros(total, dtype=bool)
+        same[1:] = (lengths[1:] == lengths[:-1]) & (data[1:] == data[:-1]).all(axis=1)
+        same[firsts] = False
+        references = np.zeros(total, dtype=np.uint32)
+        stored = np.flatnonzero(last_stored >= 0)
+        if len(stored):
+            previous = self._stored_at(last_stored[stored])
+            rows = firsts[stored]
+            # Only payloads of the same length can match; empty ones always do and take no words
+            candidates = np.flatnonzero((previous['dlc'] == lengths[rows]) & (lengths[rows] > 0))
+            previous = previous[candidates]
+            rows = rows[candidates]
+            previous_data = self._payloads(previous['payload'], previous['dlc'].astype(np.int64)).view('<u8')
+            matches = (previous_data[:, :words] == data[rows]).all(axis=1)
+            same[rows[matches]] = True
+            references[rows[matches]] = previous['payload'][matches]
+
+        # New payloads go to the heap; repeated ones take the reference of the last new one before them
+        new = np.flatnonzero(~same & (lengths > 0))
+        if len(new):
+            new_words = (lengths[new] + 7) // 8
+            packed = data[new][np.arange(words) < new_words[:, None]]
+            references[new] = self._add_payloads(packed, new_words)
+        defined = np.where(~same, np.arange(total), 0)
+        defined[firsts] = firsts
+        references = references[np.maximum.accumulate(defined)]
+
+        headers = np.ascontiguousarray(records).view(RECORD_HEADER)['header']
+        payloads = np.empty(total, dtype=np.uint32)
+        payloads[order] = references
+        done = 0
+        while done < total:
+            index = start + done
+            offset = index & CHUNK_MASK
+            n = min(total - done, CHUNK_SIZE - offset)
+            stored = self.chunks[index >> CHUNK_SHIFT][offset:offset + n].view(COMPACT_HEADER)
+            stored['header'] = headers[done:done + n]
+            stored['payload'] = payloads[done:done + n]
+            done += n
+
+        first = (-start) % self.time_step
+        self.time_index.extend(records['timestamp'][first::self.time_step].tolist())
+        if self.max_ids is not None and len(self.id_positions) > self.max_ids:
+            self._evict_ids()
+        self.count = start + total
+
+    def _evict_ids(self):
+        """Drop the index of the IDs ranked lowest by id_policy"""
+        can_ids = list(self.id_positions)
+        positions = list(self.id_positions.values())
+        counts = np.fromiter(map(len, positions), dtype=np.int64, count=len(positions))
+        latest = np.fromiter((indices[-1] for indices in positions), dtype=np.int64, count=len(positions))
+        victims = select_victims(counts, latest, excess(len(positions), self.max_ids), self.id_policy).tolist()
+        for victim in victims:
+            del self.id_positions[can_ids[victim]]
+        self.evicted_frames += int(counts[victims].sum())
+        self.evicted_latest = max(self.evicted_latest, int(latest[victims].max()))
+        self.evicted_ids += len(victims)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        stored = self._stored(index)
+        header = stored.tobytes()
+        reference, = struct.unpack_from('<I', header, HEADER_SIZE)
+        payload = self._bytes(reference, header[DLC_OFFSET])
+        return np.frombuffer(bytearray(header[:HEADER_SIZE] + payload.ljust(MAX_DATA_LENGTH, b'\0')),
+                             dtype=RECORD_DTYPE)[0]
+
+    def _stored_parts(self, start, stop):
+        """(position, stored records) views of the chunks holding [start, stop)"""
+        index = start
+        while index < stop:
+            offset = index & CHUNK_MASK
+            n = min(stop - index, CHUNK_SIZE - offset)
+            yield index - start, self.chunks[index >> CHUNK_SHIFT][offset:offset + n]
+            index += n
+
+    def read(self, start=0, stop=None):
+        """Contiguous copy of the records in [start, stop)"""
+        stop = self.count if stop is None else min(stop, self.count)
+        records = np.zeros(max(stop - start, 0), dtype=RECORD_DTYPE)
+        if not len(records):
+            return records
+        raw = records.view(np.uint8).reshape(len(records), -1)
+        for position, stored in self._stored_parts(start, stop):
+            n = len(stored)
+            raw[position:position + n, :HEADER_SIZE] = stored.view(np.uint8).reshape(n, -1)[:, :HEADER_SIZE]
+            self._payloads(stored['payload'], stored['dlc'].astype(np.int64), records['data'][position:position + n])
+        return records
+
+    def ids(self):
+        """Sorted array of the distinct (indexed) CAN IDs in the store"""
+        return np.array(sorted(list(self.id_positions)), dtype=np.uint32)
+
+    def indices_for_id(self, can_id):
+        """Record indices of all frames with the given CAN ID, in capture order"""
+        positions = self.id_positions.get(int(can_id))
+        if positions is None:
+            return np.zeros(0, dtype=np.uint64)
+        # Copy first: a live view would block the writer from growing the array
+        return np.frombuffer(positions[:], dtype=np.uint64)
+
+    def id_summary(self, stop=None):
+        """Return (can_ids, first, last, counts) of the frames before `stop`, in first-seen order"""
+        stop = self.count if stop is None else min(stop, self.count)
+        can_ids, first, last, counts = [], [], [], []
+        for can_id, positions in list(self.id_positions.items()):
+            if not positions or positions[0] >= stop:
+                continue
+            n = bisect_left(positions, stop)
+            can_ids.append(can_id)
+            first.append(positions[0])
+            last.append(positions[n - 1])
+            counts.append(n)
+        order = np.argsort(np.array(first, dtype=np.int64), kind='stable')
+        return (np.array(can_ids, dtype=np.uint32)[order], np.array(first, dtype=np.int64)[order],
+                np.array(last, dtype=np.int64)[order], np.array(counts, dtype=np.int64)[order])
+
+    def indexed(self, stop=None):
+        """Boolean array: which of the frames before `stop` the per-ID index holds (not those of evicted IDs)"""
+        stop = self.count if stop is None else min(stop, self.count)
+        mask = np.zeros(stop, dtype=bool)
+        for positions in list(self.id_positions.values()):
+            # A copy: the writer may append to the array meanwhile
+            mask[np.frombuffer(positions[:bisect_left(positions, stop)], dtype=np.uint64)] = True
+        return mask
+
+    def previous_of_id(self, index):
+        """Return (position of the record within its ID, index of the previous frame of that ID or -1)
+
+        Both are -1 for a frame of an evicted ID.
+        """
+        positions = self.id_positions.get(int(self[index]['can_id']))
+        rank = bisect_left(positions, index) if positions is not None else 0
+        if positions is None or rank == len(positions) or positions[rank] != index:
+            return -1, -1
+        previous = positions[rank - 1] if rank > 0 else -1
+        return rank, previous
+
+    def index_at_time(self, timestamp):
+        """Index of the first record with a timestamp >= the given one"""
+        time_index = np.frombuffer(self.time_index[:], dtype=np.float64)
+        block = int(np.searchsorted(time_index, timestamp, side='left'))
+        start = max(block - 1, 0) * self.time_step
+        stop = min(block * self.time_step, self.count)
+        if stop <= start:
+            return min(start, self.count)
+        window = np.concatenate([stored['timestamp'] for _, stored in self._stored_parts(start, stop)])
+        return start + int(np.searchsorted(window, timestamp, side='left'))
+
+    def close(self):
+        pass
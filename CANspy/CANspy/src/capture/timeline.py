@@ -0,0 +1,129 @@
+"""
+Keyframes of the overwrite view, for scrubbing through a capture.
+
+OverwriteTimeline rebuilds the overwrite state (latest frame, frame count
+and previous frame of every ID) at any position of a capture. Every
+KEYFRAME_INTERVAL frames it keeps a keyframe: the state after all frames
+before that position, as arrays sorted by key. The state at record index
+i is the keyframe at or before i with the frames in between folded in by
+one np.unique, so any position of a capture of any length is rebuilt in
+a few milliseconds. Keyframes are made by update(), an interval at a
+time, as the capture grows.
+
+Like the overwrite view, the state holds at most max_ids keys (see
+capture.id_limit); the frames of evicted keys are counted as other IDs.
+"""
+
+import numpy as np
+from capture.id_limit import LFU, excess, select_victims
+
+KEYFRAME_INTERVAL = 32768  # frames between keyframes
+
+
+class OverwriteState:
+    """Latest frame of every key at one position of a capture, in key order"""
+
+    __slots__ = ('keys', 'latest', 'counts', 'previous', 'other_latest', 'other_count', 'evicted')
+
+    def __init__(self, keys=None, latest=None, counts=None, previous=None, other_latest=-1, other_count=0,
+                 evicted=0):
+        self.keys = np.zeros(0, dtype=np.int64) if keys is None else keys
+        self.latest = np.zeros(0, dtype=np.int64) if latest is None else latest  # record index of the latest frame
+        self.counts = np.zeros(0, dtype=np.int64) if counts is None else counts
+        self.previous = np.zeros(0, dtype=np.int64) if previous is None else previous  # frame before it, or -1
+        self.other_latest = other_latest  # latest frame of an evicted key, or -1
+        self.other_count = other_count  # frames of evicted keys
+        self.evicted = evicted  # keys evicted so far
+
+
+def block_summary(keys, start):
+    """
+    Per-key summary of a block of frames starting at record index `start`.
+
+    :return: (unique keys, index of the last frame, frame count, index of the
+        frame before the last one or -1), each in key order
+    """
+    # Last occurrence of every key in the block
+    unique_keys, reversed_index, counts = np.unique(keys[::-1], return_index=True, return_counts=True)
+    last = start + len(keys) - 1 - reversed_index
+    # The occurrence before the last one, for keys seen more than once
+    earlier = np.ones(len(keys), dtype=bool)
+    earlier[len(keys) - 1 - reversed_index] = False
+    earlier_keys = keys[earlier]
+    repeated, earlier_index = np.unique(earlier_keys[::-1], return_index=True)
+    earlier_positions = np.flatnonzero(earlier)[len(earlier_keys) - 1 - earlier_index] + start
+    previous = np.full(len(unique_keys), -1, dtype=np.int64)
+    previous[np.searchsorted(unique_keys, repeated)] = earlier_positions
+    return unique_keys, last, counts, previous
+
+
+def fold_block(state, keys, start, max_ids=None, id_policy=LFU):
+    """OverwriteState after the frames with the given keys, from record index `start`, were added to `state`"""
+    if not len(keys):
+        return state
+    block_keys, last, counts, previous = block_summary(keys, start)
+    all_keys = np.union1d(state.keys, block_keys)
+    old = np.searchsorted(all_keys, state.keys)
+    new = np.searchsorted(all_keys, block_keys)
+    merged = OverwriteState(all_keys, np.full(len(all_keys), -1, dtype=np.int64),
+                            np.zeros(len(all_keys), dtype=np.int64), np.full(len(all_keys), -1, dtype=np.int64),
+                            state.other_latest, state.other_count, state.evicted)
+    merged.latest[old] = state.latest
+    merged.counts[old] = state.counts
+    merged.previous[old] = state.previous
+    # A key's frame before its latest one is in the block or is its latest frame so far
+    merged.previous[new] = np.where(previous >= 0, previous, merged.latest[new])
+    merged.latest[new] = last
+    merged.counts[new] += counts
+    n = excess(len(all_keys), max_ids)
+    if n:
+        victims = select_victims(merged.counts, merged.latest, n, id_policy)
+        merged.other_latest = max(merged.other_latest, int(merged.latest[victims].max()))
+        merged.other_count += int(merged.counts[victims].sum())
+        merged.evicted += len(victims)
+        kept = np.ones(len(all_keys), dtype=bool)
+        kept[victims] = False
+        for name in ('keys', 'latest', 'counts', 'previous'):
+            setattr(merged, name, getattr(merged, name)[kept])
+    return merged
+
+
+class OverwriteTimeline:
+    """Overwrite state at any position of a CaptureReader or CaptureStore.
+
+    :param group_key: as LatestTableModel.group_key, or None for one key per CAN ID
+    :param max_ids: most keys to keep, or None for all of them
+    """
+
+    def __init__(self, source, group_key=None, max_ids=None, id_policy=LFU, interval=KEYFRAME_INTERVAL):
+        self.source = source
+        self.group_key = group_key
+        self.max_ids = max_ids
+        self.id_policy = id_policy
+        self.interval = interval
+        self.keyframes = [OverwriteState()]  # keyframes[k]: the state before record k * interval
+
+    def keys(self, start, stop):
+        records = self.source.read(start, stop)
+        if self.group_key is None:
+            return records['can_id'].astype(np.int64)
+        return np.asarray(self.group_key(records['can_id'], records['flags']), dtype=np.int64)
+
+    def fold(self, state, start, stop):
+        if stop <= start:
+            return state
+        return fold_block(state, self.keys(start, stop), start, self.max_ids, self.id_policy)
+
+    def update(self, count=None):
+        """Add the keyframes of the complete intervals among the first `count` records"""
+        count = len(self.source) if count is None else count
+        while len(self.keyframes) * self.interval <= count:
+            start = (len(self.keyframes) - 1) * self.interval
+            self.keyframes.append(self.fold(self.keyframes[-1], start, start + self.interval))
+
+    def state_at(self, index):
+        """OverwriteState after the records before `index`"""
+        index = min(index, len(self.source))
+        self.update(index)
+        keyframe = index // self.interval
+        return self.fold(self.keyframes[keyframe], keyframe * self.interval, index)
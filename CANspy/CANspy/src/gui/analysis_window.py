@@ -0,0 +1,66 @@
+from PyQt5 import QtCore
+from PyQt5.QtWidgets import QWidget, QLabel, QPushButton, QVBoxLayout, QHBoxLayout
+
+REFRESH_INTERVAL = 500  # ms between repaints of an analysis panel
+
+
+class AnalysisWindow(QWidget):
+    """
+    Base of the panels of the Analyze menu.
+
+    A panel owns an analyzer (BitStatistics, IsoTpDecoder, ...) whose
+    update_batch() is subscribed to the CANReceiver, so it sees the frames
+    received (or replayed into the table) from the time the panel is opened
+    or reset, on the receive thread. The panel repaints from the analyzer
+    every REFRESH_INTERVAL ms. Subclasses create the analyzer, add their
+    widgets to main_layout and implement refresh() and clear_view().
+    """
+
+    title = ""
+
+    def __init__(self, analyzer, parent=None):
+        super().__init__(parent, QtCore.Qt.Window)
+        self.setWindowTitle(self.title)
+        self.resize(900, 500)
+        self.analyzer = analyzer
+        self.receiver = None
+
+        self.main_layout = QVBoxLayout(self)
+        self.controls_layout = QHBoxLayout()
+        self.reset_button = QPushButton("Reset", self)
+        self.reset_button.clicked.connect(self.reset)
+        self.controls_layout.addWidget(self.reset_button)
+        self.info_label = QLabel("", self)
+        self.controls_layout.addWidget(self.info_label, 1)
+        self.main_layout.addLayout(self.controls_layout)
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+
+    def set_receiver(self, receiver):
+        """Analyze the frames of this receiver from now on"""
+        if self.receiver is not None:
+            self.receiver.unsubscribe(self.analyzer.update_batch)
+        self.receiver = receiver
+        if receiver is not None:
+            receiver.subscribe(self.analyzer.update_batch)
+
+    def reset(self):
+        self.analyzer.reset()
+        self.clear_view()
+        self.refresh()
+
+    def closeEvent(self, event):
+        self.timer.stop()
+        self.set_receiver(None)
+        event.accept()
+
+    def showEvent(self, event):
+        self.timer.start(REFRESH_INTERVAL)
+        super().showEvent(event)
+
+    def clear_view(self):
+        pass
+
+    def refresh(self):
+        pass
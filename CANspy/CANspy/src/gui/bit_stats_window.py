@@ -0,0 +1,121 @@
+from PyQt5 import QtWidgets, QtCore
+from PyQt5.QtWidgets import QTableWidget, QTableWidgetItem, QSplitter
+from PyQt5.QtGui import QColor
+import numpy as np
+from gui.analysis_window import AnalysisWindow
+from capture.bit_stats import BitStatistics, HISTOGRAM_BYTES, CLASS_NAMES, CONSTANT, COUNTER, CHECKSUM
+
+# Background of the class column
+CLASS_COLORS = {
+    CONSTANT: QColor(220, 220, 220),
+    COUNTER: QColor(170, 210, 255),
+    CHECKSUM: QColor(255, 200, 140),
+}
+
+GRID_COLUMNS = ["7", "6", "5", "4", "3", "2", "1", "0", "Class", "Values", "Most frequent"]
+CLASS_COLUMN = 8
+
+
+def toggle_color(rate):
+    """White for bits that never toggle, up to red for bits that toggle every frame"""
+    level = int(255 - 185 * min(max(rate, 0.0), 1.0))
+    return QColor(255, level, level)
+
+
+class BitStatsWindow(AnalysisWindow):
+    """Reverse-engineering panel: per-ID bit toggle counts and byte classes"""
+
+    title = "Bit Statistics"
+
+    def __init__(self, parent=None):
+        super().__init__(BitStatistics(), parent)
+        self.stats = self.analyzer
+        self.selected_id = None
+
+        # CAN IDs seen, with their frame count and number of changing bits
+        self.id_table = QTableWidget(0, 3, self)
+        self.id_table.setHorizontalHeaderLabels(["CAN ID", "Frames", "Changing bits"])
+        self.id_table.verticalHeader().setVisible(False)
+        self.id_table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.id_table.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
+        self.id_table.setSelectionMode(QtWidgets.QAbstractItemView.SingleSelection)
+        self.id_table.itemSelectionChanged.connect(self.on_id_selected)
+
+        # Bit grid of the selected ID: one row per byte, bit 7 (MSB) first
+        self.grid = QTableWidget(0, len(GRID_COLUMNS), self)
+        self.grid.setHorizontalHeaderLabels(GRID_COLUMNS)
+        self.grid.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.grid.setSelectionMode(QtWidgets.QAbstractItemView.NoSelection)
+        self.grid.horizontalHeader().setSectionResizeMode(QtWidgets.QHeaderView.ResizeToContents)
+
+        splitter = QSplitter(QtCore.Qt.Horizontal, self)
+        splitter.addWidget(self.id_table)
+        splitter.addWidget(self.grid)
+        splitter.setStretchFactor(1, 1)
+        self.main_layout.addWidget(splitter)
+
+    def clear_view(self):
+        self.id_table.setRowCount(0)
+        self.selected_id = None
+
+    def on_id_selected(self):
+        rows = self.id_table.selectionModel().selectedRows()
+        if rows:
+            self.selected_id = self.id_table.item(rows[0].row(), 0).data(QtCore.Qt.UserRole)
+        self.refresh_grid()
+
+    def refresh(self):
+        can_ids, frames, changing = self.stats.summary()
+        self.info_label.setText(f"{len(can_ids)} IDs, {int(frames.sum())} frames")
+        self.id_table.setUpdatesEnabled(False)
+        # Rows are in first-seen order, so new IDs are only ever appended
+        for row in range(self.id_table.rowCount(), len(can_ids)):
+            self.id_table.insertRow(row)
+            can_id = int(can_ids[row])
+            item = QTableWidgetItem(f"0x{can_id:X}")
+            item.setData(QtCore.Qt.UserRole, can_id)
+            self.id_table.setItem(row, 0, item)
+            self.id_table.setItem(row, 1, QTableWidgetItem())
+            self.id_table.setItem(row, 2, QTableWidgetItem())
+        for row in range(len(can_ids)):
+            self.id_table.item(row, 1).setText(str(int(frames[row])))
+            self.id_table.item(row, 2).setText(str(int(changing[row])))
+        self.id_table.setUpdatesEnabled(True)
+        self.refresh_grid()
+
+    def refresh_grid(self):
+        snapshot = None if self.selected_id is None else self.stats.snapshot(self.selected_id)
+        if snapshot is None:
+            self.grid.setRowCount(0)
+            return
+        length = snapshot['length']
+        pairs = max(snapshot['pairs'], 1)
+        toggles = snapshot['toggles'].reshape(-1, 8)
+        self.grid.setUpdatesEnabled(False)
+        self.grid.setRowCount(length)
+        self.grid.setVerticalHeaderLabels([f"Byte {i}" for i in range(length)])
+        for byte in range(length):
+            for bit in range(8):
+                count = int(toggles[byte, bit])
+                self.set_cell(byte, bit, str(count), toggle_color(count / pairs))
+            byte_class = int(snapshot['classes'][byte])
+            self.set_cell(byte, CLASS_COLUMN, CLASS_NAMES[byte_class], CLASS_COLORS.get(byte_class))
+            if byte < HISTOGRAM_BYTES:
+                histogram = snapshot['histograms'][byte]
+                top = int(np.argmax(histogram))
+                self.set_cell(byte, CLASS_COLUMN + 1, str(np.count_nonzero(histogram)))
+                self.set_cell(byte, CLASS_COLUMN + 2,
+                              f"0x{top:02X} ({100.0 * histogram[top] / snapshot['frames']:.1f}%)")
+            else:
+                self.set_cell(byte, CLASS_COLUMN + 1, "")
+                self.set_cell(byte, CLASS_COLUMN + 2, "")
+        self.grid.setUpdatesEnabled(True)
+
+    def set_cell(self, row, column, text, color=None):
+        item = self.grid.item(row, column)
+        if item is None:
+            item = QTableWidgetItem()
+            item.setTextAlignment(QtCore.Qt.AlignCenter)
+            self.grid.setItem(row, column, item)
+        item.setText(text)
+        item.setBackground(color if color is not None else QColor(QtCore.Qt.white))
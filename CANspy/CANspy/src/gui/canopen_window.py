@@ -0,0 +1,149 @@
+from PyQt5 import QtCore
+from PyQt5.QtWidgets import QTableWidgetItem, QPlainTextEdit, QSplitter, QPushButton, QFileDialog, QInputDialog
+from PyQt5.QtGui import QColor, QFont
+from gui.analysis_window import AnalysisWindow
+from gui.isotp_window import hex_dump
+from gui.j1939_window import make_table
+from capture.canopen import CanOpenDecoder, OK, load_device
+
+MAX_ROWS = 5000  # events shown; older rows are removed
+PREVIEW_BYTES = 24  # payload bytes shown in the event table
+NODE_COLUMNS = ["Node", "State", "Heartbeat", "Heartbeats", "Boot-ups", "EMCY", "Last EMCY", "PDO frames",
+                "SDO transfers"]
+PDO_COLUMNS = ["COB-ID", "Node", "PDO", "Frames", "Data", "Values"]
+EVENT_COLUMNS = ["Time", "Node", "Type", "Object", "Size", "Status", "Data"]
+STATE_COLORS = {"operational": QColor(200, 240, 200), "pre-operational": QColor(255, 240, 190),
+                "stopped": QColor(220, 220, 220)}
+SILENT_COLOR = QColor(255, 210, 200)
+ERROR_COLOR = QColor(255, 210, 200)
+DEVICE_FILTER = "CANopen Device Description (*.eds *.dcf *.EDS *.DCF);;All Files (*)"
+
+
+def set_row(table, row, values, color=None):
+    """Write a row of texts, creating its items on first use"""
+    for column, value in enumerate(values):
+        item = table.item(row, column)
+        if item is None:
+            item = QTableWidgetItem(value)
+            table.setItem(row, column, item)
+        elif item.text() != value:
+            item.setText(value)
+        item.setBackground(color if color is not None else QColor(QtCore.Qt.white))
+
+
+class CanOpenWindow(AnalysisWindow):
+    """Live node status, PDO values and SDO/EMCY/NMT events of a CANopen network"""
+
+    title = "CANopen"
+
+    def __init__(self, parent=None):
+        super().__init__(CanOpenDecoder(), parent)
+        self.next_serial = 0
+        self.payloads = []  # payload of each event row
+
+        # PDO mappings and object names come from the nodes' device descriptions
+        self.load_button = QPushButton("Load EDS/DCF...", self)
+        self.load_button.clicked.connect(self.load_device)
+        self.controls_layout.insertWidget(1, self.load_button)
+
+        self.node_table = make_table(NODE_COLUMNS, self)
+        self.pdo_table = make_table(PDO_COLUMNS, self)
+        self.event_table = make_table(EVENT_COLUMNS, self)
+        self.event_table.itemSelectionChanged.connect(self.on_event_selected)
+
+        # Full payload of the selected event
+        self.detail = QPlainTextEdit(self)
+        self.detail.setReadOnly(True)
+        self.detail.setFont(QFont("Monospace"))
+
+        splitter = QSplitter(QtCore.Qt.Vertical, self)
+        for widget in (self.node_table, self.pdo_table, self.event_table, self.detail):
+            splitter.addWidget(widget)
+        self.main_layout.addWidget(splitter)
+
+    def load_device(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Load Device Description", "", DEVICE_FILTER)
+        if not path:
+            return
+        try:
+            try:
+                device = load_device(path)
+            except ValueError:
+                # An EDS does not name the node it describes
+                node_id, ok = QInputDialog.getInt(self, "Node ID", f"Node ID of {path}:", 1, 1, 127)
+                if not ok:
+                    return
+                device = load_device(path, node_id)
+        except (OSError, ValueError) as e:
+            self.info_label.setText(f"Error loading {path}: {e}")
+            return
+        self.analyzer.add_device(device)
+        self.pdo_table.setRowCount(0)
+        self.refresh()
+
+    def clear_view(self):
+        self.node_table.setRowCount(0)
+        self.pdo_table.setRowCount(0)
+        self.event_table.setRowCount(0)
+        self.payloads = []
+        self.detail.clear()
+        self.next_serial = 0
+
+    def refresh(self):
+        summary = self.analyzer.summary()
+        devices = ", ".join(f"{node_id}: {device.product}" for node_id, device in sorted(self.analyzer.devices.items()))
+        self.info_label.setText(f"{summary['nodes']} nodes, {summary['pdos']} PDOs, {summary['syncs']} SYNCs, "
+                                f"{summary['events']} events in {summary['frames']} frames"
+                                + (f" - devices {devices}" if devices else ""))
+        self.refresh_nodes()
+        self.refresh_pdos()
+        self.refresh_events()
+
+    def refresh_nodes(self):
+        rows = self.analyzer.node_rows()
+        self.node_table.setUpdatesEnabled(False)
+        self.node_table.setRowCount(len(rows))
+        for row, (node_id, state, last_heartbeat, heartbeats, boot_ups, emergencies, last_emergency, pdo_frames,
+                  sdo_transfers, silent) in enumerate(rows):
+            heartbeat = "" if last_heartbeat is None else f"{last_heartbeat:.3f}" + (" (silent)" if silent else "")
+            set_row(self.node_table, row, [str(node_id), state, heartbeat, str(heartbeats), str(boot_ups),
+                                           str(emergencies), last_emergency, str(pdo_frames), str(sdo_transfers)],
+                    SILENT_COLOR if silent else STATE_COLORS.get(state))
+        self.node_table.setUpdatesEnabled(True)
+
+    def refresh_pdos(self):
+        rows = self.analyzer.pdo_rows()
+        self.pdo_table.setUpdatesEnabled(False)
+        self.pdo_table.setRowCount(len(rows))
+        for row, (cob_id, node_id, kind, number, frames, last, data, values) in enumerate(rows):
+            text = "" if values is None else ", ".join(
+                f"{name}={value:.6g}" if isinstance(value, float) else f"{name}={value}" for name, value in values)
+            set_row(self.pdo_table, row, [f"0x{cob_id:03X}", str(node_id), f"{kind}{number}", str(frames),
+                                          data.hex(" ").upper(), text])
+        self.pdo_table.setUpdatesEnabled(True)
+
+    def refresh_events(self):
+        events = self.analyzer.events_since(self.next_serial)
+        if not events:
+            return
+        self.next_serial = events[-1][0] + 1
+        events = events[-MAX_ROWS:]
+        self.event_table.setUpdatesEnabled(False)
+        excess = self.event_table.rowCount() + len(events) - MAX_ROWS
+        for _ in range(max(excess, 0)):
+            self.event_table.removeRow(0)
+        del self.payloads[:max(excess, 0)]
+        for _, start, end, node_id, kind, what, size, payload, status in events:
+            row = self.event_table.rowCount()
+            self.event_table.insertRow(row)
+            preview = payload[:PREVIEW_BYTES].hex(" ").upper() + (" ..." if len(payload) > PREVIEW_BYTES else "")
+            set_row(self.event_table, row, [f"{start:.6f}", str(node_id), kind, what, str(size), status, preview],
+                    None if status == OK else ERROR_COLOR)
+            self.payloads.append(payload)
+        self.event_table.setUpdatesEnabled(True)
+        self.event_table.scrollToBottom()
+
+    def on_event_selected(self):
+        rows = self.event_table.selectionModel().selectedRows()
+        if rows and rows[0].row() < len(self.payloads):
+            self.detail.setPlainText(hex_dump(self.payloads[rows[0].row()]))
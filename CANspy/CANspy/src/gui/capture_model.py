@@ -0,0 +1,417 @@
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QVariant
+from capture.capture_file import FLAG_EXTENDED, FLAG_FD, FLAG_REMOTE, FLAG_GAP
+from capture.receiver import gap_start
+from capture.id_limit import MAX_IDS, LFU, excess, select_victims
+from capture.timeline import block_summary
+import numpy as np
+import time
+
+COLUMNS = ["#", "Timestamp", "CAN ID", "Type", "Length", "Data", "Cycle Time", "Count"]
+SCAN_BLOCK = 65536
+OTHER_KEY = 1 << 32  # CAN ID sort key of the "other IDs" row, after every real ID
+
+
+def format_timestamp(timestamp):
+    """Format a CAN timestamp as HH:MM:SS.mmm like the live table does"""
+    try:
+        text = time.strftime('%H:%M:%S', time.localtime(float(timestamp)))
+        return text + f".{int((float(timestamp) % 1) * 1000):03d}"
+    except Exception:
+        return str(timestamp)
+
+
+class FrameTableModel(QAbstractTableModel):
+    """Base for read-only models over a CaptureReader or CaptureStore.
+
+    Rows map to record indices of the source. Cells are formatted on demand,
+    so only rows that are actually painted cost anything. Qt.UserRole returns
+    a numeric sort key for every column. id_format, when set, formats the
+    CAN ID column as id_format(can_id, extended) (e.g. j1939.id_text), and
+    highlight, when set, gives the background of a row as highlight(can_id),
+    a QColor or None.
+    """
+
+    CACHE_SIZE = 4096
+
+    def __init__(self, source, parent=None):
+        super().__init__(parent)
+        self.source = source
+        self.row_cache = {}
+        self.id_format = None
+        self.highlight = None
+
+    def columnCount(self, parent=None):
+        return len(COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return COLUMNS[section]
+        return QVariant()
+
+    def record_index(self, row):
+        raise NotImplementedError
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return QVariant()
+        if role == Qt.DisplayRole:
+            return self.row_cells(index.row())[0][index.column()]
+        if role == Qt.UserRole:
+            return self.row_cells(index.row())[1][index.column()]
+        if role == Qt.BackgroundRole and self.highlight is not None:
+            color = self.highlight(self.row_cells(index.row())[1][2])
+            if color is not None:
+                return color
+        return QVariant()
+
+    def row_cells(self, row):
+        """(display texts, sort keys) of one row"""
+        record_index = self.record_index(row)
+        cached = self.row_cache.get(row)
+        if cached is not None and cached[0] == record_index:
+            return cached[1]
+        record = self.source[record_index]
+        timestamp = float(record['timestamp'])
+        can_id = int(record['can_id'])
+        length = int(record['dlc'])
+        data = b'' if record['flags'] & FLAG_REMOTE else record['data'][:length].tobytes()
+        rank, previous = self.previous_frame(row, record_index)
+        cycle = -1.0
+        cycle_time = ""
+        if previous >= 0:
+            cycle = (timestamp - float(self.source[previous]['timestamp'])) * 1000
+            cycle_time = f"{cycle:.2f} ms"
+        msg_type = "FD" if record['flags'] & FLAG_FD else "STD"
+        if record['flags'] & FLAG_GAP:
+            gap = timestamp - gap_start(data)
+            cells = (
+                (str(row + 1), format_timestamp(timestamp), "", "GAP", "", f"Bus lost for {gap:.2f} s", "", ""),
+                (row + 1, timestamp, can_id, "GAP", 0, "", -1.0, rank + 1),
+            )
+        else:
+            if self.id_format is None:
+                id_text = f"0x{can_id:X}"
+            else:
+                id_text = self.id_format(can_id, bool(record['flags'] & FLAG_EXTENDED))
+            cells = (
+                (str(row + 1), format_timestamp(timestamp), id_text, msg_type, str(length),
+                 ' '.join(f"{b:02X}" for b in data), cycle_time, str(rank + 1) if rank >= 0 else ""),
+                (row + 1, timestamp, can_id, msg_type, length, data.hex(), cycle, rank + 1),
+            )
+        if len(self.row_cache) >= self.CACHE_SIZE:
+            self.row_cache.clear()
+        self.row_cache[row] = (record_index, cells)
+        return cells
+
+    def previous_frame(self, row, record_index):
+        """(number of earlier frames, index of the previous frame or -1) of the row's frame ID"""
+        return self.source.previous_of_id(record_index)
+
+    def sort_key(self, row, column):
+        return self.row_cells(row)[1][column]
+
+    def sort_keys(self, column):
+        """Sort keys of all rows for one column; None when rows are already in that order"""
+        if column == 0:
+            return None
+        return [self.row_cells(row)[1][column] for row in range(self.rowCount())]
+
+    def reset(self, source):
+        """Show another source (e.g. after the live store was cleared)"""
+        self.beginResetModel()
+        self.source = source
+        self.row_cache = {}
+        self.rebuild()
+        self.endResetModel()
+
+    def rebuild(self):
+        pass
+
+
+class CaptureTableModel(FrameTableModel):
+    """Full trace: one row per frame, in capture order"""
+
+    def __init__(self, source, parent=None):
+        super().__init__(source, parent)
+        self.rows = len(source)
+
+    def rebuild(self):
+        self.rows = len(self.source)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.rows
+
+    def record_index(self, row):
+        return row
+
+    def sort_keys(self, column):
+        if column in (0, 5):
+            return super().sort_keys(column)
+        records = self.source.read(0, self.rows)
+        if column == 1:
+            return records['timestamp']
+        if column == 2:
+            return records['can_id']
+        if column == 3:
+            flags = records['flags']
+            return np.where(flags & FLAG_GAP, "GAP", np.where(flags & FLAG_FD, "FD", "STD"))
+        if column == 4:
+            return np.where(records['flags'] & FLAG_GAP, 0, records['dlc'])
+        # Cycle time and count need the previous frame of the same ID: group the frames by ID. Like in
+        # previous_of_id(), frames of IDs a bounded store no longer indexes have neither.
+        if getattr(self.source, 'evicted_ids', 0):
+            frames = np.flatnonzero(self.source.indexed(self.rows))
+        else:
+            frames = np.arange(self.rows)
+        order = frames[np.argsort(records['can_id'][frames], kind='stable')]
+        sorted_ids = records['can_id'][order]
+        firsts = np.ones(len(order), dtype=bool)
+        firsts[1:] = sorted_ids[1:] != sorted_ids[:-1]
+        positions = np.arange(len(order))
+        counts = np.zeros(self.rows, dtype=np.int64)
+        counts[order] = positions - np.maximum.accumulate(np.where(firsts, positions, 0)) + 1
+        sorted_cycles = np.empty(len(order))
+        sorted_cycles[1:] = np.diff(records['timestamp'][order]) * 1000
+        sorted_cycles[firsts] = -1.0
+        cycles = np.full(self.rows, -1.0)
+        cycles[order] = sorted_cycles
+        return cycles if column == 6 else counts
+
+    def refresh(self, count=None):
+        """Pick up frames appended to the source, up to `count` (a snapshot of its length)"""
+        count = len(self.source) if count is None else count
+        if count > self.rows:
+            self.beginInsertRows(QModelIndex(), self.rows, count - 1)
+            self.rows = count
+            self.endInsertRows()
+
+
+class LatestTableModel(FrameTableModel):
+    """Overwrite view: one row per CAN ID showing its latest frame, in first-seen order
+
+    With group_key set, rows group frames by group_key(can_ids, flags)
+    instead of by ID (e.g. j1939.group_keys: one row per PGN and source
+    address), and Count and Cycle Time count the frames of the group.
+
+    At most max_rows keys (None: all) get a row. Beyond that, the keys
+    ranked lowest by id_policy are evicted like in the receiver and the
+    store (see capture.id_limit): they give up their rows to new keys, the
+    rows left over are removed, and their frames are counted in one "other
+    IDs" row at the end.
+    """
+
+    def __init__(self, source, parent=None, max_rows=MAX_IDS, id_policy=LFU):
+        super().__init__(source, parent)
+        self.group_key = None
+        self.max_rows = max_rows
+        self.id_policy = id_policy
+        self.rebuild()
+
+    def rebuild(self):
+        self.row_ids = []
+        self.latest = []
+        self.row_of_id = {}
+        self.counts = []
+        self.previous = []  # index of the frame of the key before the latest one
+        self.other_row = None  # row of the "other IDs" aggregate, after all others
+        self.other_latest = -1
+        self.other_count = 0
+        self.evicted = 0
+        if self.group_key is None:
+            self.scanned = len(self.source)
+            can_ids, first, last, counts = self.source.id_summary(self.scanned)
+            # Frames of IDs a bounded CaptureStore no longer indexes are other IDs as well
+            if getattr(self.source, 'evicted_ids', 0):
+                self.evicted = self.source.evicted_ids
+                self.other_count = self.source.evicted_frames
+                self.other_latest = self.source.evicted_latest
+            victims = select_victims(counts, last, excess(len(can_ids), self.max_rows), self.id_policy)
+            if len(victims):
+                self.fold(last[victims], counts[victims])
+                kept = np.ones(len(can_ids), dtype=bool)
+                kept[victims] = False
+                can_ids, last, counts = can_ids[kept], last[kept], counts[kept]
+            self.add_rows([(can_id, index, count, self.source.previous_of_id(index)[1])
+                           for can_id, index, count in zip(can_ids.tolist(), last.tolist(), counts.tolist())])
+            self.add_other_row()
+            return
+        # Groups are not indexed by the source: scan it
+        self.scanned = 0
+        count = len(self.source)
+        while self.scanned < count:
+            stop = min(count, self.scanned + SCAN_BLOCK)
+            new_ids, changed = self.scan_block(self.scanned, stop)
+            new_ids, removed = self.make_room(new_ids, changed)
+            self.remove_rows(removed)
+            self.add_rows(new_ids)
+            self.scanned = stop
+        self.add_other_row()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.row_ids) + (self.other_row is not None)
+
+    def record_index(self, row):
+        return self.latest[row] if row != self.other_row else self.other_latest
+
+    def previous_frame(self, row, record_index):
+        return self.counts[row] - 1, self.previous[row]
+
+    def row_cells(self, row):
+        if row != self.other_row:
+            return super().row_cells(row)
+        timestamp = float(self.source[self.other_latest]['timestamp'])
+        return (
+            (str(row + 1), format_timestamp(timestamp), "Other IDs", "", "",
+             f"{self.evicted} IDs evicted", "", str(self.other_count)),
+            (row + 1, timestamp, OTHER_KEY, "", 0, "", -1.0, self.other_count),
+        )
+
+    def scan_block(self, start, stop):
+        """
+        Update the rows of the keys in source[start:stop].
+
+        :return: ([(key, latest index, count, previous index)] of keys without a
+            row, in first-seen order; rows that changed)
+        """
+        if self.group_key is None:
+            keys = self.source.read(start, stop)['can_id']
+        else:
+            records = self.source.read(start, stop)
+            keys = self.group_key(records['can_id'], records['flags'])
+        unique_keys, last, counts, block_previous = block_summary(keys, start)
+        new_ids = []
+        changed = []
+        for key, index, count, previous in zip(unique_keys.tolist(), last.tolist(), counts.tolist(),
+                                               block_previous.tolist()):
+            row = self.row_of_id.get(key)
+            if row is None:
+                new_ids.append((key, index, count, previous))
+                continue
+            self.counts[row] += count
+            self.previous[row] = previous if previous >= 0 else self.latest[row]
+            self.latest[row] = index
+            changed.append(row)
+        if new_ids:
+            # New keys get rows in the order they first appeared
+            block_keys, first_index = np.unique(keys, return_index=True)
+            first_seen = dict(zip(block_keys.tolist(), first_index.tolist()))
+            new_ids.sort(key=lambda item: first_seen[item[0]])
+        return new_ids, changed
+
+    def make_room(self, new_ids, changed):
+        """
+        Evict keys once more than max_rows keys would have rows, and give
+        their rows to new keys.
+
+        Rows that were given to new keys are added to `changed`.
+
+        :return: (the new keys that still need a row of their own, rows of
+            evicted keys that no new key took)
+        """
+        tracked = len(self.row_ids)
+        n = excess(tracked + len(new_ids), self.max_rows)
+        if n <= 0:
+            return new_ids, []
+        counts = np.array(self.counts + [item[2] for item in new_ids], dtype=np.int64)
+        latest = np.array(self.latest + [item[1] for item in new_ids], dtype=np.int64)
+        victims = np.sort(select_victims(counts, latest, n, self.id_policy))
+        self.fold(latest[victims], counts[victims])
+        # Rows of evicted keys go to the new keys that were kept, in first-seen order
+        evicted_new = set((victims[victims >= tracked] - tracked).tolist())
+        kept = [item for i, item in enumerate(new_ids) if i not in evicted_new]
+        free = victims[victims < tracked].tolist()
+        for row, (key, index, count, previous) in zip(free, kept):
+            del self.row_of_id[self.row_ids[row]]
+            self.row_of_id[key] = row
+            self.row_ids[row] = key
+            self.latest[row] = index
+            self.counts[row] = count
+            self.previous[row] = previous
+            changed.append(row)
+        if self.other_row is not None:
+            changed.append(self.other_row)
+        return kept[len(free):], free[len(kept):]
+
+    def remove_rows(self, rows):
+        """Remove the rows of evicted keys; the rows after them move up"""
+        if not rows:
+            return
+        removed = set(rows)
+        kept = [row for row in range(len(self.row_ids)) if row not in removed]
+        for name in ('row_ids', 'latest', 'counts', 'previous'):
+            values = getattr(self, name)
+            setattr(self, name, [values[row] for row in kept])
+        self.row_of_id = {key: row for row, key in enumerate(self.row_ids)}
+        if self.other_row is not None:
+            self.other_row = len(self.row_ids)
+        self.row_cache = {}
+
+    def fold(self, latest, counts):
+        """Count the frames of evicted keys, given their latest indices and counts, in the "other IDs" row"""
+        self.evicted += len(latest)
+        self.other_latest = max(self.other_latest, int(latest.max()))
+        self.other_count += int(counts.sum())
+
+    def add_other_row(self):
+        """Append the "other IDs" row once keys were evicted; True when it was added"""
+        if self.other_row is not None or not self.evicted:
+            return False
+        self.other_row = len(self.row_ids)
+        return True
+
+    def show_state(self, state, scanned):
+        """Show an OverwriteState of the first `scanned` records (e.g. from an OverwriteTimeline), in key order"""
+        self.beginResetModel()
+        self.row_cache = {}
+        self.row_ids = state.keys.tolist()
+        self.latest = state.latest.tolist()
+        self.counts = state.counts.tolist()
+        self.previous = state.previous.tolist()
+        self.row_of_id = {key: row for row, key in enumerate(self.row_ids)}
+        self.other_latest = state.other_latest
+        self.other_count = state.other_count
+        self.evicted = state.evicted
+        self.other_row = len(self.row_ids) if self.evicted else None
+        self.scanned = scanned
+        self.endResetModel()
+
+    def add_rows(self, new_ids):
+        for key, index, count, previous in new_ids:
+            self.row_of_id[key] = len(self.row_ids)
+            self.row_ids.append(key)
+            self.latest.append(index)
+            self.counts.append(count)
+            self.previous.append(previous)
+
+    def refresh(self, count=None):
+        """Fold frames appended to the source into the per-ID rows, up to `count`"""
+        count = len(self.source) if count is None else count
+        while self.scanned < count:
+            start = self.scanned
+            stop = min(count, start + SCAN_BLOCK)
+            new_ids, changed = self.scan_block(start, stop)
+            if new_ids:
+                new_ids, removed = self.make_room(new_ids, changed)
+                if removed:
+                    # The rows after the removed ones move up: show the remaining rows in one reset
+                    self.beginResetModel()
+                    self.remove_rows(removed)
+                    self.add_other_row()
+                    self.endResetModel()
+                    changed = []
+                if new_ids:
+                    # Rows are only appended before the "other IDs" row exists
+                    first_row = len(self.row_ids)
+                    self.beginInsertRows(QModelIndex(), first_row, first_row + len(new_ids) - 1)
+                    self.add_rows(new_ids)
+                    self.endInsertRows()
+                if self.evicted and self.other_row is None:
+                    self.beginInsertRows(QModelIndex(), len(self.row_ids), len(self.row_ids))
+                    self.add_other_row()
+                    self.endInsertRows()
+            if len(changed) > 64:
+                self.dataChanged.emit(self.index(min(changed), 0), self.index(max(changed), len(COLUMNS) - 1))
+            else:
+                for row in changed:
+                    self.dataChanged.emit(self.index(row, 0), self.index(row, len(COLUMNS) - 1))
+            self.scanned = stop
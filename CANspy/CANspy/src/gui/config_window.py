@@ -1,13 +1,28 @@
 from PyQt5 import QtWidgets, QtCore
-from PyQt5.QtWidgets import QWidget, QTableWidget, QTableWidgetItem, QCheckBox, QLabel, QVBoxLayout, QHBoxLayout
+from PyQt5.QtWidgets import QWidget, QTableView, QCheckBox, QLabel, QLineEdit, QSlider, QVBoxLayout, QHBoxLayout
 from PyQt5.QtCore import pyqtSignal
-from gui.custom_items import HexIDItem
-import threading  # Add this import
-import can  # Also add this to make sure can is imported
-import time  # For timestamps
+from gui.capture_model import CaptureTableModel, LatestTableModel, format_timestamp
+from gui.sort_proxy import SortedProxyModel
+from capture.capture_file import CaptureReader, CAPTURE_EXTENSION
+from capture.store import CaptureStore
+from capture.importers import ImportThread
+from capture.replay import ReplayEngine, open_replay_bus
+from capture.receiver import CANReceiver
+from capture.id_limit import MAX_IDS, LFU
+from capture.timeline import OverwriteTimeline
+from capture.capture_process import ProcessReceiver
+from capture.display_filter import DisplayFilter, FilterError, FilterFeed
+from capture import j1939
+from utils.profiles import FILTER_SETTINGS
+import os
+
+SCRUB_DELAY = 15  # ms; slider moves within this time are shown at once
 
 class ConfigWindow(QWidget):
-    message_received = pyqtSignal(dict)
+    frames_received = pyqtSignal(object)
+    import_progress = pyqtSignal(object, int, int)
+    import_finished = pyqtSignal(object, str)
+    replay_finished = pyqtSignal(str)
 
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -25,248 +40,581 @@ class ConfigWindow(QWidget):
         self.overwrite_checkbox.stateChanged.connect(self.handle_overwrite_change)
         controls_layout.addWidget(self.overwrite_checkbox)
         
+        # J1939 mode: decoded IDs, and the overwrite view grouped by PGN and source address
+        self.j1939_checkbox = QCheckBox("J1939", self)
+        self.j1939_checkbox.setToolTip("Show J1939 PGN and source address of 29-bit IDs and keep one\n"
+                                       "overwrite row per PGN and source address")
+        self.j1939_checkbox.toggled.connect(self.handle_j1939_change)
+        controls_layout.addWidget(self.j1939_checkbox)
+        
+        # Display filter, applied with Enter
+        self.filter_edit = QLineEdit(self)
+        self.filter_edit.setPlaceholderText("Filter, e.g. id in 0x100..0x1FF and data[0] & 0x80 and cycle > 50ms")
+        self.filter_edit.setClearButtonEnabled(True)
+        self.filter_edit.setMinimumWidth(360)
+        self.filter_edit.returnPressed.connect(self.handle_filter_change)
+        controls_layout.addWidget(self.filter_edit)
+        
+        # ID ranges of the filter can also be set as acceptance filters on the bus
+        self.bus_filter_checkbox = QCheckBox("Filter on bus", self)
+        self.bus_filter_checkbox.setChecked(True)
+        self.bus_filter_checkbox.setToolTip(
+            "Let the bus drop IDs the filter cannot match. Those frames are then\n"
+            "neither captured nor recorded until the filter is cleared.")
+        self.bus_filter_checkbox.toggled.connect(self.update_bus_filter)
+        controls_layout.addWidget(self.bus_filter_checkbox)
+        
         # Status label (this will be replaced by status bar)
         self.status_label = QLabel("", self)
         controls_layout.addWidget(self.status_label)
         controls_layout.addStretch()
         
-        # Data table
-        self.table = QTableWidget(self)
-        self.table.setColumnCount(8)
-        self.table.setHorizontalHeaderLabels([
-            "#", "Timestamp", "CAN ID", "Type", "Length", "Data", "Cycle Time", "Count"
-        ])
+        # Data table: the full trace and the latest frame per CAN ID are two
+        # models over the same capture store, so Overwrite only swaps models
+        self.table = QTableView(self)
         self.table.verticalHeader().setVisible(False)
         self.table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
         self.table.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
         self.table.setSelectionMode(QtWidgets.QAbstractItemView.SingleSelection)
         self.table.horizontalHeader().setSectionResizeMode(QtWidgets.QHeaderView.Interactive)
+        self.table.horizontalHeader().setResizeContentsPrecision(64)  # size columns from the first rows only
         self.table.setSortingEnabled(True)
+        self.table.sortByColumn(0, QtCore.Qt.AscendingOrder)
         
         # Add widgets to main layout
+        # Timeline: dragged back, the overwrite view shows the capture as it was at that time
+        timeline_layout = QHBoxLayout()
+        self.timeline_slider = QSlider(QtCore.Qt.Horizontal, self)
+        self.timeline_slider.setRange(0, 0)
+        self.timeline_slider.setToolTip("Drag back to see the latest frame of each ID at an earlier time;\n"
+                                        "at the right end the table follows the capture.")
+        self.timeline_slider.valueChanged.connect(self.handle_timeline_change)
+        timeline_layout.addWidget(self.timeline_slider)
+        self.timeline_label = QLabel("Live", self)
+        timeline_layout.addWidget(self.timeline_label)
+        self.scrub_timer = QtCore.QTimer(self)
+        self.scrub_timer.setSingleShot(True)
+        self.scrub_timer.setInterval(SCRUB_DELAY)
+        self.scrub_timer.timeout.connect(self.scrub)
+        
         main_layout.addLayout(controls_layout)
+        main_layout.addLayout(timeline_layout)
         main_layout.addWidget(self.table)
         
-        # Initialize variables for CAN reception
-        self.receive_thread = None
-        self.running = False
-        self.last_timestamps = {}
-        self.counts = {}
         self.can_config = None  # Will be set by configure_can()
         
-        # Connect signals
-        self.message_received.connect(self.handle_message)
+        # Capture file viewing and replay
+        self.capture_reader = None
+        self.import_thread = None
+        self.capture_path = None
+        self.replay_engine = None
+        self.replay_bus = None
         
-        # Initial resize of columns after first data
-        if self.table.rowCount() > 0:
-            self.table.resizeColumnsToContents()
+        # Row colors of the overwrite view, e.g. from the cycle monitor
+        self.highlight = None
+        
+        # Per-ID state of live frames is bounded, so a flood of random IDs cannot exhaust memory
+        self.max_ids = MAX_IDS
+        self.id_policy = LFU
+        
+        # While the timeline is dragged back, the overwrite view of the shown source is
+        # replaced by one of its state at that time, rebuilt from keyframes
+        self.timeline = None  # OverwriteTimeline of the shown source, made on first use
+        self.scrub_views = None
+        
+        # Live frames go into this store; opened captures get their own views
+        self.live_store = CaptureStore(self.max_ids, self.id_policy)
+        self.live_views = self.create_views(self.live_store)
+        self.views = self.live_views
+        
+        # With a display filter, the matching frames of the current source are
+        # copied into the feed's store, which has views of its own
+        self.display_filter = None
+        self.filter_feed = None
+        self.filter_views = None
+        self.filter_pending = False
+        self.show_view()
+        
+        # The capture engine receives into the live store on its own thread
+        self.receiver = None
+        self.recording_path = None
+        self.analysis_windows = {}  # AnalysisWindow subclass -> its panel, once opened
+        self.set_receiver(CANReceiver)
+        
+        # Connect signals
+        self.frames_received.connect(self.handle_frames)
+        self.import_progress.connect(self.handle_import_progress)
+        self.import_finished.connect(self.handle_import_finished)
 
     # Add configure_can method
     def configure_can(self, config):
         """Store CAN configuration"""
+        config = dict(config)
+        filters = {key: config.pop(key) for key in FILTER_SETTINGS if key in config}
+        use_process = config.pop('capture_process', False)
+        auto_reconnect = config.pop('auto_reconnect', False)
+        self.set_id_limit(config.pop('max_ids', MAX_IDS), config.pop('id_policy', LFU))
         self.can_config = config
+        if use_process != isinstance(self.receiver, ProcessReceiver):
+            if self.recording_path is None:
+                self.set_receiver(ProcessReceiver if use_process else CANReceiver)
+            else:
+                self.status_label.setText("Capture mode changes once recording stops")
+        self.receiver.config = config
+        self.receiver.auto_reconnect = auto_reconnect
+        if filters:
+            self.set_filter_settings(filters)
 
-    def start_receiving(self):
-        """Start receiving CAN messages"""
+    def set_receiver(self, receiver_class):
+        """Switch between capturing in this process and in a capture process"""
+        if self.receiver is not None:
+            self.receiver.close()
+        self.receiver = receiver_class(store=self.live_store)
+        self.receiver.max_ids = self.max_ids
+        self.receiver.id_policy = self.id_policy
+        self.receiver.subscribe(self.on_frames)
+        self.receiver.on_error = self.on_receive_error
+        self.receiver.on_status = self.on_receive_status
+        self.update_bus_filter()
+        for window in self.analysis_windows.values():
+            if window.isVisible():
+                window.set_receiver(self.receiver)
+
+    def show_analysis(self, window_class):
+        """Open an analysis panel (see AnalysisWindow), which analyzes frames from now on"""
+        window = self.analysis_windows.get(window_class)
+        if window is None:
+            window = self.analysis_windows[window_class] = window_class(self)
+        if not window.isVisible():
+            window.reset()
+            window.set_receiver(self.receiver)
+        window.show()
+        window.raise_()
+
+    def shutdown(self):
+        """Stop receiving and recording, and end a capture process"""
+        self.receiver.close()
+        self.recording_path = None
+
+    def start_receiving(self, wait_timeout=None):
+        """Start receiving CAN messages; with wait_timeout, also wait until the bus is open"""
         try:
-            if not self.running:
-                self.running = True
-                self.receive_thread = threading.Thread(target=self.receive_messages, daemon=True)
-                self.receive_thread.start()
-                return True
-            return False
+            self.show_live_table()
+            if self.replay_engine is not None and self.replay_bus is None:
+                self.stop_replay()  # the receiver takes over the live table
+            if not self.receiver.start_receiving():
+                return False
+            if wait_timeout is not None and not self.receiver.wait_connected(wait_timeout):
+                self.receiver.stop_receiving()
+                return False
+            return True
         except Exception as e:
             print(f"Error starting receive thread: {e}")
             self.status_label.setText(f"Error: {e}")
-            self.running = False
             return False
 
-    def receive_messages(self):
-        bus = None
+    def on_frames(self, batch):
+        """Pass a batch of received frames on to the table (called off the GUI thread)"""
+        self.frames_received.emit(batch)
+
+    def on_receive_error(self, error):
+        self.on_receive_status(f"Error: {error}")
+
+    def on_receive_status(self, text):
+        """Show a receiver status text, e.g. while reconnecting (called off the GUI thread)"""
+        QtCore.QMetaObject.invokeMethod(
+            self.status_label,
+            "setText",
+            QtCore.Qt.QueuedConnection,
+            QtCore.Q_ARG(str, text)
+        )
+
+    def create_views(self, source):
+        """Trace and latest-per-ID models, each behind its own sort proxy"""
+        views = {}
+        for name, model in (('trace', CaptureTableModel(source, self)),
+                            ('latest', LatestTableModel(source, self, self.max_ids, self.id_policy))):
+            proxy = SortedProxyModel(self)
+            proxy.setSourceModel(model)
+            views[name] = (model, proxy)
+        if self.j1939_checkbox.isChecked():
+            self.set_j1939(views, True)
+        views['latest'][0].highlight = self.highlight
+        return views
+
+    def set_highlight(self, highlight):
+        """Color the rows of the overwrite views by CAN ID with highlight(can_id) -> QColor or None"""
+        self.highlight = highlight
+        for views in (self.live_views, self.views, self.filter_views, self.scrub_views):
+            if views is not None:
+                views['latest'][0].highlight = highlight
+        self.table.viewport().update()
+
+    def set_id_limit(self, max_ids, id_policy):
+        """Bound the IDs tracked by the receiver, the stores and the overwrite views (max_ids None: all)"""
+        if (max_ids, id_policy) == (self.max_ids, self.id_policy):
+            return
+        self.stop_scrubbing()
+        self.timeline = None
+        self.max_ids = max_ids
+        self.id_policy = id_policy
+        for target in (self.receiver, self.live_store):
+            target.max_ids = max_ids
+            target.id_policy = id_policy
+        for views in (self.live_views, self.views):
+            if views is not None:
+                model = views['latest'][0]
+                model.max_rows = max_ids
+                model.id_policy = id_policy
+                model.reset(model.source)
+        if self.filter_feed is not None:
+            # The filter store is bounded as well
+            self.restart_filter()
+
+    def set_j1939(self, views, enabled):
+        """Switch the models of one source to J1939 (or plain CAN) IDs and grouping"""
+        for model, proxy in views.values():
+            model.id_format = j1939.id_text if enabled else None
+            if isinstance(model, LatestTableModel):
+                model.group_key = j1939.group_keys if enabled else None
+            model.reset(model.source)
+
+    def handle_j1939_change(self, enabled):
+        self.stop_scrubbing()
+        sources = [self.live_views, self.filter_views]
+        if self.views is not self.live_views:
+            sources.append(self.views)  # an opened capture
+        for views in sources:
+            if views is not None:
+                self.set_j1939(views, enabled)
+        self.show_view()
+
+    def show_view(self):
+        """Show the latest-per-ID or the full trace model of the current source"""
+        name = 'latest' if self.overwrite_checkbox.isChecked() else 'trace'
+        views = self.shown_views()
+        if name == 'latest' and self.scrub_views is not None:
+            views = self.scrub_views
+        proxy = views[name][1]
+        if self.table.model() is not proxy:
+            self.table.setModel(proxy)
+        # A view that was hidden while the user changed the sort catches up once
+        header = self.table.horizontalHeader()
+        proxy.sort(header.sortIndicatorSection(), header.sortIndicatorOrder())
+        self.update_timeline_range()
+
+    def shown_views(self):
+        """Views of the shown source: the display filter's matches, or the live or opened capture"""
+        return self.views if self.filter_views is None else self.filter_views
+
+    def refresh_views(self, views, count):
+        """Bring both models up to the same snapshot of their source"""
+        was_empty = self.table.model().rowCount() == 0
+        for model, proxy in views.values():
+            model.refresh(count)
+        if was_empty and self.table.model().rowCount() > 0:
+            self.table.resizeColumnsToContents()
+        if views is self.shown_views():
+            self.update_timeline_range()
+
+    def update_timeline_range(self):
+        """Stretch the timeline over the shown source; at the right end it stays there"""
+        source = self.shown_views()['latest'][0].source
+        count = len(source)
+        duration = int((source[count - 1]['timestamp'] - source[0]['timestamp']) * 1000) if count else 0
+        self.timeline_slider.blockSignals(True)
+        self.timeline_slider.setMaximum(duration)
+        if self.scrub_views is None:
+            self.timeline_slider.setValue(duration)
+        self.timeline_slider.blockSignals(False)
+
+    def handle_timeline_change(self, value):
+        # Dragging moves the slider faster than the table can follow: show where it rests
+        self.scrub_timer.start()
+
+    def scrub(self):
+        """Show the overwrite view at the timeline's time, or follow the capture again at its right end"""
+        slider = self.timeline_slider
+        latest = self.shown_views()['latest'][0]
+        source = latest.source
+        if slider.value() >= slider.maximum() or not len(source):
+            self.stop_scrubbing()
+            return
+        timestamp = float(source[0]['timestamp']) + slider.value() / 1000
+        index = source.index_at_time(timestamp)
+        timeline = self.timeline
+        if timeline is None or timeline.source is not source or timeline.group_key is not latest.group_key:
+            timeline = self.timeline = OverwriteTimeline(source, latest.group_key, self.max_ids, self.id_policy)
+        if self.scrub_views is None:
+            model = LatestTableModel(source, self, self.max_ids, self.id_policy)
+            model.group_key = latest.group_key
+            model.id_format = latest.id_format
+            model.highlight = latest.highlight
+            proxy = SortedProxyModel(self)
+            proxy.setSourceModel(model)
+            self.scrub_views = {'latest': (model, proxy)}
+        self.scrub_views['latest'][0].show_state(timeline.state_at(index), index)
+        self.timeline_label.setText(format_timestamp(timestamp))
+        self.show_view()
+        if not self.overwrite_checkbox.isChecked() and index:
+            # The trace scrolls to the frames of that time
+            model, proxy = self.shown_views()['trace']
+            row = proxy.mapFromSource(model.index(min(index, model.rowCount()) - 1, 0))
+            self.table.scrollTo(row, QtWidgets.QAbstractItemView.PositionAtCenter)
+
+    def stop_scrubbing(self):
+        """Let the overwrite view follow the capture again"""
+        self.scrub_timer.stop()
+        self.timeline_label.setText("Live")
+        self.timeline_slider.blockSignals(True)
+        self.timeline_slider.setValue(self.timeline_slider.maximum())
+        self.timeline_slider.blockSignals(False)
+        if self.scrub_views is None:
+            return
+        model, proxy = self.scrub_views['latest']
+        self.scrub_views = None
+        self.show_view()
+        proxy.deleteLater()
+        model.deleteLater()
+
+    def handle_frames(self, batch):
+        # Frames that arrived since the last refresh are picked up in one go
+        self.refresh_views(self.live_views, len(self.live_store))
+        if self.filter_feed is not None and self.filter_feed.source is self.live_store:
+            self.run_filter()
+
+    def handle_filter_change(self):
         try:
-            # Use stored configuration if available
-            if hasattr(self, 'can_config') and self.can_config:
-                bus = can.interface.Bus(**self.can_config)
-            else:
-                # Fallback to default configuration
-                bus = can.interface.Bus(
-                    interface='pcan',
-                    channel='PCAN_USBBUS1',
-                    bitrate=500000,
-                    fd=False
-                )
-            while self.running:
-                msg = bus.recv(1.0)
-                if msg:
-                    try:
-                        timestamp = time.strftime('%H:%M:%S', time.localtime(float(msg.timestamp)))
-                        timestamp += f".{int((float(msg.timestamp) % 1) * 1000):03d}"
-                    except Exception:
-                        timestamp = str(msg.timestamp)
-
-                    can_id = hex(msg.arbitration_id)  # This naturally uses lowercase 'x'
-                    msg_type = "FD" if getattr(msg, "is_fd", False) else "STD"
-                    length = msg.dlc
-                    data = ' '.join(f"{b:02X}" for b in msg.data)
-                    cycle_time = ""
-                    count = 1
-
-                    try:
-                        if can_id in self.last_timestamps:
-                            prev = float(self.last_timestamps[can_id])
-                            curr = float(msg.timestamp)
-                            cycle = (curr - prev) * 1000
-                            cycle_time = f"{cycle:.2f} ms"
-                            self.last_timestamps[can_id] = curr
-                            self.counts[can_id] += 1
-                            count = self.counts[can_id]
-                        else:
-                            self.last_timestamps[can_id] = float(msg.timestamp)
-                            self.counts[can_id] = 1
-                    except Exception:
-                        cycle_time = ""
-
-                    overwrite = self.overwrite_checkbox.isChecked()
-                    msg_data = {
-                        'timestamp': timestamp,
-                        'can_id': can_id,
-                        'msg_type': msg_type,
-                        'length': length,
-                        'data': data,
-                        'cycle_time': cycle_time,
-                        'count': count,
-                        'overwrite': overwrite
-                    }
-                    self.message_received.emit(msg_data)
+            self.set_display_filter(self.filter_edit.text())
+        except FilterError as e:
+            self.status_label.setText(f"Filter error: {e}")
+            return
+        if self.status_label.text().startswith("Filter error"):
+            self.status_label.setText("")
+
+    def set_display_filter(self, text):
+        """Show only the frames matching a display filter; an empty text shows all frames"""
+        self.display_filter = DisplayFilter(text) if text.strip() else None
+        self.update_bus_filter()
+        self.restart_filter()
+
+    def bus_filters(self):
+        """Acceptance filters for the bus: the ID ranges of the display filter, or None for all IDs"""
+        if self.display_filter is not None and self.bus_filter_checkbox.isChecked():
+            return self.display_filter.can_filters()
+        return None
+
+    def update_bus_filter(self):
+        """Push the ID ranges of the display filter down to the bus acceptance filters"""
+        self.set_bus_filters(self.bus_filters())
+
+    def set_bus_filters(self, can_filters):
+        try:
+            self.receiver.set_filters(can_filters)
         except Exception as e:
-            QtCore.QMetaObject.invokeMethod(
-                self.status_label,
-                "setText",
-                QtCore.Qt.QueuedConnection,
-                QtCore.Q_ARG(str, f"Error: {e}")
-            )
-        finally:
-            if bus is not None:
-                bus.shutdown()
-
-    def handle_message(self, msg_data):
-        # Temporarily disable sorting
-        was_sorting_enabled = self.table.isSortingEnabled()
-        self.table.setSortingEnabled(False)
-        
-        timestamp = msg_data['timestamp']
-        can_id = msg_data['can_id'].upper()
-        msg_type = msg_data['msg_type']
-        length = msg_data['length']
-        data = msg_data['data']
-        cycle_time = msg_data['cycle_time']
-        count = msg_data['count']
-        overwrite = msg_data['overwrite']
-
-        if overwrite:
-            row = self.find_row_by_can_id(can_id)
-            if row is not None:
-                self.update_row(row, timestamp, can_id, msg_type, length, data, cycle_time, count)
-            else:
-                row = self.table.rowCount()
-                self.table.insertRow(row)
-                self.set_row(row, timestamp, can_id, msg_type, length, data, cycle_time, count)
+            self.status_label.setText(f"Error: {e}")
+
+    def filter_settings(self):
+        """The display filter and the bus filters, to save in a connection profile"""
+        return {'display_filter': self.display_filter.text if self.display_filter is not None else '',
+                'filter_on_bus': self.bus_filter_checkbox.isChecked(),
+                'can_filters': self.bus_filters()}
+
+    def set_filter_settings(self, settings):
+        """Apply the filter_settings() of a connection profile, before its bus is opened"""
+        self.bus_filter_checkbox.blockSignals(True)
+        self.bus_filter_checkbox.setChecked(settings.get('filter_on_bus', True))
+        self.bus_filter_checkbox.blockSignals(False)
+        text = settings.get('display_filter', '')
+        self.filter_edit.setText(text)
+        try:
+            self.set_display_filter(text)
+        except FilterError as e:
+            # Filter with the saved bus filters at least
+            self.status_label.setText(f"Filter error: {e}")
+            self.set_bus_filters(settings.get('can_filters'))
+
+    def restart_filter(self):
+        """Filter the current source from the start (after the filter or the source changed)"""
+        self.stop_scrubbing()
+        self.timeline = None
+        old_views = self.filter_views
+        if self.display_filter is None:
+            self.filter_feed = None
+            self.filter_views = None
         else:
-            row = self.table.rowCount()
-            self.table.insertRow(row)
-            self.set_row(row, timestamp, can_id, msg_type, length, data, cycle_time, count)
-        
-        self.update_row_numbers()
-        
-        # Re-enable sorting if it was enabled before
-        self.table.setSortingEnabled(was_sorting_enabled)
+            source = self.capture_reader if self.capture_reader is not None else self.live_store
+            self.filter_feed = FilterFeed(source, self.display_filter, self.max_ids, self.id_policy)
+            self.filter_views = self.create_views(self.filter_feed.store)
+        self.show_view()
+        if old_views is not None:
+            for model, proxy in old_views.values():
+                proxy.deleteLater()
+                model.deleteLater()
+        self.run_filter()
 
-    def handle_overwrite_change(self, state):
-        # Temporarily disable sorting while modifying the table
-        was_sorting_enabled = self.table.isSortingEnabled()
-        self.table.setSortingEnabled(False)
-    
-        if state == QtCore.Qt.Checked:
-            # Find all unique CAN IDs and their rows
-            can_id_rows = {}
-            for row in range(self.table.rowCount()):
-                item = self.table.item(row, 2)
-                if item:
-                    can_id = item.text()
-                    if can_id in can_id_rows:
-                        can_id_rows[can_id].append(row)
-                    else:
-                        can_id_rows[can_id] = [row]
-            
-            # Remove all but the last row for each CAN ID with duplicates
-            rows_to_remove = []
-            for can_id, rows in can_id_rows.items():
-                if len(rows) > 1:
-                    # Keep the last row (most recent data)
-                    rows_to_remove.extend(rows[:-1])
-            
-            # Remove rows in reverse order to keep indices valid
-            for row in sorted(rows_to_remove, reverse=True):
-                self.table.removeRow(row)
-        
-        # Update row numbers after removing rows
-        self.update_row_numbers()
-        
-        # Re-enable sorting if it was enabled
-        self.table.setSortingEnabled(was_sorting_enabled)
-
-    def update_row_numbers(self):
-        # Set row number column to be sequential from 1 to N
-        for row in range(self.table.rowCount()):
-            self.table.setItem(row, 0, QTableWidgetItem(str(row + 1)))
-
-    def set_row(self, row, timestamp, can_id, msg_type, length, data, cycle_time, count):
-        self.table.setItem(row, 0, QTableWidgetItem(str(row + 1)))
-        self.table.setItem(row, 1, QTableWidgetItem(timestamp))
-        self.table.setItem(row, 2, HexIDItem(can_id.upper()))  # Use custom item for CAN ID
-        self.table.setItem(row, 3, QTableWidgetItem(msg_type))
-        self.table.setItem(row, 4, QTableWidgetItem(str(length)))
-        self.table.setItem(row, 5, QTableWidgetItem(data))
-        self.table.setItem(row, 6, QTableWidgetItem(cycle_time))
-        self.table.setItem(row, 7, QTableWidgetItem(str(count)))
-        if row == 0:
-            self.table.resizeColumnsToContents()
+    def run_filter(self):
+        """Filter the next step of frames; a large backlog is worked off between GUI events"""
+        feed = self.filter_feed
+        if feed is None:
+            return
+        done = feed.update()
+        self.refresh_views(self.filter_views, len(feed.store))
+        if not done and not self.filter_pending:
+            self.filter_pending = True
+            QtCore.QTimer.singleShot(0, self.continue_filter)
 
-    def update_row(self, row, timestamp, can_id, msg_type, length, data, cycle_time, count):
-        self.table.setItem(row, 1, QTableWidgetItem(timestamp))
-        self.table.setItem(row, 3, QTableWidgetItem(msg_type))
-        self.table.setItem(row, 4, QTableWidgetItem(str(length)))
-        self.table.setItem(row, 5, QTableWidgetItem(data))
-        self.table.setItem(row, 6, QTableWidgetItem(cycle_time))
-        self.table.setItem(row, 7, QTableWidgetItem(str(count)))
+    def continue_filter(self):
+        self.filter_pending = False
+        self.run_filter()
+
+    def handle_overwrite_change(self, state):
+        # Both views are always up to date, so this only switches models
+        self.show_view()
 
     def stop_receiving(self):
-        self.running = False
-        if self.receive_thread and self.receive_thread.is_alive():
-            self.receive_thread.join(timeout=2)
+        self.receiver.stop_receiving()
         self.status_label.setText("Disconnected.")
 
-    def find_row_by_can_id(self, can_id):
-        """Find row containing the given CAN ID, case insensitive"""
-        can_id_lower = can_id.lower()
-        for row in range(self.table.rowCount()):
-            item = self.table.item(row, 2)  # CAN ID is in column 2
-            if item and item.text().lower() == can_id_lower:
-                return row
-        return None
+    def start_recording(self, path):
+        """Record received frames into a CANspy capture file"""
+        self.receiver.start_recording(path)
+        self.recording_path = path
+
+    def stop_recording(self):
+        """Stop recording and write the capture index"""
+        self.receiver.stop_recording()
+        self.recording_path = None
+
+    def open_capture(self, path):
+        """Show a capture file or import a candump/ASC/TRC/BLF log.
+
+        Native capture files are memory-mapped, not loaded. Other logs are
+        imported into a CaptureStore by a background thread; the first
+        frames can be browsed while the rest of the file is indexed.
+        """
+        self.show_live_table()
+        if path.lower().endswith(CAPTURE_EXTENSION):
+            source = CaptureReader(path)
+        else:
+            source = CaptureStore()
+            self.import_thread = ImportThread(
+                path, source,
+                on_progress=lambda frames, percent: self.import_progress.emit(source, frames, percent),
+                on_finished=lambda error: self.import_finished.emit(source, str(error) if error else ""))
+        self.views = self.create_views(source)
+        self.show_view()
+        self.capture_reader = source
+        self.capture_path = path
+        self.restart_filter()
+        if self.import_thread is not None:
+            self.status_label.setText(f"Importing {os.path.basename(path)}...")
+            self.import_thread.start()
+        else:
+            self.handle_import_finished(source, "")
+
+    def handle_import_progress(self, source, frames, percent):
+        if source is not self.capture_reader:
+            return  # Late signal from an import that was replaced
+        self.refresh_views(self.views, len(source))
+        self.run_filter()
+        self.status_label.setText(f"Importing {os.path.basename(self.capture_path)}: {percent}% ({frames} frames)")
+
+    def handle_import_finished(self, source, error):
+        if source is not self.capture_reader:
+            return
+        self.refresh_views(self.views, len(source))
+        self.run_filter()
+        self.import_thread = None
+        if error:
+            self.status_label.setText(f"Error: {error}")
+            return
+        self.status_label.setText(f"{os.path.basename(self.capture_path)}: {len(source)} frames")
+
+    def show_live_table(self):
+        """Switch back from a capture file to the live table"""
+        source = self.detach_capture()
+        if source is not None:
+            source.close()
+
+    def detach_capture(self):
+        """Hide the capture view and return its source without closing it"""
+        if self.import_thread is not None:
+            self.import_thread.stop()
+            self.import_thread.join()
+            self.import_thread = None
+        source = self.capture_reader
+        if source is None:
+            return None
+        self.views = self.live_views
+        self.capture_reader = None
+        self.restart_filter()
+        self.status_label.setText("")
+        return source
+
+    def start_replay(self, config):
+        """Replay the open capture onto a bus or into the live table"""
+        if self.capture_reader is None:
+            raise ValueError("Open a capture before starting a replay")
+        self.stop_replay()
+        interface = config.get('interface')
+        if interface is None:
+            # Replayed frames go through the live pipeline, which has a single writer
+            if self.receiver.is_receiving:
+                raise ValueError("Disconnect before replaying into the table")
+            source = self.detach_capture()
+            bus = None
+            on_frame = self.receiver.process_message
+            # Frames before a pause or a long gap would otherwise wait for the next frame to be published
+            on_idle = self.receiver.flush
+        else:
+            if not config.get('channel'):
+                raise ValueError(f"No channel given for the {interface} replay")
+            source = self.capture_reader
+            kwargs = {}
+            if interface == 'pcan':
+                kwargs['bitrate'] = (self.can_config or {}).get('bitrate', 500000)
+            bus = open_replay_bus(interface, config['channel'], **kwargs)
+            on_frame = None
+            on_idle = None
+        engine = ReplayEngine(
+            source, bus=bus, on_frame=on_frame, on_idle=on_idle,
+            speed=config.get('speed', 1.0),
+            loop=config.get('loop', False),
+            id_filter=config.get('id_filter'),
+            on_finished=lambda error: self.finish_replay(error))
+        if config.get('start'):
+            engine.seek(float(source[0]['timestamp']) + config['start'] if len(source) else 0)
+        self.replay_engine = engine
+        self.replay_bus = bus
+        engine.start()
+
+    def finish_replay(self, error):
+        """Publish the last replayed frames and report the end (called on the replay thread)"""
+        if self.replay_bus is None:
+            self.receiver.flush()
+        self.replay_finished.emit(str(error) if error else "")
+
+    def stop_replay(self):
+        engine = self.replay_engine
+        if engine is None:
+            return
+        self.replay_engine = None
+        engine.on_finished = None
+        engine.stop()
+        if self.replay_bus is not None:
+            self.replay_bus.shutdown()
+            self.replay_bus = None
+        else:
+            self.receiver.flush()  # last frames of a replay into the table
 
     def clear_table(self):
         """Clear the message table and reset counters"""
-        # Temporarily disable sorting
-        was_sorting_enabled = self.table.isSortingEnabled()
-        self.table.setSortingEnabled(False)
-        
-        # Clear the table
-        self.table.setRowCount(0)
-        
-        # Reset all data tracking
-        self.last_timestamps = {}
-        self.counts = {}
+        self.show_live_table()
         
-        # Re-enable sorting if it was enabled
-        self.table.setSortingEnabled(was_sorting_enabled)
\ No newline at end of file
+        # Start a new store; a batch still in flight lands in the old one
+        self.live_store = CaptureStore(self.max_ids, self.id_policy)
+        self.receiver.clear(self.live_store)
+        for model, proxy in self.live_views.values():
+            model.reset(self.live_store)
+        self.restart_filter()
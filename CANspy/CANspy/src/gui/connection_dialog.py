@@ -4,8 +4,10 @@ from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QLabel, QComboBo
                              QDoubleSpinBox, QRadioButton, QButtonGroup, QFrame)
 from PyQt5.QtGui import QIcon, QFont, QBrush, QColor
 from PyQt5.QtCore import Qt, QTimer
-import can
 import re
+from utils.usb2can import probe_pcan_channels
+from utils.profiles import DEFAULT_PROFILE, FILTER_SETTINGS, delete_profile, load_profiles
+from capture.id_limit import MAX_IDS, LFU, POLICIES
 
 class ConnectionDialog(QDialog):
     def __init__(self, parent=None):
@@ -43,9 +45,21 @@ class ConnectionDialog(QDialog):
         
         # Setup CAN configuration tab
         self.setup_can_tab()
+        self.setup_options_tab()
         
         # Button layout
         self.button_layout = QHBoxLayout()
+        
+        # Connection profiles: pick one to load it, or type a new name to save as
+        self.profile_combo = QComboBox()
+        self.profile_combo.setEditable(True)
+        self.profile_combo.setMinimumWidth(160)
+        self.profile_combo.setToolTip("The settings are saved under this name on OK")
+        self.delete_profile_button = QPushButton("Delete")
+        self.button_layout.addWidget(QLabel("Profile:"))
+        self.button_layout.addWidget(self.profile_combo)
+        self.button_layout.addWidget(self.delete_profile_button)
+        
         self.ok_button = QPushButton("OK")
         self.cancel_button = QPushButton("Cancel")
         self.help_button = QPushButton("Help")
@@ -67,6 +81,7 @@ class ConnectionDialog(QDialog):
         self.cancel_button.clicked.connect(self.reject)
         self.help_button.clicked.connect(self.show_help)
         self.hardware_tree.itemSelectionChanged.connect(self.on_hardware_selection_changed)
+        self.delete_profile_button.clicked.connect(self.delete_selected_profile)
         
         # Initialize default selection
         self.set_default_values()
@@ -74,6 +89,12 @@ class ConnectionDialog(QDialog):
         # Load hardware initially
         self.load_hardware()
         
+        # Start from the last used profile
+        self.profiles = {}
+        self.profile_filters = {}  # filters of the loaded profile, passed on unchanged
+        self.fill_profiles()
+        self.profile_combo.activated[str].connect(self.on_profile_selected)
+        
         # Set up timer for real-time hardware detection
         self.refresh_timer = QTimer(self)
         self.refresh_timer.timeout.connect(self.load_hardware)
@@ -91,66 +112,30 @@ class ConnectionDialog(QDialog):
             # Check for available PCAN hardware using the PCAN-Basic API
             import can.interfaces.pcan as pcan
             
-            # Common PCAN channels to check
-            channels = [
-                'PCAN_USBBUS1', 'PCAN_USBBUS2', 'PCAN_USBBUS3', 'PCAN_USBBUS4',
-                'PCAN_USBBUS5', 'PCAN_USBBUS6', 'PCAN_USBBUS7', 'PCAN_USBBUS8'
-            ]
-            
             found_devices = False
             
-            for channel in channels:
-                try:
-                    # Try to initialize the channel (will fail if not available)
-                    bus = can.Bus(interface='pcan', channel=channel, bitrate=500000)
-                    
-                    # Get hardware info if possible
-                    hw_name = "PCAN-USB"
-                    if hasattr(bus, 'get_hardware_name'):
-                        try:
-                            hw_name = bus.get_hardware_name()
-                        except:
-                            pass
-                    
-                    # If it's an FD capable device
-                    is_fd = False
-                    try:
-                        # Check if FD is available
-                        bus.shutdown()
-                        bus = can.Bus(interface='pcan', channel=channel, bitrate=500000, fd=True)
-                        is_fd = True
-                        bus.shutdown()
-                    except:
-                        pass
-                    
-                    device_text = f"{hw_name}{' FD' if is_fd else ''}: {channel}"
-                    
-                    # Add to tree with green text
-                    device_item = QTreeWidgetItem(self.hardware_tree)
-                    device_item.setText(0, device_text)
-                    
-                    # Set green color and bold font
-                    green_brush = QBrush(QColor(0, 128, 0))  # Dark green
-                    bold_font = QFont()
-                    bold_font.setBold(True)
-                    device_item.setForeground(0, green_brush)
-                    device_item.setFont(0, bold_font)
-                    
-                    # Store channel name in item data for later retrieval
-                    device_item.setData(0, Qt.UserRole, channel)
-                    
-                    found_devices = True
-                    
-                    # Re-select previously selected item if it exists
-                    if previously_selected and previously_selected == device_text:
-                        device_item.setSelected(True)
-                    
-                except Exception as e:
-                    # This channel is not available
-                    continue
-                finally:
-                    if 'bus' in locals() and bus:
-                        bus.shutdown()
+            for channel, hw_name, is_fd in probe_pcan_channels():
+                device_text = f"{hw_name}{' FD' if is_fd else ''}: {channel}"
+                
+                # Add to tree with green text
+                device_item = QTreeWidgetItem(self.hardware_tree)
+                device_item.setText(0, device_text)
+                
+                # Set green color and bold font
+                green_brush = QBrush(QColor(0, 128, 0))  # Dark green
+                bold_font = QFont()
+                bold_font.setBold(True)
+                device_item.setForeground(0, green_brush)
+                device_item.setFont(0, bold_font)
+                
+                # Store channel name in item data for later retrieval
+                device_item.setData(0, Qt.UserRole, channel)
+                
+                found_devices = True
+                
+                # Re-select previously selected item if it exists
+                if previously_selected and previously_selected == device_text:
+                    device_item.setSelected(True)
             
             if not found_devices:
                 # No devices found - red text and disable tabs
@@ -194,6 +179,33 @@ class ConnectionDialog(QDialog):
         # Update OK button state based on selection
         self.on_hardware_selection_changed()
 
+    def fill_profiles(self):
+        """Fill the profile list and load the settings of the last used profile"""
+        data = load_profiles()
+        self.profiles = data['profiles']
+        self.profile_combo.clear()
+        self.profile_combo.addItems(sorted(self.profiles))
+        last = data['last'] if data['last'] in self.profiles else None
+        self.profile_combo.setCurrentText(last or DEFAULT_PROFILE)
+        if last:
+            self.set_configuration(self.profiles[last])
+
+    def on_profile_selected(self, name):
+        if name in self.profiles:
+            self.set_configuration(self.profiles[name])
+
+    def delete_selected_profile(self):
+        name = self.profile_name()
+        delete_profile(name)
+        self.profiles.pop(name, None)
+        index = self.profile_combo.findText(name)
+        if index >= 0:
+            self.profile_combo.removeItem(index)
+
+    def profile_name(self):
+        """Name to save the configuration under"""
+        return self.profile_combo.currentText().strip() or DEFAULT_PROFILE
+
     def on_hardware_selection_changed(self):
         """Enable/disable OK button based on hardware selection"""
         selected = self.hardware_tree.selectedItems()
@@ -283,6 +295,41 @@ class ConnectionDialog(QDialog):
         self.mode_combo.currentTextChanged.connect(self.on_mode_changed)
         self.on_mode_changed("CAN")  # Initialize visibility
 
+    def setup_options_tab(self):
+        layout = QFormLayout(self.options_tab)
+        
+        # Receive in a separate process so GUI load cannot delay reception
+        self.capture_process_checkbox = QCheckBox("Capture in a separate process")
+        self.capture_process_checkbox.setToolTip(
+            "Frames are received and recorded by a capture process and shared with\n"
+            "the GUI through shared memory. A recording survives a GUI crash.")
+        layout.addRow("", self.capture_process_checkbox)
+
+        # Keep capturing when the adapter drops out (e.g. a USB glitch)
+        self.auto_reconnect_checkbox = QCheckBox("Reconnect automatically")
+        self.auto_reconnect_checkbox.setChecked(True)
+        self.auto_reconnect_checkbox.setToolTip(
+            "When the bus is lost, it is reopened with increasing delays. The table,\n"
+            "statistics and recording continue, and the outage is marked as a gap.")
+        layout.addRow("", self.auto_reconnect_checkbox)
+
+        # Bound per-ID state, so a node sending random IDs cannot exhaust memory
+        self.max_ids_spin = QSpinBox()
+        self.max_ids_spin.setRange(0, 1 << 22)
+        self.max_ids_spin.setSingleStep(1024)
+        self.max_ids_spin.setSpecialValueText("Unlimited")
+        self.max_ids_spin.setValue(MAX_IDS)
+        self.max_ids_spin.setToolTip(
+            "Most CAN IDs with a row in the overwrite view and their own statistics.\n"
+            "Beyond that, IDs are evicted and counted in an \"Other IDs\" row.")
+        layout.addRow("Tracked IDs:", self.max_ids_spin)
+        self.id_policy_combo = QComboBox()
+        self.id_policy_combo.addItems(POLICIES)
+        self.id_policy_combo.setToolTip(
+            "Least frequent keeps periodic IDs during a flood of one-off IDs;\n"
+            "least recent keeps the IDs seen last.")
+        layout.addRow("Evict:", self.id_policy_combo)
+
     def on_mode_changed(self, mode):
         self.fd_group.setVisible(mode == "CAN FD")
         
@@ -354,14 +401,43 @@ class ConnectionDialog(QDialog):
             'interface': 'pcan',
             'channel': channel,
             'bitrate': bitrate,
-            'fd': is_fd
+            'fd': is_fd,
+            'capture_process': self.capture_process_checkbox.isChecked(),
+            'auto_reconnect': self.auto_reconnect_checkbox.isChecked(),
+            'max_ids': self.max_ids_spin.value() or None,
+            'id_policy': self.id_policy_combo.currentText()
         }
+        config.update(self.profile_filters)
         
         if is_fd and data_bitrate:
             config['data_bitrate'] = data_bitrate
             
         return config
 
+    def set_configuration(self, config):
+        """Show a configuration from get_configuration() (e.g. a saved profile) in the dialog"""
+        self.profile_filters = {key: config[key] for key in FILTER_SETTINGS if key in config}
+        is_fd = config.get('fd', False)
+        self.mode_combo.setCurrentText("CAN FD" if is_fd else "CAN")
+        bitrate = config.get('bitrate', 500000) // 1000
+        preset = f"{bitrate // 1000} MBit/s" if bitrate % 1000 == 0 else f"{bitrate} kBit/s"
+        self.bitrate_combo.setCurrentText(preset if self.bitrate_combo.findText(preset) >= 0 else "Custom")
+        self.bitrate_edit.setText(str(bitrate))
+        data_bitrate = config.get('data_bitrate')
+        if is_fd and data_bitrate:
+            if data_bitrate == config.get('bitrate'):
+                self.data_bitrate_combo.setCurrentText("Same as Nominal")
+            elif data_bitrate % 1000000 == 0:
+                self.data_bitrate_combo.setCurrentText(f"{data_bitrate // 1000000} MBit/s")
+        self.capture_process_checkbox.setChecked(config.get('capture_process', False))
+        self.auto_reconnect_checkbox.setChecked(config.get('auto_reconnect', True))
+        self.max_ids_spin.setValue(config.get('max_ids', MAX_IDS) or 0)
+        self.id_policy_combo.setCurrentText(config.get('id_policy', LFU))
+        # Select the profile's channel if that hardware is present
+        for index in range(self.hardware_tree.topLevelItemCount()):
+            item = self.hardware_tree.topLevelItem(index)
+            item.setSelected(item.data(0, Qt.UserRole) == config.get('channel'))
+
     def closeEvent(self, event):
         """Stop the timer when dialog is closed"""
         self.refresh_timer.stop()
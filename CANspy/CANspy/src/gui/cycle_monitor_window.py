@@ -0,0 +1,110 @@
+from PyQt5.QtWidgets import QLineEdit, QPushButton, QSplitter
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QColor
+from gui.analysis_window import AnalysisWindow
+from gui.j1939_window import make_table
+from gui.canopen_window import set_row
+from capture.cycle_monitor import CycleMonitor, LATE, MISSING, TOO_FAST, OK, parse_periods
+
+MAX_ROWS = 5000  # alarms shown; older rows are removed
+ID_COLUMNS = ["ID", "Status", "Period", "Last interval", "Frames", "Late", "Missing", "Too fast"]
+ALARM_COLUMNS = ["Time", "ID", "Alarm", "Interval", "Period"]
+STATUS_COLORS = {LATE: QColor(255, 230, 170), MISSING: QColor(255, 190, 180), TOO_FAST: QColor(210, 220, 255)}
+OK_COLOR = QColor(210, 240, 210)
+
+
+def format_ms(seconds):
+    return "" if seconds is None else f"{seconds * 1000:.2f} ms"
+
+
+class CycleMonitorWindow(AnalysisWindow):
+    """Late, missing and too-fast periodic messages; also colors their rows in the overwrite view"""
+
+    title = "Cycle Monitor"
+
+    def __init__(self, parent=None):
+        super().__init__(CycleMonitor(), parent)
+        self.next_serial = 0
+
+        # Expected periods, applied with Enter; other IDs are learned
+        self.periods_edit = QLineEdit(self)
+        self.periods_edit.setPlaceholderText("Periods, e.g. 0x100=10ms, 0x200=100ms (other IDs are learned)")
+        self.periods_edit.setMinimumWidth(360)
+        self.periods_edit.returnPressed.connect(self.apply_periods)
+        self.controls_layout.insertWidget(1, self.periods_edit)
+        self.learn_button = QPushButton("Learn from table", self)
+        self.learn_button.setToolTip("Take the periods of the IDs in the live table from their cycle times")
+        self.learn_button.clicked.connect(self.learn_from_table)
+        self.controls_layout.insertWidget(2, self.learn_button)
+
+        self.id_table = make_table(ID_COLUMNS, self)
+        self.alarm_table = make_table(ALARM_COLUMNS, self)
+        splitter = QSplitter(Qt.Vertical, self)
+        splitter.addWidget(self.id_table)
+        splitter.addWidget(self.alarm_table)
+        self.main_layout.addWidget(splitter)
+
+    def apply_periods(self):
+        text = self.periods_edit.text()
+        try:
+            self.analyzer.periods = parse_periods(text)
+        except ValueError as e:
+            self.info_label.setText(str(e))
+            return
+        self.reset()
+
+    def learn_from_table(self):
+        self.analyzer.learn_from(self.parent().live_store)
+        self.refresh()
+
+    def highlight(self, can_id):
+        return STATUS_COLORS.get(self.analyzer.status_of(can_id))
+
+    def showEvent(self, event):
+        self.parent().set_highlight(self.highlight)
+        super().showEvent(event)
+
+    def closeEvent(self, event):
+        self.parent().set_highlight(None)
+        super().closeEvent(event)
+
+    def clear_view(self):
+        self.id_table.setRowCount(0)
+        self.alarm_table.setRowCount(0)
+        self.next_serial = 0
+
+    def refresh(self):
+        # The wheel also has to advance while the bus is silent
+        self.analyzer.poll()
+        summary = self.analyzer.summary()
+        self.info_label.setText(f"{summary['monitored']} of {summary['ids']} IDs monitored: {summary['late']} late, "
+                                f"{summary['missing']} missing, {summary['too_fast']} too fast; "
+                                f"{summary['alarms']} alarms")
+        rows = self.analyzer.id_rows()
+        self.id_table.setUpdatesEnabled(False)
+        self.id_table.setRowCount(len(rows))
+        for row, (can_id, status, period, interval, frames, late, missing, too_fast) in enumerate(rows):
+            set_row(self.id_table, row, [f"0x{can_id:X}", status, format_ms(period), format_ms(interval), str(frames),
+                                         str(late), str(missing), str(too_fast)],
+                    STATUS_COLORS.get(status, OK_COLOR if status == OK else None))
+        self.id_table.setUpdatesEnabled(True)
+        self.refresh_alarms()
+        self.parent().table.viewport().update()
+
+    def refresh_alarms(self):
+        alarms = self.analyzer.alarms_since(self.next_serial)
+        if not alarms:
+            return
+        self.next_serial = alarms[-1][0] + 1
+        alarms = alarms[-MAX_ROWS:]
+        self.alarm_table.setUpdatesEnabled(False)
+        excess = self.alarm_table.rowCount() + len(alarms) - MAX_ROWS
+        for _ in range(max(excess, 0)):
+            self.alarm_table.removeRow(0)
+        for _, when, can_id, status, interval, period in alarms:
+            row = self.alarm_table.rowCount()
+            self.alarm_table.insertRow(row)
+            set_row(self.alarm_table, row, [f"{when:.6f}", f"0x{can_id:X}", status, format_ms(interval),
+                                            format_ms(period)], STATUS_COLORS.get(status))
+        self.alarm_table.setUpdatesEnabled(True)
+        self.alarm_table.scrollToBottom()
@@ -0,0 +1,90 @@
+from PyQt5.QtWidgets import QLineEdit, QSplitter
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QColor
+from gui.analysis_window import AnalysisWindow
+from gui.j1939_window import make_table
+from gui.canopen_window import set_row
+from capture.e2e import E2EChecker, OK, TOO_SHORT, CRC_ERROR, INVALID_COUNTER, REPEATED, LOST, WRONG_SEQUENCE, \
+    parse_profiles
+
+MAX_ROWS = 5000  # errors shown; older rows are removed
+ID_COLUMNS = ["ID", "Profile", "Status", "Frames", "CRC errors", "Repeated", "Lost", "Wrong sequence",
+              "Invalid counter", "Too short", "Counter"]
+ERROR_COLUMNS = ["Time", "ID", "Error", "Detail", "Data"]
+STATUS_COLORS = {CRC_ERROR: QColor(255, 190, 180), WRONG_SEQUENCE: QColor(255, 190, 180),
+                 INVALID_COUNTER: QColor(255, 190, 180), TOO_SHORT: QColor(255, 190, 180),
+                 LOST: QColor(255, 230, 170), REPEATED: QColor(255, 230, 170), OK: QColor(210, 240, 210)}
+
+
+class E2EWindow(AnalysisWindow):
+    """CRC and alive counter checks of AUTOSAR E2E protected IDs"""
+
+    title = "E2E Protection"
+
+    def __init__(self, parent=None):
+        super().__init__(E2EChecker(), parent)
+        self.next_serial = 0
+
+        # Protected IDs, applied with Enter
+        self.profiles_edit = QLineEdit(self)
+        self.profiles_edit.setPlaceholderText("Profiles, e.g. 0x100=P01:0x123, 0x101=P01:0x124:alt, 0x200=P05:0x1234")
+        self.profiles_edit.setMinimumWidth(420)
+        self.profiles_edit.returnPressed.connect(self.apply_profiles)
+        self.controls_layout.insertWidget(1, self.profiles_edit)
+
+        self.id_table = make_table(ID_COLUMNS, self)
+        self.error_table = make_table(ERROR_COLUMNS, self)
+        splitter = QSplitter(Qt.Vertical, self)
+        splitter.addWidget(self.id_table)
+        splitter.addWidget(self.error_table)
+        self.main_layout.addWidget(splitter)
+
+    def apply_profiles(self):
+        try:
+            self.analyzer.profiles = parse_profiles(self.profiles_edit.text())
+        except ValueError as e:
+            self.info_label.setText(str(e))
+            return
+        self.reset()
+
+    def clear_view(self):
+        self.id_table.setRowCount(0)
+        self.error_table.setRowCount(0)
+        self.next_serial = 0
+
+    def refresh(self):
+        summary = self.analyzer.summary()
+        if not summary['ids']:
+            self.info_label.setText("No protected IDs: enter their profiles and press Enter")
+        else:
+            self.info_label.setText(f"{summary['checked']} of {summary['frames']} frames checked, "
+                                    f"{summary['failing']} of {summary['ids']} IDs failing, {summary['errors']} errors")
+        rows = self.analyzer.id_rows()
+        self.id_table.setUpdatesEnabled(False)
+        self.id_table.setRowCount(len(rows))
+        for row, (can_id, name, status, frames, counts, lost, counter) in enumerate(rows):
+            set_row(self.id_table, row, [f"0x{can_id:X}", name, status or "", str(frames), str(counts[CRC_ERROR]),
+                                         str(counts[REPEATED]), f"{lost} in {counts[LOST]} jumps",
+                                         str(counts[WRONG_SEQUENCE]), str(counts[INVALID_COUNTER]),
+                                         str(counts[TOO_SHORT]), "" if counter is None else str(counter)],
+                    STATUS_COLORS.get(status))
+        self.id_table.setUpdatesEnabled(True)
+        self.refresh_errors()
+
+    def refresh_errors(self):
+        errors = self.analyzer.errors_since(self.next_serial)
+        if not errors:
+            return
+        self.next_serial = errors[-1][0] + 1
+        errors = errors[-MAX_ROWS:]
+        self.error_table.setUpdatesEnabled(False)
+        excess = self.error_table.rowCount() + len(errors) - MAX_ROWS
+        for _ in range(max(excess, 0)):
+            self.error_table.removeRow(0)
+        for _, when, can_id, status, detail, data in errors:
+            row = self.error_table.rowCount()
+            self.error_table.insertRow(row)
+            set_row(self.error_table, row, [f"{when:.6f}", f"0x{can_id:X}", status, detail, data.hex(" ").upper()],
+                    STATUS_COLORS.get(status))
+        self.error_table.setUpdatesEnabled(True)
+        self.error_table.scrollToBottom()
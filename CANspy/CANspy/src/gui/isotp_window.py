@@ -0,0 +1,107 @@
+from PyQt5 import QtWidgets, QtCore
+from PyQt5.QtWidgets import QTableWidget, QTableWidgetItem, QLineEdit, QPlainTextEdit, QSplitter
+from PyQt5.QtGui import QColor, QFont
+from gui.analysis_window import AnalysisWindow
+from capture.isotp import IsoTpDecoder, DEFAULT_PAIRS, OK, describe_uds, parse_pairs
+
+MAX_ROWS = 5000  # PDUs shown; older rows are removed
+PREVIEW_BYTES = 24  # payload bytes shown in the table
+COLUMNS = ["Time", "ID", "Partner", "Length", "Frames", "Status", "Service", "Data"]
+ERROR_COLOR = QColor(255, 210, 200)
+
+
+def format_id(can_id):
+    return "" if can_id is None else f"0x{can_id:X}"
+
+
+def hex_dump(payload, width=16):
+    return "\n".join(f"{offset:06X}  {payload[offset:offset + width].hex(' ').upper()}"
+                     for offset in range(0, len(payload), width))
+
+
+class IsoTpWindow(AnalysisWindow):
+    """PDU view: reassembled ISO-TP transfers with their UDS service"""
+
+    title = "ISO-TP"
+
+    def __init__(self, parent=None):
+        super().__init__(IsoTpDecoder(), parent)
+        self.next_serial = 0
+        self.payloads = []  # payload of each table row
+
+        # Diagnostic ID pairs, applied with Enter
+        self.pairs_edit = QLineEdit(self)
+        self.pairs_edit.setPlaceholderText("ID pairs, e.g. 7E0:7E8, 18DA10F1:18DAF110 (empty = OBD/UDS defaults)")
+        self.pairs_edit.setMinimumWidth(360)
+        self.pairs_edit.returnPressed.connect(self.apply_pairs)
+        self.controls_layout.insertWidget(1, self.pairs_edit)
+
+        self.table = QTableWidget(0, len(COLUMNS), self)
+        self.table.setHorizontalHeaderLabels(COLUMNS)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.table.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
+        self.table.setSelectionMode(QtWidgets.QAbstractItemView.SingleSelection)
+        self.table.horizontalHeader().setStretchLastSection(True)
+        self.table.itemSelectionChanged.connect(self.on_pdu_selected)
+
+        # Full payload of the selected PDU
+        self.detail = QPlainTextEdit(self)
+        self.detail.setReadOnly(True)
+        self.detail.setFont(QFont("Monospace"))
+
+        splitter = QSplitter(QtCore.Qt.Vertical, self)
+        splitter.addWidget(self.table)
+        splitter.addWidget(self.detail)
+        splitter.setStretchFactor(0, 3)
+        self.main_layout.addWidget(splitter)
+
+    def apply_pairs(self):
+        text = self.pairs_edit.text().strip()
+        try:
+            pairs = parse_pairs(text) if text else DEFAULT_PAIRS
+        except ValueError:
+            self.info_label.setText(f"Invalid ID pairs: {text}")
+            return
+        self.analyzer.pairs = pairs
+        self.reset()
+
+    def clear_view(self):
+        self.table.setRowCount(0)
+        self.payloads = []
+        self.detail.clear()
+        self.next_serial = 0
+
+    def refresh(self):
+        summary = self.analyzer.summary()
+        self.info_label.setText(f"{summary['pdus']} PDUs from {summary['frames']} frames, "
+                                f"{summary['active']} in progress, {summary['stray']} stray frames")
+        pdus = self.analyzer.pdus_since(self.next_serial)
+        if not pdus:
+            return
+        self.next_serial = pdus[-1][0] + 1
+        pdus = pdus[-MAX_ROWS:]
+        self.table.setUpdatesEnabled(False)
+        excess = self.table.rowCount() + len(pdus) - MAX_ROWS
+        for _ in range(max(excess, 0)):
+            self.table.removeRow(0)
+        del self.payloads[:max(excess, 0)]
+        for _, start, end, can_id, partner, length, payload, status, frames in pdus:
+            row = self.table.rowCount()
+            self.table.insertRow(row)
+            preview = payload[:PREVIEW_BYTES].hex(" ").upper() + (" ..." if len(payload) > PREVIEW_BYTES else "")
+            values = [f"{start:.6f}", format_id(can_id), format_id(partner), str(length), str(frames), status,
+                      describe_uds(payload), preview]
+            for column, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if status != OK:
+                    item.setBackground(ERROR_COLOR)
+                self.table.setItem(row, column, item)
+            self.payloads.append(payload)
+        self.table.setUpdatesEnabled(True)
+        self.table.scrollToBottom()
+
+    def on_pdu_selected(self):
+        rows = self.table.selectionModel().selectedRows()
+        if rows and rows[0].row() < len(self.payloads):
+            self.detail.setPlainText(hex_dump(self.payloads[rows[0].row()]))
@@ -0,0 +1,123 @@
+from PyQt5 import QtWidgets, QtCore
+from PyQt5.QtWidgets import QTableWidget, QTableWidgetItem, QPlainTextEdit, QSplitter
+from PyQt5.QtGui import QColor, QFont
+from gui.analysis_window import AnalysisWindow
+from gui.isotp_window import hex_dump
+from capture.j1939 import J1939Decoder, OK, GLOBAL_ADDRESS, STANDARD_KEY, split_id, pgn_name
+
+MAX_ROWS = 5000  # transport messages shown; older rows are removed
+PREVIEW_BYTES = 24  # payload bytes shown in the table
+GROUP_COLUMNS = ["PGN", "Name", "SA", "Priority", "Count", "Rate", "Data"]
+MESSAGE_COLUMNS = ["Time", "Type", "PGN", "Name", "SA", "DA", "Size", "Status", "Data"]
+ERROR_COLOR = QColor(255, 210, 200)
+
+
+def make_table(columns, parent):
+    table = QTableWidget(0, len(columns), parent)
+    table.setHorizontalHeaderLabels(columns)
+    table.verticalHeader().setVisible(False)
+    table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+    table.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
+    table.setSelectionMode(QtWidgets.QAbstractItemView.SingleSelection)
+    table.horizontalHeader().setStretchLastSection(True)
+    return table
+
+
+class J1939Window(AnalysisWindow):
+    """Parameter groups per PGN and source address, and reassembled transport messages"""
+
+    title = "J1939"
+
+    def __init__(self, parent=None):
+        super().__init__(J1939Decoder(), parent)
+        self.next_serial = 0
+        self.payloads = []  # payload of each message row
+        self.row_of_key = {}  # group key -> row of the group table
+
+        self.group_table = make_table(GROUP_COLUMNS, self)
+        self.message_table = make_table(MESSAGE_COLUMNS, self)
+        self.message_table.itemSelectionChanged.connect(self.on_message_selected)
+
+        # Full payload of the selected message
+        self.detail = QPlainTextEdit(self)
+        self.detail.setReadOnly(True)
+        self.detail.setFont(QFont("Monospace"))
+
+        splitter = QSplitter(QtCore.Qt.Vertical, self)
+        splitter.addWidget(self.group_table)
+        splitter.addWidget(self.message_table)
+        splitter.addWidget(self.detail)
+        splitter.setStretchFactor(0, 2)
+        splitter.setStretchFactor(1, 2)
+        self.main_layout.addWidget(splitter)
+
+    def clear_view(self):
+        self.group_table.setRowCount(0)
+        self.row_of_key = {}
+        self.message_table.setRowCount(0)
+        self.payloads = []
+        self.detail.clear()
+        self.next_serial = 0
+
+    def refresh(self):
+        summary = self.analyzer.summary()
+        self.info_label.setText(f"{summary['groups']} parameter groups in {summary['frames']} frames, "
+                                f"{summary['messages']} transport messages, {summary['sessions']} in progress"
+                                + (f", {summary['dropped']} sessions dropped" if summary['dropped'] else ""))
+        self.refresh_groups()
+        self.refresh_messages()
+
+    def refresh_groups(self):
+        self.group_table.setUpdatesEnabled(False)
+        for key, count, first, last, can_id, data in self.analyzer.group_rows():
+            row = self.row_of_key.get(key)
+            if row is None:
+                row = self.row_of_key[key] = self.group_table.rowCount()
+                self.group_table.insertRow(row)
+                if key & STANDARD_KEY:
+                    cells = ["", f"0x{can_id:X} (11-bit)", "", ""]
+                else:
+                    priority, pgn, source, destination = split_id(can_id)
+                    cells = [f"{pgn} (0x{pgn:04X})", pgn_name(pgn), f"{source:02X}", ""]
+                for column, value in enumerate(cells):
+                    self.group_table.setItem(row, column, QTableWidgetItem(value))
+                for column in range(len(cells), len(GROUP_COLUMNS)):
+                    self.group_table.setItem(row, column, QTableWidgetItem(""))
+            rate = (count - 1) / (last - first) if last > first else 0.0
+            priority = "" if key & STANDARD_KEY else str(split_id(can_id)[0])
+            for column, value in ((3, priority), (4, str(count)), (5, f"{rate:.1f} Hz"),
+                                  (6, data.hex(" ").upper())):
+                self.group_table.item(row, column).setText(value)
+        self.group_table.setUpdatesEnabled(True)
+
+    def refresh_messages(self):
+        messages = self.analyzer.messages_since(self.next_serial)
+        if not messages:
+            return
+        self.next_serial = messages[-1][0] + 1
+        messages = messages[-MAX_ROWS:]
+        self.message_table.setUpdatesEnabled(False)
+        excess = self.message_table.rowCount() + len(messages) - MAX_ROWS
+        for _ in range(max(excess, 0)):
+            self.message_table.removeRow(0)
+        del self.payloads[:max(excess, 0)]
+        for _, start, end, pgn, source, destination, size, payload, status, broadcast in messages:
+            row = self.message_table.rowCount()
+            self.message_table.insertRow(row)
+            preview = payload[:PREVIEW_BYTES].hex(" ").upper() + (" ..." if len(payload) > PREVIEW_BYTES else "")
+            values = [f"{start:.6f}", "BAM" if broadcast else "CMDT", f"{pgn} (0x{pgn:04X})", pgn_name(pgn),
+                      f"{source:02X}", "" if destination == GLOBAL_ADDRESS else f"{destination:02X}", str(size),
+                      status, preview]
+            for column, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if status != OK:
+                    item.setBackground(ERROR_COLOR)
+                self.message_table.setItem(row, column, item)
+            self.payloads.append(payload)
+        self.message_table.setUpdatesEnabled(True)
+        self.message_table.scrollToBottom()
+
+    def on_message_selected(self):
+        rows = self.message_table.selectionModel().selectedRows()
+        if rows and rows[0].row() < len(self.payloads):
+            self.detail.setPlainText(hex_dump(self.payloads[rows[0].row()]))
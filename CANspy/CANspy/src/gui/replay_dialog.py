@@ -0,0 +1,102 @@
+from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QFormLayout, QComboBox, QLineEdit,
+                             QDoubleSpinBox, QCheckBox, QPushButton, QLabel)
+from capture.replay import MIN_SPEED, MAX_SPEED
+
+# Replay targets: label -> python-can interface (None = CANspy's own table), default channel
+REPLAY_TARGETS = [
+    ("CANspy table", None, ""),
+    ("Virtual bus (python-can)", "virtual", "vcan0"),
+    ("SocketCAN (can0, vcan0, ...)", "socketcan", "can0"),
+    ("PCAN", "pcan", "PCAN_USBBUS1"),
+]
+
+
+class ReplayDialog(QDialog):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Replay")
+
+        main_layout = QVBoxLayout(self)
+        form = QFormLayout()
+
+        # Where the frames go
+        self.target_combo = QComboBox()
+        for label, _, _ in REPLAY_TARGETS:
+            self.target_combo.addItem(label)
+        self.target_combo.currentIndexChanged.connect(self.on_target_changed)
+        form.addRow(QLabel("Target:"), self.target_combo)
+
+        self.channel_edit = QLineEdit()
+        self.channel_edit.textChanged.connect(self.update_start_button)
+        self.target_index = 0
+        form.addRow(QLabel("Channel:"), self.channel_edit)
+
+        # Timing
+        self.speed_spin = QDoubleSpinBox()
+        self.speed_spin.setRange(MIN_SPEED, MAX_SPEED)
+        self.speed_spin.setDecimals(1)
+        self.speed_spin.setSingleStep(0.5)
+        self.speed_spin.setValue(1.0)
+        self.speed_spin.setSuffix(" x")
+        form.addRow(QLabel("Speed:"), self.speed_spin)
+
+        self.asap_checkbox = QCheckBox("As fast as possible")
+        self.asap_checkbox.toggled.connect(lambda checked: self.speed_spin.setEnabled(not checked))
+        form.addRow("", self.asap_checkbox)
+
+        self.start_spin = QDoubleSpinBox()
+        self.start_spin.setRange(0, 1e9)
+        self.start_spin.setDecimals(3)
+        self.start_spin.setSuffix(" s")
+        form.addRow(QLabel("Start at:"), self.start_spin)
+
+        self.loop_checkbox = QCheckBox("Loop")
+        form.addRow("", self.loop_checkbox)
+
+        # Only replay these IDs (comma separated hex, empty = all)
+        self.id_filter_edit = QLineEdit()
+        self.id_filter_edit.setPlaceholderText("e.g. 0x100, 0x1A3 (empty = all IDs)")
+        form.addRow(QLabel("CAN IDs:"), self.id_filter_edit)
+
+        main_layout.addLayout(form)
+
+        button_layout = QHBoxLayout()
+        self.ok_button = QPushButton("Start")
+        self.cancel_button = QPushButton("Cancel")
+        button_layout.addStretch()
+        button_layout.addWidget(self.ok_button)
+        button_layout.addWidget(self.cancel_button)
+        main_layout.addLayout(button_layout)
+
+        self.ok_button.clicked.connect(self.accept)
+        self.cancel_button.clicked.connect(self.reject)
+        self.on_target_changed(0)
+
+    def on_target_changed(self, index):
+        # A channel the user typed is kept; the default one follows the target
+        if self.channel_edit.text().strip() in ("", REPLAY_TARGETS[self.target_index][2]):
+            self.channel_edit.setText(REPLAY_TARGETS[index][2])
+        self.target_index = index
+        self.channel_edit.setEnabled(REPLAY_TARGETS[index][1] is not None)
+        self.update_start_button()
+
+    def update_start_button(self):
+        # A bus target needs a channel
+        needs_channel = REPLAY_TARGETS[self.target_combo.currentIndex()][1] is not None
+        self.ok_button.setEnabled(not needs_channel or bool(self.channel_edit.text().strip()))
+
+    def get_configuration(self):
+        """Return the replay settings as a dictionary"""
+        id_filter = []
+        for part in self.id_filter_edit.text().replace(';', ',').split(','):
+            part = part.strip()
+            if part:
+                id_filter.append(int(part, 16))
+        return {
+            'interface': REPLAY_TARGETS[self.target_combo.currentIndex()][1],
+            'channel': self.channel_edit.text().strip(),
+            'speed': None if self.asap_checkbox.isChecked() else self.speed_spin.value(),
+            'start': self.start_spin.value(),
+            'loop': self.loop_checkbox.isChecked(),
+            'id_filter': id_filter,
+        }
@@ -0,0 +1,285 @@
+"""
+Sort proxy that keeps a live table sorted incrementally.
+
+QSortFilterProxyModel re-sorts through Python data() calls and handles
+appended rows by re-sorting, which does not scale to live capture. The
+SortedProxyModel keeps the source rows ordered by (sort key, source row)
+in a SortedRows list and inserts or moves a single row in O(log n) when
+the source appends rows or changes one. Sort keys come from the source
+model's sort_key()/sort_keys(), i.e. the numbers it returns for Qt.UserRole.
+"""
+
+from bisect import bisect_left, bisect_right
+from PyQt5.QtCore import Qt, QAbstractProxyModel, QModelIndex, QVariant
+import numpy as np
+
+BLOCK_SIZE = 512
+RESET_THRESHOLD = 1024  # appended rows above which one reset beats row-by-row inserts
+
+
+class SortedRows:
+    """Sorted list of (key, row) items with O(log n) insert, remove and lookup.
+
+    Items live in blocks of up to 2 * BLOCK_SIZE; a Fenwick tree over the
+    block lengths maps list positions to blocks.
+    """
+
+    def __init__(self, items=()):
+        items = list(items)
+        self.blocks = [items[i:i + BLOCK_SIZE] for i in range(0, len(items), BLOCK_SIZE)]
+        self.rebuild()
+
+    def rebuild(self):
+        self.maxes = [block[-1] for block in self.blocks]
+        self.size = sum(len(block) for block in self.blocks)
+        self.tree = [0] * (len(self.blocks) + 1)
+        for b, block in enumerate(self.blocks):
+            self._add(b, len(block))
+
+    def __len__(self):
+        return self.size
+
+    def _add(self, b, delta):
+        b += 1
+        while b < len(self.tree):
+            self.tree[b] += delta
+            b += b & -b
+
+    def _offset(self, b):
+        """Number of items in the blocks before block b"""
+        total = 0
+        while b > 0:
+            total += self.tree[b]
+            b -= b & -b
+        return total
+
+    def _locate(self, position):
+        """(block, index in block) of a list position"""
+        b = 0
+        step = 1 << (len(self.tree).bit_length() - 1)
+        while step:
+            if b + step < len(self.tree) and self.tree[b + step] <= position:
+                b += step
+                position -= self.tree[b]
+            step >>= 1
+        return b, position
+
+    def __getitem__(self, position):
+        b, i = self._locate(position)
+        return self.blocks[b][i]
+
+    def bisect(self, item):
+        """Position at which the item would be inserted"""
+        b = bisect_left(self.maxes, item)
+        if b == len(self.blocks):
+            return self.size
+        return self._offset(b) + bisect_left(self.blocks[b], item)
+
+    def index(self, item):
+        """Position of an item that is in the list"""
+        b = bisect_left(self.maxes, item)
+        return self._offset(b) + bisect_left(self.blocks[b], item)
+
+    def add(self, item):
+        if not self.blocks:
+            self.blocks = [[item]]
+            self.rebuild()
+            return
+        b = min(bisect_left(self.maxes, item), len(self.blocks) - 1)
+        block = self.blocks[b]
+        block.insert(bisect_right(block, item), item)
+        self.maxes[b] = block[-1]
+        self.size += 1
+        if len(block) > 2 * BLOCK_SIZE:
+            self.blocks[b:b + 1] = [block[:BLOCK_SIZE], block[BLOCK_SIZE:]]
+            self.rebuild()
+        else:
+            self._add(b, 1)
+
+    def remove(self, item):
+        b = bisect_left(self.maxes, item)
+        block = self.blocks[b]
+        del block[bisect_left(block, item)]
+        self.size -= 1
+        if block:
+            self.maxes[b] = block[-1]
+            self._add(b, -1)
+        else:
+            del self.blocks[b]
+            self.rebuild()
+
+
+class SortedProxyModel(QAbstractProxyModel):
+    """Flat-table proxy sorted by one column, updated incrementally.
+
+    The source appends rows at the end (beginInsertRows) and announces
+    changed rows with dataChanged; both are folded into the sorted order
+    without re-sorting. A sort key of None from sort_keys() means the source
+    rows are already in key order (the "#" column), which needs no lookup.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.sort_column = -1
+        self.sort_order = Qt.AscendingOrder
+        self.rows = None  # SortedRows, or None when the order is the source order
+        self.keys = []  # sort key of every source row
+        self.count = 0
+
+    def setSourceModel(self, model):
+        old = self.sourceModel()
+        if old is not None:
+            old.rowsInserted.disconnect(self.on_rows_inserted)
+            old.dataChanged.disconnect(self.on_data_changed)
+            old.modelAboutToBeReset.disconnect(self.beginResetModel)
+            old.modelReset.disconnect(self.on_model_reset)
+        self.beginResetModel()
+        super().setSourceModel(model)
+        model.rowsInserted.connect(self.on_rows_inserted)
+        model.dataChanged.connect(self.on_data_changed)
+        model.modelAboutToBeReset.connect(self.beginResetModel)
+        model.modelReset.connect(self.on_model_reset)
+        self.build()
+        self.endResetModel()
+
+    # Mapping
+
+    def build(self):
+        """Sort all rows of the source by the current column"""
+        model = self.sourceModel()
+        self.count = model.rowCount()
+        keys = model.sort_keys(self.sort_column) if self.sort_column >= 0 else None
+        if keys is None:
+            self.rows = None
+            self.keys = []
+            return
+        if isinstance(keys, np.ndarray):
+            order = np.argsort(keys, kind='stable').tolist()
+            keys = keys.tolist()
+        else:
+            order = sorted(range(len(keys)), key=keys.__getitem__)
+        self.keys = keys
+        self.rows = SortedRows([(keys[row], row) for row in order])
+
+    def source_row(self, row):
+        position = row if self.sort_order == Qt.AscendingOrder else self.count - 1 - row
+        return position if self.rows is None else self.rows[position][1]
+
+    def proxy_row(self, source_row):
+        position = source_row if self.rows is None else self.rows.index((self.keys[source_row], source_row))
+        return position if self.sort_order == Qt.AscendingOrder else self.count - 1 - position
+
+    def mapToSource(self, index):
+        if not index.isValid() or self.sourceModel() is None:
+            return QModelIndex()
+        return self.sourceModel().index(self.source_row(index.row()), index.column())
+
+    def mapFromSource(self, index):
+        if not index.isValid() or index.row() >= self.count:
+            return QModelIndex()
+        return self.index(self.proxy_row(index.row()), index.column())
+
+    def index(self, row, column, parent=QModelIndex()):
+        if parent.isValid() or not 0 <= row < self.count or not 0 <= column < self.columnCount():
+            return QModelIndex()
+        return self.createIndex(row, column)
+
+    def parent(self, index=None):
+        return QModelIndex()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.count
+
+    def columnCount(self, parent=QModelIndex()):
+        model = self.sourceModel()
+        return 0 if model is None or parent.isValid() else model.columnCount()
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal:
+            return self.sourceModel().headerData(section, orientation, role)
+        if role == Qt.DisplayRole:
+            return section + 1
+        return QVariant()
+
+    # Sorting
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        if column == self.sort_column and order == self.sort_order:
+            return
+        self.layoutAboutToBeChanged.emit()
+        persistent = self.persistentIndexList()
+        source_rows = [self.source_row(index.row()) for index in persistent]
+        self.sort_column = column
+        self.sort_order = order
+        self.build()
+        self.changePersistentIndexList(
+            persistent, [self.index(self.proxy_row(row), index.column()) for row, index in zip(source_rows, persistent)])
+        self.layoutChanged.emit()
+
+    # Source updates
+
+    def on_model_reset(self):
+        self.build()
+        self.endResetModel()
+
+    def on_rows_inserted(self, parent, first, last):
+        if parent.isValid():
+            return
+        if self.rows is None:
+            # Appended source rows go to the end, or to the top when descending
+            row = self.count if self.sort_order == Qt.AscendingOrder else 0
+            self.beginInsertRows(QModelIndex(), row, row + last - first)
+            self.count += last - first + 1
+            self.endInsertRows()
+            return
+        if last - first >= RESET_THRESHOLD:
+            self.beginResetModel()
+            self.build()
+            self.endResetModel()
+            return
+        model = self.sourceModel()
+        for source_row in range(first, last + 1):
+            item = (model.sort_key(source_row, self.sort_column), source_row)
+            position = self.rows.bisect(item)
+            row = position if self.sort_order == Qt.AscendingOrder else self.count - position
+            self.beginInsertRows(QModelIndex(), row, row)
+            self.keys.append(item[0])
+            self.rows.add(item)
+            self.count += 1
+            self.endInsertRows()
+
+    def on_data_changed(self, top_left, bottom_right, roles=()):
+        first, last = top_left.row(), bottom_right.row()
+        columns = self.columnCount() - 1
+        if self.rows is None:
+            self.dataChanged.emit(self.index(self.proxy_row(first), 0), self.index(self.proxy_row(last), columns))
+            return
+        model = self.sourceModel()
+        changed = []
+        for source_row in range(first, min(last + 1, self.count)):
+            old = (self.keys[source_row], source_row)
+            new = (model.sort_key(source_row, self.sort_column), source_row)
+            if new != old:
+                self.move(old, new)
+            changed.append(self.proxy_row(source_row))
+        if len(changed) > 64:
+            self.dataChanged.emit(self.index(min(changed), 0), self.index(max(changed), columns))
+        else:
+            for row in changed:
+                self.dataChanged.emit(self.index(row, 0), self.index(row, columns))
+
+    def move(self, old, new):
+        """Move a source row whose sort key changed to its new position"""
+        position = self.rows.index(old)
+        target = self.rows.bisect(new)
+        if target > position:
+            target -= 1  # position once the old item is gone
+        if self.sort_order != Qt.AscendingOrder:
+            position, target = self.count - 1 - position, self.count - 1 - target
+        moved = target != position and self.beginMoveRows(
+            QModelIndex(), position, position, QModelIndex(), target + 1 if target > position else target)
+        self.rows.remove(old)
+        self.rows.add(new)
+        self.keys[new[1]] = new[0]
+        if moved:
+            self.endMoveRows()
@@ -1,5 +1,5 @@
 import sys
-from PyQt5.QtWidgets import QApplication, QMainWindow, QAction, QMenuBar, QStatusBar
+from PyQt5.QtWidgets import QApplication, QMainWindow, QAction, QMenuBar, QStatusBar, QFileDialog
 from PyQt5.QtGui import QIcon, QColor
 from PyQt5.QtCore import Qt
 
@@ -28,6 +28,21 @@ if missing_modules:
 
 from gui.config_window import ConfigWindow
 from gui.connection_dialog import ConnectionDialog
+from gui.replay_dialog import ReplayDialog
+from gui.bit_stats_window import BitStatsWindow
+from gui.isotp_window import IsoTpWindow
+from gui.j1939_window import J1939Window
+from gui.canopen_window import CanOpenWindow
+from gui.cycle_monitor_window import CycleMonitorWindow
+from gui.e2e_window import E2EWindow
+from capture.capture_file import CAPTURE_EXTENSION
+from utils.profiles import last_profile, load_profiles, save_profile
+
+CAPTURE_FILTER = f"CANspy Capture (*{CAPTURE_EXTENSION})"
+LOG_FILTER = (f"CAN Logs (*{CAPTURE_EXTENSION} *.log *.asc *.trc *.blf);;{CAPTURE_FILTER};;"
+              "candump Log (*.log);;Vector ASC (*.asc);;PCAN-View Trace (*.trc);;Vector BLF (*.blf)")
+PROFILE_CONNECT_TIMEOUT = 5.0  # seconds to wait for the last profile's bus to open
+ANALYSIS_WINDOWS = [BitStatsWindow, IsoTpWindow, J1939Window, CanOpenWindow, CycleMonitorWindow, E2EWindow]
 
 class MainApp(QMainWindow):
     def __init__(self):
@@ -36,6 +51,7 @@ class MainApp(QMainWindow):
         self.setGeometry(100, 100, 800, 600)
         self.config_window = ConfigWindow(self)
         self.setCentralWidget(self.config_window)
+        self.profile_name = None  # connection profile in use, if any
         
         # Create status bar
         self.status_bar = QStatusBar()
@@ -54,11 +70,43 @@ class MainApp(QMainWindow):
         self.connect_action.triggered.connect(self.toggle_connection)
         menubar.addAction(self.connect_action)
 
+        # Connect through the dialog instead of the last profile
+        connect_to_action = QAction(QIcon(), "Connect To...", self)
+        connect_to_action.triggered.connect(self.connect_to)
+        menubar.addAction(connect_to_action)
+
         # Clear table action
         clear_action = QAction(QIcon(), "Clear", self)
         clear_action.triggered.connect(self.clear_table)
         menubar.addAction(clear_action)
 
+        # Open capture file action
+        open_action = QAction(QIcon(), "Open", self)
+        open_action.triggered.connect(self.open_capture)
+        menubar.addAction(open_action)
+
+        # Record to capture file action
+        self.record_action = QAction(QIcon(), "Record", self)
+        self.record_action.setCheckable(True)
+        self.record_action.setChecked(False)
+        self.record_action.triggered.connect(self.toggle_recording)
+        menubar.addAction(self.record_action)
+
+        # Replay the open capture
+        self.replay_action = QAction(QIcon(), "Replay", self)
+        self.replay_action.setCheckable(True)
+        self.replay_action.setChecked(False)
+        self.replay_action.triggered.connect(self.toggle_replay)
+        menubar.addAction(self.replay_action)
+        self.config_window.replay_finished.connect(self.replay_finished)
+
+        # Analysis panels fed from the receive path
+        analyze_menu = menubar.addMenu("Analyze")
+        for window_class in ANALYSIS_WINDOWS:
+            action = QAction(QIcon(), window_class.title, self)
+            action.triggered.connect(lambda checked, cls=window_class: self.config_window.show_analysis(cls))
+            analyze_menu.addAction(action)
+
         # Exit action
         exit_action = QAction(QIcon(), "Exit", self)
         exit_action.triggered.connect(self.exit_app)
@@ -76,63 +124,168 @@ class MainApp(QMainWindow):
 
     def toggle_connection(self):
         if not self.connect_action.isChecked():
+            self.save_profile_filters()
             self.config_window.stop_receiving()
             self.connect_action.setText("Connect")
             self.update_status_bar("Disconnected", connected=False)
-        else:
+            return
+        # Open the last used profile directly; the dialog (which probes for hardware) is the fallback
+        profile = last_profile()
+        if profile is not None:
+            name, config = profile
+            self.update_status_bar(f"Connecting ({name})...", connected=False)
+            QApplication.processEvents()
             try:
-                # Show connection dialog
-                dialog = ConnectionDialog(self)
-                if dialog.exec_():
-                    # User clicked OK
-                    try:
-                        config = dialog.get_configuration()
-                        self.config_window.configure_can(config)
-                        
-                        # Try to start receiving - this is where it's likely failing
-                        success = self.config_window.start_receiving()
-                        
-                        if success:
-                            self.connect_action.setText("Disconnect")
-                            
-                            # Update status bar with connection info
-                            bitrate = config.get('bitrate', 500000) / 1000
-                            channel = config.get('channel', 'UNKNOWN')
-                            fd_status = "FD Enabled" if config.get('fd', False) else "FD Disabled"
-                            data_bitrate = ""
-                            if config.get('fd', False) and 'data_bitrate' in config:
-                                data_bitrate = f", Data: {config['data_bitrate']/1000} kbps"
-                            
-                            status_text = f"Connected: {channel} at {bitrate} kbps{data_bitrate} ({fd_status})"
-                            self.update_status_bar(status_text, connected=True)
-                        else:
-                            # Connection failed
-                            self.connect_action.setChecked(False)
-                            self.update_status_bar("Connection failed", connected=False)
-                    except Exception as e:
-                        # Handle errors in connection setup
-                        import traceback
-                        traceback.print_exc()
+                if self.connect_with(config, wait_timeout=PROFILE_CONNECT_TIMEOUT):
+                    self.profile_name = name
+                    return
+            except Exception as e:
+                print(f"Error connecting with profile {name}: {e}")
+        self.connect_with_dialog()
+
+    def connect_to(self):
+        """Pick the connection in the dialog, even when a profile was used before"""
+        if self.connect_action.isChecked():
+            self.save_profile_filters()
+            self.config_window.stop_receiving()
+        self.connect_action.setChecked(True)
+        self.connect_with_dialog()
+
+    def connect_with_dialog(self):
+        try:
+            # Show connection dialog
+            dialog = ConnectionDialog(self)
+            if dialog.exec_():
+                # User clicked OK
+                try:
+                    config = dialog.get_configuration()
+                    if self.connect_with(config):
+                        self.profile_name = dialog.profile_name()
+                        try:
+                            save_profile(self.profile_name, dict(config, **self.config_window.filter_settings()))
+                        except OSError as e:
+                            print(f"Error saving connection profile: {e}")
+                    else:
+                        # Connection failed
                         self.connect_action.setChecked(False)
-                        self.update_status_bar(f"Error: {str(e)}", connected=False)
-                else:
-                    # User cancelled
+                        self.connect_action.setText("Connect")
+                        self.update_status_bar("Connection failed", connected=False)
+                except Exception as e:
+                    # Handle errors in connection setup
+                    import traceback
+                    traceback.print_exc()
                     self.connect_action.setChecked(False)
-                    self.update_status_bar("Disconnected", connected=False)
-            except Exception as e:
-                # Catch any other errors
-                import traceback
-                traceback.print_exc()
+                    self.connect_action.setText("Connect")
+                    self.update_status_bar(f"Error: {str(e)}", connected=False)
+            else:
+                # User cancelled
                 self.connect_action.setChecked(False)
-                self.update_status_bar(f"Error: {str(e)}", connected=False)
+                self.connect_action.setText("Connect")
+                self.update_status_bar("Disconnected", connected=False)
+        except Exception as e:
+            # Catch any other errors
+            import traceback
+            traceback.print_exc()
+            self.connect_action.setChecked(False)
+            self.connect_action.setText("Connect")
+            self.update_status_bar(f"Error: {str(e)}", connected=False)
+
+    def connect_with(self, config, wait_timeout=None):
+        """Start receiving with a configuration; with wait_timeout, fail if the bus does not open"""
+        self.config_window.configure_can(config)
+        if not self.config_window.start_receiving(wait_timeout):
+            return False
+        self.connect_action.setText("Disconnect")
+        
+        # Update status bar with connection info
+        bitrate = config.get('bitrate', 500000) / 1000
+        channel = config.get('channel', 'UNKNOWN')
+        fd_status = "FD Enabled" if config.get('fd', False) else "FD Disabled"
+        data_bitrate = ""
+        if config.get('fd', False) and 'data_bitrate' in config:
+            data_bitrate = f", Data: {config['data_bitrate']/1000} kbps"
+        
+        status_text = f"Connected: {channel} at {bitrate} kbps{data_bitrate} ({fd_status})"
+        self.update_status_bar(status_text, connected=True)
+        return True
+
+    def save_profile_filters(self):
+        """Keep the filters of the profile in use as they are now, for its next direct connect"""
+        if self.profile_name is None:
+            return
+        config = load_profiles()['profiles'].get(self.profile_name)
+        if config is None:
+            return
+        config.update(self.config_window.filter_settings())
+        try:
+            save_profile(self.profile_name, config)
+        except OSError as e:
+            print(f"Error saving connection profile: {e}")
 
     def clear_table(self):
         self.config_window.clear_table()
 
+    def open_capture(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Open Capture", "", LOG_FILTER)
+        if not path:
+            return
+        try:
+            self.config_window.open_capture(path)
+        except Exception as e:
+            self.update_status_bar(f"Error: {str(e)}", connected=False)
+
+    def toggle_recording(self):
+        if not self.record_action.isChecked():
+            self.config_window.stop_recording()
+            self.record_action.setText("Record")
+            return
+        path, _ = QFileDialog.getSaveFileName(self, "Record Capture", "capture" + CAPTURE_EXTENSION, CAPTURE_FILTER)
+        if not path:
+            self.record_action.setChecked(False)
+            return
+        try:
+            self.config_window.start_recording(path)
+            self.record_action.setText("Stop Recording")
+        except Exception as e:
+            self.record_action.setChecked(False)
+            self.update_status_bar(f"Error: {str(e)}", connected=False)
+
+    def toggle_replay(self):
+        if not self.replay_action.isChecked():
+            self.config_window.stop_replay()
+            self.replay_action.setText("Replay")
+            return
+        dialog = ReplayDialog(self)
+        if not dialog.exec_():
+            self.replay_action.setChecked(False)
+            return
+        try:
+            self.config_window.start_replay(dialog.get_configuration())
+            self.replay_action.setText("Stop Replay")
+        except Exception as e:
+            self.replay_action.setChecked(False)
+            self.update_status_bar(f"Error: {str(e)}", connected=False)
+
+    def replay_finished(self, error):
+        self.config_window.stop_replay()
+        self.replay_action.setChecked(False)
+        self.replay_action.setText("Replay")
+        if error:
+            self.update_status_bar(f"Replay error: {error}", connected=False)
+
     def exit_app(self):
-        self.config_window.stop_receiving()
+        self.save_profile_filters()
+        self.config_window.stop_replay()
+        self.config_window.shutdown()
         QApplication.quit()
 
+    def closeEvent(self, event):
+        # A capture process must close its recording before the app exits
+        self.save_profile_filters()
+        self.config_window.stop_replay()
+        self.config_window.shutdown()
+        event.accept()
+
 if __name__ == "__main__":
     app = QApplication(sys.argv)
     main_app = MainApp()
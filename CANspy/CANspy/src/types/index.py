@@ -10,12 +10,3 @@ FD_DISABLED = False
 
 MESSAGE_FORMAT_STANDARD = 0
 MESSAGE_FORMAT_EXTENDED = 1
-
-class CANMessage:
-    def __init__(self, identifier, data, is_fd=False):
-        self.identifier = identifier
-        self.data = data
-        self.is_fd = is_fd
-
-    def __repr__(self):
-        return f"CANMessage(identifier={self.identifier}, data={self.data}, is_fd={self.is_fd})"
\ No newline at end of file
@@ -0,0 +1,81 @@
+"""
+Named connection profiles.
+
+A profile is the configuration dictionary returned by
+ConnectionDialog.get_configuration() (interface, channel, bit rates, FD
+and options) together with the filters of ConfigWindow.filter_settings()
+(display filter and bus acceptance filters), saved under a name. All
+profiles and the name of the last one used are kept in one JSON file, so
+the next Connect can open the bus directly, with its filters, instead of
+probing for hardware in the dialog.
+"""
+
+import json
+import os
+
+PROFILES_PATH = os.path.join(os.path.expanduser("~"), ".canspy", "profiles.json")
+DEFAULT_PROFILE = "Default"
+FILTER_SETTINGS = ('display_filter', 'filter_on_bus', 'can_filters')  # profile keys of the filters
+
+
+def load_profiles(path=PROFILES_PATH):
+    """
+    Reads the profile file.
+
+    :param path: Profile file; a missing or unreadable file has no profiles.
+    :return: {'last': name or None, 'profiles': {name: configuration}}
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            data = json.load(file)
+        profiles = data.get('profiles', {})
+        if not isinstance(profiles, dict):
+            raise ValueError("profiles must be an object")
+    except (OSError, ValueError, AttributeError):
+        return {'last': None, 'profiles': {}}
+    return {'last': data.get('last'), 'profiles': profiles}
+
+
+def write_profiles(data, path=PROFILES_PATH):
+    """Writes the profile file, replacing it in one step"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temporary = path + ".tmp"
+    with open(temporary, "w", encoding="utf-8") as file:
+        json.dump(data, file, indent=2, sort_keys=True)
+    os.replace(temporary, path)
+
+
+def save_profile(name, config, path=PROFILES_PATH):
+    """
+    Saves a configuration under a name and makes it the last used profile.
+
+    :param name: Profile name; an existing profile of that name is replaced.
+    :param config: Connection configuration dictionary.
+    """
+    data = load_profiles(path)
+    data['profiles'][name] = dict(config)
+    data['last'] = name
+    write_profiles(data, path)
+
+
+def delete_profile(name, path=PROFILES_PATH):
+    data = load_profiles(path)
+    if data['profiles'].pop(name, None) is None:
+        return
+    if data['last'] == name:
+        data['last'] = None
+    write_profiles(data, path)
+
+
+def last_profile(path=PROFILES_PATH):
+    """
+    Returns the profile used last.
+
+    :return: (name, configuration) or None if there is none.
+    """
+    data = load_profiles(path)
+    name = data['last']
+    config = data['profiles'].get(name)
+    if config is None:
+        return None
+    return name, dict(config)
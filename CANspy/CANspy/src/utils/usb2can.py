@@ -25,4 +25,54 @@ def stop_receiving_messages():
     This function should handle the cleanup and stopping of the CAN receiver.
     """
     # Implementation for stopping message reception goes here
-    pass
\ No newline at end of file
+    pass
+
+PCAN_CHANNELS = [
+    'PCAN_USBBUS1', 'PCAN_USBBUS2', 'PCAN_USBBUS3', 'PCAN_USBBUS4',
+    'PCAN_USBBUS5', 'PCAN_USBBUS6', 'PCAN_USBBUS7', 'PCAN_USBBUS8'
+]
+
+def probe_pcan_channel(channel, bitrate=500000):
+    """
+    Checks whether a PCAN channel can be opened.
+    
+    :param channel: PCAN channel name, e.g. 'PCAN_USBBUS1'.
+    :param bitrate: Bit rate used for the test connection.
+    :return: (hardware name, FD capable) or None if the channel is not available.
+    """
+    import can
+    try:
+        # Try to initialize the channel (will fail if not available)
+        bus = can.Bus(interface='pcan', channel=channel, bitrate=bitrate)
+    except Exception:
+        return None
+    hw_name = "PCAN-USB"
+    try:
+        if hasattr(bus, 'get_hardware_name'):
+            hw_name = bus.get_hardware_name()
+    except Exception:
+        pass
+    finally:
+        bus.shutdown()
+    # Check if FD is available
+    is_fd = False
+    try:
+        bus = can.Bus(interface='pcan', channel=channel, bitrate=bitrate, fd=True)
+        is_fd = True
+        bus.shutdown()
+    except Exception:
+        pass
+    return hw_name, is_fd
+
+def probe_pcan_channels(channels=PCAN_CHANNELS, bitrate=500000):
+    """
+    Finds the PCAN channels that can be opened.
+    
+    :return: List of (channel, hardware name, FD capable).
+    """
+    found = []
+    for channel in channels:
+        info = probe_pcan_channel(channel, bitrate)
+        if info is not None:
+            found.append((channel,) + info)
+    return found
@@ -0,0 +1,24 @@
+import numpy as np
+from capture.capture_file import RECORD_DTYPE
+from capture.store import CaptureStore
+from gui.capture_model import CaptureTableModel
+
+
+def test_sort_keys_match_the_cells_of_evicted_ids():
+    rng = np.random.default_rng(2)
+    records = np.zeros(3000, dtype=RECORD_DTYPE)
+    records['timestamp'] = np.arange(len(records)) * 1e-3
+    records['can_id'] = rng.integers(0, 64, len(records))
+    records['can_id'][::3] = 0x700
+    records['dlc'] = 8
+    store = CaptureStore(max_ids=16)
+    for start in range(0, len(records), 100):
+        store.append_records(records[start:start + 100])
+    assert store.evicted_ids
+    model = CaptureTableModel(store)
+    for column in (6, 7):
+        keys = model.sort_keys(column)
+        assert np.allclose(keys, [model.sort_key(row, column) for row in range(model.rowCount())])
+    # Frames of evicted IDs have no count, the others do
+    counts = model.sort_keys(7)
+    assert (counts == 0).any() and (counts[::3] > 0).all()
@@ -0,0 +1,42 @@
+import time
+import numpy as np
+from capture.capture_file import RECORD_DTYPE
+from capture.capture_process import SharedRing, ProcessReceiver
+
+
+def numbered(start, count):
+    records = np.zeros(count, dtype=RECORD_DTYPE)
+    records['can_id'] = np.arange(start, start + count)
+    return records
+
+
+def test_ring_write_larger_than_capacity():
+    ring = SharedRing(capacity=8)
+    try:
+        ring.write(numbered(0, 3))
+        ring.write(numbered(3, 20))
+        records, position, lost = ring.read(0)
+        assert position == 23
+        assert lost == 15
+        assert records['can_id'].tolist() == list(range(15, 23))
+        # The next write continues right behind them
+        ring.write(numbered(23, 2))
+        records, position, lost = ring.read(position)
+        assert records['can_id'].tolist() == [23, 24]
+        assert lost == 0
+    finally:
+        ring.close()
+
+
+def test_process_receiver_disconnects_without_timeout():
+    receiver = ProcessReceiver({'interface': 'virtual', 'channel': 'test_capture_process'})
+    try:
+        receiver.start_receiving()
+        assert receiver.wait_connected(30)
+        started = time.monotonic()
+        receiver.stop_receiving(timeout=2)
+        assert time.monotonic() - started < 1
+        assert receiver.disconnected.is_set()
+        assert not receiver.thread.is_alive()
+    finally:
+        receiver.close()
@@ -0,0 +1,35 @@
+import numpy as np
+from capture.capture_file import RECORD_DTYPE
+from capture.cycle_monitor import CycleMonitor, MISSING, OK
+
+
+def frames(can_id, times):
+    records = np.zeros(len(times), dtype=RECORD_DTYPE)
+    records['can_id'] = can_id
+    records['timestamp'] = times
+    records['dlc'] = 8
+    return records
+
+
+def test_missing_reported_at_its_deadline():
+    t0 = 1000.0
+    monitor = CycleMonitor({0x100: 0.010})
+    monitor.update(frames(0x100, t0 + np.arange(100) * 0.010))
+    assert monitor.status_of(0x100) == OK
+    # A later, unrelated batch: 0x100 was last seen at t0 + 0.99 and is long overdue
+    monitor.update(frames(0x200, [t0 + 2.0]))
+    assert monitor.status_of(0x100) == MISSING
+    _, when, can_id, status, interval, period = monitor.alarms_since(0)[-1]
+    assert (can_id, status) == (0x100, MISSING)
+    assert abs(when - (t0 + 0.99 + 0.030)) < 1e-6
+    assert abs(interval - 0.030) < 1e-6
+
+
+def test_seen_since_armed_not_missing():
+    t0 = 1000.0
+    monitor = CycleMonitor({0x100: 0.010})
+    monitor.update(frames(0x100, t0 + np.arange(100) * 0.010))
+    # The first deadline fires, but the ID kept coming and its next deadline is ahead
+    monitor.update(frames(0x100, t0 + 1.0 + np.arange(100) * 0.010))
+    assert monitor.status_of(0x100) == OK
+    assert all(alarm[3] != MISSING for alarm in monitor.alarms_since(0))
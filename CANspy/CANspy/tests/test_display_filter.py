@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+from capture.capture_file import RECORD_DTYPE
+from capture.display_filter import DisplayFilter, FilterError, SCALAR_FRAMES
+
+
+def frames(first_bytes, repeat=1):
+    records = np.zeros(len(first_bytes), dtype=RECORD_DTYPE)
+    records['dlc'] = 8
+    records['data'][:, 0] = first_bytes
+    return np.tile(records, repeat)
+
+
+def masks(display_filter, first_bytes):
+    """Matches of the per-frame closure and of the NumPy version"""
+    scalar = display_filter.mask(frames(first_bytes))
+    vector = display_filter.mask(frames(first_bytes, SCALAR_FRAMES + 1))[:len(first_bytes)]
+    return scalar.tolist(), vector.tolist()
+
+
+def test_shift_by_data_dependent_count():
+    # Invalid on all-zero data, valid on real frames
+    display_filter = DisplayFilter("1 << (data[0] - 5)")
+    expected = [False, False, True, True, False]
+    assert masks(display_filter, [0, 4, 5, 6, 70]) == (expected, expected)
+
+
+def test_shift_out_of_range_only_fails_its_frame():
+    display_filter = DisplayFilter("data[0] == 1 or 1 << (data[0] - 5) > 4")
+    expected = [True, False, False, True]
+    assert masks(display_filter, [1, 2, 7, 8]) == (expected, expected)
+
+
+def test_left_shift_beyond_64_bits():
+    display_filter = DisplayFilter("data[0] << 60 > 0x1000")
+    expected = [False, True, True]
+    assert masks(display_filter, [0, 1, 255]) == (expected, expected)
+
+
+def test_invalid_filters_are_rejected():
+    for text in ("data[0] <<", "speed > 3", "time << 2"):
+        with pytest.raises(FilterError):
+            DisplayFilter(text)
@@ -0,0 +1,55 @@
+import numpy as np
+from capture.capture_file import RECORD_DTYPE, FLAG_EXTENDED
+from capture.display_filter import DisplayFilter, FilterFeed
+from capture.receiver import CANReceiver
+from capture.store import CaptureStore
+from gui.capture_model import LatestTableModel
+
+MAX_IDS = 1024
+FRAMES = 100000
+BLOCK = 5000
+
+
+def flood():
+    """Periodic traffic on 16 IDs with random 29-bit IDs in between"""
+    rng = np.random.default_rng(1)
+    records = np.zeros(FRAMES, dtype=RECORD_DTYPE)
+    records['timestamp'] = np.arange(FRAMES) * 1e-4
+    records['can_id'] = rng.integers(0, 1 << 29, FRAMES)
+    records['can_id'][::4] = 0x100 + np.arange(FRAMES // 4) % 16
+    records['flags'] = FLAG_EXTENDED
+    records['dlc'] = 8
+    return records
+
+
+def test_flood_of_random_ids_is_bounded():
+    records = flood()
+    store = CaptureStore(MAX_IDS)
+    receiver = CANReceiver(store=store, max_ids=MAX_IDS)
+    model = LatestTableModel(store, max_rows=MAX_IDS)
+    feed = FilterFeed(store, DisplayFilter("cycle > 0 or id < 0x200"), max_ids=MAX_IDS)
+    for start in range(0, FRAMES, BLOCK):
+        receiver.process_records(records[start:start + BLOCK])
+        model.refresh()
+        while not feed.update():
+            pass
+        assert len(receiver.id_state) <= MAX_IDS
+        assert len(store.id_positions) <= MAX_IDS
+        assert len(model.row_ids) <= MAX_IDS
+        assert len(feed.last_seen) <= MAX_IDS
+        assert len(feed.store.id_positions) <= MAX_IDS
+
+    assert len(store) == FRAMES
+    assert sum(state.count for state in receiver.id_state.values()) + receiver.other_state.count == FRAMES
+    assert int(store.id_summary()[3].sum()) + store.evicted_frames == FRAMES
+    assert sum(model.counts) + model.other_count == FRAMES
+    assert model.other_row == len(model.row_ids) == model.rowCount() - 1
+    assert model.row_cells(model.other_row)[1][7] == model.other_count
+    # The periodic IDs survive the flood
+    assert all(0x100 + i in model.row_of_id for i in range(16))
+    assert all(0x100 + i in receiver.id_state for i in range(16))
+
+    # Built at once from the bounded store, the view still accounts for every frame
+    model.reset(store)
+    assert len(model.row_ids) <= MAX_IDS
+    assert sum(model.counts) + model.other_count == FRAMES
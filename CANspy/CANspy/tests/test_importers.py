@@ -0,0 +1,38 @@
+import numpy as np
+from capture.capture_file import FLAG_FD, FLAG_BRS
+from capture.importers import import_trc
+
+
+def read_trc(tmp_path, text):
+    path = tmp_path / "trace.trc"
+    path.write_text(text)
+    return np.concatenate([records for records, _ in import_trc(str(path))])
+
+
+def test_trc_v20_fd_data_length(tmp_path):
+    data = ' '.join(f"{i:02X}" for i in range(20))
+    records = read_trc(tmp_path, ";$FILEVERSION=2.0\n"
+                                 f"     1)         1.500 FD     0123 Rx 20  {data}\n")
+    assert len(records) == 1
+    assert records[0]['flags'] == FLAG_FD
+    assert records[0]['dlc'] == 20
+    assert records[0]['data'][:20].tolist() == list(range(20))
+    assert abs(records[0]['timestamp'] - 0.0015) < 1e-9
+
+
+def test_trc_v21_fd_dlc(tmp_path):
+    data = ' '.join(f"{i:02X}" for i in range(12))
+    records = read_trc(tmp_path, ";$FILEVERSION=2.1\n"
+                                 ";$COLUMNS=N,O,T,B,I,d,R,L,D\n"
+                                 f"     1)         2.000 FB  1  0123 Rx -  9  {data}\n")
+    assert len(records) == 1
+    assert records[0]['flags'] == FLAG_FD | FLAG_BRS
+    assert records[0]['dlc'] == 12
+    assert records[0]['data'][:12].tolist() == list(range(12))
+
+
+def test_trc_v11_classic(tmp_path):
+    records = read_trc(tmp_path, ";$FILEVERSION=1.1\n"
+                                 "     1)      1841.0  Rx         0001  8  00 01 02 03 04 05 06 07\n")
+    assert records['dlc'].tolist() == [8]
+    assert records[0]['data'][:8].tolist() == list(range(8))
@@ -0,0 +1,59 @@
+from capture.j1939 import TransportDecoder, TP_RTS, TP_CTS, TP_END_OF_MESSAGE_ACK, PF_TP_CM, PF_TP_DT, OK
+
+SENDER = 0x00
+RECEIVER = 0xF9
+PGN = 0xFECA
+
+
+def tp_id(pf, destination, source):
+    return (7 << 26) | (pf << 16) | (destination << 8) | source
+
+
+def rts(size, packets):
+    return bytes([TP_RTS, size & 0xFF, size >> 8, packets, 0xFF, PGN & 0xFF, (PGN >> 8) & 0xFF, PGN >> 16])
+
+
+def cts(count, next_packet):
+    return bytes([TP_CTS, count, next_packet, 0xFF, 0xFF, PGN & 0xFF, (PGN >> 8) & 0xFF, PGN >> 16])
+
+
+def dt(sequence, payload):
+    return bytes([sequence]) + payload[(sequence - 1) * 7:sequence * 7].ljust(7, b'\xff')
+
+
+def test_cts_retransmission_completes_the_message():
+    payload = bytes(range(20))
+    decoder = TransportDecoder()
+    to_receiver = tp_id(PF_TP_DT, RECEIVER, SENDER)
+    frames = [
+        (tp_id(PF_TP_CM, RECEIVER, SENDER), rts(len(payload), 3)),
+        (tp_id(PF_TP_CM, SENDER, RECEIVER), cts(2, 1)),
+        (to_receiver, dt(1, payload)),
+        (to_receiver, dt(2, payload)),
+        # Packet 2 was corrupted: the receiver asks for it again
+        (tp_id(PF_TP_CM, SENDER, RECEIVER), cts(2, 2)),
+        (to_receiver, dt(2, payload)),
+        (to_receiver, dt(3, payload)),
+        (tp_id(PF_TP_CM, SENDER, RECEIVER), bytes([TP_END_OF_MESSAGE_ACK, 20, 0, 3, 0xFF, 0xCA, 0xFE, 0x00])),
+    ]
+    for i, (can_id, data) in enumerate(frames):
+        decoder.handle(can_id, i * 0.01, data)
+    messages = decoder.messages_since(0)
+    assert len(messages) == 1
+    _, _, _, pgn, source, destination, size, received, status, broadcast = messages[0]
+    assert (pgn, source, destination, size, status, broadcast) == (PGN, SENDER, RECEIVER, 20, OK, False)
+    assert received == payload
+
+
+def test_cts_hold_keeps_the_next_packet():
+    payload = bytes(range(14))
+    decoder = TransportDecoder()
+    to_receiver = tp_id(PF_TP_DT, RECEIVER, SENDER)
+    decoder.handle(tp_id(PF_TP_CM, RECEIVER, SENDER), 0.0, rts(len(payload), 2))
+    decoder.handle(tp_id(PF_TP_CM, SENDER, RECEIVER), 0.01, cts(1, 1))
+    decoder.handle(to_receiver, 0.02, dt(1, payload))
+    # Zero packets: wait, the next packet number means nothing
+    decoder.handle(tp_id(PF_TP_CM, SENDER, RECEIVER), 0.03, cts(0, 0xFF))
+    decoder.handle(tp_id(PF_TP_CM, SENDER, RECEIVER), 0.5, cts(1, 2))
+    decoder.handle(to_receiver, 0.51, dt(2, payload))
+    assert [message[7:9] for message in decoder.messages_since(0)] == [(payload, OK)]
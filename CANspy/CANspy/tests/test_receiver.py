@@ -0,0 +1,90 @@
+import select
+import socket
+import time
+import can
+import pytest
+from capture.receiver import CANReceiver, bus_fileno
+
+STOP_BOUND = 0.25  # seconds; an unwoken receive loop waits up to 1 s
+
+
+class SocketPairBus(can.BusABC):
+    """A bus readable through a file descriptor, like SocketCAN: frames are 4-byte IDs on a socket pair"""
+
+    def __init__(self, channel=None, **kwargs):
+        self.reader, self.writer = socket.socketpair()
+        self.reader.setblocking(False)
+        self.channel_info = "socket pair"
+        super().__init__(channel, **kwargs)
+
+    def fileno(self):
+        return self.reader.fileno()
+
+    def _recv_internal(self, timeout):
+        if not select.select([self.reader], [], [], timeout)[0]:
+            return None, False
+        try:
+            data = self.reader.recv(4)
+        except BlockingIOError:
+            return None, False
+        return can.Message(arbitration_id=int.from_bytes(data, 'little'), timestamp=time.time()), False
+
+    def send(self, msg, timeout=None):
+        self.writer.send(msg.arbitration_id.to_bytes(4, 'little'))
+
+    def shutdown(self):
+        super().shutdown()
+        self.reader.close()
+        self.writer.close()
+
+
+class SocketPairReceiver(CANReceiver):
+    def open_bus(self):
+        return SocketPairBus()
+
+
+def stop_time(receiver):
+    receiver.start_receiving()
+    assert receiver.wait_connected(5)
+    time.sleep(0.05)  # let the loop settle into its wait
+    bus = receiver.bus
+    started = time.perf_counter()
+    receiver.stop_receiving()
+    elapsed = time.perf_counter() - started
+    assert not receiver.thread.is_alive()
+    assert bus._is_shutdown
+    return elapsed
+
+
+def test_stop_wakes_select_on_bus_with_fileno():
+    receiver = SocketPairReceiver()
+    assert stop_time(receiver) < STOP_BOUND
+
+
+def test_stop_wakes_select_with_frames_pending():
+    receiver = SocketPairReceiver()
+    receiver.start_receiving()
+    assert receiver.wait_connected(5)
+    receiver.bus.send(can.Message(arbitration_id=0x123))
+    time.sleep(0.05)
+    started = time.perf_counter()
+    receiver.stop_receiving()
+    assert time.perf_counter() - started < STOP_BOUND
+    assert receiver.frames_received == 1
+
+
+def test_stop_bounded_on_bus_without_fileno():
+    receiver = CANReceiver({'interface': 'virtual', 'channel': 'test_receiver_stop'})
+    receiver.start_receiving()
+    assert receiver.wait_connected(5)
+    assert bus_fileno(receiver.bus) is None
+    receiver.stop_receiving()
+    assert stop_time(receiver) < STOP_BOUND
+
+
+def test_stop_wakes_socketcan():
+    try:
+        can.Bus(interface='socketcan', channel='vcan0').shutdown()
+    except (OSError, can.CanError) as e:
+        pytest.skip(f"no vcan0: {e}")
+    assert stop_time(CANReceiver({'interface': 'socketcan', 'channel': 'vcan0'})) < STOP_BOUND
@@ -0,0 +1,28 @@
+import time
+import numpy as np
+from capture.capture_file import RECORD_DTYPE
+from capture.receiver import CANReceiver
+from capture.replay import ReplayEngine
+from capture.store import CaptureStore
+
+
+def test_replay_into_receiver_publishes_before_a_gap():
+    source = CaptureStore()
+    records = np.zeros(3, dtype=RECORD_DTYPE)
+    records['can_id'] = [0x100, 0x101, 0x102]
+    records['timestamp'] = [0.0, 0.01, 0.5]
+    records['dlc'] = 8
+    source.append_records(records)
+    receiver = CANReceiver(store=CaptureStore())
+    published = []
+    receiver.subscribe(lambda batch: published.append((time.perf_counter(), len(batch))))
+    engine = ReplayEngine(source, on_frame=receiver.process_message, on_idle=receiver.flush)
+    started = time.perf_counter()
+    engine.start()
+    engine.thread.join(5)
+    receiver.flush()
+    assert sum(count for _, count in published) == 3
+    # The frames before the gap were not held back until the last frame
+    first_time, first_count = published[0]
+    assert first_count == 2
+    assert first_time - started < 0.3